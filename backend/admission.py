@@ -0,0 +1,300 @@
+"""
+Admission control and load shedding for the analysis pipeline.
+
+Every /analyze/ request is admitted (or rejected) before any work starts:
+  - a cap on requests in the system, rejected immediately with 503 and a
+    Retry-After estimate when full
+  - per-stage concurrency limits (detection, LLM) with a bounded wait queue
+    and a maximum wait; a request whose expected wait (queue length x
+    measured service time) already exceeds it is rejected on arrival
+  - per-client fair share: a client may hold at most a share of a stage's
+    slots + queue, and freed slots go to the waiting client with the fewest
+    running requests
+  - a thread pool per stage sized to its limit (bulkhead), so slow Gemini
+    calls cannot take the threads detection or 3D generation need
+  - degraded mode: under pressure, optional work (annotated image, 3D model
+    generation) is skipped so the core analysis keeps its latency
+
+All bookkeeping runs on the event loop, so no locks are needed.
+"""
+
+import asyncio
+import math
+import os
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Callable, Dict, Optional, Set
+
+from tracing import bind_context
+from metrics import ADMISSION_DEGRADED, ADMISSION_REJECTIONS, ADMISSION_STAGE_ACTIVE, ADMISSION_STAGE_WAITING
+
+# Configuration
+ADMISSION_ENABLED = os.environ.get("ADMISSION_ENABLED", "true").lower() in ("1", "true", "yes")
+ADMISSION_MAX_IN_FLIGHT = int(os.environ.get("ADMISSION_MAX_IN_FLIGHT", "32"))
+ADMISSION_DETECT_CONCURRENCY = int(os.environ.get("ADMISSION_DETECT_CONCURRENCY", "2"))
+ADMISSION_LLM_CONCURRENCY = int(os.environ.get("ADMISSION_LLM_CONCURRENCY", "8"))
+ADMISSION_QUEUE_SIZE = int(os.environ.get("ADMISSION_QUEUE_SIZE", "16"))
+ADMISSION_MAX_WAIT = float(os.environ.get("ADMISSION_MAX_WAIT", "10"))
+ADMISSION_CLIENT_SHARE = float(os.environ.get("ADMISSION_CLIENT_SHARE", "0.5"))
+ADMISSION_DEGRADE_AT = float(os.environ.get("ADMISSION_DEGRADE_AT", "0.75"))
+ADMISSION_3D_BACKLOG = int(os.environ.get("ADMISSION_3D_BACKLOG", "8"))
+
+# Optional work that degraded mode may skip
+FEATURE_ANNOTATION = "annotation"
+FEATURE_MODEL_3D = "model_3d"
+
+
+class Overloaded(Exception):
+    """Raised when a request cannot be admitted; maps to 503 + Retry-After."""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class StageLimiter:
+    """Concurrency limit with a bounded, fair, deadline-aware wait queue."""
+
+    def __init__(self, name: str, limit: int, queue_size: int = ADMISSION_QUEUE_SIZE,
+                 max_wait: float = ADMISSION_MAX_WAIT, client_share: float = ADMISSION_CLIENT_SHARE):
+        self.name = name
+        self.limit = max(1, limit)
+        self.queue_size = queue_size
+        self.max_wait = max_wait
+        self.client_share = client_share
+        self.active = 0
+        self.waiting = 0
+        self.service_time = 0.0  # EWMA of seconds per slot (0 until measured)
+        self._active_by_client: Counter = Counter()
+        self._waiters: Dict[str, deque] = {}
+        self.executor = ThreadPoolExecutor(max_workers=self.limit, thread_name_prefix=f"stage-{name}")
+        ADMISSION_STAGE_ACTIVE.labels(stage=name).set_function(lambda: self.active)
+        ADMISSION_STAGE_WAITING.labels(stage=name).set_function(lambda: self.waiting)
+
+    @property
+    def pressure(self) -> float:
+        """0 when idle, 1 when the wait queue is full."""
+        if self.queue_size <= 0:
+            return 1.0 if self.active >= self.limit else 0.0
+        return min(1.0, self.waiting / self.queue_size)
+
+    def client_quota(self) -> int:
+        return max(1, int((self.limit + self.queue_size) * self.client_share))
+
+    def expected_wait(self) -> float:
+        """Seconds a request joining the queue now should wait for a slot."""
+        return (self.waiting + 1) * self.service_time / self.limit
+
+    def retry_after(self) -> int:
+        """Seconds until the current backlog should have drained."""
+        return max(1, math.ceil(self.expected_wait()))
+
+    def _reject(self, reason: str) -> Overloaded:
+        ADMISSION_REJECTIONS.labels(reason=f"{self.name}_{reason}").inc()
+        return Overloaded(f"{self.name} {reason.replace('_', ' ')}", self.retry_after())
+
+    async def acquire(self, client: str) -> None:
+        """
+        Take a slot, waiting in the queue if needed.
+
+        Raises:
+            Overloaded: If the client is over its share, the queue is full or
+                the wait exceeded max_wait
+        """
+        queued = len(self._waiters.get(client, ()))
+        if self._active_by_client[client] + queued >= self.client_quota():
+            raise self._reject("client_quota")
+        if self.active < self.limit and not self.waiting:
+            self._grant(client)
+            return
+        if self.waiting >= self.queue_size:
+            raise self._reject("queue_full")
+        if self.expected_wait() > self.max_wait:
+            # Would miss its deadline anyway: fail fast instead of timing out in the queue
+            raise self._reject("deadline")
+
+        future = asyncio.get_event_loop().create_future()
+        self._waiters.setdefault(client, deque()).append((time.monotonic(), future))
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(future, self.max_wait)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if future.done() and not future.cancelled():
+                # Granted just as the wait ended: keep the slot unless cancelled
+                if isinstance(e, asyncio.CancelledError):
+                    self.release(client, 0.0)
+                    raise
+                return
+            self._remove_waiter(client, future)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            raise self._reject("wait_timeout")
+
+    def release(self, client: str, elapsed: float) -> None:
+        self.active -= 1
+        self._active_by_client[client] -= 1
+        if self._active_by_client[client] <= 0:
+            del self._active_by_client[client]
+        if elapsed > 0:
+            self.service_time = 0.8 * self.service_time + 0.2 * elapsed if self.service_time else elapsed
+        self._wake_next()
+
+    @asynccontextmanager
+    async def slot(self, client: str):
+        await self.acquire(client)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(client, time.monotonic() - start)
+
+    def _grant(self, client: str) -> None:
+        self.active += 1
+        self._active_by_client[client] += 1
+
+    def _remove_waiter(self, client: str, future) -> None:
+        waiters = self._waiters.get(client)
+        if waiters is None:
+            return
+        for entry in waiters:
+            if entry[1] is future:
+                waiters.remove(entry)
+                self.waiting -= 1
+                break
+        if not waiters:
+            del self._waiters[client]
+
+    def _wake_next(self) -> None:
+        """Hand free slots to the waiting client with the fewest running requests."""
+        while self.active < self.limit and self._waiters:
+            client = min(
+                self._waiters,
+                key=lambda c: (self._active_by_client[c], self._waiters[c][0][0])
+            )
+            waiters = self._waiters[client]
+            _, future = waiters.popleft()
+            self.waiting -= 1
+            if not waiters:
+                del self._waiters[client]
+            if future.done():
+                continue
+            self._grant(client)
+            future.set_result(None)
+
+    def stats(self) -> dict:
+        return {
+            "limit": self.limit,
+            "active": self.active,
+            "waiting": self.waiting,
+            "queue_size": self.queue_size,
+            "service_time_s": round(self.service_time, 3),
+            "clients": len(set(self._active_by_client) | set(self._waiters)),
+        }
+
+
+class AdmissionController:
+    """Request-level admission, per-stage limiters and degraded-mode decisions."""
+
+    def __init__(
+        self,
+        max_in_flight: int = ADMISSION_MAX_IN_FLIGHT,
+        stages: Optional[Dict[str, StageLimiter]] = None,
+        client_share: float = ADMISSION_CLIENT_SHARE,
+        degrade_at: float = ADMISSION_DEGRADE_AT,
+        model_3d_backlog: int = ADMISSION_3D_BACKLOG,
+        backlog_3d: Optional[Callable[[], int]] = None,
+        enabled: bool = ADMISSION_ENABLED
+    ):
+        """
+        Args:
+            max_in_flight: Requests allowed in the system (running or queued)
+            stages: Limiter per stage name (defaults: detect, llm)
+            client_share: Share of max_in_flight one client may hold
+            degrade_at: Pressure (0-1) from which optional work is skipped
+            model_3d_backlog: 3D jobs waiting beyond which new 3D jobs are skipped
+            backlog_3d: Callable returning the current number of unfinished 3D jobs
+            enabled: When False every request is admitted and nothing is skipped
+        """
+        self.enabled = enabled
+        self.max_in_flight = max_in_flight
+        self.client_share = client_share
+        self.degrade_at = degrade_at
+        self.model_3d_backlog = model_3d_backlog
+        self.backlog_3d = backlog_3d or (lambda: 0)
+        self.stages = stages if stages is not None else {
+            "detect": StageLimiter("detect", ADMISSION_DETECT_CONCURRENCY),
+            "llm": StageLimiter("llm", ADMISSION_LLM_CONCURRENCY),
+        }
+        self.in_flight = 0
+        self._in_flight_by_client: Counter = Counter()
+
+    @asynccontextmanager
+    async def admit(self, client: str):
+        """
+        Admit a request for its whole lifetime.
+
+        Raises:
+            Overloaded: If the system or the client's share is full
+        """
+        if not self.enabled:
+            yield
+            return
+        if self.in_flight >= self.max_in_flight:
+            ADMISSION_REJECTIONS.labels(reason="in_flight").inc()
+            raise Overloaded("server at capacity", self._retry_after())
+        if self._in_flight_by_client[client] >= max(1, int(self.max_in_flight * self.client_share)):
+            ADMISSION_REJECTIONS.labels(reason="client_quota").inc()
+            raise Overloaded("client over its fair share", self._retry_after())
+
+        self.in_flight += 1
+        self._in_flight_by_client[client] += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._in_flight_by_client[client] -= 1
+            if self._in_flight_by_client[client] <= 0:
+                del self._in_flight_by_client[client]
+
+    async def run(self, name: str, client: str, fn: Callable, *args):
+        """Run a blocking call in the named stage's pool while holding one of its slots."""
+        loop = asyncio.get_event_loop()
+        if not self.enabled:
+            return await loop.run_in_executor(None, bind_context(fn), *args)
+        stage = self.stages[name]
+        async with stage.slot(client):
+            return await loop.run_in_executor(stage.executor, bind_context(fn), *args)
+
+    def pressure(self) -> float:
+        return max(
+            [self.in_flight / self.max_in_flight if self.max_in_flight else 0.0]
+            + [stage.pressure for stage in self.stages.values()]
+        )
+
+    def degraded_features(self) -> Set[str]:
+        """Optional work to skip for a request admitted now."""
+        if not self.enabled:
+            return set()
+        skipped = set()
+        if self.pressure() >= self.degrade_at:
+            skipped.update((FEATURE_ANNOTATION, FEATURE_MODEL_3D))
+        elif self.backlog_3d() >= self.model_3d_backlog:
+            skipped.add(FEATURE_MODEL_3D)
+        for feature in skipped:
+            ADMISSION_DEGRADED.labels(feature=feature).inc()
+        return skipped
+
+    def _retry_after(self) -> int:
+        return max(stage.retry_after() for stage in self.stages.values())
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "pressure": round(self.pressure(), 3),
+            "stages": {name: stage.stats() for name, stage in self.stages.items()},
+        }
@@ -0,0 +1,496 @@
+"""
+Analysis history: every /analyze/ response, queryable by user, time, score and object class.
+
+Responses used to survive only as detection records in the artifact store
+and in-memory 3D job status, so listing a user's rooms or finding the rooms
+that scored 9+ meant scanning everything. The history keeps one row per
+analysis in a repository (SQLite by default, ANALYSIS_REPOSITORY):
+
+  analyses           one small row per analysis (id, user, time, score, counts),
+                     indexed by time, user + time, score and user + score
+  analysis_classes   (class, time, analysis) rows for the class filter
+  analysis_responses the full response, zlib-compressed, read only by id
+
+List queries never touch the responses. Pages are keyset-paginated: the
+cursor carries the sort key and row id of the last item, so page 10,000
+costs the same as page 1 (OFFSET would walk every skipped row).
+
+Writes are off the request path: submit() only puts the record on a bounded
+queue, and a writer thread inserts batches of up to ANALYSIS_WRITE_BATCH
+rows in one transaction at least every ANALYSIS_WRITE_INTERVAL seconds. An
+analysis therefore shows up in /analyses within that interval. When the
+queue is full (the disk cannot keep up) records are dropped and counted
+rather than blocking requests.
+"""
+
+import base64
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+import zlib
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional, Sequence
+
+from metrics import (
+    ANALYSIS_HISTORY_BATCH_SECONDS, ANALYSIS_HISTORY_QUERY_SECONDS, ANALYSIS_HISTORY_QUEUE, ANALYSIS_HISTORY_WRITES
+)
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Configuration
+ANALYSIS_REPOSITORY = os.environ.get("ANALYSIS_REPOSITORY", "sqlite").lower()
+ANALYSIS_DB_PATH = Path(__file__).parent / os.environ.get("ANALYSIS_DB_PATH", "analyses.sqlite3")
+ANALYSIS_WRITE_BATCH = int(os.environ.get("ANALYSIS_WRITE_BATCH", "500"))
+ANALYSIS_WRITE_INTERVAL = float(os.environ.get("ANALYSIS_WRITE_INTERVAL", "1.0"))
+ANALYSIS_QUEUE_SIZE = int(os.environ.get("ANALYSIS_QUEUE_SIZE", "20000"))
+ANALYSIS_PAGE_MAX = 200
+SORT_KEYS = ("created", "score")
+# Stored for unparseable scores (as parse_fengshui_response does for the whole analysis)
+NEUTRAL_SCORE = 5.0
+
+
+@dataclass
+class AnalysisRecord:
+    """One analysis as stored in the history."""
+
+    analysis_id: str
+    user: str
+    created: float
+    score: float
+    classes: List[str]
+    object_count: int
+    response: dict
+
+    @classmethod
+    def from_response(cls, analysis_id: str, user: str, response: dict, created: Optional[float] = None):
+        """Record of an /analyze/ response (its detected_objects give the classes)."""
+        try:
+            score = float(response.get("score", NEUTRAL_SCORE))
+        except (TypeError, ValueError):
+            score = NEUTRAL_SCORE
+        objects = response.get("detected_objects") or []
+        return cls(
+            analysis_id=analysis_id,
+            user=user or "",
+            created=time.time() if created is None else created,
+            score=score,
+            classes=sorted({obj["class"] for obj in objects}),
+            object_count=len(objects),
+            response=response,
+        )
+
+
+@dataclass
+class AnalysisQuery:
+    """Filters and page of an /analyses query (newest or best first)."""
+
+    user: Optional[str] = None
+    object_class: Optional[str] = None
+    min_score: Optional[float] = None
+    max_score: Optional[float] = None
+    since: Optional[float] = None
+    until: Optional[float] = None
+    sort: str = "created"
+    limit: int = 50
+    cursor: Optional[str] = None
+
+
+@dataclass
+class AnalysisPage:
+    items: List[dict] = field(default_factory=list)
+    next_cursor: Optional[str] = None
+
+    def to_dict(self) -> dict:
+        return {"items": self.items, "next_cursor": self.next_cursor}
+
+
+def encode_cursor(sort: str, value: float, row_id: int) -> str:
+    """Opaque cursor after the row with this sort key and id."""
+    raw = json.dumps([sort, value, row_id], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: str) -> tuple:
+    """
+    (sort key, row id) of a cursor.
+
+    Raises:
+        ValueError: If the cursor is malformed or belongs to another sort order
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        cursor_sort, value, row_id = json.loads(raw)
+        value, row_id = float(value), int(row_id)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+    if cursor_sort != sort:
+        raise ValueError(f"Cursor is for sort={cursor_sort}, not sort={sort}")
+    return value, row_id
+
+
+# ---------------------------------------------------------------------------
+# Repositories
+# ---------------------------------------------------------------------------
+
+class AnalysisRepository:
+    """Storage interface of the analysis history."""
+
+    def add_many(self, records: Sequence[AnalysisRecord]) -> None:
+        raise NotImplementedError
+
+    def get(self, analysis_id: str) -> Optional[dict]:
+        """The stored response of an analysis, or None."""
+        raise NotImplementedError
+
+    def query(self, query: AnalysisQuery) -> AnalysisPage:
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class SQLiteAnalysisRepository(AnalysisRepository):
+    """History in a SQLite file: one writer connection, one read connection per thread (WAL)."""
+
+    def __init__(self, path: Path = ANALYSIS_DB_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS analyses (
+                id INTEGER PRIMARY KEY,
+                analysis_id TEXT NOT NULL UNIQUE,
+                user TEXT NOT NULL,
+                created REAL NOT NULL,
+                score REAL NOT NULL,
+                object_count INTEGER NOT NULL,
+                classes TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS analyses_created ON analyses (created, id);
+            CREATE INDEX IF NOT EXISTS analyses_user_created ON analyses (user, created, id);
+            CREATE INDEX IF NOT EXISTS analyses_score ON analyses (score, id);
+            CREATE INDEX IF NOT EXISTS analyses_user_score ON analyses (user, score, id);
+            CREATE TABLE IF NOT EXISTS analysis_classes (
+                class TEXT NOT NULL,
+                created REAL NOT NULL,
+                analysis INTEGER NOT NULL,
+                PRIMARY KEY (class, created, analysis)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS analysis_responses (
+                id INTEGER PRIMARY KEY,
+                response BLOB NOT NULL
+            );
+        """)
+
+    def _reader(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+            self._local.conn = conn
+        return conn
+
+    def add_many(self, records: Sequence[AnalysisRecord]) -> None:
+        """Insert (or replace) records in one transaction."""
+        rows = [
+            (record, zlib.compress(json.dumps(record.response, separators=(",", ":")).encode("utf-8")))
+            for record in records
+        ]
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                for record, payload in rows:
+                    self._delete_locked(record.analysis_id)
+                    row_id = self._conn.execute(
+                        "INSERT INTO analyses (analysis_id, user, created, score, object_count, classes) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        (record.analysis_id, record.user, record.created, record.score,
+                         record.object_count, ",".join(record.classes)),
+                    ).lastrowid
+                    self._conn.executemany(
+                        "INSERT INTO analysis_classes (class, created, analysis) VALUES (?, ?, ?)",
+                        [(name, record.created, row_id) for name in record.classes],
+                    )
+                    self._conn.execute(
+                        "INSERT INTO analysis_responses (id, response) VALUES (?, ?)", (row_id, payload)
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _delete_locked(self, analysis_id: str) -> None:
+        row = self._conn.execute("SELECT id, created, classes FROM analyses WHERE analysis_id = ?",
+                                 (analysis_id,)).fetchone()
+        if row is None:
+            return
+        row_id, created, classes = row
+        self._conn.executemany(
+            "DELETE FROM analysis_classes WHERE class = ? AND created = ? AND analysis = ?",
+            [(name, created, row_id) for name in classes.split(",") if name],
+        )
+        self._conn.execute("DELETE FROM analysis_responses WHERE id = ?", (row_id,))
+        self._conn.execute("DELETE FROM analyses WHERE id = ?", (row_id,))
+
+    def get(self, analysis_id: str) -> Optional[dict]:
+        row = self._reader().execute(
+            "SELECT r.response FROM analyses a JOIN analysis_responses r ON r.id = a.id WHERE a.analysis_id = ?",
+            (analysis_id,),
+        ).fetchone()
+        return json.loads(zlib.decompress(row[0])) if row is not None else None
+
+    def query(self, query: AnalysisQuery) -> AnalysisPage:
+        """
+        One page of analyses matching the filters, newest (or best) first.
+
+        Raises:
+            ValueError: On an unknown sort order or invalid cursor
+        """
+        if query.sort not in SORT_KEYS:
+            raise ValueError(f"Unknown sort '{query.sort}' (expected one of {', '.join(SORT_KEYS)})")
+        limit = max(1, min(query.limit, ANALYSIS_PAGE_MAX))
+
+        # A class filter alone walks the (class, created, analysis) table newest first; combined
+        # with a user (or sorted by score) each row's class is a primary-key lookup instead
+        by_class = query.object_class is not None and query.sort == "created" and query.user is None
+        if by_class:
+            source = "analysis_classes c JOIN analyses a ON a.id = c.analysis"
+            key, row_id = "c.created", "c.analysis"
+            conditions, params = ["c.class = ?"], [query.object_class]
+        else:
+            source = "analyses a"
+            key, row_id = f"a.{query.sort}", "a.id"
+            conditions, params = [], []
+            if query.object_class is not None:
+                conditions.append(
+                    "EXISTS (SELECT 1 FROM analysis_classes c "
+                    "WHERE c.class = ? AND c.created = a.created AND c.analysis = a.id)"
+                )
+                params.append(query.object_class)
+
+        for condition, value in (
+            ("a.user = ?", query.user),
+            ("a.score >= ?", query.min_score),
+            ("a.score <= ?", query.max_score),
+            (f"{'c' if by_class else 'a'}.created >= ?", query.since),
+            (f"{'c' if by_class else 'a'}.created < ?", query.until),
+        ):
+            if value is not None:
+                conditions.append(condition)
+                params.append(value)
+
+        def page_sql(extra: List[str]) -> str:
+            where = conditions + extra
+            return (
+                "SELECT a.id, a.analysis_id, a.user, a.created, a.score, a.object_count, a.classes, "
+                f"{key} AS sort_key, {row_id} AS row_key FROM {source}"
+                + (" WHERE " + " AND ".join(where) if where else "")
+                + f" ORDER BY {key} DESC, {row_id} DESC LIMIT ?"
+            )
+
+        if query.cursor:
+            # SQLite only seeks on the first column of a row-value comparison, which would scan
+            # every row tied with the cursor's score; the tie and the rest are two index seeks
+            value, last_id = decode_cursor(query.cursor, query.sort)
+            sql = (
+                f"SELECT * FROM ({page_sql([f'{key} = ?', f'{row_id} < ?'])}) UNION ALL "
+                f"SELECT * FROM ({page_sql([f'{key} < ?'])}) ORDER BY sort_key DESC, row_key DESC LIMIT ?"
+            )
+            params = params + [value, last_id, limit + 1] + params + [value, limit + 1, limit + 1]
+        else:
+            sql = page_sql([])
+            params.append(limit + 1)
+
+        with ANALYSIS_HISTORY_QUERY_SECONDS.labels(sort=query.sort).time():
+            rows = self._reader().execute(sql, params).fetchall()
+
+        page = AnalysisPage(items=[
+            {
+                "analysis_id": analysis_id,
+                "user": user,
+                "created": datetime.fromtimestamp(created).isoformat(),
+                "score": score,
+                "object_count": object_count,
+                "classes": classes.split(",") if classes else [],
+            }
+            for _, analysis_id, user, created, score, object_count, classes, _, _ in rows[:limit]
+        ])
+        if len(rows) > limit:
+            last = rows[limit - 1]
+            page.next_cursor = encode_cursor(query.sort, last[7], last[8])
+        return page
+
+    def stats(self) -> dict:
+        (count,) = self._reader().execute("SELECT COUNT(*) FROM analyses").fetchone()
+        return {
+            "backend": "sqlite",
+            "path": str(self.path),
+            "analyses": count,
+            "bytes": sum(
+                path.stat().st_size for path in self.path.parent.glob(self.path.name + "*") if path.is_file()
+            ),
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def create_repository(name: str = ANALYSIS_REPOSITORY) -> AnalysisRepository:
+    """Build the repository selected by ANALYSIS_REPOSITORY."""
+    if name != "sqlite":
+        logger.warning(f"Unknown ANALYSIS_REPOSITORY '{name}' - using SQLite")
+    return SQLiteAnalysisRepository()
+
+
+# ---------------------------------------------------------------------------
+# Writer
+# ---------------------------------------------------------------------------
+
+class AnalysisWriter:
+    """Batches history writes in a background thread."""
+
+    def __init__(
+        self,
+        repository: AnalysisRepository,
+        batch_size: int = ANALYSIS_WRITE_BATCH,
+        interval: float = ANALYSIS_WRITE_INTERVAL,
+        queue_size: int = ANALYSIS_QUEUE_SIZE
+    ):
+        self.repository = repository
+        self.batch_size = batch_size
+        self.interval = interval
+        self.queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self.dropped = 0
+
+    def submit(self, record: AnalysisRecord) -> bool:
+        """Queue a record for writing without blocking; False if the queue is full and it was dropped."""
+        self._ensure_started()
+        try:
+            self.queue.put_nowait(record)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            ANALYSIS_HISTORY_WRITES.labels(outcome="dropped").inc()
+            if self.dropped == 1 or self.dropped % 1000 == 0:
+                logger.warning(f"Analysis history queue full - {self.dropped} analyses dropped so far")
+            return False
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="analysis-history-writer", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            if self._stopping.is_set():
+                # Shutting down: write what is left, then exit instead of waiting for more
+                try:
+                    batch = [self.queue.get_nowait()]
+                except queue.Empty:
+                    return
+            else:
+                batch = [self.queue.get()]
+            deadline = time.monotonic() + self.interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            stop = None in batch
+            records = [record for record in batch if record is not None]
+            if records:
+                try:
+                    with ANALYSIS_HISTORY_BATCH_SECONDS.time():
+                        self.repository.add_many(records)
+                    ANALYSIS_HISTORY_WRITES.labels(outcome="written").inc(len(records))
+                except Exception as e:
+                    ANALYSIS_HISTORY_WRITES.labels(outcome="failed").inc(len(records))
+                    logger.error(f"Failed to write {len(records)} analyses to the history: {e}")
+            for _ in batch:
+                self.queue.task_done()
+            if stop:
+                return
+
+    def flush(self) -> None:
+        """Block until every queued record is written."""
+        if self._thread is not None and self._thread.is_alive():
+            self.queue.join()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Write what is queued and stop the thread, waiting at most timeout seconds."""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        self._stopping.set()
+        try:
+            # Wakes the thread if it is waiting on an empty queue; a full queue needs no wake-up
+            self.queue.put_nowait(None)
+        except queue.Full:
+            pass
+        self._thread.join(timeout)
+
+    def stats(self) -> dict:
+        return {
+            "queued": self.queue.qsize(),
+            "dropped": self.dropped,
+            "batch_size": self.batch_size,
+            "interval_seconds": self.interval,
+        }
+
+
+# Singleton instances
+_repository: Optional[AnalysisRepository] = None
+_writer: Optional[AnalysisWriter] = None
+_singleton_lock = threading.Lock()
+
+
+def get_analysis_repository() -> AnalysisRepository:
+    global _repository
+    with _singleton_lock:
+        if _repository is None:
+            _repository = create_repository()
+        return _repository
+
+
+def get_analysis_writer() -> AnalysisWriter:
+    global _writer
+    repository = get_analysis_repository()
+    with _singleton_lock:
+        if _writer is None:
+            _writer = AnalysisWriter(repository)
+            ANALYSIS_HISTORY_QUEUE.set_function(_writer.queue.qsize)
+        return _writer
+
+
+def record_analysis(analysis_id: str, user: str, response: dict) -> None:
+    """Queue an /analyze/ response for the history (returns immediately)."""
+    get_analysis_writer().submit(AnalysisRecord.from_response(analysis_id, user, response))
+
+
+def stop_analysis_history() -> None:
+    """Write queued analyses and stop the writer (at shutdown)."""
+    if _writer is not None:
+        _writer.stop()
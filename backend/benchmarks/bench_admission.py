@@ -0,0 +1,173 @@
+"""
+Load test: /analyze/ goodput at 2x capacity with and without admission control.
+
+The real app runs under uvicorn with stubbed services that model a fixed
+amount of CPU: detection and 3D generation each hold one of --cores "CPU"
+slots for their service time, the Gemini call is pure I/O latency. Capacity
+is therefore cores / detect_time requests per second.
+
+An open-loop client fires requests at --load x capacity for --duration
+seconds; one "heavy" client sends --heavy-share of the traffic, the rest is
+spread over light clients. Every request has a client-side deadline (--slo).
+For each mode the benchmark reports goodput (200s within the SLO per
+second), p50/p95 latency of good responses, fast 503s, timeouts, degraded
+responses and goodput per client class.
+
+Usage (from backend/):
+    python benchmarks/bench_admission.py --load 2 --duration 20
+"""
+
+import argparse
+import asyncio
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+import httpx
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import main  # noqa: E402
+from admission import AdmissionController, StageLimiter  # noqa: E402
+from metrics import ADMISSION_REJECTIONS  # noqa: E402
+from fakes import fake_detections, fake_gemini_response, free_port, start_server  # noqa: E402
+
+
+def install_stubs(cores: int, detect_time: float, llm_latency: float, model_3d_time: float) -> None:
+    cpu = threading.Semaphore(cores)
+
+    def detect(image_data, save_results=True, result_id=None, annotate=None):
+        with cpu:
+            # Annotating costs extra CPU when not skipped
+            time.sleep(detect_time * (1.25 if annotate is not False else 1.0))
+        return fake_detections(), "", ""
+
+    def call_gemini(image_data, detected_objects=None, rule_report=None):
+        time.sleep(llm_latency)
+        return fake_gemini_response(detected_objects)
+
+    def generate_3d(image_data, model_id):
+        main.model_generation_status[model_id] = {'status': 'processing', 'filename': None, 'error': None}
+        with cpu:
+            time.sleep(model_3d_time)
+        main.model_generation_status[model_id] = {'status': 'completed', 'filename': None, 'error': None}
+
+    async def generate_3d_background(image_data, model_id):
+        await asyncio.get_event_loop().run_in_executor(None, generate_3d, image_data, model_id)
+
+    main.detect_room_objects = detect
+    main.call_gemini_fengshui = call_gemini
+    main.generate_3d_model_background = generate_3d_background
+
+
+async def run_load(base_url: str, rate: float, duration: float, slo: float, heavy_share: float,
+                   light_clients: int, seed: int) -> list:
+    rng = np.random.default_rng(seed)
+    results = []
+
+    async def one(client: httpx.AsyncClient, client_id: str):
+        start = time.perf_counter()
+        try:
+            response = await client.post(
+                f"{base_url}/analyze/", params={"narrate": "false"},
+                files={"file": ("room.jpg", b"not-really-a-jpeg", "image/jpeg")},
+                headers={"X-Client-Id": client_id}, timeout=slo,
+            )
+            outcome = response.status_code
+            degraded = response.status_code == 200 and "degraded" in response.json()
+        except httpx.TimeoutException:
+            outcome, degraded = "timeout", False
+        results.append((client_id, outcome, time.perf_counter() - start, degraded))
+
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=200)
+    async with httpx.AsyncClient(limits=limits) as client:
+        tasks = []
+        next_arrival = time.perf_counter()
+        deadline = next_arrival + duration
+        while next_arrival < deadline:
+            await asyncio.sleep(max(0.0, next_arrival - time.perf_counter()))
+            heavy = rng.random() < heavy_share
+            client_id = "heavy" if heavy else f"light-{rng.integers(light_clients)}"
+            tasks.append(asyncio.create_task(one(client, client_id)))
+            next_arrival += rng.exponential(1 / rate)
+        await asyncio.gather(*tasks)
+    return results
+
+
+def report(name: str, results: list, duration: float, slo: float) -> None:
+    good = [r for r in results if r[1] == 200 and r[2] <= slo]
+    outcomes = Counter(r[1] for r in results)
+    latencies = [r[2] * 1000 for r in good]
+    heavy_good = sum(1 for r in good if r[0] == "heavy")
+    print(f"{name:<12} {len(results):>6} {len(good) / duration:>9.2f} "
+          f"{np.percentile(latencies, 50) if latencies else float('nan'):>8.0f} "
+          f"{np.percentile(latencies, 95) if latencies else float('nan'):>8.0f} "
+          f"{outcomes.get(503, 0):>6} {outcomes.get('timeout', 0):>8} "
+          f"{sum(1 for r in good if r[3]):>8} {heavy_good / duration:>10.2f} "
+          f"{(len(good) - heavy_good) / duration:>10.2f}")
+
+
+def main_benchmark() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cores", type=int, default=2, help="Simulated CPU slots")
+    parser.add_argument("--detect-time", type=float, default=0.2, help="CPU seconds per detection")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="Gemini latency (s)")
+    parser.add_argument("--model-3d-time", type=float, default=0.5, help="CPU seconds per 3D job")
+    parser.add_argument("--load", type=float, default=2.0, help="Offered load as a multiple of capacity")
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds of offered load per mode")
+    parser.add_argument("--slo", type=float, default=3.0, help="Client deadline (s)")
+    parser.add_argument("--heavy-share", type=float, default=0.6, help="Share of traffic from one client")
+    parser.add_argument("--light-clients", type=int, default=10)
+    args = parser.parse_args()
+
+    capacity = args.cores / args.detect_time
+    rate = capacity * args.load
+    install_stubs(args.cores, args.detect_time, args.llm_latency, args.model_3d_time)
+    port = free_port()
+    server = start_server(main.app, port)
+    base_url = f"http://127.0.0.1:{port}"
+
+    modes = {
+        "off": AdmissionController(enabled=False),
+        "admission": AdmissionController(
+            max_in_flight=int(capacity * args.slo),
+            stages={
+                "detect": StageLimiter("detect", args.cores, queue_size=int(capacity * args.slo / 2),
+                                       max_wait=args.slo / 2),
+                "llm": StageLimiter("llm", 64, queue_size=64, max_wait=args.slo / 2),
+            },
+            backlog_3d=main.count_unfinished_model_jobs,
+            model_3d_backlog=args.cores * 2,
+        ),
+    }
+
+    print(f"capacity ~{capacity:.1f} req/s, offered {rate:.1f} req/s for {args.duration:.0f}s, SLO {args.slo}s\n")
+    print(f"{'mode':<12} {'sent':>6} {'goodput':>9} {'p50 ms':>8} {'p95 ms':>8} {'503':>6} "
+          f"{'timeouts':>8} {'degraded':>8} {'heavy/s':>10} {'light/s':>10}")
+    rejections = []
+    for name, controller in modes.items():
+        main.admission = controller
+        main.model_generation_status.clear()
+        results = asyncio.run(run_load(base_url, rate, args.duration, args.slo, args.heavy_share,
+                                       args.light_clients, seed=1))
+        report(name, results, args.duration, args.slo)
+        # 503 and client timeouts are what admission control trades for goodput; anything else is a bug
+        errors = Counter(r[1] for r in results if r[1] not in (200, 503, "timeout"))
+        if errors:
+            server.should_exit = True
+            sys.exit(f"'{name}' mode: unexpected responses {dict(errors)}")
+        rejections.append((name, {key[0]: child.value for key, child in ADMISSION_REJECTIONS._children.items()}))
+        # Let the backlog (stuck detections, queued 3D jobs) drain between modes
+        while main.count_unfinished_model_jobs() or controller.in_flight:
+            time.sleep(0.2)
+        time.sleep(max(args.slo, 2.0))
+    server.should_exit = True
+    for name, counts in rejections:
+        print(f"rejections after '{name}': {counts}")
+
+
+if __name__ == "__main__":
+    main_benchmark()
@@ -0,0 +1,220 @@
+"""
+Benchmark: analysis history query latency at 10M rows, and the cost of writing it.
+
+A history of --rows synthetic analyses (--users clients, bench_rules' class
+mix, a year of timestamps) is loaded through SQLiteAnalysisRepository.add_many
+into --db (kept between runs; delete it or pass --rebuild to start over).
+Then every /analyses query shape is timed through the repository:
+  - newest first, a random deep page (keyset cursor) and the same depth
+    with OFFSET, which is what keyset pagination avoids
+  - a user's history (newest and best first), by class (common / rare),
+    min_score, user + class, best first, and the stored response by id
+
+Writes: the request path only queues a record (AnalysisWriter.submit), and
+the writer thread's throughput with realistic responses is measured on a
+fresh database.
+
+Usage (from backend/):
+    python benchmarks/bench_analysis_history.py                  # 10M rows, ~2.5 GB
+    python benchmarks/bench_analysis_history.py --rows 1000000 --db /tmp/history_1m.sqlite3
+"""
+
+import argparse
+import json
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from analysis_history import (  # noqa: E402
+    AnalysisQuery, AnalysisRecord, AnalysisWriter, SQLiteAnalysisRepository, encode_cursor
+)
+from bench_rules import CLASS_MIX  # noqa: E402
+from fakes import fake_detections, fake_gemini_response  # noqa: E402
+
+YEAR_SECONDS = 365 * 86400
+START = 1_700_000_000.0
+CLASSES = ["bed"] + list(CLASS_MIX)
+CLASS_WEIGHTS = np.array([4.0] + [weight for weight, _ in CLASS_MIX.values()])
+CHUNK = 50_000
+
+
+def synthetic_records(rng: np.random.Generator, start_row: int, count: int, rows: int, users: int) -> list:
+    """Analyses start_row .. start_row + count of the history, oldest first."""
+    created = START + (np.arange(start_row, start_row + count) + rng.random(count)) * (YEAR_SECONDS / rows)
+    user_ids = rng.integers(users, size=count)
+    scores = np.round(np.clip(rng.normal(6.0, 1.5, size=count), 1, 10), 1)
+    class_counts = rng.integers(2, 9, size=count)
+    probabilities = CLASS_WEIGHTS / CLASS_WEIGHTS.sum()
+    records = []
+    for i in range(count):
+        classes = sorted(set(rng.choice(CLASSES, size=class_counts[i], p=probabilities)))
+        records.append(AnalysisRecord(
+            analysis_id=f"bench_{start_row + i:09d}",
+            user=f"user_{user_ids[i]}",
+            created=float(created[i]),
+            score=float(scores[i]),
+            classes=classes,
+            object_count=int(class_counts[i]) + 2,
+            response={"score": float(scores[i])},
+        ))
+    return records
+
+
+def load(repository: SQLiteAnalysisRepository, rows: int, users: int) -> None:
+    existing = repository.stats()["analyses"]
+    if existing >= rows:
+        print(f"Reusing {existing:,} rows in {repository.path}")
+        return
+    rng = np.random.default_rng(existing)
+    start = time.perf_counter()
+    for offset in range(existing, rows, CHUNK):
+        repository.add_many(synthetic_records(rng, offset, min(CHUNK, rows - offset), rows, users))
+        done = offset + min(CHUNK, rows - offset)
+        if done % 1_000_000 < CHUNK:
+            elapsed = time.perf_counter() - start
+            print(f"  loaded {done:,} rows ({(done - existing) / elapsed:,.0f} rows/s)", flush=True)
+    print(f"Loaded {rows - existing:,} rows in {time.perf_counter() - start:.0f}s")
+
+
+def timed(function, repeats: int) -> list:
+    latencies = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def report(name: str, latencies: list, rows_returned: str = "") -> None:
+    ordered = sorted(latencies)
+    p95 = ordered[int(0.95 * (len(ordered) - 1))]
+    print(f"{name:<34} {statistics.median(ordered) * 1000:>9.2f} {p95 * 1000:>9.2f} "
+          f"{ordered[-1] * 1000:>9.2f} {rows_returned:>8}")
+
+
+def bench_queries(repository: SQLiteAnalysisRepository, rows: int, users: int, repeats: int, offset_repeats: int):
+    rng = random.Random(0)
+    conn = sqlite3.connect(f"file:{repository.path}?mode=ro", uri=True)
+    max_id = conn.execute("SELECT MAX(id) FROM analyses").fetchone()[0]
+
+    def random_row() -> tuple:
+        return conn.execute(
+            "SELECT id, created, score, user FROM analyses WHERE id >= ? LIMIT 1", (rng.randint(1, max_id),)
+        ).fetchone()
+
+    returned = {}
+
+    def run(name: str, make_query, count: int = repeats) -> None:
+        queries = [make_query() for _ in range(count)]
+        pages = []
+        latencies = []
+        for query in queries:
+            start = time.perf_counter()
+            pages.append(repository.query(query))
+            latencies.append(time.perf_counter() - start)
+        returned[name] = statistics.mean(len(page.items) for page in pages)
+        report(name, latencies, f"{returned[name]:.0f}")
+
+    print(f"\n{'query (50 per page)':<34} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9} {'rows':>8}")
+    run("newest first", lambda: AnalysisQuery())
+
+    def deep_created() -> AnalysisQuery:
+        row_id, created, _, _ = random_row()
+        return AnalysisQuery(cursor=encode_cursor("created", created, row_id))
+    run("random deep page (cursor)", deep_created)
+
+    def offset_page() -> None:
+        depth = max_id - random_row()[0]
+        conn.execute(
+            "SELECT id, analysis_id, user, created, score, object_count, classes FROM analyses "
+            "ORDER BY created DESC, id DESC LIMIT 51 OFFSET ?", (depth,)
+        ).fetchall()
+    report("random deep page (OFFSET)", timed(offset_page, offset_repeats), "50")
+
+    run("user history", lambda: AnalysisQuery(user=f"user_{rng.randrange(users)}"))
+    run("user history, best first", lambda: AnalysisQuery(user=f"user_{rng.randrange(users)}", sort="score"))
+    run("class=bed (common)", lambda: AnalysisQuery(object_class="bed"))
+
+    def deep_class() -> AnalysisQuery:
+        row_id, created, _, _ = random_row()
+        return AnalysisQuery(object_class="bed", cursor=encode_cursor("created", created, row_id))
+    run("class=bed, random deep page", deep_class)
+    run("class=toilet (rare)", lambda: AnalysisQuery(object_class="toilet"))
+    run("min_score=9", lambda: AnalysisQuery(min_score=9))
+    run("user + class=bed", lambda: AnalysisQuery(user=f"user_{rng.randrange(users)}", object_class="bed"))
+    run("best first", lambda: AnalysisQuery(sort="score"))
+
+    def deep_score() -> AnalysisQuery:
+        row_id, _, score, _ = random_row()
+        return AnalysisQuery(sort="score", cursor=encode_cursor("score", score, row_id))
+    run("best first, random deep page", deep_score)
+
+    def last_month() -> AnalysisQuery:
+        until = START + YEAR_SECONDS * rng.random()
+        return AnalysisQuery(since=until - 30 * 86400, until=until, min_score=8)
+    run("30-day window, min_score=8", last_month)
+
+    ids = [f"bench_{rng.randrange(rows):09d}" for _ in range(repeats)]
+    report("response by id", timed(lambda: repository.get(ids.pop()), repeats), "1")
+
+
+def bench_writes(directory: Path, records: int) -> None:
+    """Request-path cost of queueing an analysis and the writer's throughput with real responses."""
+    response = json.loads(fake_gemini_response())
+    response["detected_objects"] = fake_detections().to_list()
+    response["tooltips"] = [{"object_index": i, "message": "x" * 80} for i in range(4)]
+    repository = SQLiteAnalysisRepository(directory / "writes.sqlite3")
+    writer = AnalysisWriter(repository, queue_size=records)
+
+    submit_times = []
+    start = time.perf_counter()
+    for i in range(records):
+        t = time.perf_counter()
+        writer.submit(AnalysisRecord.from_response(f"write_{i}", f"user_{i % 100}", response))
+        submit_times.append(time.perf_counter() - t)
+    writer.flush()
+    elapsed = time.perf_counter() - start
+    writer.stop()
+
+    response_bytes = len(json.dumps(response))
+    print(f"\nWrites ({response_bytes:,} byte responses): request path {statistics.median(submit_times) * 1e6:.1f} us "
+          f"p50 / {sorted(submit_times)[int(0.99 * (records - 1))] * 1e6:.1f} us p99 per analysis; "
+          f"writer {records / elapsed:,.0f} analyses/s in batches of {writer.batch_size}")
+    size = sum(path.stat().st_size for path in directory.glob("writes.sqlite3*"))
+    print(f"  {size / records:,.0f} bytes per analysis on disk (indexes and compressed response)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10_000_000, help="Analyses in the history")
+    parser.add_argument("--users", type=int, default=100_000, help="Distinct users")
+    parser.add_argument("--db", type=Path, default=Path(tempfile.gettempdir()) / "bench_analysis_history.sqlite3")
+    parser.add_argument("--rebuild", action="store_true", help="Delete --db first")
+    parser.add_argument("--queries", type=int, default=200, help="Repetitions per query shape")
+    parser.add_argument("--offset-queries", type=int, default=10, help="Repetitions of the OFFSET comparison")
+    parser.add_argument("--writes", type=int, default=20_000, help="Analyses for the write benchmark")
+    args = parser.parse_args()
+
+    if args.rebuild:
+        for path in args.db.parent.glob(args.db.name + "*"):
+            path.unlink()
+    repository = SQLiteAnalysisRepository(args.db)
+    load(repository, args.rows, args.users)
+    stats = repository.stats()
+    print(f"{stats['analyses']:,} analyses, {args.users:,} users, {stats['bytes'] / 2 ** 30:.2f} GB")
+
+    bench_queries(repository, args.rows, args.users, args.queries, args.offset_queries)
+    with tempfile.TemporaryDirectory() as directory:
+        bench_writes(Path(directory), args.writes)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Benchmark: detection throughput vs. concurrency with the CPU budget on and off.
+
+Each (mode, concurrency) pair runs in a fresh process, because PyTorch and
+OpenCV thread pools are process-wide:
+  - off: library defaults (PyTorch and OpenCV size themselves to every core)
+  - on:  cpu_budget.apply_cpu_budget() with the budget derived for that many
+         concurrent detections
+
+Every request does what /analyze/ does on the CPU: decode a photo, an
+OpenCV resize/blur pass, and a YOLO forward pass. With --hog a stand-in for
+Blender runs alongside (a NumPy matmul loop whose BLAS pool sizes itself to
+the machine; with the budget on it gets the 3D thread count, lower priority
+and, with CPU_BUDGET_AFFINITY, its own cores).
+
+Without network access use an untrained model (--model-format yaml): the
+timings are representative, the detections are not. On a single-core box
+both modes necessarily end up with one thread per pool.
+
+Usage (from backend/):
+    python benchmarks/bench_cpu_budget.py --model-format yaml
+    python benchmarks/bench_cpu_budget.py --concurrency 1,2,4,8 --hog
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+DATA_DIR = Path(__file__).resolve().parent.parent.parent / "data"
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png"}
+
+HOG = """
+import numpy as np
+a = np.random.rand(512, 512)
+while True:
+    a = np.tanh(a @ a)
+"""
+
+
+def run_worker(args) -> None:
+    """Measure one (mode, concurrency) pair and print a JSON result line."""
+    import cpu_budget
+    budget = cpu_budget.derive_cpu_budget(detect_concurrency=args.concurrency)
+    if args.mode == "on":
+        cpu_budget.apply_cpu_budget(budget)
+
+    import cv2
+    import numpy as np
+    from object_detection import DETECTION_PROFILES, ObjectDetector, load_detection_profile
+
+    hog = None
+    if args.hog:
+        env = cpu_budget.model_3d_env() if args.mode == "on" else dict(os.environ)
+        hog = subprocess.Popen([sys.executable, "-c", HOG], env=env)
+        if args.mode == "on":
+            os.setpriority(os.PRIO_PROCESS, hog.pid, 10)
+            if budget.affinity:
+                os.sched_setaffinity(hog.pid, budget.model_3d_cpus)
+
+    try:
+        profile = DETECTION_PROFILES[args.profile] if args.profile else load_detection_profile()
+        if args.model_format:
+            profile = replace(profile, model_format=args.model_format)
+        detector = ObjectDetector(profile=profile)
+        images = [
+            path.read_bytes() for path in sorted(args.images.iterdir())
+            if path.suffix.lower() in IMAGE_EXTENSIONS
+        ]
+        detector.detect_objects(images[0])
+
+        def request(i: int) -> float:
+            start = time.perf_counter()
+            image = cv2.imdecode(np.frombuffer(images[i % len(images)], dtype=np.uint8), cv2.IMREAD_COLOR)
+            large = cv2.resize(image, (3840, 2160), interpolation=cv2.INTER_CUBIC)
+            cv2.GaussianBlur(large, (9, 9), 0)
+            detector.detect_objects(images[i % len(images)])
+            return time.perf_counter() - start
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            latencies = list(executor.map(request, range(args.requests)))
+        elapsed = time.perf_counter() - start
+    finally:
+        if hog is not None:
+            hog.kill()
+            hog.wait()
+
+    runtime = cpu_budget.runtime_threads()
+    print(json.dumps({
+        "throughput": args.requests / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": sorted(latencies)[int(0.95 * (len(latencies) - 1))] * 1000,
+        "torch_threads": runtime.get("torch_threads"),
+        "opencv_threads": runtime["opencv_threads"],
+    }))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=Path, default=DATA_DIR, help="Directory of room images")
+    parser.add_argument("--profile", default=None, help="Detection profile (default: DETECTION_PROFILE)")
+    parser.add_argument("--model-format", default=None, help="Override weights format (e.g. onnx, yaml)")
+    parser.add_argument("--concurrency", default="1,2,4", help="Concurrent requests to test")
+    parser.add_argument("--requests", type=int, default=24, help="Requests per run")
+    parser.add_argument("--hog", action="store_true", help="Run a Blender stand-in alongside")
+    parser.add_argument("--mode", choices=("on", "off"), help=argparse.SUPPRESS)
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        args.concurrency = int(args.concurrency)
+        run_worker(args)
+        return
+
+    import cpu_budget
+    print(f"{len(cpu_budget.available_cpus())} CPUs available, cgroup quota {cpu_budget.cgroup_cpu_quota()}, "
+          f"{args.requests} requests per run{', Blender stand-in running' if args.hog else ''}\n")
+    print(f"{'budget':<7} {'conc':>5} {'torch thr':>9} {'cv2 thr':>8} {'req/s':>7} {'p50 ms':>8} {'p95 ms':>8}")
+    for concurrency in [int(value) for value in args.concurrency.split(",")]:
+        for mode in ("off", "on"):
+            command = [sys.executable, __file__, "--worker", "--mode", mode, "--concurrency", str(concurrency),
+                       "--requests", str(args.requests), "--images", str(args.images)]
+            if args.profile:
+                command += ["--profile", args.profile]
+            if args.model_format:
+                command += ["--model-format", args.model_format]
+            if args.hog:
+                command.append("--hog")
+            output = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(f"{mode:<7} {concurrency:>5} {result['torch_threads']:>9} {result['opencv_threads']:>8} "
+                  f"{result['throughput']:>7.2f} {result['p50_ms']:>8.0f} {result['p95_ms']:>8.0f}")
+
+
+if __name__ == "__main__":
+    main()
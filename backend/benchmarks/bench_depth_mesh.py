@@ -0,0 +1,162 @@
+"""
+Benchmark: in-process depth-to-mesh backend vs the Blender service on data/ images.
+
+For every image the depth backend's phases (decode, depth inference, mesh
+build, file write) are timed in-process, then whole jobs are timed through
+DepthMeshGenerator both inline and through the process pool (which adds
+pickling the image and result across the process boundary). The Blender
+path is timed end to end (health check, upload, processing, download) when
+the service answers on BLENDER_SERVICE_URL, and skipped otherwise.
+
+A last section regenerates each room at other detail/strength settings to
+show what the depth-map and mesh caches save (caches live in a temp dir).
+
+The real depth model is not shipped: put depth_anything_v2_vits.onnx in
+backend/models/ (or pass --depth-model-dir). For offline runs, --stand-in
+exports a small random-weight network with the same input/output layout;
+its inference time is far below the real ViT-S, so only the mesh/write/pool
+numbers are meaningful then.
+
+Usage (from backend/):
+    python benchmarks/bench_depth_mesh.py --detail 10 --repeat 3
+    python benchmarks/bench_depth_mesh.py --stand-in --workers 2
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+DATA_DIR = BACKEND_DIR.parent / "data"
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+
+
+def export_stand_in_model(directory: Path) -> None:
+    """Random-weight conv net with the Depth Anything V2 I/O layout (needs torch + onnx)."""
+    import torch
+    from torch import nn
+
+    class StandIn(nn.Module):
+        def __init__(self):
+            super().__init__()
+            widths = [3, 32, 64, 128, 256]
+            self.encoder = nn.Sequential(*[
+                layer for i in range(4) for layer in (nn.Conv2d(widths[i], widths[i + 1], 3, 2, 1), nn.ReLU())
+            ])
+            self.decoder = nn.Sequential(nn.Conv2d(256, 64, 3, 1, 1), nn.ReLU(), nn.Conv2d(64, 1, 3, 1, 1))
+
+        def forward(self, x):
+            y = self.decoder(self.encoder(x))
+            return nn.functional.interpolate(y, size=x.shape[-2:], mode="bilinear")[:, 0]
+
+    torch.onnx.export(
+        StandIn().eval(), torch.randn(1, 3, 518, 518), str(directory / "depth_anything_v2_vits.onnx"),
+        input_names=["pixel_values"], output_names=["predicted_depth"], dynamo=False
+    )
+
+
+def summarize(samples: list) -> str:
+    return f"{statistics.median(samples) * 1000:>8.0f} {max(samples) * 1000:>8.0f}"
+
+
+def main_benchmark() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--depth-model-dir", type=Path, help="Directory with depth_anything_v2_<size>.onnx")
+    parser.add_argument("--stand-in", action="store_true", help="Export and use a stand-in depth model")
+    parser.add_argument("--detail", type=int, default=10)
+    parser.add_argument("--strength", type=float, default=0.6)
+    parser.add_argument("--format", choices=("fbx", "glb"), default="fbx")
+    parser.add_argument("--workers", type=int, default=1, help="Process pool size for the pooled run")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    temp_dir = tempfile.TemporaryDirectory()
+    if args.stand_in:
+        export_stand_in_model(Path(temp_dir.name))
+        os.environ["DEPTH_MODEL_DIR"] = temp_dir.name
+    elif args.depth_model_dir:
+        os.environ["DEPTH_MODEL_DIR"] = str(args.depth_model_dir)
+    os.environ["DEPTH_CACHE_DIR"] = str(Path(temp_dir.name) / "cache")
+
+    # Configuration is read on import, after DEPTH_MODEL_DIR is set (pool workers inherit it)
+    sys.path.insert(0, str(BACKEND_DIR))
+    import depth_mesh
+    from depth_cache import get_depth_cache, get_mesh_cache
+    from model_generation import DepthMeshGenerator, ModelGenerator
+
+    images = [(p.name, p.read_bytes()) for p in sorted(DATA_DIR.iterdir()) if p.suffix.lower() in IMAGE_EXTENSIONS]
+    if not depth_mesh.depth_model_path().exists():
+        sys.exit(f"Depth model not found at {depth_mesh.depth_model_path()} (use --depth-model-dir or --stand-in)")
+
+    # Phase breakdown, in-process
+    print(f"{len(images)} images from {DATA_DIR}, detail={args.detail}, format={args.format}\n")
+    print(f"{'image':<44} {'decode':>8} {'depth':>8} {'mesh':>8} {'write':>8} {'total':>8} {'MB':>6}")
+    depth_mesh.generate_mesh_file(images[0][1], detail=args.detail, mesh_format=args.format)  # load the model
+    for name, data in images:
+        runs = [depth_mesh.generate_mesh_file(data, detail=args.detail, strength=args.strength,
+                                              mesh_format=args.format) for _ in range(args.repeat)]
+        phases = {phase: statistics.median(r[1][phase] for r in runs) for phase in runs[0][1]}
+        print(f"{name[:44]:<44} " + " ".join(f"{seconds * 1000:>8.1f}" for seconds in phases.values())
+              + f" {sum(phases.values()) * 1000:>8.1f} {len(runs[0][0]) / 1e6:>6.2f}")
+
+    # Whole jobs through the generators (nothing saved)
+    print(f"\n{'backend':<28} {'jobs':>5} {'p50 ms':>8} {'max ms':>8} {'jobs/s':>8}")
+    jobs = [data for _, data in images] * args.repeat
+
+    def run(generator, concurrency: int, label: str, jobs=jobs, detail=args.detail, strength=args.strength) -> None:
+        def one(data):
+            start = time.perf_counter()
+            path, message = generator.generate_3d_model(
+                data, detail=detail, strength=strength, save_results=False
+            )
+            if "generated" not in message:
+                raise RuntimeError(message)
+            return time.perf_counter() - start
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as executor:
+            latencies = list(executor.map(one, jobs))
+        elapsed = time.perf_counter() - start
+        print(f"{label:<28} {len(jobs):>5} {summarize(latencies)} {len(jobs) / elapsed:>8.2f}")
+
+    def clear_caches() -> None:
+        get_depth_cache().clear()
+        get_mesh_cache().clear()
+
+    inline = DepthMeshGenerator(workers=0, mesh_format=args.format)
+    for _ in range(args.repeat):
+        clear_caches()
+        run(inline, 1, "depth, inline, cold", jobs=[data for _, data in images])
+    pooled = DepthMeshGenerator(workers=args.workers, mesh_format=args.format)
+    pooled.generate_3d_model(images[0][1], save_results=False)  # start and warm the workers
+    for _ in range(args.repeat):
+        clear_caches()
+        run(pooled, args.workers, f"depth, pool x{args.workers}, cold", jobs=[data for _, data in images])
+
+    # Regeneration: same rooms, other mesh parameters, then the same parameters again
+    print(f"\n{'regenerate (inline)':<28} {'jobs':>5} {'p50 ms':>8} {'max ms':>8} {'jobs/s':>8}")
+    clear_caches()
+    rooms = [data for _, data in images]
+    run(inline, 1, f"detail {args.detail}, cold", jobs=rooms)
+    run(inline, 1, f"detail {args.detail * 2}, depth cached", jobs=rooms, detail=args.detail * 2)
+    run(inline, 1, "strength 1.0, depth cached", jobs=rooms, detail=args.detail * 2, strength=1.0)
+    run(inline, 1, f"detail {args.detail}, mesh cached", jobs=rooms)
+    for cache in (get_depth_cache(), get_mesh_cache()):
+        print(f"  {cache.stage} cache: {cache.stats()}")
+    pooled.shutdown()
+
+    blender = ModelGenerator()
+    if blender.check_service_health():
+        run(blender, 1, "blender service", jobs=[data for _, data in images])
+    else:
+        print(f"{'blender service':<28} unavailable at {blender.service_url} (start it to compare)")
+    temp_dir.cleanup()
+
+
+if __name__ == "__main__":
+    main_benchmark()
@@ -0,0 +1,162 @@
+"""
+Benchmark: on-demand derivative images vs. eager annotation.
+
+For the room photos in data/ (with synthetic detection boxes) reports
+  - the per-analysis cost of eager annotation (draw + full-size JPEG encode
+    + store) against storing only the original upload
+  - first-render latency and size per variant, width and format
+  - cache-hit latency (record lookup + cache check) and the hit ratio of a
+    gallery-like request mix
+  - coalescing: concurrent requests for one uncached derivative and how
+    many renders they caused
+
+Storage and the derivative cache live in a temp directory.
+
+Usage (from backend/):
+    python benchmarks/bench_derivatives.py
+    python benchmarks/bench_derivatives.py --widths 320,1280 --formats jpeg,webp --concurrency 32
+"""
+
+import argparse
+import asyncio
+import io
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+TEMP_DIR = tempfile.TemporaryDirectory()
+os.environ["STORAGE_ROOT"] = TEMP_DIR.name
+os.environ["STORAGE_INDEX_PATH"] = str(Path(TEMP_DIR.name) / "storage_index.sqlite3")
+os.environ["DERIVATIVE_CACHE_DIR"] = str(Path(TEMP_DIR.name) / "derivative_cache")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import object_detection  # noqa: E402
+from derivatives import IMAGE_FORMATS, get_derivative_service  # noqa: E402
+from object_detection import Detections, ObjectDetector  # noqa: E402
+from PIL import Image  # noqa: E402
+
+DATA_DIR = Path(__file__).resolve().parent.parent.parent / "data"
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp"}
+CLASSES = ("bed", "chair", "couch", "potted plant", "tv", "dining table", "lamp", "mirror")
+
+
+def synthetic_detections(rng: random.Random, size: tuple, count: int) -> Detections:
+    width, height = size
+    detections = []
+    for _ in range(count):
+        x1, y1 = rng.uniform(0, width * 0.8), rng.uniform(0, height * 0.8)
+        x2, y2 = rng.uniform(x1 + 10, width), rng.uniform(y1 + 10, height)
+        detections.append({
+            "class": rng.choice(CLASSES),
+            "confidence": round(rng.uniform(0.3, 0.95), 3),
+            "bbox": {"x1": x1, "y1": y1, "x2": x2, "y2": y2},
+        })
+    return Detections.from_list(detections, size)
+
+
+def median_ms(fn, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=Path, default=DATA_DIR, help="Directory of room images")
+    parser.add_argument("--objects", type=int, default=12, help="Synthetic detections per image")
+    parser.add_argument("--widths", default="320,640,1280", help="Widths to render")
+    parser.add_argument("--formats", default=",".join(IMAGE_FORMATS), help="Formats to render")
+    parser.add_argument("--repeat", type=int, default=3, help="Repetitions of each timed save")
+    parser.add_argument("--requests", type=int, default=2000, help="Requests in the gallery mix")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent requests for one derivative")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    images = [
+        path.read_bytes() for path in sorted(args.images.iterdir())
+        if path.suffix.lower() in IMAGE_EXTENSIONS
+    ]
+    if not images:
+        sys.exit(f"No images found in {args.images}")
+    rooms = [(image, synthetic_detections(rng, Image.open(io.BytesIO(image)).size, args.objects)) for image in images]
+    detector = ObjectDetector.__new__(ObjectDetector)  # save_results needs no model
+    service = get_derivative_service()
+
+    # Per-analysis save cost
+    print(f"{len(rooms)} rooms, {args.objects} boxes each\n")
+    print(f"{'save at analysis time':<26} {'median ms':>10}")
+    for label, eager in (("original only (default)", False), ("eager annotated JPEG", True)):
+        object_detection.EAGER_ANNOTATION = eager
+        per_room = [
+            median_ms(lambda: detector.save_results(image, detections), args.repeat)
+            for image, detections in rooms
+        ]
+        print(f"{label:<26} {statistics.mean(per_room):>10.1f}")
+    object_detection.EAGER_ANNOTATION = False
+
+    ids = []
+    for i, (image, detections) in enumerate(rooms):
+        detector.save_results(image, detections, f"bench_{i:03d}")
+        ids.append(f"bench_{i:03d}")
+
+    # First render per variant / width / format
+    widths = [int(width) for width in args.widths.split(",")]
+    formats = [fmt for fmt in args.formats.split(",") if fmt in IMAGE_FORMATS]
+    print(f"\n{'variant':<10} {'width':>6} {'format':>6} {'render ms':>10} {'KB':>7}")
+    for variant in ("original", "annotated"):
+        for width in widths:
+            for fmt in formats:
+                times, sizes = [], []
+                for analysis_id in ids:
+                    plan = service.plan(analysis_id, variant, width, fmt)
+                    start = time.perf_counter()
+                    path = service._render(plan)
+                    times.append(time.perf_counter() - start)
+                    sizes.append(path.stat().st_size)
+                print(f"{variant:<10} {width:>6} {fmt:>6} {statistics.median(times) * 1000:>10.1f} "
+                      f"{statistics.mean(sizes) / 1024:>7.1f}")
+
+    # Cache hits: what a repeat request costs before the file is sent
+    hit = median_ms(lambda: service.plan(ids[0], "annotated", widths[0], formats[0]), 200)
+    print(f"\ncache hit (record lookup + cache check): {hit:.2f} ms")
+
+    # Gallery mix: mostly thumbnails of a few popular rooms, some full-size views
+    service.cache.clear()
+    service.cache.hits = service.cache.misses = 0
+    for _ in range(args.requests):
+        analysis_id = ids[min(int(rng.expovariate(1.5)), len(ids) - 1)]
+        variant = rng.choice(("original", "annotated"))
+        width = widths[0] if rng.random() < 0.8 else widths[-1]
+        fmt = rng.choice(formats)
+        plan = service.plan(analysis_id, variant, width, fmt)
+        if plan.path is None:
+            service._render(plan)
+    stats = service.cache.stats()
+    print(f"gallery mix: {args.requests} requests, hit ratio {stats['hit_ratio']:.3f}, "
+          f"{stats['entries']} cached files, {stats['bytes'] / 1e6:.1f} MB")
+
+    # Coalescing
+    async def concurrent() -> None:
+        plan = service.plan(ids[-1], "annotated", widths[-1], formats[0])
+        service.cache.clear()
+        before = service.renders
+        start = time.perf_counter()
+        paths = await asyncio.gather(*[service.render(plan) for _ in range(args.concurrency)])
+        elapsed = time.perf_counter() - start
+        print(f"\n{args.concurrency} concurrent requests for one uncached derivative: "
+              f"{service.renders - before} render(s), {len(set(paths))} file, {elapsed * 1000:.0f} ms total")
+
+    asyncio.run(concurrent())
+    TEMP_DIR.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Microbenchmark: YOLO result post-processing, per-box loop vs columnar Detections.
+
+Builds synthetic ultralytics Results with 20-300 boxes and times
+  - legacy: the original per-box parsing loop (3 .cpu() calls per box + dicts)
+  - columnar: Detections.from_result() only (what detect_objects now does)
+  - columnar+json: Detections.from_result().to_list() (serialized at the API boundary)
+
+Usage (from backend/):
+    python benchmarks/bench_detection_postprocess.py
+"""
+
+import sys
+import timeit
+from pathlib import Path
+
+import numpy as np
+import torch
+from ultralytics.engine.results import Results
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from object_detection import Detections  # noqa: E402
+
+COCO_NAMES = {i: f"class_{i}" for i in range(80)}
+
+
+def make_result(n: int, seed: int = 0) -> Results:
+    rng = np.random.default_rng(seed)
+    xy = rng.uniform(0, 1500, size=(n, 2))
+    wh = rng.uniform(20, 400, size=(n, 2))
+    data = np.column_stack([
+        xy, xy + wh,
+        rng.uniform(0.25, 1.0, size=n),
+        rng.integers(0, 80, size=n),
+    ]).astype(np.float32)
+    image = np.zeros((1920, 1920, 3), dtype=np.uint8)
+    return Results(image, path="bench.jpg", names=COCO_NAMES, boxes=torch.from_numpy(data))
+
+
+def legacy_parse(result) -> list:
+    """The original per-box loop from ObjectDetector.detect_objects."""
+    detections = []
+    boxes = result.boxes
+    for i in range(len(boxes)):
+        bbox = boxes.xyxy[i].cpu().numpy()
+        x1, y1, x2, y2 = bbox
+        class_id = int(boxes.cls[i].cpu().numpy())
+        confidence = float(boxes.conf[i].cpu().numpy())
+        class_name = result.names[class_id]
+        width = x2 - x1
+        height = y2 - y1
+        center_x = (x1 + x2) / 2
+        center_y = (y1 + y2) / 2
+        detections.append({
+            "class": class_name,
+            "confidence": round(confidence, 3),
+            "bbox": {
+                "x1": round(float(x1), 2),
+                "y1": round(float(y1), 2),
+                "x2": round(float(x2), 2),
+                "y2": round(float(y2), 2),
+                "width": round(float(width), 2),
+                "height": round(float(height), 2)
+            },
+            "center": {
+                "x": round(float(center_x), 2),
+                "y": round(float(center_y), 2)
+            }
+        })
+    return detections
+
+
+def time_us(fn, repeat: int = 5, number: int = 50) -> float:
+    """Best-of-repeat mean time per call in microseconds."""
+    return min(timeit.repeat(fn, repeat=repeat, number=number)) / number * 1e6
+
+
+def main() -> None:
+    print(f"{'boxes':>6} {'legacy us':>11} {'columnar us':>12} {'+to_list us':>12} {'speedup':>8}")
+    for n in (20, 50, 100, 200, 300):
+        result = make_result(n)
+
+        # Sanity check: both paths produce the same payload shape
+        assert len(legacy_parse(result)) == len(Detections.from_result(result).to_list()) == n
+
+        legacy = time_us(lambda: legacy_parse(result))
+        columnar = time_us(lambda: Detections.from_result(result))
+        serialized = time_us(lambda: Detections.from_result(result).to_list())
+        print(f"{n:>6} {legacy:>11.1f} {columnar:>12.1f} {serialized:>12.1f} {legacy / serialized:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
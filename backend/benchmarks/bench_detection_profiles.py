@@ -0,0 +1,134 @@
+"""
+Benchmark matrix: detection latency and furniture recall per detection profile.
+
+Runs every image in data/ through each profile and reports mean / p95
+latency per image plus furniture recall, measured against the reference
+profile (default: 'full', i.e. yolo11x with all 80 COCO classes). A
+reference furniture box counts as found when the profile reports the same
+class with IoU >= 0.5.
+
+Usage (from backend/):
+    python benchmarks/bench_detection_profiles.py
+    python benchmarks/bench_detection_profiles.py --profiles accurate,fast --sizes n,s,m
+"""
+
+import argparse
+import sys
+import time
+from dataclasses import replace
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from object_detection import (  # noqa: E402
+    DETECTION_PROFILES,
+    FURNITURE_CLASSES,
+    Detections,
+    ObjectDetector,
+)
+
+DATA_DIR = Path(__file__).resolve().parent.parent.parent / "data"
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp"}
+
+
+def pairwise_iou(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """IoU matrix between (N, 4) and (M, 4) xyxy boxes."""
+    top_left = np.maximum(a[:, None, :2], b[None, :, :2])
+    bottom_right = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    intersection = np.prod(np.clip(bottom_right - top_left, 0, None), axis=2)
+    area_a = np.prod(a[:, 2:] - a[:, :2], axis=1)
+    area_b = np.prod(b[:, 2:] - b[:, :2], axis=1)
+    return intersection / (area_a[:, None] + area_b[None, :] - intersection + 1e-9)
+
+
+def furniture_matches(reference: Detections, candidate: Detections, iou_threshold: float = 0.5) -> tuple:
+    """Return (matched, total) furniture boxes of reference found in candidate."""
+    ref_names = np.array(reference.class_names, dtype=object)
+    cand_names = np.array(candidate.class_names, dtype=object)
+    ref_mask = np.isin(ref_names, FURNITURE_CLASSES)
+    total = int(ref_mask.sum())
+    if total == 0 or len(candidate) == 0:
+        return 0, total
+
+    ious = pairwise_iou(reference.xyxy[ref_mask], candidate.xyxy)
+    ious[ref_names[ref_mask][:, None] != cand_names[None, :]] = 0.0
+
+    # Greedy one-to-one matching, best IoU first
+    matched = 0
+    used = np.zeros(len(candidate), dtype=bool)
+    for row in np.argsort(-ious.max(axis=1)):
+        scores = np.where(used, 0.0, ious[row])
+        best = int(np.argmax(scores))
+        if scores[best] >= iou_threshold:
+            used[best] = True
+            matched += 1
+    return matched, total
+
+
+def run_profile(profile, images: list, warmup: int) -> tuple:
+    """Return (latencies_ms, detections_per_image) for one profile."""
+    detector = ObjectDetector(profile=profile)
+    for _ in range(warmup):
+        detector.detect_objects(images[0])
+
+    latencies = []
+    detections = []
+    for image_data in images:
+        start = time.perf_counter()
+        detections.append(detector.detect_objects(image_data))
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies, detections
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=Path, default=DATA_DIR, help="Directory of room images")
+    parser.add_argument("--profiles", default=",".join(DETECTION_PROFILES),
+                        help="Comma-separated profile names to benchmark")
+    parser.add_argument("--sizes", default="",
+                        help="Also benchmark the 'accurate' profile at these model sizes (e.g. n,s,m,l)")
+    parser.add_argument("--reference", default="full", help="Profile used as recall ground truth")
+    parser.add_argument("--model-format", default=None, help="Override weights format (e.g. onnx)")
+    parser.add_argument("--warmup", type=int, default=1, help="Warm-up inferences per profile")
+    args = parser.parse_args()
+
+    images = [
+        path.read_bytes() for path in sorted(args.images.iterdir())
+        if path.suffix.lower() in IMAGE_EXTENSIONS
+    ]
+    if not images:
+        sys.exit(f"No images found in {args.images}")
+
+    profiles = [DETECTION_PROFILES[name] for name in args.profiles.split(",") if name]
+    for size in filter(None, args.sizes.split(",")):
+        profiles.append(replace(DETECTION_PROFILES["accurate"], name=f"accurate-{size}", model_size=size))
+    if args.model_format:
+        profiles = [replace(p, model_format=args.model_format) for p in profiles]
+
+    reference_profile = DETECTION_PROFILES[args.reference]
+    if args.model_format:
+        reference_profile = replace(reference_profile, model_format=args.model_format)
+    _, reference = run_profile(reference_profile, images, args.warmup)
+
+    print(f"{len(images)} images, recall reference: {reference_profile.name} ({reference_profile.model_name})\n")
+    print(f"{'profile':<14} {'model':<12} {'imgsz':>5} {'classes':>7} {'max_det':>7} "
+          f"{'mean ms':>8} {'p95 ms':>8} {'img/s':>6} {'recall':>7}")
+
+    for profile in profiles:
+        latencies, detections = run_profile(profile, images, args.warmup)
+        matched = total = 0
+        for ref, cand in zip(reference, detections):
+            m, t = furniture_matches(ref, cand)
+            matched += m
+            total += t
+        recall = f"{matched / total:.3f}" if total else "n/a"
+        classes = len(profile.classes) if profile.classes else 80
+        print(f"{profile.name:<14} {profile.model_name:<12} {profile.imgsz:>5} {classes:>7} {profile.max_det:>7} "
+              f"{np.mean(latencies):>8.1f} {np.percentile(latencies, 95):>8.1f} "
+              f"{1000 / np.mean(latencies):>6.2f} {recall:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Benchmark: cost of the metrics instrumentation.
+
+Measures the primitive operations used on hot paths (counter increment,
+histogram observe, timer context manager) and the end-to-end overhead on
+/analyze/ by running the real app under uvicorn with stubbed detection and
+Gemini, with and without MetricsMiddleware and stage timers. Also reports
+the cost of rendering /metrics once the registry is populated.
+
+Usage (from backend/):
+    python benchmarks/bench_metrics_overhead.py --requests 300
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+import timeit
+from pathlib import Path
+
+import numpy as np
+import requests
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import main  # noqa: E402
+import metrics  # noqa: E402
+from fakes import fake_detections, fake_gemini_response, free_port, start_server  # noqa: E402
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+class _NullStage:
+    """Stand-in for a histogram child with recording switched off."""
+
+    def time(self):
+        return _NullTimer()
+
+    def observe(self, value):
+        pass
+
+
+def micro_benchmarks(iterations: int) -> None:
+    registry = metrics.Registry()
+    counter = metrics.Counter("bench_total", "bench", registry=registry)
+    histogram = metrics.Histogram("bench_seconds", "bench", registry=registry)
+    labelled = metrics.Histogram("bench_labelled_seconds", "bench", ("stage",), registry=registry)
+    child = labelled.labels(stage="detect")
+
+    def timer():
+        with child.time():
+            pass
+
+    cases = [
+        ("counter.inc()", counter.inc),
+        ("histogram.observe()", lambda: histogram.observe(0.042)),
+        ("child.observe() (pre-resolved label)", lambda: child.observe(0.042)),
+        ("labels(...).observe()", lambda: labelled.labels(stage="detect").observe(0.042)),
+        ("with child.time()", timer),
+    ]
+    print(f"{'operation':<40} {'ns/op':>8}")
+    for name, fn in cases:
+        seconds = min(timeit.repeat(fn, number=iterations, repeat=3))
+        print(f"{name:<40} {seconds / iterations * 1e9:>8.0f}")
+
+
+def install_stubs(llm_latency: float) -> None:
+    def call_gemini(image_data, detected_objects=None, rule_report=None):
+        time.sleep(llm_latency)
+        return fake_gemini_response(detected_objects)
+
+    async def no_3d(image_data, model_id):
+        await asyncio.sleep(0)
+
+    main.detect_room_objects = (
+        lambda image_data, save_results=True, result_id=None, annotate=None: (fake_detections(), "", "")
+    )
+    main.call_gemini_fengshui = call_gemini
+    main.generate_3d_model_background = no_3d
+
+
+def disable_instrumentation() -> None:
+    """Strip the middleware and stage timers to get an uninstrumented baseline."""
+    main.app.user_middleware = [m for m in main.app.user_middleware if m.cls is not metrics.MetricsMiddleware]
+    main.app.middleware_stack = None
+    main.STAGE_LLM = main.STAGE_RESPONSE_BUILD = _NullStage()
+
+
+def measure(requests_count: int, warmup: int) -> list:
+    port = free_port()
+    server = start_server(main.app, port)
+    url = f"http://127.0.0.1:{port}/analyze/"
+    session = requests.Session()
+    latencies = []
+    for i in range(warmup + requests_count):
+        start = time.perf_counter()
+        response = session.post(url, params={"narrate": "false"},
+                                files={"file": ("room.jpg", b"not-really-a-jpeg", "image/jpeg")})
+        response.raise_for_status()
+        if i >= warmup:
+            latencies.append((time.perf_counter() - start) * 1000)
+    server.should_exit = True
+    return latencies
+
+
+def main_benchmark() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--llm-latency", type=float, default=0.0,
+                        help="Simulated Gemini latency (s); 0 isolates the framework overhead")
+    parser.add_argument("--iterations", type=int, default=200_000, help="Iterations per micro-benchmark")
+    args = parser.parse_args()
+
+    micro_benchmarks(args.iterations)
+    install_stubs(args.llm_latency)
+
+    instrumented = measure(args.requests, args.warmup)
+    render_ms = min(timeit.repeat(metrics.REGISTRY.render, number=100, repeat=3)) / 100 * 1000
+    series = metrics.REGISTRY.render().count("\n")
+
+    disable_instrumentation()
+    baseline = measure(args.requests, args.warmup)
+
+    print(f"\n/analyze/ with stubbed detection and LLM, {args.requests} requests\n")
+    print(f"{'variant':<16} {'p50 ms':>8} {'p95 ms':>8} {'mean ms':>8}")
+    for name, values in (("uninstrumented", baseline), ("instrumented", instrumented)):
+        print(f"{name:<16} {np.percentile(values, 50):>8.2f} {np.percentile(values, 95):>8.2f} "
+              f"{np.mean(values):>8.2f}")
+    delta = np.median(instrumented) - np.median(baseline)
+    print(f"\nmedian overhead per request: {delta * 1000:+.0f} us")
+    print(f"/metrics render: {render_ms:.2f} ms for {series} lines")
+
+
+if __name__ == "__main__":
+    main_benchmark()
@@ -0,0 +1,129 @@
+"""
+Benchmark: perceived narration latency with and without pre-synthesis.
+
+Simulates the viewer flow against the real app under uvicorn with stubbed
+detection, Gemini and ElevenLabs:
+    POST /analyze/  ->  results render  ->  request mascot audio
+and measures the wait between the analysis response arriving and the first
+audio byte (what the user perceives as the mascot's delay), plus the total
+time from upload to first audio byte.
+
+  - on-demand:      /analyze/?narrate=false, then POST /tts/generate with the text
+  - pre-synthesized: /analyze/?narrate=true, then GET the narration audio_id URL
+
+Every round uses a fresh analysis text so the TTS cache never short-circuits.
+
+Usage (from backend/):
+    python benchmarks/bench_narration_presynth.py --rounds 20 --viewer-delay 0.3
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import requests
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import main  # noqa: E402
+import tts_cache  # noqa: E402
+from fakes import (  # noqa: E402
+    FakeElevenLabs, FakeTextToSpeech, fake_detections, fake_gemini_response, free_port, start_server
+)
+
+
+def install_stubs(gemini_latency: float, tts: FakeTextToSpeech) -> None:
+    counter = itertools.count()
+
+    def call_gemini(image_data, detected_objects=None, rule_report=None):
+        time.sleep(gemini_latency)
+        analysis = json.loads(fake_gemini_response(detected_objects))
+        analysis["overall_analysis"] += f" (analysis #{next(counter)})"
+        return json.dumps(analysis)
+
+    async def no_3d(image_data, model_id):
+        await asyncio.sleep(0)
+
+    main.detect_room_objects = (
+        lambda image_data, save_results=True, result_id=None, annotate=None: (fake_detections(), "", "")
+    )
+    main.call_gemini_fengshui = call_gemini
+    main.generate_3d_model_background = no_3d
+    main.get_elevenlabs_client = lambda: FakeElevenLabs(tts)
+
+
+
+def run_round(base_url: str, session: requests.Session, presynth: bool, viewer_delay: float) -> tuple:
+    start = time.perf_counter()
+    response = session.post(
+        f"{base_url}/analyze/",
+        params={"narrate": str(presynth).lower()},
+        files={"file": ("room.jpg", b"not-really-a-jpeg", "image/jpeg")},
+    )
+    response.raise_for_status()
+    analysis = response.json()
+    shown = time.perf_counter()
+
+    # Viewer renders the results before asking for the mascot's voice
+    time.sleep(viewer_delay)
+
+    if presynth:
+        request = session.get(f"{base_url}{analysis['narration']['overall']['url']}", stream=True)
+    else:
+        request = session.post(f"{base_url}/tts/generate", json={"text": analysis["overall_analysis"]}, stream=True)
+    with request as response:
+        response.raise_for_status()
+        next(response.iter_content(chunk_size=4096))
+        audio = time.perf_counter()
+        for _ in response.iter_content(chunk_size=4096):
+            pass
+
+    return audio - shown, audio - start
+
+
+def main_benchmark() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=15)
+    parser.add_argument("--gemini-latency", type=float, default=0.5, help="Stubbed Gemini latency (s)")
+    parser.add_argument("--tts-latency", type=float, default=0.4, help="Stubbed TTS first-chunk latency (s)")
+    parser.add_argument("--viewer-delay", type=float, default=0.3,
+                        help="Time between results arriving and the viewer requesting audio (s)")
+    args = parser.parse_args()
+
+    tts = FakeTextToSpeech(first_chunk_latency=args.tts_latency, chunk_interval=0.005)
+    install_stubs(args.gemini_latency, tts)
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        tts_cache._cache_instance = tts_cache.AudioCache(Path(cache_dir))
+        port = free_port()
+        server = start_server(main.app, port)
+        base_url = f"http://127.0.0.1:{port}"
+        session = requests.Session()
+
+        results = {}
+        for presynth in (False, True):
+            runs = [run_round(base_url, session, presynth, args.viewer_delay) for _ in range(args.rounds)]
+            results[presynth] = np.array(runs) * 1000
+
+        # Let background syntheses finish before the cache directory goes away
+        while main._narration_jobs:
+            time.sleep(0.05)
+        server.should_exit = True
+
+    print(f"{args.rounds} rounds, gemini {args.gemini_latency * 1000:.0f} ms, "
+          f"tts first chunk {args.tts_latency * 1000:.0f} ms, viewer delay {args.viewer_delay * 1000:.0f} ms\n")
+    print(f"{'mode':<16} {'wait after results p50':>23} {'p95':>8} {'upload->audio p50':>18}")
+    for presynth, label in ((False, "on-demand"), (True, "pre-synthesized")):
+        waits, totals = results[presynth][:, 0], results[presynth][:, 1]
+        print(f"{label:<16} {np.percentile(waits, 50):>20.1f} ms {np.percentile(waits, 95):>5.1f} ms "
+              f"{np.percentile(totals, 50):>15.1f} ms")
+
+
+if __name__ == "__main__":
+    main_benchmark()
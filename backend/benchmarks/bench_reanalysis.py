@@ -0,0 +1,200 @@
+"""
+Benchmark: what incremental re-analysis saves when a room is re-photographed.
+
+Synthetic rooms (bench_rules' class mix) are photographed again after an
+edit, with a few pixels of detection jitter on every box:
+  - unchanged:    nothing moved
+  - bed moved:    the largest object moved to the other side of the room
+  - swap:         one object removed, another added
+  - rearranged:   a third of the objects moved
+  - camera moved: the whole view shifted by 15% (falls back to a full analysis)
+
+For each scenario the benchmark reports the diff time, how often the delta
+mode applies, the tooltips carried over, how often the 3D job is skipped,
+and the Gemini tokens of a full analysis (prompt, image, response) against
+the delta prompt (text only, tooltips only for changed objects).
+
+Token counts are estimates (see bench_rules). Seconds saved are estimated
+from the tokens Gemini no longer generates (--output-tokens-per-s) plus the
+3D jobs skipped (--model-3d-seconds, e.g. from bench_depth_mesh). With
+GOOGLE_API_KEY set, --live times one real full and one real delta call per
+scenario for an example room instead.
+
+Usage (from backend/):
+    python benchmarks/bench_reanalysis.py --rooms 500
+    python benchmarks/bench_reanalysis.py --rooms 20 --live
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import main  # noqa: E402
+from bench_rules import IMAGE_SIZE, estimate_tokens, image_tokens, synthetic_room  # noqa: E402
+from fakes import fake_gemini_response  # noqa: E402
+from fengshui_rules import evaluate_rules  # noqa: E402
+from object_detection import Detections  # noqa: E402
+from reanalysis import plan_reanalysis  # noqa: E402
+
+JITTER_PX = 4.0
+
+
+def rephotograph(rng: np.random.Generator, room: Detections, scenario: str) -> Detections:
+    """The room after the scenario's edit, as the detector would see it again."""
+    boxes = room.xyxy.copy()
+    class_ids = room.class_ids.copy()
+    width, height = IMAGE_SIZE
+    sizes = boxes[:, 2:] - boxes[:, :2]
+
+    def move(index: int) -> None:
+        # Half the free width across (wrapping around), so the object lands clearly elsewhere
+        free = width - sizes[index, 0]
+        x1 = (boxes[index, 0] + free / 2) % free if free > 0 else 0.0
+        y1 = rng.uniform(0, height - sizes[index, 1])
+        boxes[index] = [x1, y1, x1 + sizes[index, 0], y1 + sizes[index, 1]]
+
+    if scenario == "bed moved":
+        move(int(np.argmax(np.prod(sizes, axis=1))))
+    elif scenario == "rearranged":
+        for index in rng.choice(len(boxes), size=max(1, len(boxes) // 3), replace=False):
+            move(int(index))
+    elif scenario == "swap":
+        removed = int(rng.integers(len(boxes)))
+        boxes = np.delete(boxes, removed, axis=0)
+        class_ids = np.delete(class_ids, removed)
+        added = synthetic_room(rng, 1)
+        boxes = np.vstack([boxes, added.xyxy])
+        class_ids = np.concatenate([class_ids, added.class_ids])
+    elif scenario == "camera moved":
+        boxes[:, [0, 2]] -= width * 0.15
+        boxes = np.clip(boxes, 0, [width, height, width, height])
+
+    boxes += rng.normal(0, JITTER_PX, size=boxes.shape)
+    order = rng.permutation(len(boxes))  # the detector's order is arbitrary
+    return Detections(
+        boxes[order], class_ids[order], rng.uniform(0.3, 0.95, size=len(boxes)), room.names, IMAGE_SIZE
+    )
+
+
+def previous_record(room: Detections) -> dict:
+    """A stored analysis of the first photo (tooltips for the first three objects)."""
+    return {**json.loads(fake_gemini_response(room)), "model_3d_id": "previous"}
+
+
+def full_prompt(room: Detections) -> str:
+    """The text part of call_gemini_fengshui's request."""
+    return (
+        "You are a Feng Shui master. Analyze the room in this image.\n\n"
+        f"{main.build_object_context(room)}\n"
+        "Please provide your response in the following JSON format:\n"
+        f"{main.FENGSHUI_RESPONSE_FORMAT}"
+    )
+
+
+def delta_response(changed: int) -> str:
+    """A delta response: the analysis text plus at most three tooltips for changed objects."""
+    response = json.loads(fake_gemini_response())
+    response["object_tooltips"] = response["object_tooltips"][:min(changed, 3)]
+    return json.dumps(response)
+
+
+def capture_delta_prompt(reanalysis, room: Detections) -> str:
+    """The prompt call_gemini_fengshui_delta sends (captured instead of calling Gemini)."""
+    captured = []
+    original = main.generate_gemini_json
+    main.generate_gemini_json = lambda parts, **kwargs: captured.append(parts[0]["text"]) or "{}"
+    try:
+        main.call_gemini_fengshui_delta(reanalysis, room, evaluate_rules(room))
+    finally:
+        main.generate_gemini_json = original
+    return captured[0]
+
+
+def live_seconds(image_data: bytes, room: Detections, reanalysis) -> tuple:
+    """Wall time of one real full and one real delta Gemini call."""
+    report = evaluate_rules(room)
+    start = time.perf_counter()
+    main.call_gemini_fengshui(image_data, room, report)
+    full = time.perf_counter() - start
+    start = time.perf_counter()
+    if reanalysis.mode == "delta":
+        main.call_gemini_fengshui_delta(reanalysis, room, report)
+    else:
+        main.call_gemini_fengshui(image_data, room, report)
+    return full, time.perf_counter() - start
+
+
+def main_benchmark() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rooms", type=int, default=500, help="Rooms per scenario")
+    parser.add_argument("--objects", type=int, default=12, help="Objects per room")
+    parser.add_argument("--output-tokens-per-s", type=float, default=200.0, help="Gemini generation speed")
+    parser.add_argument("--model-3d-seconds", type=float, default=20.0, help="Time of one 3D job")
+    parser.add_argument("--live", action="store_true", help="Time real Gemini calls (needs GOOGLE_API_KEY)")
+    args = parser.parse_args()
+
+    scenarios = ("unchanged", "bed moved", "swap", "rearranged", "camera moved")
+    rng = np.random.default_rng(0)
+    full_response_tokens = estimate_tokens(fake_gemini_response())
+    call_image_tokens = image_tokens(*IMAGE_SIZE)
+
+    print(f"{args.rooms} synthetic rooms per scenario, {args.objects} objects, {JITTER_PX:.0f}px detection jitter\n")
+    print(f"{'scenario':<13} {'diff us':>8} {'delta':>6} {'reused':>7} {'3D skip':>8} "
+          f"{'full tok':>9} {'delta tok':>10} {'saved':>6} {'est s saved':>12}")
+    for scenario in scenarios:
+        diff_seconds, deltas, reused, skipped_3d = [], 0, [], 0
+        full_tokens, actual_tokens, seconds_saved = [], [], []
+        example = None
+        for _ in range(args.rooms):
+            room = synthetic_room(rng, args.objects)
+            record = previous_record(room)
+            again = rephotograph(rng, room, scenario)
+
+            start = time.perf_counter()
+            reanalysis = plan_reanalysis("previous", (record, room), again)
+            diff_seconds.append(time.perf_counter() - start)
+
+            full = estimate_tokens(full_prompt(again)) + call_image_tokens + full_response_tokens
+            full_tokens.append(full)
+            saved = 0.0
+            if reanalysis.mode == "delta":
+                deltas += 1
+                changed = len(reanalysis.diff.moved) + len(reanalysis.diff.added)
+                response = delta_response(changed)
+                reused.append(len(reanalysis.merge(json.loads(response))["object_tooltips"]) - min(changed, 3))
+                actual_tokens.append(estimate_tokens(capture_delta_prompt(reanalysis, again))
+                                     + estimate_tokens(response))
+                saved += (full_response_tokens - estimate_tokens(response)) / args.output_tokens_per_s
+                if reanalysis.reuse_3d:
+                    skipped_3d += 1
+                    saved += args.model_3d_seconds
+                example = example or (reanalysis, again)
+            else:
+                actual_tokens.append(full)
+            seconds_saved.append(saved)
+
+        full_mean, actual_mean = np.mean(full_tokens), np.mean(actual_tokens)
+        print(f"{scenario:<13} {np.mean(diff_seconds) * 1e6:>8.0f} {deltas / args.rooms:>6.0%} "
+              f"{np.mean(reused) if reused else 0:>7.1f} {skipped_3d / args.rooms:>8.0%} "
+              f"{full_mean:>9.0f} {actual_mean:>10.0f} {1 - actual_mean / full_mean:>6.0%} "
+              f"{np.mean(seconds_saved):>12.1f}")
+
+        if args.live and example is not None:
+            image_path = next(Path(__file__).resolve().parent.parent.parent.joinpath("data").glob("*.jp*g"))
+            full_s, delta_s = live_seconds(image_path.read_bytes(), example[1], example[0])
+            print(f"{'':<13} live: full call {full_s:.2f}s, delta call {delta_s:.2f}s")
+
+    room = synthetic_room(np.random.default_rng(1), args.objects)
+    again = rephotograph(rng, room, "bed moved")
+    reanalysis = plan_reanalysis("previous", (previous_record(room), room), again)
+    print(f"\nexample delta prompt (bed moved):\n{capture_delta_prompt(reanalysis, again)}")
+
+
+if __name__ == "__main__":
+    main_benchmark()
@@ -0,0 +1,134 @@
+"""
+Benchmark: encode time and payload size of analysis responses.
+
+Synthetic rooms (bench_rules' class mix) at several object counts, each with
+a Gemini tooltip for every object, are turned into /analyze/ responses with
+build_analysis_response(). For each size the benchmark compares
+  - encoding: FastAPI's default path (jsonable_encoder, then Starlette's
+    JSONResponse.render with json.dumps) against encode_json() (orjson when
+    installed), for the full and the compact (?compact=true) wire format
+  - payload size: raw, gzip and brotli (when installed) for both formats,
+    and the time CompressionMiddleware spends compressing
+Finally a /analyze/batch NDJSON stream is compressed the way the middleware
+does it (a flush per result line) and as one body, to show what streaming
+costs in ratio.
+
+Usage (from backend/):
+    python benchmarks/bench_response_encoding.py --rooms 200
+"""
+
+import argparse
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from fastapi.responses import JSONResponse  # noqa: E402
+
+import main  # noqa: E402
+import response_encoding  # noqa: E402
+from bench_rules import synthetic_room  # noqa: E402
+from fakes import fake_gemini_response  # noqa: E402
+from response_encoding import (  # noqa: E402
+    ENCODINGS, Compressor, compact_analysis, compress_body, encode_json, encode_json_line
+)
+
+TOOLTIP_KINDS = ("good", "bad", "neutral")
+
+
+def synthetic_response(rng: np.random.Generator, objects: int, index: int) -> dict:
+    """An /analyze/ response for a synthetic room, one Gemini tooltip per object."""
+    room = synthetic_room(rng, objects)
+    analysis = json.loads(fake_gemini_response())
+    analysis["object_tooltips"] = [
+        {
+            "object_index": i,
+            "type": TOOLTIP_KINDS[int(rng.integers(len(TOOLTIP_KINDS)))],
+            "message": f"The {obj['class']} here could be placed to let energy flow more freely through the room.",
+        }
+        for i, obj in enumerate(room)
+    ]
+    model_id = f"bench_{index:06d}"
+    return main.build_analysis_response(
+        analysis, room, f"results/{model_id}.json", f"results/{model_id}.jpg", model_id
+    )
+
+
+def fastapi_default(response: dict) -> bytes:
+    """What an endpoint returning the dict sent before: jsonable_encoder + json.dumps."""
+    return JSONResponse(jsonable_encoder(response)).body
+
+
+def per_call(function, items: list, repeats: int = 3) -> float:
+    """Best-of-repeats mean seconds per item."""
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for item in items:
+            function(item)
+        best = min(best, (time.perf_counter() - start) / len(items))
+    return best
+
+
+def main_benchmark() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rooms", type=int, default=200, help="Responses per object count")
+    parser.add_argument("--sizes", default="5,15,40,100", help="Objects per room")
+    parser.add_argument("--batch", type=int, default=64, help="Results in the NDJSON batch stream")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    encoder = "orjson" if response_encoding.orjson is not None else "json (orjson not installed)"
+    print(f"encode_json: {encoder}; encodings: {', '.join(ENCODINGS)}; "
+          f"gzip level {response_encoding.RESPONSE_GZIP_LEVEL}, brotli quality {response_encoding.RESPONSE_BROTLI_QUALITY}\n")
+
+    print(f"{'objects':>7} {'default us':>10} {'fast us':>8} {'speedup':>7} {'compact us':>10} "
+          f"{'full B':>8} {'compact B':>9} {'saved':>6}", end="")
+    for encoding in ENCODINGS:
+        print(f" {'full ' + encoding + ' B':>11} {'compact ' + encoding + ' B':>14} {encoding + ' us':>8}", end="")
+    print()
+
+    for objects in [int(size) for size in args.sizes.split(",")]:
+        responses = [synthetic_response(rng, objects, i) for i in range(args.rooms)]
+        assert json.loads(fastapi_default(responses[0])) == json.loads(encode_json(responses[0]))
+
+        default_time = per_call(fastapi_default, responses)
+        fast_time = per_call(encode_json, responses)
+        compact_time = per_call(lambda response: encode_json(compact_analysis(response)), responses)
+        full_bodies = [encode_json(response) for response in responses]
+        compact_bodies = [encode_json(compact_analysis(response)) for response in responses]
+        full_size = statistics.mean(len(body) for body in full_bodies)
+        compact_size = statistics.mean(len(body) for body in compact_bodies)
+
+        print(f"{objects:>7} {default_time * 1e6:>10.1f} {fast_time * 1e6:>8.1f} "
+              f"{default_time / fast_time:>6.1f}x {compact_time * 1e6:>10.1f} "
+              f"{full_size:>8.0f} {compact_size:>9.0f} {1 - compact_size / full_size:>6.0%}", end="")
+        for encoding in ENCODINGS:
+            full_compressed = statistics.mean(len(compress_body(body, encoding)) for body in full_bodies)
+            compact_compressed = statistics.mean(len(compress_body(body, encoding)) for body in compact_bodies)
+            compress_time = per_call(lambda body: compress_body(body, encoding), full_bodies)
+            print(f" {full_compressed:>11.0f} {compact_compressed:>14.0f} {compress_time * 1e6:>8.1f}", end="")
+        print()
+
+    # Batch stream: the middleware flushes after every line so results arrive as they are produced
+    lines = [encode_json_line(synthetic_response(rng, 15, i)) for i in range(args.batch)]
+    raw = sum(len(line) for line in lines)
+    print(f"\n/analyze/batch NDJSON, {args.batch} results of 15 objects: {raw:,} B raw")
+    for encoding in ENCODINGS:
+        compressor = Compressor(encoding)
+        start = time.perf_counter()
+        streamed = sum(len(compressor.compress(line, flush=True)) for line in lines) + len(compressor.finish())
+        stream_time = time.perf_counter() - start
+        whole = len(compress_body(b"".join(lines), encoding))
+        print(f"  {encoding:<5} streamed (flush per line) {streamed:>9,} B ({streamed / raw:.1%}, "
+              f"{stream_time * 1e3:.1f} ms)   one body {whole:>9,} B ({whole / raw:.1%})")
+
+
+if __name__ == "__main__":
+    main_benchmark()
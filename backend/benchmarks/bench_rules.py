@@ -0,0 +1,138 @@
+"""
+Benchmark: feng shui rule engine throughput and the LLM tokens it saves.
+
+Synthetic rooms with realistic class mixes (a bed, a few pieces of furniture,
+screens, plants and a long tail of loose items) are generated at several
+object counts and evaluated with evaluate_rules(). For each size the
+benchmark reports rooms and rules evaluated per second, then compares the
+Gemini prompt built from
+  - legacy: the old numbered object list (one line per object with confidence)
+  - compact: class-grouped object indices plus brief rule findings
+and what fast mode saves by skipping the call altogether (prompt text,
+image and response).
+
+Token counts are estimates (~4 characters per token for text; 258 tokens
+per 768px image tile, as Gemini bills images), since counting exactly needs
+the Gemini API.
+
+Usage (from backend/):
+    python benchmarks/bench_rules.py --rooms 2000
+"""
+
+import argparse
+import json
+import math
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import main  # noqa: E402
+from fakes import fake_gemini_response  # noqa: E402
+from fengshui_rules import RULES, evaluate_rules  # noqa: E402
+from object_detection import ROOM_CLASSES, Detections  # noqa: E402
+
+NAMES = dict(enumerate(ROOM_CLASSES))
+CLASS_IDS = {name: i for i, name in NAMES.items()}
+IMAGE_SIZE = (1280, 960)
+
+# Relative frequency and typical size (fraction of frame width) of the classes drawn
+CLASS_MIX = {
+    "chair": (6, 0.15), "couch": (2, 0.35), "dining table": (2, 0.3), "tv": (2, 0.2), "laptop": (1, 0.1),
+    "potted plant": (3, 0.1), "clock": (1, 0.05), "vase": (2, 0.05), "book": (12, 0.03), "bottle": (5, 0.03),
+    "cup": (5, 0.03), "bowl": (3, 0.04), "handbag": (1, 0.08), "backpack": (1, 0.08), "toilet": (0.3, 0.12),
+}
+
+
+def legacy_object_context(detected_objects) -> str:
+    """The numbered object list call_gemini_fengshui used to send."""
+    object_context = "\n\nDetected objects in the room:\n"
+    for i, obj in enumerate(detected_objects):
+        object_context += f"{i}. {obj['class']} (confidence: {obj['confidence']:.2f})\n"
+    return object_context
+
+
+def synthetic_room(rng: np.random.Generator, objects: int) -> Detections:
+    """One room: usually a bed plus `objects - 1` objects drawn from CLASS_MIX."""
+    classes = list(CLASS_MIX)
+    weights = np.array([CLASS_MIX[name][0] for name in classes])
+    names = (["bed"] if rng.random() < 0.7 else []) + list(
+        rng.choice(classes, size=objects, p=weights / weights.sum())
+    )
+    names = names[:objects]
+    width, height = IMAGE_SIZE
+    boxes = []
+    for name in names:
+        size = 0.5 if name == "bed" else CLASS_MIX[name][1]
+        w = width * size * rng.uniform(0.7, 1.3)
+        h = min(w * rng.uniform(0.5, 1.2), height * 0.9)
+        x1 = rng.uniform(0, width - w)
+        y1 = rng.uniform(0, height - h)
+        boxes.append([x1, y1, x1 + w, y1 + h])
+    return Detections(
+        np.array(boxes), np.array([CLASS_IDS[name] for name in names]),
+        rng.uniform(0.3, 0.95, size=len(names)), NAMES, IMAGE_SIZE
+    )
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / 4)
+
+
+def image_tokens(width: int, height: int) -> int:
+    if width <= 384 and height <= 384:
+        return 258
+    return 258 * math.ceil(width / 768) * math.ceil(height / 768)
+
+
+def main_benchmark() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rooms", type=int, default=2000, help="Rooms per object count")
+    parser.add_argument("--sizes", default="5,15,40,100", help="Objects per room")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+
+    def prompt(context: str) -> str:
+        """The text part of call_gemini_fengshui's request."""
+        return (
+            "You are a Feng Shui master. Analyze the room in this image.\n\n"
+            f"{context}\n"
+            "Please provide your response in the following JSON format:\n"
+            f"{main.FENGSHUI_RESPONSE_FORMAT}"
+        )
+    response_tokens = estimate_tokens(fake_gemini_response())
+    call_image_tokens = image_tokens(*IMAGE_SIZE)
+
+    print(f"{len(RULES)} rules, {args.rooms} synthetic rooms per size, {IMAGE_SIZE[0]}x{IMAGE_SIZE[1]} frames\n")
+    print(f"{'objects':>7} {'us/room':>8} {'rooms/s':>9} {'rules/s':>10} {'score':>6} "
+          f"{'legacy tok':>10} {'compact tok':>11} {'saved':>6} {'fast-mode tok saved':>19}")
+    for objects in [int(size) for size in args.sizes.split(",")]:
+        rooms = [synthetic_room(rng, objects) for _ in range(args.rooms)]
+        for room in rooms[:50]:
+            evaluate_rules(room)  # warm up
+
+        start = time.perf_counter()
+        reports = [evaluate_rules(room) for room in rooms]
+        elapsed = time.perf_counter() - start
+
+        legacy = np.mean([estimate_tokens(prompt(legacy_object_context(room))) for room in rooms])
+        compact = np.mean([
+            estimate_tokens(prompt(main.build_object_context(room, report)))
+            for room, report in zip(rooms, reports)
+        ])
+        fast_saved = compact + call_image_tokens + response_tokens
+        print(f"{objects:>7} {elapsed / len(rooms) * 1e6:>8.1f} {len(rooms) / elapsed:>9.0f} "
+              f"{len(rooms) * len(RULES) / elapsed:>10.0f} {np.mean([r.score for r in reports]):>6.2f} "
+              f"{legacy:>10.0f} {compact:>11.0f} {1 - compact / legacy:>6.0%} {fast_saved:>19.0f}")
+
+    example = synthetic_room(np.random.default_rng(1), 15)
+    print(f"\nexample compact context (15 objects):{main.build_object_context(example)}")
+    print(json.dumps(evaluate_rules(example).to_dict(), indent=2))
+
+
+if __name__ == "__main__":
+    main_benchmark()
@@ -0,0 +1,120 @@
+"""
+Benchmark: similar-room index build time, recall@10 and queries per second.
+
+Fills a RoomIndex in a temp directory with synthetic embeddings (a mixture
+of Gaussian clusters on the unit sphere, like embeddings of rooms that come
+in styles) and random scores, trains the IVF quantizer, then runs queries
+near stored rooms one at a time for several nprobe values. Recall@10 is
+measured against exact brute-force search over the same float16 vectors,
+with and without a min_score filter ("rooms like yours that scored 9+").
+
+Usage (from backend/):
+    python benchmarks/bench_similar_rooms.py --rooms 1000000
+    python benchmarks/bench_similar_rooms.py --rooms 100000 --nprobe 4,8,16
+"""
+
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from object_detection import ROOM_EMBEDDING_DIM  # noqa: E402
+from room_index import RoomIndex, normalize  # noqa: E402
+
+
+def synthetic_embeddings(rng: np.random.Generator, rooms: int, styles: int, spread: float) -> np.ndarray:
+    centers = normalize(rng.standard_normal((styles, ROOM_EMBEDDING_DIM)))
+    labels = rng.integers(0, styles, rooms)
+    embeddings = np.empty((rooms, ROOM_EMBEDDING_DIM), dtype=np.float32)
+    for start in range(0, rooms, 100_000):
+        chunk = labels[start:start + 100_000]
+        noise = rng.standard_normal((len(chunk), ROOM_EMBEDDING_DIM)).astype(np.float32)
+        embeddings[start:start + len(chunk)] = normalize(centers[chunk] + spread * noise)
+    return embeddings
+
+
+def exact_top_k(vectors: np.ndarray, scores: np.ndarray, query: np.ndarray, k: int,
+                min_score: float, exclude: int) -> set:
+    similarities = vectors @ query
+    similarities[exclude] = -np.inf
+    if min_score is not None:
+        similarities[scores < min_score] = -np.inf
+    return set(np.argpartition(-similarities, k)[:k].tolist())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rooms", type=int, default=1_000_000, help="Rooms in the index")
+    parser.add_argument("--queries", type=int, default=500, help="Queries per setting")
+    parser.add_argument("--styles", type=int, default=2000, help="Clusters in the synthetic data")
+    parser.add_argument("--spread", type=float, default=0.05, help="Per-dimension noise around a style")
+    parser.add_argument("--nprobe", default="4,8,16,32,64", help="IVF lists scanned per query")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--min-score", type=float, default=9.0, help="Score filter for the filtered run")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    start = time.perf_counter()
+    embeddings = synthetic_embeddings(rng, args.rooms, args.styles, args.spread)
+    scores = np.clip(rng.normal(6.5, 1.5, args.rooms), 0, 10).round(1).astype(np.float32)
+    room_ids = [f"room_{i:08d}" for i in range(args.rooms)]
+    print(f"Generated {args.rooms} embeddings ({ROOM_EMBEDDING_DIM}-d) in {time.perf_counter() - start:.1f}s; "
+          f"{(scores >= args.min_score).mean():.1%} scored >= {args.min_score}")
+
+    with tempfile.TemporaryDirectory() as directory:
+        index = RoomIndex(Path(directory), auto_train=False)
+        start = time.perf_counter()
+        for i in range(0, args.rooms, 50_000):
+            index.add_many(room_ids[i:i + 50_000], embeddings[i:i + 50_000], scores[i:i + 50_000])
+        insert_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        index.train()
+        train_seconds = time.perf_counter() - start
+        stats = index.stats()
+        size_mb = sum(path.stat().st_size for path in Path(directory).iterdir()) / 1e6
+        print(f"Inserted in {insert_seconds:.1f}s ({args.rooms / insert_seconds:,.0f} rooms/s), "
+              f"trained {stats['lists']} lists in {train_seconds:.1f}s, {size_mb:.0f} MB on disk")
+
+        # Single-room inserts into the trained index (the /analyze/ path)
+        extra = synthetic_embeddings(rng, 2000, args.styles, args.spread)
+        start = time.perf_counter()
+        for i, embedding in enumerate(extra):
+            index.add(f"extra_{i}", embedding, 5.0)
+        print(f"Incremental insert: {(time.perf_counter() - start) / len(extra) * 1e6:.0f} us/room")
+
+        # Ground truth on exactly what the index stores
+        stored = np.asarray(index._vectors[:index.count], dtype=np.float32)
+        stored_scores = np.asarray(index._rooms["score"][:index.count])
+        query_rows = rng.choice(args.rooms, args.queries, replace=False)
+
+        print(f"\n{'nprobe':>6} {'filter':>8} {'recall@' + str(args.k):>10} {'p50 ms':>7} {'p95 ms':>7} {'QPS':>7}")
+        for min_score in (None, args.min_score):
+            truth = [
+                exact_top_k(stored, stored_scores, stored[row], args.k, min_score, row) for row in query_rows
+            ]
+            for nprobe in [int(n) for n in args.nprobe.split(",")]:
+                latencies, found = [], 0
+                for row, expected in zip(query_rows, truth):
+                    query = stored[row]
+                    begin = time.perf_counter()
+                    results = index.search(query, args.k, min_score, nprobe, exclude=room_ids[row])
+                    latencies.append(time.perf_counter() - begin)
+                    found += len(expected & {index._row_by_id[room_id.encode()] for room_id, _, _ in results})
+                latencies = np.array(latencies) * 1000
+                label = "none" if min_score is None else f">={min_score:g}"
+                print(f"{nprobe:>6} {label:>8} {found / (len(truth) * args.k):>10.3f} "
+                      f"{np.percentile(latencies, 50):>7.2f} {np.percentile(latencies, 95):>7.2f} "
+                      f"{1000 / latencies.mean():>7.0f}")
+
+        start = time.perf_counter()
+        reopened = RoomIndex(Path(directory), auto_train=False)
+        print(f"\nReopened {reopened.count} rooms in {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
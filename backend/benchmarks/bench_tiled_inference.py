@@ -0,0 +1,139 @@
+"""
+Benchmark: sliced (tiled) inference vs a single downscaled pass on large images.
+
+For each image the benchmark runs
+  - single: the profile's normal full-image pass at its imgsz
+  - tiled:  sliced inference (overlapping tiles + one global pass, merged with NMS)
+  - reference: one pass at (close to) native resolution, used as recall ground truth
+and reports latency and recall of small decor objects (plants, vases,
+clocks, books, cups...) for single vs tiled.
+
+data/ photos are mostly ~1000 px, so by default they are upscaled to a
+4000 px long side to stand in for wide-angle/panoramic shots; pass
+--upscale 0 to use images as-is.
+
+Usage (from backend/):
+    python benchmarks/bench_tiled_inference.py
+    python benchmarks/bench_tiled_inference.py --profile accurate --tile-size 960 --overlap 0.25
+"""
+
+import argparse
+import io
+import sys
+import time
+from dataclasses import replace
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from object_detection import DETECTION_PROFILES, ObjectDetector  # noqa: E402
+from bench_detection_profiles import DATA_DIR, IMAGE_EXTENSIONS, pairwise_iou  # noqa: E402
+
+SMALL_DECOR_CLASSES = ("potted plant", "vase", "clock", "book", "cup", "bottle", "bowl", "wine glass")
+
+
+def decor_recall(reference, candidate, iou_threshold: float = 0.5) -> tuple:
+    """(matched, total) small decor boxes of reference found in candidate (same class, IoU)."""
+    ref_names = np.array(reference.class_names, dtype=object)
+    cand_names = np.array(candidate.class_names, dtype=object)
+    ref_mask = np.isin(ref_names, SMALL_DECOR_CLASSES)
+    total = int(ref_mask.sum())
+    if total == 0 or len(candidate) == 0:
+        return 0, total
+    ious = pairwise_iou(reference.xyxy[ref_mask], candidate.xyxy)
+    ious[ref_names[ref_mask][:, None] != cand_names[None, :]] = 0.0
+    return int((ious.max(axis=1) >= iou_threshold).sum()), total
+
+
+def load_images(directory: Path, upscale: int) -> list:
+    images = []
+    for path in sorted(directory.iterdir()):
+        if path.suffix.lower() not in IMAGE_EXTENSIONS:
+            continue
+        image = Image.open(path).convert("RGB")
+        if upscale and max(image.size) < upscale:
+            scale = upscale / max(image.size)
+            image = image.resize((round(image.width * scale), round(image.height * scale)), Image.LANCZOS)
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG", quality=92)
+        images.append((path.name, image.size, buffer.getvalue()))
+    return images
+
+
+def timed(detector: ObjectDetector, image_data: bytes):
+    start = time.perf_counter()
+    detections = detector.detect_objects(image_data)
+    return detections, (time.perf_counter() - start) * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=Path, default=DATA_DIR)
+    parser.add_argument("--profile", default="accurate", choices=sorted(DETECTION_PROFILES))
+    parser.add_argument("--model-format", default=None, help="Override weights format (e.g. onnx)")
+    parser.add_argument("--upscale", type=int, default=4000, help="Upscale images to this long side (0 = off)")
+    parser.add_argument("--tile-size", type=int, default=1024)
+    parser.add_argument("--overlap", type=float, default=0.2)
+    parser.add_argument("--reference-imgsz", type=int, default=2560,
+                        help="Cap on the native-resolution reference pass")
+    args = parser.parse_args()
+
+    base = DETECTION_PROFILES[args.profile]
+    if args.model_format:
+        base = replace(base, model_format=args.model_format)
+    # Tiled runs keep more detections since they see more small objects
+    max_det = max(base.max_det, 100)
+
+    single = ObjectDetector(profile=replace(base, tiling_min_side=0, max_det=max_det))
+    tiled = ObjectDetector(profile=replace(
+        base, tiling_min_side=1, tile_size=args.tile_size, tile_overlap=args.overlap, max_det=max_det
+    ))
+
+    images = load_images(args.images, args.upscale)
+    if not images:
+        sys.exit(f"No images found in {args.images}")
+
+    # Warm up both paths once
+    single.detect_objects(images[0][2])
+    tiled.detect_objects(images[0][2])
+
+    print(f"profile={base.name} model={base.model_name} imgsz={base.imgsz} "
+          f"tile={args.tile_size}px overlap={args.overlap}\n")
+    print(f"{'image':<28} {'size':>11} {'single ms':>10} {'tiled ms':>9} {'single n':>8} {'tiled n':>8}")
+
+    totals = {"single_ms": [], "tiled_ms": [], "single_hit": 0, "tiled_hit": 0, "decor": 0}
+    for name, (width, height), image_data in images:
+        side = min(args.reference_imgsz, int(np.ceil(max(width, height) / 32) * 32))
+        reference = ObjectDetector(profile=replace(base, tiling_min_side=0, imgsz=side, max_det=300))
+        reference_detections = reference.detect_objects(image_data)
+
+        single_detections, single_ms = timed(single, image_data)
+        tiled_detections, tiled_ms = timed(tiled, image_data)
+
+        hit, total = decor_recall(reference_detections, single_detections)
+        totals["single_hit"] += hit
+        totals["decor"] += total
+        totals["tiled_hit"] += decor_recall(reference_detections, tiled_detections)[0]
+        totals["single_ms"].append(single_ms)
+        totals["tiled_ms"].append(tiled_ms)
+
+        print(f"{name[:28]:<28} {f'{width}x{height}':>11} {single_ms:>10.1f} {tiled_ms:>9.1f} "
+              f"{len(single_detections):>8} {len(tiled_detections):>8}")
+
+    single_ms = np.mean(totals["single_ms"])
+    tiled_ms = np.mean(totals["tiled_ms"])
+    print(f"\nmean latency: single {single_ms:.1f} ms, tiled {tiled_ms:.1f} ms "
+          f"({tiled_ms / single_ms:.1f}x cost)")
+    if totals["decor"]:
+        print(f"small decor recall vs native-resolution reference ({totals['decor']} objects): "
+              f"single {totals['single_hit'] / totals['decor']:.3f}, "
+              f"tiled {totals['tiled_hit'] / totals['decor']:.3f}")
+    else:
+        print("no small decor objects in the reference pass - recall not measured")
+
+
+if __name__ == "__main__":
+    main()
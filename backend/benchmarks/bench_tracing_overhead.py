@@ -0,0 +1,57 @@
+"""
+Benchmark: cost of a traced operation at different sampling ratios.
+
+Times a nested span (parent + child with attributes, the shape of one
+/analyze/ stage) with tracing disabled, and with the file exporter enabled
+at several TRACE_SAMPLE_RATIO values. Unsampled traces only allocate a
+placeholder span, so the per-request cost should scale with the ratio.
+
+Usage (from backend/):
+    python benchmarks/bench_tracing_overhead.py --iterations 100000
+"""
+
+import argparse
+import sys
+import tempfile
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import tracing  # noqa: E402
+
+
+def traced_operation() -> None:
+    with tracing.start_span("analyze_image", "server") as parent:
+        parent.set_attribute("model_id", "20250101_000000_000000")
+        with tracing.start_span("detect.inference") as child:
+            child.set_attributes({"detect.objects": 5, "detect.tiled": False})
+        tracing.inject_headers()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=100_000)
+    parser.add_argument("--ratios", default="0,0.01,0.1,1", help="Comma-separated sample ratios")
+    args = parser.parse_args()
+
+    print(f"{'configuration':<28} {'us/op':>8} {'spans written':>14}")
+    tracing.configure(None)
+    seconds = min(timeit.repeat(traced_operation, number=args.iterations, repeat=3))
+    print(f"{'disabled':<28} {seconds / args.iterations * 1e6:>8.2f} {0:>14}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for ratio in (float(r) for r in args.ratios.split(",")):
+            path = Path(tmp) / f"spans_{ratio}.jsonl"
+            tracing.configure(tracing.FileSpanExporter(path), sample_ratio=ratio)
+            seconds = timeit.timeit(traced_operation, number=args.iterations)
+            tracing.configure(None)
+            written = sum(1 for _ in open(path)) if path.exists() else 0
+            print(f"{f'file exporter, ratio {ratio:g}':<28} {seconds / args.iterations * 1e6:>8.2f} "
+                  f"{written:>14}")
+    if tracing._processor.dropped:
+        print(f"\n{tracing._processor.dropped} spans dropped (export queue full)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Benchmark: /tts/generate time-to-first-audio-byte and cache hit rate.
+
+Runs the real FastAPI app under uvicorn with ElevenLabs replaced by a local
+fake provider that emits audio in chunks with configurable latency. A
+workload of stock mascot phrases (Zipf-distributed, so a few are very
+popular) mixed with unique analysis texts is replayed and the benchmark
+reports hit rate plus time-to-first-byte (TTFB) and total time for cache
+hits and misses. The "buffered" row is what the old implementation's TTFB
+would be: the provider's full synthesis time, since it joined all chunks
+before responding.
+
+Usage (from backend/):
+    python benchmarks/bench_tts_cache.py --requests 300
+"""
+
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import requests
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import main  # noqa: E402
+import tts_cache  # noqa: E402
+from fakes import FakeElevenLabs, FakeTextToSpeech, free_port, start_server  # noqa: E402
+
+
+def build_workload(n: int, stock_phrases: int, unique_ratio: float, seed: int = 0) -> list:
+    rng = np.random.default_rng(seed)
+    stock = [f"Stock mascot phrase number {i}: remember to let the chi flow freely." for i in range(stock_phrases)]
+    texts = []
+    for i in range(n):
+        if rng.random() < unique_ratio:
+            texts.append(f"Unique analysis {i}: the bed faces the door, consider moving it. " * 3)
+        else:
+            texts.append(stock[min(int(rng.zipf(1.3)) - 1, stock_phrases - 1)])
+    return texts
+
+
+def pct(values: list, q: float) -> float:
+    return float(np.percentile(values, q)) * 1000 if values else float("nan")
+
+
+def run_benchmark() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--stock-phrases", type=int, default=25)
+    parser.add_argument("--unique-ratio", type=float, default=0.2, help="Share of never-repeated texts")
+    parser.add_argument("--first-chunk-latency", type=float, default=0.25, help="Provider latency (s)")
+    parser.add_argument("--chunk-interval", type=float, default=0.01, help="Delay between chunks (s)")
+    parser.add_argument("--bytes-per-char", type=int, default=800, help="Audio bytes per input character")
+    args = parser.parse_args()
+
+    fake = FakeTextToSpeech(args.first_chunk_latency, args.chunk_interval, args.bytes_per_char)
+    main.get_elevenlabs_client = lambda: FakeElevenLabs(fake)
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        tts_cache._cache_instance = tts_cache.AudioCache(Path(cache_dir))
+        port = free_port()
+        server = start_server(main.app, port)
+        url = f"http://127.0.0.1:{port}/tts/generate"
+
+        ttfb = {"hit": [], "miss": []}
+        total = {"hit": [], "miss": []}
+        buffered = []
+        session = requests.Session()
+        for text in build_workload(args.requests, args.stock_phrases, args.unique_ratio):
+            start = time.perf_counter()
+            with session.post(url, json={"text": text}, stream=True) as response:
+                response.raise_for_status()
+                chunks = response.iter_content(chunk_size=4096)
+                next(chunks)
+                first = time.perf_counter() - start
+                for _ in chunks:
+                    pass
+                elapsed = time.perf_counter() - start
+            outcome = response.headers["X-TTS-Cache"]
+            ttfb[outcome].append(first)
+            total[outcome].append(elapsed)
+            if outcome == "miss":
+                buffered.append(fake.full_synthesis_seconds(text))
+
+        server.should_exit = True
+        stats = tts_cache.get_audio_cache().stats()
+
+    print(f"{args.requests} requests, {fake.calls} provider calls, "
+          f"hit rate {stats['hit_ratio']:.1%} ({stats['entries']} cached files, {stats['bytes'] / 1e6:.1f} MB)\n")
+    print(f"{'path':<22} {'n':>5} {'TTFB p50 ms':>12} {'TTFB p95 ms':>12} {'total p50 ms':>13}")
+    for outcome, label in (("hit", "hit (disk cache)"), ("miss", "miss (streaming)")):
+        print(f"{label:<22} {len(ttfb[outcome]):>5} {pct(ttfb[outcome], 50):>12.1f} "
+              f"{pct(ttfb[outcome], 95):>12.1f} {pct(total[outcome], 50):>13.1f}")
+    print(f"{'miss (old, buffered)':<22} {len(buffered):>5} {pct(buffered, 50):>12.1f} "
+          f"{pct(buffered, 95):>12.1f} {pct(buffered, 50):>13.1f}")
+
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,148 @@
+"""
+Benchmark: /analyze/video pipeline throughput and the detection work keyframes save.
+
+Builds a synthetic walkthrough video from the room photos in data/: for each
+photo the camera pans across a crop for a couple of seconds (with a few
+motion-blurred frames), then cuts to the next room. The video goes through
+analyze_video() and the benchmark reports
+  - per-stage time and throughput (decode, keyframe selection, batched
+    detection, tracking)
+  - keyframes vs. frames decoded / sampled, and raw detections vs. tracked
+    objects (duplicates the tracker merged)
+  - estimated detection time had every frame, or every sampled frame, been
+    sent through the detector one at a time (single-image latency measured
+    on the keyframes)
+
+Without network access use an untrained model (--model-format yaml): the
+timings are representative, the object counts are not.
+
+Usage (from backend/):
+    python benchmarks/bench_video.py
+    python benchmarks/bench_video.py --profile fast --model-format yaml --seconds-per-room 3
+"""
+
+import argparse
+import json
+import sys
+import tempfile
+import time
+from dataclasses import replace
+from pathlib import Path
+
+import cv2
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import video_analysis  # noqa: E402
+from object_detection import DETECTION_PROFILES, ObjectDetector, load_detection_profile  # noqa: E402
+
+DATA_DIR = Path(__file__).resolve().parent.parent.parent / "data"
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp"}
+
+
+def write_walkthrough(images: list, path: str, size: tuple, fps: float, seconds_per_room: float) -> int:
+    """Pan across each image (70% crop, left to right), blurring every 9th frame. Returns frames written."""
+    width, height = size
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, size)
+    if not writer.isOpened():
+        sys.exit("cv2 cannot write mp4 here (no FFmpeg backend?)")
+    frames = 0
+    per_room = max(2, int(seconds_per_room * fps))
+    blur = np.zeros((1, 25), np.float32)
+    blur[0, :] = 1 / 25
+    for image in images:
+        image = cv2.resize(image, (int(width / 0.7), int(height / 0.7)), interpolation=cv2.INTER_AREA)
+        max_x = image.shape[1] - width
+        y = (image.shape[0] - height) // 2
+        for i in range(per_room):
+            x = round(max_x * i / (per_room - 1))
+            frame = image[y:y + height, x:x + width]
+            if frames % 9 == 4:
+                frame = cv2.filter2D(frame, -1, blur)
+            writer.write(np.ascontiguousarray(frame))
+            frames += 1
+    writer.release()
+    return frames
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=Path, default=DATA_DIR, help="Directory of room images")
+    parser.add_argument("--profile", default=None, help="Detection profile (default: DETECTION_PROFILE)")
+    parser.add_argument("--model-format", default=None, help="Override weights format (e.g. onnx, yaml)")
+    parser.add_argument("--fps", type=float, default=30.0, help="Frame rate of the generated video")
+    parser.add_argument("--seconds-per-room", type=float, default=2.5, help="Pan duration per photo")
+    parser.add_argument("--width", type=int, default=1280, help="Video width (height is 3/4 of it)")
+    parser.add_argument("--video", type=Path, default=None, help="Analyze this video instead of generating one")
+    args = parser.parse_args()
+
+    profile = DETECTION_PROFILES[args.profile] if args.profile else load_detection_profile()
+    if args.model_format:
+        profile = replace(profile, model_format=args.model_format)
+    detector = ObjectDetector(profile=profile)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        if args.video:
+            video_path = str(args.video)
+        else:
+            images = [
+                cv2.imread(str(path)) for path in sorted(args.images.iterdir())
+                if path.suffix.lower() in IMAGE_EXTENSIONS
+            ]
+            images = [image for image in images if image is not None]
+            if not images:
+                sys.exit(f"No images found in {args.images}")
+            video_path = str(Path(temp_dir) / "walkthrough.mp4")
+            size = (args.width, args.width * 3 // 4)
+            start = time.perf_counter()
+            frames = write_walkthrough(images, video_path, size, args.fps, args.seconds_per_room)
+            print(f"Generated {frames} frames ({frames / args.fps:.1f}s, {len(images)} rooms, "
+                  f"{size[0]}x{size[1]}) in {time.perf_counter() - start:.1f}s")
+
+        # Warm up the model so the first batch does not pay for initialization
+        detector.detect_images_batch([Image.new("RGB", (640, 480))])
+
+        start = time.perf_counter()
+        video = video_analysis.analyze_video(video_path, detector=detector)
+        total = time.perf_counter() - start
+
+    stats = video.stats
+    print(f"\nprofile {profile.name} ({profile.model_name}), sampling {video_analysis.VIDEO_SAMPLE_FPS} fps, "
+          f"at most {video_analysis.VIDEO_MAX_KEYFRAMES} keyframes\n")
+    print(f"{'stage':<8} {'seconds':>8} {'items':>7} {'items/s':>9}")
+    for stage, entry in stats["stages"].items():
+        unit = "frames" if "frames" in entry else "detections"
+        rate = entry[f"{unit}_per_s"]
+        print(f"{stage:<8} {entry['seconds']:>8.3f} {entry[unit]:>7} {rate if rate is not None else '-':>9}")
+    print(f"{'total':<8} {total:>8.3f} {stats['frames_decoded']:>7} {stats['frames_decoded'] / total:>9.1f}")
+
+    print(f"\n{stats['frames_decoded']} frames decoded, {stats['frames_sampled']} sampled, "
+          f"{stats['segments']} segments, {len(video.keyframes)} keyframes "
+          f"(hero: {video.hero}, {len(video.hero_detections)} objects)")
+    print(f"{stats['detections']} raw detections -> {stats['objects']} tracked objects")
+
+    # Single-image latency, as a frame-by-frame pipeline would pay it
+    rgb = [keyframe.to_rgb() for keyframe in video.keyframes]
+    start = time.perf_counter()
+    for image in rgb:
+        detector.detect_images_batch([image])
+    per_frame = (time.perf_counter() - start) / len(rgb)
+    batched = stats["stages"]["detect"]["seconds"]
+    print(f"\ndetection: {per_frame * 1000:.0f} ms per single frame, "
+          f"{batched / len(rgb) * 1000:.0f} ms per keyframe batched")
+    print(f"{'detect on':<18} {'frames':>7} {'est. seconds':>13} {'vs keyframes':>13}")
+    for label, count, seconds in (
+        ("every frame", stats["frames_decoded"], stats["frames_decoded"] * per_frame),
+        ("every sample", stats["frames_sampled"], stats["frames_sampled"] * per_frame),
+        ("keyframes", len(rgb), batched),
+    ):
+        print(f"{label:<18} {count:>7} {seconds:>13.2f} {seconds / batched:>12.1f}x")
+
+    print("\nkeyframes:")
+    print(json.dumps(video.to_dict()["keyframes"], indent=None))
+
+
+if __name__ == "__main__":
+    main()
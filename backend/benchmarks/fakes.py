@@ -0,0 +1,169 @@
+"""
+Local stand-ins for the external services used by the backend.
+
+Benchmarks patch these into `main` so the real FastAPI app can be exercised
+offline: a chunked fake ElevenLabs client, a canned Gemini analysis (and a
+client returning it), a fake Blender HTTP service, a fixed detection result
+and a helper to run the app under uvicorn.
+"""
+
+import json
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+import uvicorn
+
+from object_detection import Detections
+
+SAMPLE_IMAGE_SIZE = (1024, 768)
+SAMPLE_DETECTIONS = [
+    {"class": "bed", "confidence": 0.93, "bbox": {"x1": 210.0, "y1": 380.5, "x2": 820.4, "y2": 760.2}},
+    {"class": "chair", "confidence": 0.81, "bbox": {"x1": 40.2, "y1": 420.0, "x2": 180.9, "y2": 690.3}},
+    {"class": "potted plant", "confidence": 0.77, "bbox": {"x1": 860.0, "y1": 300.1, "x2": 960.5, "y2": 520.8}},
+    {"class": "tv", "confidence": 0.72, "bbox": {"x1": 400.3, "y1": 120.0, "x2": 610.7, "y2": 260.4}},
+    {"class": "clock", "confidence": 0.55, "bbox": {"x1": 700.0, "y1": 90.0, "x2": 760.0, "y2": 150.0}},
+]
+
+
+class FakeTextToSpeech:
+    """Stand-in for ElevenLabs' text_to_speech client."""
+
+    def __init__(self, first_chunk_latency: float = 0.25, chunk_interval: float = 0.01, bytes_per_char: int = 800):
+        self.first_chunk_latency = first_chunk_latency
+        self.chunk_interval = chunk_interval
+        self.bytes_per_char = bytes_per_char
+        self.calls = 0
+
+    def convert(self, voice_id: str, text: str, output_format: str):
+        self.calls += 1
+        total = max(4096, len(text) * self.bytes_per_char)
+        chunk = b"\xff\xfb" + b"\x00" * 4094
+        time.sleep(self.first_chunk_latency)
+        sent = 0
+        while sent < total:
+            yield chunk
+            sent += len(chunk)
+            time.sleep(self.chunk_interval)
+
+    def full_synthesis_seconds(self, text: str) -> float:
+        chunks = -(-max(4096, len(text) * self.bytes_per_char) // 4096)
+        return self.first_chunk_latency + chunks * self.chunk_interval
+
+
+class FakeElevenLabs:
+    def __init__(self, tts: FakeTextToSpeech):
+        self.text_to_speech = tts
+
+
+def fake_detections() -> Detections:
+    return Detections.from_list(SAMPLE_DETECTIONS, image_size=SAMPLE_IMAGE_SIZE)
+
+
+def fake_gemini_response(detected_objects=None) -> str:
+    """A well-formed analysis in the shape call_gemini_fengshui returns."""
+    count = len(detected_objects) if detected_objects is not None else len(SAMPLE_DETECTIONS)
+    return json.dumps({
+        "score": 7,
+        "overall_analysis": "The room has a calm palette and good natural light, but the bed "
+                            "sits in line with the door and the television faces the sleeping area.",
+        "strengths": ["Soft, balanced colours", "Healthy plant near the window"],
+        "weaknesses": ["Bed in line with the door", "Screen facing the bed"],
+        "suggestions": ["Move the bed to a commanding position", "Cover the TV at night"],
+        "object_tooltips": [
+            {"object_index": i, "type": kind, "message": message}
+            for i, (kind, message) in enumerate([
+                ("bad", "Move the bed so you can see the door without being in line with it."),
+                ("neutral", "Angle the chair towards the room to invite conversation."),
+                ("good", "This plant brings lively wood energy into the space."),
+            ]) if i < count
+        ],
+    })
+
+
+class FakeGeminiModels:
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = 0
+
+    def generate_content(self, model: str, contents: list, config=None):
+        self.calls += 1
+        time.sleep(self.latency)
+        text = fake_gemini_response()
+        usage = SimpleNamespace(prompt_token_count=1500, candidates_token_count=len(text) // 4)
+        return SimpleNamespace(text=text, usage_metadata=usage)
+
+
+class FakeGemini:
+    """Stand-in for genai.Client: the canned analysis for every prompt (set as main._client)."""
+
+    def __init__(self, latency: float = 0.0):
+        self.models = FakeGeminiModels(latency)
+
+
+class FakeBlenderService:
+    """
+    Stand-in for the Blender TrueDepth web service on a local port.
+
+    Serves /status, /process (consumes the upload, answers with an fbx_url)
+    and /download/<name> (fbx_bytes of zeros), like the real service.
+    """
+
+    def __init__(self, fbx_bytes: int = 256 * 1024, process_latency: float = 0.0):
+        self.fbx_bytes = fbx_bytes
+        self.process_latency = process_latency
+        self.processed = 0
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/status":
+                    self.reply(200, json.dumps({"status": "running"}).encode(), "application/json")
+                elif self.path.startswith("/download/"):
+                    self.reply(200, b"\0" * service.fbx_bytes, "application/octet-stream")
+                else:
+                    self.reply(404, b"{}", "application/json")
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                time.sleep(service.process_latency)
+                service.processed += 1
+                body = {"success": True, "fbx_url": f"/download/room_{service.processed}.fbx"}
+                self.reply(200, json.dumps(body).encode(), "application/json")
+
+            def reply(self, status: int, body: bytes, content_type: str):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(app, port: int) -> uvicorn.Server:
+    """Run an ASGI app under uvicorn in a daemon thread (lifespan off, so no Blender)."""
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port,
+                                           lifespan="off", log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
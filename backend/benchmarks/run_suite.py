@@ -0,0 +1,360 @@
+"""
+Offline performance benchmark suite with regression tracking.
+
+Runs on CPU against the images in data/, with Gemini, ElevenLabs and the
+Blender service replaced by the local fakes in fakes.py, and writes every
+measurement to a machine-readable JSON file:
+
+  detector   latency (p50/p95) and throughput per model size, single and batched
+  analyze    end-to-end POST /analyze/ latency (real detector, stubbed services)
+  status     GET /models/status/{id} throughput under concurrent polling
+  fbx        GET /models/{filename} throughput for a generated-size FBX file
+  memory     Python heap peak per /analyze/ request and RSS growth over the run
+
+Each metric records whether lower or higher is better, so a run can be
+compared against a stored baseline; a metric that got worse by more than
+--threshold (relative) is reported as a regression and the exit code is 1.
+
+Without downloaded weights, use --model-format yaml: models are built from
+their architecture definition (untrained, identical compute cost).
+
+Usage (from backend/):
+    python benchmarks/run_suite.py --output benchmarks/results/latest.json
+    python benchmarks/run_suite.py --save-baseline benchmarks/results/baseline.json
+    python benchmarks/run_suite.py --compare benchmarks/results/baseline.json --threshold 0.15
+    python benchmarks/run_suite.py --only detector,analyze --model-sizes n,s --model-format yaml
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import requests
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import main  # noqa: E402
+import object_detection  # noqa: E402
+import storage  # noqa: E402
+from bench_detection_profiles import DATA_DIR, IMAGE_EXTENSIONS  # noqa: E402
+from fakes import FakeElevenLabs, FakeTextToSpeech, fake_gemini_response, free_port, start_server  # noqa: E402
+from object_detection import DETECTION_PROFILES, ObjectDetector  # noqa: E402
+
+SUITES = ("detector", "analyze", "status", "fbx", "memory")
+
+
+class Results:
+    """Flat collection of named measurements."""
+
+    def __init__(self):
+        self.metrics = {}
+
+    def add(self, name: str, value: float, unit: str, better: str = "lower") -> None:
+        self.metrics[name] = {"value": round(float(value), 4), "unit": unit, "better": better}
+        print(f"  {name:<48} {value:>12.3f} {unit}")
+
+    def add_latencies(self, prefix: str, latencies_ms: list) -> None:
+        self.add(f"{prefix}.p50_ms", np.percentile(latencies_ms, 50), "ms")
+        self.add(f"{prefix}.p95_ms", np.percentile(latencies_ms, 95), "ms")
+
+
+def load_images(directory: Path, limit: int) -> list:
+    images = [
+        path.read_bytes() for path in sorted(directory.iterdir())
+        if path.suffix.lower() in IMAGE_EXTENSIONS
+    ]
+    if not images:
+        sys.exit(f"No images found in {directory}")
+    return images[:limit] if limit else images
+
+
+def detector_for(size: str, model_format: str) -> ObjectDetector:
+    return ObjectDetector(profile=replace(
+        DETECTION_PROFILES["accurate"], name=f"accurate-{size}", model_size=size, model_format=model_format
+    ))
+
+
+# ---------------------------------------------------------------------------
+# Suites
+# ---------------------------------------------------------------------------
+
+def bench_detector(results: Results, images: list, args) -> None:
+    for size in args.model_sizes.split(","):
+        detector = detector_for(size, args.model_format)
+        detector.detect_objects(images[0])  # Warm-up
+
+        latencies = []
+        for _ in range(args.rounds):
+            for image_data in images:
+                start = time.perf_counter()
+                detector.detect_objects(image_data)
+                latencies.append((time.perf_counter() - start) * 1000)
+        prefix = f"detector.yolo11{size}"
+        results.add_latencies(f"{prefix}.single", latencies)
+        results.add(f"{prefix}.single.images_per_s", 1000 / np.mean(latencies), "img/s", "higher")
+
+        start = time.perf_counter()
+        for _ in range(args.rounds):
+            detector.detect_objects_batch(images)
+        elapsed = time.perf_counter() - start
+        results.add(f"{prefix}.batched.images_per_s", args.rounds * len(images) / elapsed, "img/s", "higher")
+
+
+def install_stubs(detector: ObjectDetector, fbx_bytes: int) -> None:
+    """Real detector; Gemini, ElevenLabs and Blender replaced by local fakes."""
+    object_detection._detector_instance = detector
+    main.call_gemini_fengshui = (
+        lambda image_data, detected_objects=None, rule_report=None: fake_gemini_response(detected_objects)
+    )
+    main.get_elevenlabs_client = lambda: FakeElevenLabs(FakeTextToSpeech(0.0, 0.0))
+    main.is_blender_service_running = lambda: True
+
+    def fake_generate_room_model(image_data, model='vits', device='cpu', save_results=True, detail=10, strength=0.6):
+        filename = f"room_model_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.fbx"
+        store = storage.get_store()
+        key = store.save(storage.KIND_RENDERS, filename, b"\0" * fbx_bytes)
+        return store.location(key), "3D model generated successfully"
+
+    main.generate_room_model = fake_generate_room_model
+
+
+def check_response(response: requests.Response) -> None:
+    """Abort the run on an error response: timing error paths would make every metric meaningless."""
+    if response.status_code != 200:
+        sys.exit(f"{response.request.method} {response.url} returned {response.status_code}: {response.text[:500]}")
+
+
+def post_analyze(session: requests.Session, base_url: str, image_data: bytes) -> dict:
+    response = session.post(f"{base_url}/analyze/", params={"narrate": "false"},
+                            files={"file": ("room.jpg", image_data, "image/jpeg")})
+    check_response(response)
+    return response.json()
+
+
+def wait_for_models(session: requests.Session, base_url: str, model_ids: list, timeout: float = 60.0) -> None:
+    """Abort the run unless every queued 3D job completes: a failing job is cheaper than a real one."""
+    deadline = time.monotonic() + timeout
+    for model_id in model_ids:
+        while True:
+            response = session.get(f"{base_url}/models/status/{model_id}")
+            check_response(response)
+            status = response.json()
+            if status["status"] == "completed":
+                break
+            if status["status"] == "failed":
+                sys.exit(f"3D job {model_id} failed: {status['error']}")
+            if time.monotonic() > deadline:
+                sys.exit(f"3D job {model_id} still {status['status']} after {timeout:.0f}s")
+            time.sleep(0.05)
+
+
+def bench_analyze(results: Results, images: list, base_url: str, args) -> None:
+    session = requests.Session()
+    model_ids = [post_analyze(session, base_url, images[0])["model_3d"]["model_id"]]  # Warm-up
+    latencies = []
+    for _ in range(args.rounds):
+        for image_data in images:
+            start = time.perf_counter()
+            model_ids.append(post_analyze(session, base_url, image_data)["model_3d"]["model_id"])
+            latencies.append((time.perf_counter() - start) * 1000)
+    results.add_latencies("analyze.latency", latencies)
+    wait_for_models(session, base_url, model_ids)
+
+
+def throughput(url: str, requests_count: int, concurrency: int) -> float:
+    """Requests per second for GETs of url from `concurrency` keep-alive clients."""
+    per_client = max(1, requests_count // concurrency)
+
+    def client(_):
+        session = requests.Session()
+        for _ in range(per_client):
+            response = session.get(url)
+            check_response(response)
+            response.content
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        start = time.perf_counter()
+        list(pool.map(client, range(concurrency)))
+        elapsed = time.perf_counter() - start
+    return per_client * concurrency / elapsed
+
+
+def bench_status(results: Results, base_url: str, args) -> None:
+    model_id = "bench_status_model"
+    main.model_generation_status[model_id] = {'status': 'processing', 'filename': None, 'error': None}
+    rate = throughput(f"{base_url}/models/status/{model_id}", args.requests, args.concurrency)
+    results.add("status.requests_per_s", rate, "req/s", "higher")
+
+
+def bench_fbx(results: Results, base_url: str, args) -> None:
+    filename = "room_model_bench.fbx"
+    storage.get_store().save(storage.KIND_RENDERS, filename, os.urandom(args.fbx_mb * 1024 * 1024))
+    rate = throughput(f"{base_url}/models/{filename}", max(args.requests // 10, args.concurrency), args.concurrency)
+    results.add("fbx.requests_per_s", rate, "req/s", "higher")
+    results.add("fbx.megabytes_per_s", rate * args.fbx_mb, "MB/s", "higher")
+
+
+def rss_bytes() -> int:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def bench_memory(results: Results, images: list, base_url: str, args) -> None:
+    session = requests.Session()
+    post_analyze(session, base_url, images[0])  # Warm-up
+    gc.collect()
+    rss_start = rss_bytes()
+
+    # The server runs in this process, so tracemalloc sees the request's allocations
+    peaks = []
+    tracemalloc.start()
+    for image_data in images:
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        post_analyze(session, base_url, image_data)
+        peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+    tracemalloc.stop()
+
+    for _ in range(args.rounds):
+        for image_data in images:
+            post_analyze(session, base_url, image_data)
+    gc.collect()
+    requests_made = len(images) * (args.rounds + 1)
+
+    results.add("memory.heap_peak_per_request_mb", np.mean(peaks) / 1e6, "MB")
+    results.add("memory.rss_growth_per_request_kb", (rss_bytes() - rss_start) / requests_made / 1024, "KB")
+
+
+# ---------------------------------------------------------------------------
+# Comparison
+# ---------------------------------------------------------------------------
+
+def compare(current: dict, baseline: dict, threshold: float) -> list:
+    """
+    Compare two result files.
+
+    Returns:
+        List of regressed metric names (worse than baseline by more than threshold)
+    """
+    regressions = []
+    print(f"\n{'metric':<48} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name, metric in sorted(current["metrics"].items()):
+        reference = baseline["metrics"].get(name)
+        if reference is None or reference["value"] == 0:
+            continue
+        change = (metric["value"] - reference["value"]) / abs(reference["value"])
+        worse = change > threshold if metric["better"] == "lower" else change < -threshold
+        flag = "  REGRESSION" if worse else ""
+        print(f"{name:<48} {reference['value']:>12.3f} {metric['value']:>12.3f} {change:>+8.1%}{flag}")
+        if worse:
+            regressions.append(name)
+    return regressions
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=Path(__file__).parent, check=True).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+def environment(args) -> dict:
+    import torch
+
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "torch": torch.__version__,
+        "torch_threads": torch.get_num_threads(),
+        "args": {key: str(value) for key, value in vars(args).items()},
+    }
+
+
+def main_suite() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=Path, default=DATA_DIR, help="Directory of room images")
+    parser.add_argument("--image-limit", type=int, default=0, help="Use at most this many images (0 = all)")
+    parser.add_argument("--only", default=",".join(SUITES), help=f"Comma-separated subset of {','.join(SUITES)}")
+    parser.add_argument("--model-sizes", default="n,s", help="Detector sizes for the detector suite")
+    parser.add_argument("--analyze-model-size", default="n", help="Detector size used behind /analyze/")
+    parser.add_argument("--model-format", default="pt", help="Weights format: pt, onnx, ... or yaml (offline)")
+    parser.add_argument("--rounds", type=int, default=2, help="Passes over the image set per measurement")
+    parser.add_argument("--requests", type=int, default=2000, help="Requests for the throughput suites")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent clients for throughput suites")
+    parser.add_argument("--fbx-mb", type=int, default=8, help="Size of the served FBX file")
+    parser.add_argument("--output", type=Path, default=None, help="Write results JSON here")
+    parser.add_argument("--save-baseline", type=Path, default=None, help="Also store results as a baseline")
+    parser.add_argument("--compare", type=Path, default=None, help="Baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.15, help="Relative change counted as regression")
+    args = parser.parse_args()
+
+    suites = [name for name in args.only.split(",") if name]
+    unknown = set(suites) - set(SUITES)
+    if unknown:
+        sys.exit(f"Unknown suites: {', '.join(sorted(unknown))}")
+
+    images = load_images(args.images, args.image_limit)
+    results = Results()
+    print(f"{len(images)} images from {args.images}, suites: {', '.join(suites)}\n")
+
+    if "detector" in suites:
+        bench_detector(results, images, args)
+
+    server_suites = [name for name in suites if name != "detector"]
+    if server_suites:
+        with tempfile.TemporaryDirectory() as tmp:
+            storage._store_instance = storage.ArtifactStore(
+                storage.LocalDirectoryBackend(Path(tmp)), storage.StorageIndex(Path(tmp) / "index.sqlite3")
+            )
+            install_stubs(detector_for(args.analyze_model_size, args.model_format), fbx_bytes=512 * 1024)
+
+            port = free_port()
+            server = start_server(main.app, port)
+            base_url = f"http://127.0.0.1:{port}"
+            if "analyze" in suites:
+                bench_analyze(results, images, base_url, args)
+            if "status" in suites:
+                bench_status(results, base_url, args)
+            if "fbx" in suites:
+                bench_fbx(results, base_url, args)
+            if "memory" in suites:
+                bench_memory(results, images, base_url, args)
+            server.should_exit = True
+            # Let queued 3D background tasks finish before the temp dir goes away
+            time.sleep(0.5)
+
+    report = {"environment": environment(args), "metrics": results.metrics}
+    for path in filter(None, (args.output, args.save_baseline)):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(report, indent=2) + "\n")
+        print(f"\nResults written to {path}")
+
+    if args.compare:
+        baseline = json.loads(args.compare.read_text())
+        regressions = compare(report, baseline, args.threshold)
+        if baseline["environment"].get("platform") != report["environment"]["platform"]:
+            print("\nwarning: baseline was recorded on a different platform")
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.threshold:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+        print(f"\nNo regressions beyond {args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main_suite()
@@ -0,0 +1,429 @@
+"""
+Soak test: drive the API for tens of thousands of requests and fail on resource growth.
+
+The real FastAPI app runs under uvicorn in this process with local fakes for
+the external services: Gemini (a client returning a canned analysis, so the
+prompt and parsing path runs), ElevenLabs (chunked fake audio) and Blender
+(an HTTP service on a local port, so ModelGenerator's requests run for real).
+Detection uses the real detector (--detector yaml: untrained weights built
+offline, pt: downloaded weights) or a fixed result (--detector fake).
+
+--concurrency clients loop over a room's lifecycle until --requests have
+been made:
+  POST /analyze/ (every other one with narration), GET /models/status/{id}
+  until the 3D job finishes, GET /models/{filename}, GET /images/{id}/annotated,
+  POST /tts/generate (--tts-texts distinct texts: hits and misses) and
+  GET /tts/audio/{id} for the narration
+
+Every --sample-every requests the clients pause, background work (3D jobs,
+narration, history writes) drains and the quiet process is sampled: RSS,
+open file descriptors, threads, the traced Python heap and the number of 3D
+job statuses held. The sample after --warmup requests is the baseline
+(caches and pools filled); at the end open files and
+threads must not have grown beyond their limits, and RSS and heap must not
+grow faster than theirs (per 1000 requests) in both halves of the run. The
+tracemalloc top-N shows where the heap grew. The exit code is 1 if any
+limit is exceeded.
+
+All artifacts go to a temporary directory; the TTS and derivative caches
+and the 3D job statuses get small budgets so they evict during warm-up. Similar-room embeddings are off
+(ROOM_EMBEDDINGS=false): the in-memory search index grows by design.
+
+Usage (from backend/):
+    python benchmarks/soak.py                                  # 20000 requests, yaml detector
+    python benchmarks/soak.py --detector fake --requests 50000 --output soak.json
+"""
+
+import argparse
+import gc
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+from pathlib import Path
+
+import requests
+
+TEMP_DIR = Path(tempfile.mkdtemp(prefix="soak_"))
+# Settings read at import time: keep every artifact out of the working tree
+for _name, _value in {
+    "MODEL_BACKEND": "blender",
+    "STORAGE_ROOT": str(TEMP_DIR),
+    "STORAGE_INDEX_PATH": str(TEMP_DIR / "storage_index.sqlite3"),
+    "DERIVATIVE_CACHE_DIR": str(TEMP_DIR / "derivative_cache"),
+    "ANALYSIS_DB_PATH": str(TEMP_DIR / "analyses.sqlite3"),
+    "DERIVATIVE_CACHE_MAX_MB": "32",
+    "MODEL_STATUS_MAX_JOBS": "500",
+    "ROOM_EMBEDDINGS": "false",
+}.items():
+    os.environ[_name] = _value
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import main  # noqa: E402
+import model_generation  # noqa: E402
+import object_detection  # noqa: E402
+import tts_cache  # noqa: E402
+from bench_detection_profiles import DATA_DIR, IMAGE_EXTENSIONS  # noqa: E402
+from analysis_history import get_analysis_writer  # noqa: E402
+from fakes import (  # noqa: E402
+    FakeBlenderService, FakeElevenLabs, FakeGemini, FakeTextToSpeech, fake_detections, free_port, start_server
+)
+from object_detection import DETECTION_PROFILES, ObjectDetector  # noqa: E402
+
+TTS_TEXTS_PER_CYCLE = 2
+STATUS_POLLS_MAX = 200
+
+
+class FakeDetector(ObjectDetector):
+    """The fixed detection result for every image; results are still stored."""
+
+    def __init__(self):
+        self.profile = DETECTION_PROFILES["accurate"]
+        self.model_name = "fake"
+
+    def detect_objects(self, image_data: bytes, confidence_threshold=None):
+        return fake_detections()
+
+
+def install_fakes(args, images: list) -> FakeBlenderService:
+    if args.detector == "fake":
+        object_detection._detector_instance = FakeDetector()
+    else:
+        detector = ObjectDetector(profile=replace(
+            DETECTION_PROFILES["accurate"], name=f"soak-{args.model_size}",
+            model_size=args.model_size, model_format=args.detector
+        ))
+        detector.detect_objects(images[0])  # Warm-up: the predictor is set up on first use
+        object_detection._detector_instance = detector
+    main._client = FakeGemini()
+    main._elevenlabs_client = FakeElevenLabs(FakeTextToSpeech(0.0, 0.0, bytes_per_char=200))
+    tts_cache._cache_instance = tts_cache.AudioCache(TEMP_DIR / "tts_cache", max_bytes=args.tts_cache_mb * 1024 * 1024)
+
+    blender = FakeBlenderService(fbx_bytes=args.fbx_kb * 1024)
+    model_generation._generator_instance = model_generation.ModelGenerator(service_url=blender.url)
+    main.is_blender_service_running = lambda: True
+    return blender
+
+
+# ---------------------------------------------------------------------------
+# Sampling
+# ---------------------------------------------------------------------------
+
+def rss_bytes() -> int:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def open_fds() -> int:
+    return len(os.listdir("/proc/self/fd"))
+
+
+def native_threads() -> int:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("Threads:"):
+                return int(line.split()[1])
+    return threading.active_count()
+
+
+def sample(done: int, start: float) -> dict:
+    gc.collect()
+    return {
+        "requests": done,
+        "seconds": round(time.perf_counter() - start, 1),
+        "rss_mb": round(rss_bytes() / 2 ** 20, 1),
+        "fds": open_fds(),
+        "threads": native_threads(),
+        "heap_mb": round(tracemalloc.get_traced_memory()[0] / 2 ** 20, 2) if tracemalloc.is_tracing() else None,
+        "model_jobs": len(main.model_generation_status),
+    }
+
+
+def print_sample(row: dict) -> None:
+    heap = f"{row['heap_mb']:>9.2f}" if row["heap_mb"] is not None else f"{'-':>9}"
+    print(f"{row['requests']:>9} {row['seconds']:>8.0f} {row['rss_mb']:>9.1f} {row['fds']:>5} "
+          f"{row['threads']:>8} {heap} {row['model_jobs']:>11}", flush=True)
+
+
+# ---------------------------------------------------------------------------
+# Load
+# ---------------------------------------------------------------------------
+
+class Load:
+    """
+    Request counter shared by the clients.
+
+    The main thread pauses the clients between room cycles to sample a
+    quiet process, so requests in flight do not blur the measurements.
+    """
+
+    def __init__(self, total: int):
+        self.total = total
+        self.done = 0
+        self.active = 0
+        self.errors = {}
+        self.running = True
+        self.condition = threading.Condition()
+
+    def count(self, response: requests.Response, allowed=(200,)) -> requests.Response:
+        with self.condition:
+            self.done += 1
+            if response.status_code not in allowed:
+                key = f"{response.request.method} {response.status_code}"
+                self.errors[key] = self.errors.get(key, 0) + 1
+            self.condition.notify_all()
+        return response
+
+    @property
+    def finished(self) -> bool:
+        return self.done >= self.total
+
+    def enter(self) -> bool:
+        """Wait until the load runs; False once all requests are made."""
+        with self.condition:
+            self.condition.wait_for(lambda: self.running or self.finished)
+            if self.finished:
+                return False
+            self.active += 1
+            return True
+
+    def leave(self) -> None:
+        with self.condition:
+            self.active -= 1
+            self.condition.notify_all()
+
+    def pause_at(self, requests_done: int) -> None:
+        """Stop the clients once requests_done requests are made and their cycles have ended."""
+        with self.condition:
+            self.condition.wait_for(lambda: self.done >= requests_done or self.finished)
+            self.running = False
+            self.condition.wait_for(lambda: self.active == 0)
+
+    def stop(self) -> None:
+        with self.condition:
+            self.total = self.done
+            self.condition.notify_all()
+
+    def resume(self) -> None:
+        with self.condition:
+            self.running = True
+            self.condition.notify_all()
+
+
+def room_cycle(session: requests.Session, base_url: str, load: Load, image: bytes, cycle: int, tts_texts: int) -> None:
+    """One upload and what a viewer does with it."""
+    response = load.count(session.post(
+        f"{base_url}/analyze/", params={"narrate": str(cycle % 2 == 0).lower()},
+        files={"file": ("room.jpg", image, "image/jpeg")}
+    ), allowed=(200, 503))
+    if response.status_code != 200:
+        return
+    analysis = response.json()
+
+    model_id = analysis["model_3d"]["model_id"]
+    for _ in range(STATUS_POLLS_MAX):
+        status = load.count(session.get(f"{base_url}/models/status/{model_id}")).json()
+        if status.get("status") in ("completed", "failed"):
+            break
+        time.sleep(0.005)
+    if status.get("filename"):
+        load.count(session.get(f"{base_url}/models/{status['filename']}"))
+
+    if analysis.get("images"):
+        load.count(session.get(f"{base_url}{analysis['images']['annotated']}"))
+
+    for i in range(TTS_TEXTS_PER_CYCLE):
+        text = f"Room {(cycle * TTS_TEXTS_PER_CYCLE + i) % tts_texts}: keep the path to the door clear."
+        load.count(session.post(f"{base_url}/tts/generate", json={"text": text})).content
+    narration = analysis.get("narration") or {}
+    if narration.get("overall"):
+        load.count(session.get(f"{base_url}{narration['overall']['url']}")).content
+
+
+def client(base_url: str, load: Load, images: list, index: int, concurrency: int, tts_texts: int) -> None:
+    session = requests.Session()
+    cycle = index
+    try:
+        while load.enter():
+            try:
+                room_cycle(session, base_url, load, images[cycle % len(images)], cycle, tts_texts)
+            finally:
+                load.leave()
+            cycle += concurrency
+    except Exception:
+        load.stop()
+        raise
+
+
+def wait_idle(timeout: float = 60.0) -> None:
+    """Let background work started by the requests finish: 3D jobs, narration and history writes."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        busy = main.count_model_jobs("pending") + main.count_model_jobs("processing") + len(main._narration_jobs)
+        if not busy:
+            break
+        time.sleep(0.05)
+    get_analysis_writer().flush()
+
+
+# ---------------------------------------------------------------------------
+# Report
+# ---------------------------------------------------------------------------
+
+def growth_per_1k(first: dict, last: dict, key: str) -> float:
+    return (last[key] - first[key]) * 1000 / max(1, last["requests"] - first["requests"])
+
+
+def check_growth(measured: list, args) -> list:
+    """
+    Limits exceeded after warm-up (measured: the baseline sample and those after it).
+
+    Open files and threads must not grow at all beyond their limit. RSS and
+    heap count as leaking when they grow in both halves of the run: a one-off
+    step (a dict resizing, an allocator arena) only shows in one.
+    """
+    baseline, middle, final = measured[0], measured[len(measured) // 2], measured[-1]
+    halves = [(baseline, middle), (middle, final)] if len(measured) > 2 else [(baseline, final)]
+    checks = [
+        ("open fds", final["fds"] - baseline["fds"], args.max_fd_growth, ""),
+        ("threads", final["threads"] - baseline["threads"], args.max_thread_growth, ""),
+        ("RSS per 1k requests", min(growth_per_1k(a, b, "rss_mb") for a, b in halves) * 1024,
+         args.max_rss_kb_per_1k, "KB"),
+    ]
+    if final["heap_mb"] is not None:
+        checks.append(("heap per 1k requests", min(growth_per_1k(a, b, "heap_mb") for a, b in halves) * 1024,
+                       args.max_heap_kb_per_1k, "KB"))
+    failures = []
+    print(f"\nGrowth over {final['requests'] - baseline['requests']} requests after warm-up "
+          f"(per 1k requests: the smaller of both halves):")
+    for name, growth, limit, unit in checks:
+        exceeded = growth > limit
+        print(f"  {name:<22} {growth:>+10.1f} {unit:<3} (limit {limit}){'  EXCEEDED' if exceeded else ''}")
+        if exceeded:
+            failures.append(name)
+    return failures
+
+
+def heap_snapshot() -> tracemalloc.Snapshot:
+    return tracemalloc.take_snapshot().filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+    ])
+
+
+def print_top_growth(baseline: tracemalloc.Snapshot, top: int) -> None:
+    grown = [stat for stat in heap_snapshot().compare_to(baseline, "lineno") if stat.size_diff > 0]
+    print(f"\nTop {top} heap growth since warm-up:")
+    for stat in grown[:top]:
+        frame = stat.traceback[0]
+        print(f"  {stat.size_diff / 1024:>+10.1f} KB {stat.count_diff:>+8} blocks  {frame.filename}:{frame.lineno}")
+
+
+def main_soak() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20000, help="Requests in total")
+    parser.add_argument("--warmup", type=int, default=2000, help="Requests before the baseline sample")
+    parser.add_argument("--sample-every", type=int, default=1000, help="Requests between samples")
+    parser.add_argument("--concurrency", type=int, default=4, help="Concurrent clients")
+    parser.add_argument("--detector", default="yaml", help="fake, or a weights format: yaml (offline), pt, onnx, ...")
+    parser.add_argument("--model-size", default="n", help="Detector size for the real detector")
+    parser.add_argument("--images", type=Path, default=DATA_DIR, help="Directory of room images")
+    parser.add_argument("--tts-texts", type=int, default=500, help="Distinct texts sent to /tts/generate")
+    parser.add_argument("--tts-cache-mb", type=int, default=16, help="TTS cache budget (evicts during the run)")
+    parser.add_argument("--fbx-kb", type=int, default=256, help="Size of the fake Blender FBX")
+    parser.add_argument("--top", type=int, default=10, help="Heap growth lines to show")
+    parser.add_argument("--no-tracemalloc", action="store_true", help="Skip heap tracing (faster, no heap check)")
+    parser.add_argument("--max-rss-kb-per-1k", type=float, default=256.0, help="Limit on RSS growth per 1000 requests")
+    parser.add_argument("--max-fd-growth", type=int, default=16, help="Limit on open file descriptor growth")
+    parser.add_argument("--max-thread-growth", type=int, default=8, help="Limit on thread count growth")
+    parser.add_argument("--max-heap-kb-per-1k", type=float, default=16.0,
+                        help="Limit on traced heap growth per 1000 requests")
+    parser.add_argument("--output", type=Path, default=None, help="Write the samples and verdict as JSON here")
+    args = parser.parse_args()
+
+    images = [
+        path.read_bytes() for path in sorted(args.images.iterdir())
+        if path.suffix.lower() in IMAGE_EXTENSIONS
+    ]
+    if not images:
+        sys.exit(f"No images found in {args.images}")
+
+    blender = install_fakes(args, images)
+    port = free_port()
+    server = start_server(main.app, port)
+    base_url = f"http://127.0.0.1:{port}"
+    print(f"Soak: {args.requests} requests, {args.concurrency} clients, detector {args.detector}, "
+          f"{len(images)} images, artifacts in {TEMP_DIR}\n")
+    print(f"{'requests':>9} {'seconds':>8} {'rss MB':>9} {'fds':>5} {'threads':>8} {'heap MB':>9} {'3D statuses':>11}")
+
+    if not args.no_tracemalloc:
+        # Traced from the start: entries replacing others in a full cache are not counted as growth
+        tracemalloc.start()
+    load = Load(args.requests)
+    start = time.perf_counter()
+    samples = [sample(0, start)]
+    print_sample(samples[0])
+    baseline_index = None
+    heap_baseline = None
+    with ThreadPoolExecutor(args.concurrency, thread_name_prefix="soak-client") as pool:
+        futures = [
+            pool.submit(client, base_url, load, images, i, args.concurrency, args.tts_texts)
+            for i in range(args.concurrency)
+        ]
+        next_sample = args.sample_every
+        while True:
+            load.pause_at(min(next_sample, args.requests))
+            wait_idle()
+            samples.append(sample(load.done, start))
+            print_sample(samples[-1])
+            if baseline_index is None and load.done >= args.warmup:
+                baseline_index = len(samples) - 1
+                if tracemalloc.is_tracing():
+                    heap_baseline = heap_snapshot()
+            if load.finished:
+                break
+            next_sample = load.done + args.sample_every
+            load.resume()
+        load.resume()
+        for future in futures:
+            future.result()  # Re-raise a client's error
+
+    if load.errors:
+        print(f"\nUnexpected responses: {', '.join(f'{key} x{count}' for key, count in sorted(load.errors.items()))}")
+    if baseline_index is None or baseline_index == len(samples) - 1:
+        sys.exit(f"--requests ({args.requests}) must exceed --warmup ({args.warmup}) by at least --sample-every")
+    failures = check_growth(samples[baseline_index:], args)
+    if heap_baseline is not None:
+        print_top_growth(heap_baseline, args.top)
+        tracemalloc.stop()
+
+    server.should_exit = True
+    blender.stop()
+    main.stop_analysis_history()
+    shutil.rmtree(TEMP_DIR, ignore_errors=True)
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(json.dumps({
+            "args": {key: str(value) for key, value in vars(args).items()},
+            "samples": samples,
+            "baseline": samples[baseline_index],
+            "failures": failures,
+            "errors": load.errors,
+        }, indent=2) + "\n")
+        print(f"\nSamples written to {args.output}")
+
+    if failures:
+        print(f"\nFAIL: growth beyond the limits in {', '.join(failures)}")
+        sys.exit(1)
+    print("\nPASS: no growth beyond the limits")
+
+
+if __name__ == "__main__":
+    main_soak()
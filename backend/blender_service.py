@@ -1,20 +1,39 @@
 """
 Blender service manager for TrueDepth Extractor web service.
 Manages the lifecycle of the Blender web service subprocess.
+
+The subprocess is supervised:
+  - its stdout/stderr are drained continuously by reader threads into a
+    bounded ring buffer (and forwarded to the log, rate limited), so a
+    chatty service can never block on a full pipe
+  - it runs at a lower CPU priority, optionally pinned to a subset of
+    cores and with an address-space limit, so Blender cannot starve the
+    API's inference threads
+  - a watchdog polls /status and restarts the service when it exits or
+    when /status stops answering in time (a hung service); a restart that
+    fails is retried with exponential backoff, up to the hourly restart cap
 """
 
 import subprocess
 import logging
+import os
+import threading
 import time
 import signal
 import sys
 import requests
 import atexit
+from collections import deque
 from pathlib import Path
-from typing import Optional
+from typing import Dict, List, Optional
+
+from cpu_budget import get_cpu_budget, model_3d_env
+from metrics import BLENDER_OUTPUT_LINES, BLENDER_OUTPUT_SUPPRESSED, BLENDER_RESTARTS, BLENDER_STATUS_SECONDS
 
 # Configure logging
 logger = logging.getLogger(__name__)
+# Lines written by the service itself
+output_logger = logging.getLogger(f"{__name__}.output")
 
 # Configuration
 BLENDER_SERVICE_PORT = 5001
@@ -22,23 +41,109 @@ BLENDER_SERVICE_HOST = "127.0.0.1"
 BLENDER_SERVICE_URL = f"http://{BLENDER_SERVICE_HOST}:{BLENDER_SERVICE_PORT}"
 TRUEDEPTH_PLUGIN_PATH = Path("/home/roman/true_depth_extractor_plugin")
 WEB_SERVICE_SCRIPT = TRUEDEPTH_PLUGIN_PATH / "web_service.py"
+BLENDER_STARTUP_TIMEOUT = float(os.environ.get("BLENDER_STARTUP_TIMEOUT", "30"))
+# Resource limits for the service and the Blender processes it spawns
+BLENDER_NICE = int(os.environ.get("BLENDER_NICE", "10"))
+BLENDER_MAX_MEMORY_MB = int(os.environ.get("BLENDER_MAX_MEMORY_MB", "0"))  # 0 = unlimited
+# Comma-separated CPU ids the service may run on (empty = the CPU budget's 3D cores, or all)
+BLENDER_CPUS = os.environ.get("BLENDER_CPUS", "")
+# Output capture: lines kept for diagnostics and lines per second forwarded to the log
+BLENDER_OUTPUT_LINES_KEPT = int(os.environ.get("BLENDER_OUTPUT_LINES", "2000"))
+BLENDER_LOG_RATE = int(os.environ.get("BLENDER_LOG_RATE", "50"))
+MAX_LINE_BYTES = 8192
+# Watchdog: seconds between /status checks (0 disables), the slowest answer
+# that counts as healthy and how many unhealthy checks in a row mean a hang
+BLENDER_WATCHDOG_INTERVAL = float(os.environ.get("BLENDER_WATCHDOG_INTERVAL", "10"))
+BLENDER_HANG_TIMEOUT = float(os.environ.get("BLENDER_HANG_TIMEOUT", "5"))
+BLENDER_HANG_CHECKS = int(os.environ.get("BLENDER_HANG_CHECKS", "3"))
+# Give up restarting a service that keeps failing
+BLENDER_MAX_RESTARTS_PER_HOUR = int(os.environ.get("BLENDER_MAX_RESTARTS_PER_HOUR", "10"))
+# Longest wait in seconds between retries of a restart that failed
+BLENDER_RESTART_BACKOFF_MAX = float(os.environ.get("BLENDER_RESTART_BACKOFF_MAX", "300"))
+
+
+def parse_cpu_list(value: str) -> List[int]:
+    """Parse '0,2-3' into [0, 2, 3]."""
+    cpus = []
+    for part in value.split(","):
+        part = part.strip()
+        if "-" in part:
+            first, last = part.split("-", 1)
+            cpus.extend(range(int(first), int(last) + 1))
+        elif part:
+            cpus.append(int(part))
+    return cpus
 
 
 class BlenderServiceManager:
     """Manager for the Blender web service subprocess."""
 
-    def __init__(self, host: str = BLENDER_SERVICE_HOST, port: int = BLENDER_SERVICE_PORT):
+    def __init__(
+        self,
+        host: str = BLENDER_SERVICE_HOST,
+        port: int = BLENDER_SERVICE_PORT,
+        command: Optional[List[str]] = None,
+        nice: int = BLENDER_NICE,
+        max_memory_mb: int = BLENDER_MAX_MEMORY_MB,
+        cpus: Optional[List[int]] = None,
+        startup_timeout: float = BLENDER_STARTUP_TIMEOUT,
+        watchdog_interval: float = BLENDER_WATCHDOG_INTERVAL,
+        hang_timeout: float = BLENDER_HANG_TIMEOUT,
+        hang_checks: int = BLENDER_HANG_CHECKS,
+        output_lines: int = BLENDER_OUTPUT_LINES_KEPT,
+        log_rate: int = BLENDER_LOG_RATE
+    ):
         """
         Initialize the Blender service manager.
 
         Args:
             host: Host address for the service
             port: Port number for the service
+            command: Command line of the service (default: TrueDepth web_service.py)
+            nice: Niceness added to the service's CPU priority
+            max_memory_mb: Address-space limit of the service in MB (0 = unlimited)
+            cpus: CPU ids the service may run on (default: BLENDER_CPUS, else the
+                CPU budget's 3D cores with CPU_BUDGET_AFFINITY, else all)
+            startup_timeout: Seconds to wait for /status after launch
+            watchdog_interval: Seconds between /status checks (0 disables the watchdog)
+            hang_timeout: Slowest /status answer that counts as healthy
+            hang_checks: Unhealthy checks in a row before the service is restarted
+            output_lines: Lines of service output kept in the ring buffer
+            log_rate: Service output lines per second forwarded to the log
         """
         self.host = host
         self.port = port
         self.url = f"http://{host}:{port}"
+        self.command = command
+        self.nice = nice
+        self.max_memory_mb = max_memory_mb
+        if cpus is None:
+            cpus = parse_cpu_list(BLENDER_CPUS) or get_cpu_budget().model_3d_cpus
+        self.cpus = cpus
+        self.startup_timeout = startup_timeout
+        self.watchdog_interval = watchdog_interval
+        self.hang_timeout = hang_timeout
+        self.hang_checks = hang_checks
+        self.log_rate = log_rate
         self.process: Optional[subprocess.Popen] = None
+        # (timestamp, stream, line) of the most recent service output
+        self.output: deque = deque(maxlen=output_lines)
+        self.restarts: List[float] = []
+        # Restarts in a row that left no running service, and when the next retry is due
+        self.failed_restarts = 0
+        self._next_restart = 0.0
+        self._cap_logged = False
+        self.last_status_seconds: Optional[float] = None
+        self._readers: List[threading.Thread] = []
+        # Serializes launch / terminate (watchdog vs. stop())
+        self._lock = threading.RLock()
+        self._watchdog: Optional[threading.Thread] = None
+        self._watchdog_stop = threading.Event()
+        # Log rate limiting: lines forwarded in the current second and lines suppressed since
+        self._log_lock = threading.Lock()
+        self._log_window = 0
+        self._logged_in_window = 0
+        self._suppressed = 0
         self._register_shutdown_handlers()
 
     def _register_shutdown_handlers(self) -> None:
@@ -47,7 +152,7 @@ class BlenderServiceManager:
         signal.signal(signal.SIGTERM, lambda s, f: self.stop())
         signal.signal(signal.SIGINT, lambda s, f: self.stop())
 
-    def is_running(self) -> bool:
+    def is_running(self, timeout: float = 2) -> bool:
         """
         Check if the Blender service is running and healthy.
 
@@ -55,7 +160,7 @@ class BlenderServiceManager:
             bool: True if service is running and healthy
         """
         try:
-            response = requests.get(f"{self.url}/status", timeout=2)
+            response = requests.get(f"{self.url}/status", timeout=timeout)
             return response.status_code == 200
         except Exception:
             return False
@@ -115,7 +220,7 @@ sys.exit(0)
 
     def start(self) -> bool:
         """
-        Start the Blender web service.
+        Start the Blender web service (and its watchdog).
 
         Returns:
             bool: True if service started successfully
@@ -125,85 +230,243 @@ sys.exit(0)
             logger.info(f"Blender service already running at {self.url}")
             return True
 
-        # Validate script path
-        if not WEB_SERVICE_SCRIPT.exists():
-            logger.error(f"Blender service script not found: {WEB_SERVICE_SCRIPT}")
-            return False
+        if self.command is None:
+            # Validate script path
+            if not WEB_SERVICE_SCRIPT.exists():
+                logger.error(f"Blender service script not found: {WEB_SERVICE_SCRIPT}")
+                return False
 
-        # Check if required Blender plugins are installed (warning only, don't block)
-        logger.info("Checking Blender plugins...")
-        if not self._check_blender_plugins():
-            logger.warning("⚠ Blender plugin check failed in background mode")
-            logger.warning("This is expected - plugins load correctly when service runs")
-            logger.warning("")
+            # Check if required Blender plugins are installed (warning only, don't block)
+            logger.info("Checking Blender plugins...")
+            if not self._check_blender_plugins():
+                logger.warning("⚠ Blender plugin check failed in background mode")
+                logger.warning("This is expected - plugins load correctly when service runs")
+                logger.warning("")
 
+        with self._lock:
+            if not self._launch():
+                return False
+            self.failed_restarts = 0
+        self._start_watchdog()
+        return True
+
+    def _service_command(self) -> List[str]:
+        if self.command is not None:
+            return self.command
+        return [
+            sys.executable,  # Use same Python interpreter
+            str(WEB_SERVICE_SCRIPT),
+            '--host', self.host,
+            '--port', str(self.port),
+            '--blender', 'blender'  # Assumes 'blender' is in PATH
+        ]
+
+    def _launch(self) -> bool:
+        """Start the subprocess with output draining and resource limits, and wait until it is healthy."""
         try:
             logger.info(f"Starting Blender service on {self.host}:{self.port}...")
 
-            # Start the web service as a subprocess
+            # Own session, so stop() also reaches the Blender processes the service spawns
             self.process = subprocess.Popen(
-                [
-                    sys.executable,  # Use same Python interpreter
-                    str(WEB_SERVICE_SCRIPT),
-                    '--host', self.host,
-                    '--port', str(self.port),
-                    '--blender', 'blender'  # Assumes 'blender' is in PATH
-                ],
+                self._service_command(),
+                stdin=subprocess.DEVNULL,
+                env=model_3d_env(),
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE,
-                text=True,
-                bufsize=1
+                start_new_session=True
             )
-
-            # Wait for service to be ready (max 30 seconds)
-            max_retries = 30
-            for i in range(max_retries):
-                time.sleep(1)
+            self._apply_limits(self.process.pid)
+            self._readers = [
+                threading.Thread(
+                    target=self._drain, args=(pipe, stream, self.process.pid),
+                    name=f"blender-{stream}", daemon=True
+                )
+                for pipe, stream in ((self.process.stdout, "stdout"), (self.process.stderr, "stderr"))
+            ]
+            for reader in self._readers:
+                reader.start()
+
+            # Wait for service to be ready
+            deadline = time.monotonic() + self.startup_timeout
+            while time.monotonic() < deadline:
+                time.sleep(0.25)
                 if self.is_running():
-                    logger.info(f"✓ Blender service started successfully at {self.url}")
+                    logger.info(f"✓ Blender service started successfully at {self.url} (pid {self.process.pid})")
                     return True
 
                 # Check if process died
                 if self.process.poll() is not None:
-                    # Process terminated
-                    stdout, stderr = self.process.communicate()
-                    logger.error(f"Blender service failed to start:")
-                    logger.error(f"STDOUT: {stdout}")
-                    logger.error(f"STDERR: {stderr}")
+                    for reader in self._readers:
+                        reader.join(timeout=2)
+                    logger.error(f"Blender service failed to start (exit code {self.process.returncode}):")
+                    for line in self.output_tail(50):
+                        logger.error(f"  {line}")
+                    self.process = None
                     return False
 
             logger.error("Blender service startup timeout")
-            self.stop()
+            self._terminate()
             return False
 
         except Exception as e:
             logger.error(f"Failed to start Blender service: {e}")
             return False
 
-    def stop(self) -> None:
-        """Stop the Blender web service."""
+    def _apply_limits(self, pid: int) -> None:
+        """
+        Lower the service's priority and apply memory / CPU limits.
+
+        Applied from the parent right after launch (preexec_fn is unsafe in
+        a threaded server); processes the service spawns inherit them.
+        """
+        try:
+            if self.nice:
+                os.setpriority(os.PRIO_PROCESS, pid, os.getpriority(os.PRIO_PROCESS, pid) + self.nice)
+            if self.max_memory_mb:
+                import resource
+                limit = self.max_memory_mb * 1024 * 1024
+                resource.prlimit(pid, resource.RLIMIT_AS, (limit, limit))
+            if self.cpus:
+                os.sched_setaffinity(pid, self.cpus)
+        except (AttributeError, OSError, ValueError) as e:
+            # Not Linux, or limits not permitted - run unrestricted
+            logger.warning(f"Could not apply Blender service resource limits: {e}")
+
+    def _drain(self, pipe, stream: str, pid: int) -> None:
+        """Read one output stream until EOF into the ring buffer and the log."""
+        with pipe:
+            for raw in iter(lambda: pipe.readline(MAX_LINE_BYTES), b""):
+                line = raw.decode("utf-8", errors="replace").rstrip()
+                self.output.append((time.time(), stream, line))
+                BLENDER_OUTPUT_LINES.labels(stream=stream).inc()
+                self._forward(stream, pid, line)
+
+    def _forward(self, stream: str, pid: int, line: str) -> None:
+        """Log a line of service output unless this second's budget is used up."""
+        with self._log_lock:
+            window = int(time.monotonic())
+            if window != self._log_window:
+                if self._suppressed:
+                    output_logger.warning(
+                        f"[blender pid={pid}] {self._suppressed} output lines not logged (rate limit); "
+                        f"see the output ring buffer"
+                    )
+                self._log_window, self._logged_in_window, self._suppressed = window, 0, 0
+            if self._logged_in_window >= self.log_rate:
+                self._suppressed += 1
+                BLENDER_OUTPUT_SUPPRESSED.inc()
+                return
+            self._logged_in_window += 1
+        output_logger.info(f"[blender pid={pid} {stream}] {line}", extra={"blender_pid": pid, "stream": stream})
+
+    def output_tail(self, lines: int = 100) -> List[str]:
+        """The most recent lines of service output, oldest first."""
+        entries = list(self.output)[-lines:]
+        return [f"{stream}: {line}" for _, stream, line in entries]
+
+    def _start_watchdog(self) -> None:
+        if self.watchdog_interval <= 0 or (self._watchdog is not None and self._watchdog.is_alive()):
+            return
+        self._watchdog_stop.clear()
+        self._watchdog = threading.Thread(target=self._watch, name="blender-watchdog", daemon=True)
+        self._watchdog.start()
+
+    def _watch(self) -> None:
+        """Poll /status and restart the service when it exits or hangs."""
+        strikes = 0
+        while not self._watchdog_stop.wait(self.watchdog_interval):
+            process = self.process
+            if process is None:
+                # Stopped, or down after a failed restart: retry the latter once its backoff is over
+                if self.failed_restarts and time.monotonic() >= self._next_restart:
+                    self._recover(f"down after {self.failed_restarts} failed restart(s)", "launch_failed")
+                continue
+            if process.poll() is not None:
+                self._recover(f"exited with code {process.returncode}", "exited")
+                strikes = 0
+                continue
+
+            start = time.perf_counter()
+            healthy = self.is_running(timeout=self.hang_timeout)
+            self.last_status_seconds = time.perf_counter() - start
+            BLENDER_STATUS_SECONDS.observe(self.last_status_seconds)
+            strikes = 0 if healthy else strikes + 1
+            if strikes >= self.hang_checks:
+                self._recover(f"/status unhealthy for {strikes} checks", "hang")
+                strikes = 0
+
+    def _recover(self, problem: str, reason: str) -> None:
+        """Restart a failed service, unless it has been restarted too often."""
+        now = time.time()
+        self.restarts = [when for when in self.restarts if now - when < 3600]
+        if len(self.restarts) >= BLENDER_MAX_RESTARTS_PER_HOUR:
+            if not self._cap_logged:
+                logger.error(f"Blender service {problem}; not restarting "
+                             f"({len(self.restarts)} restarts in the last hour)")
+                self._cap_logged = True
+            return
+        self._cap_logged = False
+
+        logger.error(f"Blender service {problem} - restarting. Last output:")
+        for line in self.output_tail(20):
+            logger.error(f"  {line}")
+        BLENDER_RESTARTS.labels(reason=reason).inc()
+        self.restarts.append(now)
+        with self._lock:
+            if self._watchdog_stop.is_set():
+                return
+            self._terminate()
+            if self._launch():
+                self.failed_restarts = 0
+                return
+            self.failed_restarts += 1
+            delay = min(self.watchdog_interval * 2 ** self.failed_restarts, BLENDER_RESTART_BACKOFF_MAX)
+            self._next_restart = time.monotonic() + delay
+            logger.error(f"Blender service restart failed ({self.failed_restarts} in a row); "
+                         f"retrying in {delay:.0f}s")
+
+    def _terminate(self) -> None:
+        """Stop the subprocess and everything it spawned, then wait for the readers."""
         if self.process is None:
             return
-
-        logger.info("Stopping Blender service...")
-
+        process = self.process
         try:
             # Try graceful termination first
-            self.process.terminate()
+            os.killpg(process.pid, signal.SIGTERM)
             try:
-                self.process.wait(timeout=5)
+                process.wait(timeout=5)
                 logger.info("✓ Blender service stopped gracefully")
             except subprocess.TimeoutExpired:
                 # Force kill if not terminated
                 logger.warning("Blender service didn't stop gracefully, forcing kill...")
-                self.process.kill()
-                self.process.wait()
+                os.killpg(process.pid, signal.SIGKILL)
+                process.wait()
                 logger.info("✓ Blender service killed")
+        except ProcessLookupError:
+            process.wait()
         except Exception as e:
             logger.error(f"Error stopping Blender service: {e}")
         finally:
+            for reader in self._readers:
+                reader.join(timeout=2)
+            self._readers = []
             self.process = None
 
+    def stop(self) -> None:
+        """Stop the Blender web service and its watchdog."""
+        self._watchdog_stop.set()
+        watchdog = self._watchdog
+        if watchdog is not None and watchdog is not threading.current_thread():
+            watchdog.join(timeout=self.hang_timeout + 10)
+        self._watchdog = None
+
+        if self.process is None:
+            return
+
+        logger.info("Stopping Blender service...")
+        with self._lock:
+            self._terminate()
+
     def restart(self) -> bool:
         """
         Restart the Blender web service.
@@ -216,6 +479,21 @@ sys.exit(0)
         time.sleep(2)
         return self.start()
 
+    def stats(self) -> Dict[str, object]:
+        """Supervision state: process, limits, watchdog and recent output."""
+        process = self.process
+        return {
+            "pid": process.pid if process is not None else None,
+            "running": process is not None and process.poll() is None,
+            "restarts_last_hour": len([when for when in self.restarts if time.time() - when < 3600]),
+            "failed_restarts": self.failed_restarts,
+            "last_status_ms": round(self.last_status_seconds * 1000, 1)
+            if self.last_status_seconds is not None else None,
+            "limits": {"nice": self.nice, "max_memory_mb": self.max_memory_mb, "cpus": self.cpus},
+            "watchdog": self._watchdog is not None and self._watchdog.is_alive(),
+            "output_tail": self.output_tail(50),
+        }
+
 
 # Global service manager instance
 _service_manager: Optional[BlenderServiceManager] = None
@@ -0,0 +1,436 @@
+"""
+Offline bulk feng shui scoring over directories of room images.
+
+Walks a directory tree and streams every image through a bounded pipeline
+(read → batched YOLO detection → concurrent Gemini calls → writer) without
+going through the HTTP API. Results are written incrementally to JSONL or
+Parquet, and a checkpoint file records finished images so an interrupted
+run resumes where it stopped.
+
+Usage:
+    python bulk_score.py ../data --output scores.jsonl
+    python bulk_score.py /archive/photos --output scores.parquet --llm-workers 16
+    python bulk_score.py ../data --output detections.jsonl --no-llm
+    python bulk_score.py /archive/photos --output quick.jsonl --fast
+"""
+
+import argparse
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Set
+
+from fengshui_rules import evaluate_rules
+from object_detection import DETECTION_PROFILES, Detections, ObjectDetector, load_detection_profile
+
+logger = logging.getLogger("bulk_score")
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp", ".bmp"}
+
+# Sentinel pushed through the queues to signal end of input
+_DONE = object()
+
+
+def iter_images(root: Path) -> Iterator[Path]:
+    """Yield image files below root in a stable (sorted) order."""
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(filenames):
+            if Path(name).suffix.lower() in IMAGE_EXTENSIONS:
+                yield Path(dirpath) / name
+
+
+def load_checkpoint(checkpoint_path: Path) -> Set[str]:
+    """Return the set of relative image paths already written by a previous run."""
+    if not checkpoint_path.exists():
+        return set()
+    with open(checkpoint_path) as f:
+        return {line.rstrip("\n") for line in f if line.strip()}
+
+
+class ResultWriter:
+    """Incremental JSONL writer. One JSON record per line, flushed per batch."""
+
+    def __init__(self, output_path: Path):
+        self.output_path = output_path
+        self._file = open(output_path, "a", encoding="utf-8")
+
+    def write(self, records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Write records; returns the records now on disk (all of them)."""
+        for record in records:
+            self._file.write(json.dumps(record, separators=(",", ":")) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        return records
+
+    def flush(self) -> List[Dict[str, Any]]:
+        return []
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class ParquetResultWriter:
+    """
+    Incremental Parquet writer.
+
+    Records are buffered and written rows_per_file at a time (plus the rest
+    on flush/close), each batch as its own part file inside the output
+    directory so that resumed runs can keep appending without rewriting
+    earlier data. Nested fields are stored as JSON strings to keep the
+    schema stable.
+    """
+
+    def __init__(self, output_path: Path, rows_per_file: int = 10_000):
+        try:
+            import pyarrow  # noqa: F401
+            import pyarrow.parquet  # noqa: F401
+        except ImportError:
+            raise RuntimeError("Parquet output requires pyarrow: pip install pyarrow")
+
+        self.output_path = output_path
+        self.output_path.mkdir(parents=True, exist_ok=True)
+        self.rows_per_file = max(1, rows_per_file)
+        self._part = len(list(self.output_path.glob("part-*.parquet")))
+        self._buffer: List[Dict[str, Any]] = []
+
+    def write(self, records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Buffer records; returns the records written to disk by this call (if the buffer filled up)."""
+        self._buffer.extend(records)
+        if len(self._buffer) < self.rows_per_file:
+            return []
+        return self.flush()
+
+    def flush(self) -> List[Dict[str, Any]]:
+        """Write the buffered records as a part file; returns them."""
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        records, self._buffer = self._buffer, []
+        if not records:
+            return []
+
+        rows = {
+            "path": [r["path"] for r in records],
+            "score": [r.get("score") for r in records],
+            "total_objects": [len(r.get("detected_objects", [])) for r in records],
+            "error": [r.get("error") for r in records],
+            "analysis": [json.dumps(r.get("analysis")) for r in records],
+            "detected_objects": [json.dumps(r.get("detected_objects", [])) for r in records],
+        }
+        table = pa.table(rows)
+        part_path = self.output_path / f"part-{self._part:05d}.parquet"
+        pq.write_table(table, part_path)
+        self._part += 1
+        return records
+
+    def close(self) -> None:
+        self.flush()
+
+
+class ProgressReporter:
+    """Logs throughput and ETA at a fixed interval."""
+
+    def __init__(self, total: int, interval: float = 10.0):
+        self.total = total
+        self.interval = interval
+        self.done = 0
+        self.failed = 0
+        self._start = time.monotonic()
+        self._last_report = self._start
+
+    def update(self, done: int, failed: int) -> None:
+        self.done += done
+        self.failed += failed
+        now = time.monotonic()
+        if now - self._last_report >= self.interval or self.done >= self.total:
+            self._last_report = now
+            self.report()
+
+    def report(self) -> None:
+        elapsed = time.monotonic() - self._start
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        remaining = self.total - self.done
+        eta = remaining / rate if rate > 0 else float("inf")
+        eta_text = time.strftime("%H:%M:%S", time.gmtime(eta)) if eta != float("inf") else "--:--:--"
+        logger.info(
+            f"{self.done}/{self.total} images ({self.failed} failed) | "
+            f"{rate:.2f} img/s | elapsed {elapsed:.0f}s | ETA {eta_text}"
+        )
+
+
+class BulkScorer:
+    """Bounded read → detect → analyze → write pipeline."""
+
+    def __init__(
+        self,
+        root: Path,
+        writer,
+        checkpoint_path: Path,
+        detector: ObjectDetector,
+        batch_size: int = 8,
+        llm_workers: int = 8,
+        queue_size: int = 64,
+        use_llm: bool = True,
+        fast: bool = False,
+        limit: Optional[int] = None,
+    ):
+        self.root = root
+        self.writer = writer
+        self.checkpoint_path = checkpoint_path
+        self.detector = detector
+        self.batch_size = batch_size
+        self.llm_workers = llm_workers
+        self.use_llm = use_llm
+        self.fast = fast
+        self.limit = limit
+
+        # Bounded queues provide backpressure between stages
+        self._read_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._write_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        # Caps LLM calls that are submitted but not yet written
+        self._llm_slots = threading.BoundedSemaphore(max(1, llm_workers) * 2)
+        self._errors: List[BaseException] = []
+
+    def run(self) -> ProgressReporter:
+        completed = load_checkpoint(self.checkpoint_path)
+        pending = [
+            path for path in iter_images(self.root)
+            if str(path.relative_to(self.root)) not in completed
+        ]
+        if self.limit is not None:
+            pending = pending[:self.limit]
+
+        logger.info(
+            f"Found {len(pending)} images to score under {self.root} "
+            f"({len(completed)} already done)"
+        )
+        progress = ProgressReporter(len(pending))
+        if not pending:
+            return progress
+
+        threads = [
+            threading.Thread(target=self._guard(self._read_stage), args=(pending,), name="bulk-read"),
+            threading.Thread(target=self._guard(self._detect_stage), name="bulk-detect"),
+            threading.Thread(target=self._guard(self._write_stage), args=(progress,), name="bulk-write"),
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if progress.done < progress.total:
+            progress.report()
+        if self._errors:
+            raise self._errors[0]
+        return progress
+
+    def _guard(self, stage):
+        """Record stage crashes and unblock the downstream stages."""
+        def run(*args):
+            try:
+                stage(*args)
+            except BaseException as e:
+                logger.error(f"Pipeline stage {stage.__name__} crashed: {e}")
+                self._errors.append(e)
+                for stage_queue in (self._read_queue, self._write_queue):
+                    try:
+                        stage_queue.put_nowait(_DONE)
+                    except queue.Full:
+                        pass
+                if stage == self._write_stage:
+                    # Keep draining so upstream stages never block on a full queue
+                    while self._write_queue.get() is not _DONE:
+                        pass
+        return run
+
+    def _read_stage(self, paths: List[Path]) -> None:
+        for path in paths:
+            try:
+                image_data = path.read_bytes()
+            except OSError as e:
+                self._read_queue.put((path, None, str(e)))
+                continue
+            self._read_queue.put((path, image_data, None))
+        self._read_queue.put(_DONE)
+
+    def _detect_stage(self) -> None:
+        executor = ThreadPoolExecutor(max_workers=self.llm_workers, thread_name_prefix="bulk-llm")
+        finished = False
+        try:
+            while not finished:
+                batch = []
+                while len(batch) < self.batch_size:
+                    item = self._read_queue.get()
+                    if item is _DONE:
+                        finished = True
+                        break
+                    batch.append(item)
+                if batch:
+                    self._process_batch(batch, executor)
+        finally:
+            executor.shutdown(wait=True)
+            self._write_queue.put(_DONE)
+
+    def _process_batch(self, batch: list, executor: ThreadPoolExecutor) -> None:
+        readable = [(path, data) for path, data, error in batch if error is None]
+        for path, _, error in batch:
+            if error is not None:
+                self._write_queue.put(self._record(path, error=error))
+
+        try:
+            batch_detections = self.detector.detect_objects_batch([data for _, data in readable])
+        except Exception:
+            # A single undecodable image fails the whole batch; retry one by one
+            batch_detections = []
+            for path, data in readable:
+                try:
+                    batch_detections.append(self.detector.detect_objects(data))
+                except Exception as e:
+                    batch_detections.append(e)
+
+        for (path, image_data), detections in zip(readable, batch_detections):
+            if isinstance(detections, Exception):
+                self._write_queue.put(self._record(path, error=f"detection failed: {detections}"))
+            elif not self.use_llm:
+                self._write_queue.put(self._record(path, detections=detections))
+            elif self.fast:
+                analysis = evaluate_rules(detections).to_analysis()
+                self._write_queue.put(self._record(path, detections=detections, analysis=analysis))
+            else:
+                self._llm_slots.acquire()
+                executor.submit(self._analyze, path, image_data, detections)
+
+    def _analyze(self, path: Path, image_data: bytes, detections: Detections) -> None:
+        from main import call_gemini_fengshui, parse_fengshui_response
+
+        try:
+            analysis = parse_fengshui_response(call_gemini_fengshui(image_data, detections))
+            self._write_queue.put(self._record(path, detections=detections, analysis=analysis))
+        except Exception as e:
+            self._write_queue.put(self._record(path, detections=detections, error=f"analysis failed: {e}"))
+        finally:
+            self._llm_slots.release()
+
+    def _write_stage(self, progress: ProgressReporter) -> None:
+        with open(self.checkpoint_path, "a", encoding="utf-8") as checkpoint:
+            def checkpoint_written(records: List[Dict[str, Any]]) -> None:
+                if not records:
+                    return
+                checkpoint.write("".join(r["path"] + "\n" for r in records))
+                checkpoint.flush()
+                os.fsync(checkpoint.fileno())
+
+            finished = False
+            while not finished:
+                records = []
+                # Block for one record, then drain whatever else is ready
+                item = self._write_queue.get()
+                while True:
+                    if item is _DONE:
+                        finished = True
+                        break
+                    records.append(item)
+                    try:
+                        item = self._write_queue.get_nowait()
+                    except queue.Empty:
+                        break
+                if not records:
+                    continue
+
+                # Results first, then checkpoint: a crash in between re-scores
+                # those images on resume rather than losing them. Only what the
+                # writer has put on disk is checkpointed (Parquet buffers rows)
+                checkpoint_written(self.writer.write(records))
+
+                failed = sum(1 for r in records if r.get("error"))
+                progress.update(len(records), failed)
+            checkpoint_written(self.writer.flush())
+
+    def _record(
+        self,
+        path: Path,
+        detections: Optional[Detections] = None,
+        analysis: Optional[dict] = None,
+        error: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        record = {
+            "path": str(path.relative_to(self.root)),
+            "score": analysis.get("score") if analysis else None,
+            "detected_objects": detections.to_list() if detections is not None else [],
+            "analysis": analysis,
+        }
+        if error:
+            record["error"] = error
+        return record
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Bulk feng shui scoring over an image directory")
+    parser.add_argument("input_dir", type=Path, help="Directory to scan recursively for images")
+    parser.add_argument("--output", "-o", type=Path, required=True,
+                        help="Output path: *.jsonl for JSON lines, *.parquet for a Parquet dataset directory")
+    parser.add_argument("--checkpoint", type=Path, default=None,
+                        help="Checkpoint file (default: <output>.checkpoint)")
+    parser.add_argument("--profile", choices=sorted(DETECTION_PROFILES), default=None,
+                        help="Detection profile (default: DETECTION_PROFILE env var or 'accurate')")
+    parser.add_argument("--model", default=None, help="YOLO weights overriding the profile's model")
+    parser.add_argument("--batch-size", type=int, default=8, help="Images per detection forward pass")
+    parser.add_argument("--llm-workers", type=int, default=8, help="Concurrent Gemini requests")
+    parser.add_argument("--queue-size", type=int, default=64, help="Capacity of each pipeline queue")
+    parser.add_argument("--no-llm", action="store_true", help="Only run detection, skip Gemini")
+    parser.add_argument("--fast", action="store_true", help="Score with the local rule engine instead of Gemini")
+    parser.add_argument("--limit", type=int, default=None, help="Score at most N new images")
+    parser.add_argument("--parquet-rows", type=int, default=10_000,
+                        help="Rows per Parquet part file (buffered in memory until written)")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    args = parse_args(argv)
+
+    if not args.input_dir.is_dir():
+        logger.error(f"Input directory not found: {args.input_dir}")
+        return 1
+
+    checkpoint_path = args.checkpoint or args.output.with_name(args.output.name + ".checkpoint")
+
+    if args.output.suffix == ".parquet":
+        writer = ParquetResultWriter(args.output, rows_per_file=args.parquet_rows)
+    else:
+        writer = ResultWriter(args.output)
+
+    scorer = BulkScorer(
+        root=args.input_dir,
+        writer=writer,
+        checkpoint_path=checkpoint_path,
+        detector=ObjectDetector(args.model, load_detection_profile(args.profile)),
+        batch_size=args.batch_size,
+        llm_workers=args.llm_workers,
+        queue_size=args.queue_size,
+        use_llm=not args.no_llm,
+        fast=args.fast,
+        limit=args.limit,
+    )
+
+    try:
+        progress = scorer.run()
+    finally:
+        writer.close()
+
+    logger.info(f"Finished: {progress.done} images written to {args.output} ({progress.failed} failed)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,247 @@
+"""
+CPU budget: how many threads (and optionally which cores) each CPU consumer gets.
+
+Left alone, PyTorch (YOLO inference), OpenCV, the asyncio executor and the
+3D backend (Blender or depth workers) each size themselves to every core,
+so under concurrent load the box runs several times more runnable threads
+than it has cores and throughput drops. The budget splits the machine up
+front, from its topology (CPUs this process may use, the cgroup CPU quota
+of a container, SMT siblings):
+
+  - a share of physical cores is reserved for 3D generation on larger boxes
+  - the rest is divided between the concurrent detections admission
+    control allows; each detection gets that many PyTorch / OpenCV threads
+  - 3D workers get the reserved cores' worth of threads (and, with
+    CPU_BUDGET_AFFINITY, are pinned to them while the API keeps the others)
+
+Every value can be overridden with a CPU_BUDGET_* setting.
+"""
+
+import logging
+import math
+import os
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from admission import ADMISSION_DETECT_CONCURRENCY
+from metrics import CPU_BUDGET_THREADS
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Configuration
+CPU_BUDGET_ENABLED = os.environ.get("CPU_BUDGET_ENABLED", "true").lower() in ("1", "true", "yes")
+CPU_BUDGET_AFFINITY = os.environ.get("CPU_BUDGET_AFFINITY", "false").lower() in ("1", "true", "yes")
+# Overrides (0 / unset: derive from the machine)
+CPU_BUDGET_CORES = int(os.environ.get("CPU_BUDGET_CORES", "0"))
+CPU_BUDGET_3D_CORES = os.environ.get("CPU_BUDGET_3D_CORES", "")
+CPU_BUDGET_DETECT_THREADS = int(os.environ.get("CPU_BUDGET_DETECT_THREADS", "0"))
+CPU_BUDGET_OPENCV_THREADS = int(os.environ.get("CPU_BUDGET_OPENCV_THREADS", "0"))
+CPU_BUDGET_EXECUTOR_WORKERS = int(os.environ.get("CPU_BUDGET_EXECUTOR_WORKERS", "0"))
+# Boxes with fewer physical cores share them between the API and 3D generation
+MIN_CORES_FOR_3D_RESERVE = 4
+# Thread-count variables native libraries in child processes read at startup
+THREAD_ENV_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "NUMEXPR_NUM_THREADS")
+
+
+def available_cpus() -> List[int]:
+    """Logical CPUs this process may run on."""
+    try:
+        return sorted(os.sched_getaffinity(0))
+    except AttributeError:
+        # Not Linux
+        return list(range(os.cpu_count() or 1))
+
+
+def cgroup_cpu_quota() -> Optional[float]:
+    """CPUs' worth of time the container may use (cgroup v2 or v1), or None if unlimited."""
+    try:
+        quota, period = Path("/sys/fs/cgroup/cpu.max").read_text().split()[:2]
+        return None if quota == "max" else int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+    try:
+        quota = int(Path("/sys/fs/cgroup/cpu/cpu.cfs_quota_us").read_text())
+        period = int(Path("/sys/fs/cgroup/cpu/cpu.cfs_period_us").read_text())
+        return None if quota <= 0 else quota / period
+    except (OSError, ValueError):
+        return None
+
+
+def physical_cores(cpus: List[int]) -> List[List[int]]:
+    """Group logical CPUs into physical cores (SMT siblings together), in CPU order."""
+    cores: Dict[str, List[int]] = {}
+    allowed = set(cpus)
+    for cpu in cpus:
+        try:
+            siblings = Path(f"/sys/devices/system/cpu/cpu{cpu}/topology/thread_siblings_list").read_text().strip()
+        except OSError:
+            siblings = str(cpu)
+        cores.setdefault(siblings, []).append(cpu)
+    return [sorted(set(core) & allowed) for core in cores.values()]
+
+
+@dataclass(frozen=True)
+class CpuBudget:
+    """Thread counts and core sets per CPU consumer."""
+
+    cores: int  # Physical cores usable by this process (after the cgroup quota)
+    logical_cpus: int
+    detect_concurrency: int
+    detect_threads: int  # PyTorch intra-op threads per detection
+    interop_threads: int
+    opencv_threads: int
+    executor_workers: int  # asyncio default executor (blocking I/O, rendering, indexing)
+    model_3d_cores: int
+    model_3d_threads: int  # Threads per Blender / depth worker
+    affinity: bool
+    api_cpus: List[int] = field(default_factory=list)
+    model_3d_cpus: List[int] = field(default_factory=list)
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def derive_cpu_budget(
+    cpus: Optional[List[int]] = None,
+    quota: Optional[float] = None,
+    detect_concurrency: int = ADMISSION_DETECT_CONCURRENCY
+) -> CpuBudget:
+    """
+    Split the machine between detection, 3D generation and the executor.
+
+    Args:
+        cpus: Logical CPUs to budget (default: this process' affinity)
+        quota: Cgroup CPU quota (default: read from the cgroup)
+        detect_concurrency: Concurrent detections admission control allows
+
+    Returns:
+        The budget, with CPU_BUDGET_* overrides applied
+    """
+    cpus = available_cpus() if cpus is None else cpus
+    quota = cgroup_cpu_quota() if quota is None else quota
+    core_groups = physical_cores(cpus)
+    cores = len(core_groups)
+    if quota is not None:
+        cores = max(1, min(cores, math.floor(quota)))
+    if CPU_BUDGET_CORES:
+        cores = CPU_BUDGET_CORES
+
+    if CPU_BUDGET_3D_CORES:
+        reserved = int(CPU_BUDGET_3D_CORES)
+    else:
+        reserved = max(1, cores // 4) if cores >= MIN_CORES_FOR_3D_RESERVE else 0
+    reserved = min(reserved, cores - 1)
+    compute = cores - reserved
+    detect_concurrency = max(1, detect_concurrency)
+
+    detect_threads = CPU_BUDGET_DETECT_THREADS or max(1, compute // detect_concurrency)
+    # Without a reserve 3D generation shares the cores (at lower priority): give it half
+    model_3d_threads = reserved or max(1, cores // 2)
+
+    affinity = CPU_BUDGET_AFFINITY and reserved > 0 and len(core_groups) > reserved
+    api_cpus = [cpu for core in core_groups[:len(core_groups) - reserved] for cpu in core] if affinity else []
+    model_3d_cpus = [cpu for core in core_groups[len(core_groups) - reserved:] for cpu in core] if affinity else []
+
+    return CpuBudget(
+        cores=cores,
+        logical_cpus=len(cpus),
+        detect_concurrency=detect_concurrency,
+        detect_threads=detect_threads,
+        interop_threads=1,
+        opencv_threads=CPU_BUDGET_OPENCV_THREADS or detect_threads,
+        executor_workers=CPU_BUDGET_EXECUTOR_WORKERS or min(32, compute + 4),
+        model_3d_cores=reserved,
+        model_3d_threads=model_3d_threads,
+        affinity=affinity,
+        api_cpus=api_cpus,
+        model_3d_cpus=model_3d_cpus,
+    )
+
+
+def apply_cpu_budget(budget: Optional["CpuBudget"] = None) -> Optional[CpuBudget]:
+    """
+    Apply the budget to this (API) process: PyTorch and OpenCV thread
+    counts and, with affinity, the API cores. Call before models load.
+
+    Returns:
+        The budget applied, or None when CPU_BUDGET_ENABLED is off
+    """
+    if not CPU_BUDGET_ENABLED:
+        logger.info("CPU budget disabled - libraries use their default thread counts")
+        return None
+    budget = budget or get_cpu_budget()
+
+    import cv2
+    cv2.setNumThreads(budget.opencv_threads)
+    try:
+        import torch
+        torch.set_num_threads(budget.detect_threads)
+        try:
+            torch.set_num_interop_threads(budget.interop_threads)
+        except RuntimeError:
+            # Only settable before the first inter-op parallel work
+            logger.warning("PyTorch inter-op threads already in use - keeping their count")
+    except ImportError:
+        pass
+    if budget.affinity:
+        os.sched_setaffinity(0, budget.api_cpus)
+
+    for consumer, threads in (
+        ("detect", budget.detect_threads * budget.detect_concurrency),
+        ("opencv", budget.opencv_threads),
+        ("executor", budget.executor_workers),
+        ("model_3d", budget.model_3d_threads),
+    ):
+        CPU_BUDGET_THREADS.labels(consumer=consumer).set(threads)
+    logger.info(
+        f"CPU budget: {budget.cores} cores -> {budget.detect_concurrency} x {budget.detect_threads} detection "
+        f"threads, {budget.opencv_threads} OpenCV, {budget.executor_workers} executor, "
+        f"{budget.model_3d_threads} for 3D" + (f" (API on {budget.api_cpus}, 3D on {budget.model_3d_cpus})"
+                                              if budget.affinity else "")
+    )
+    return budget
+
+
+def apply_model_3d_budget() -> None:
+    """Apply the 3D share of the budget to a 3D worker process (depth pool worker)."""
+    if not CPU_BUDGET_ENABLED:
+        return
+    budget = get_cpu_budget()
+    import cv2
+    cv2.setNumThreads(budget.model_3d_threads)
+    if budget.affinity:
+        os.sched_setaffinity(0, budget.model_3d_cpus)
+
+
+def model_3d_env() -> Dict[str, str]:
+    """Environment for a 3D subprocess (Blender) limiting native thread pools to its budget."""
+    env = dict(os.environ)
+    if CPU_BUDGET_ENABLED:
+        threads = str(get_cpu_budget().model_3d_threads)
+        env.update({name: threads for name in THREAD_ENV_VARS})
+    return env
+
+
+def runtime_threads() -> dict:
+    """Thread counts and affinity actually in effect in this process."""
+    import cv2
+    current = {"opencv_threads": cv2.getNumThreads(), "cpus": available_cpus()}
+    try:
+        import torch
+        current.update(torch_threads=torch.get_num_threads(), torch_interop_threads=torch.get_num_interop_threads())
+    except ImportError:
+        pass
+    return current
+
+
+# Singleton instance
+_cpu_budget: Optional[CpuBudget] = None
+
+
+def get_cpu_budget() -> CpuBudget:
+    global _cpu_budget
+    if _cpu_budget is None:
+        _cpu_budget = derive_cpu_budget()
+    return _cpu_budget
@@ -0,0 +1,222 @@
+"""
+Disk caches for the staged depth-to-mesh pipeline.
+
+Two stages are cached separately so a room regenerated with other mesh
+parameters skips depth inference:
+  - depth maps, keyed by (image hash, depth model, input size), stored as
+    float16 .npy files that workers memory-map instead of reading
+  - finished mesh files, keyed by (depth key, detail, strength, format)
+
+Each stage is a size-bounded LRU of files. Bookkeeping (recency, eviction,
+metrics) lives in the API process; pool workers only read the depth files
+they are handed and write new ones to temp paths the API process commits.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Optional
+
+from metrics import (
+    DEPTH_CACHE_BYTES, DEPTH_CACHE_EVICTIONS, DEPTH_CACHE_HIT_RATIO, DEPTH_CACHE_REQUESTS,
+    Counter, Gauge
+)
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Configuration
+DEPTH_CACHE_DIR = Path(__file__).parent / os.environ.get("DEPTH_CACHE_DIR", "depth_cache")
+DEPTH_CACHE_MAX_BYTES = int(os.environ.get("DEPTH_CACHE_MAX_MB", "1024")) * 1024 * 1024
+MESH_CACHE_MAX_BYTES = int(os.environ.get("MESH_CACHE_MAX_MB", "1024")) * 1024 * 1024
+# Bump when mesh construction or the writers change so stale meshes are not served
+MESH_CACHE_VERSION = 1
+
+
+def image_hash(image_data: bytes) -> str:
+    return hashlib.sha256(image_data).hexdigest()
+
+
+def depth_cache_key(image_digest: str, model: str, input_size: int) -> str:
+    payload = json.dumps(["depth", image_digest, model, input_size])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def mesh_cache_key(depth_key: str, detail: int, strength: float, mesh_format: str) -> str:
+    payload = json.dumps(["mesh", MESH_CACHE_VERSION, depth_key, int(detail), round(float(strength), 3), mesh_format])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+@dataclass(frozen=True)
+class CacheMetrics:
+    """Metric families a FileLRUCache reports to, each labelled by stage."""
+
+    requests: Counter
+    evictions: Counter
+    hit_ratio: Gauge
+    size: Gauge
+
+
+DEPTH_CACHE_METRICS = CacheMetrics(DEPTH_CACHE_REQUESTS, DEPTH_CACHE_EVICTIONS, DEPTH_CACHE_HIT_RATIO, DEPTH_CACHE_BYTES)
+
+
+class FileLRUCache:
+    """Disk-backed LRU cache with one file per key."""
+
+    def __init__(self, stage: str, cache_dir: Path, max_bytes: int, metrics: CacheMetrics = DEPTH_CACHE_METRICS):
+        """
+        Initialize the cache, indexing any files already on disk.
+
+        Args:
+            stage: Pipeline stage name ('depth' or 'mesh'), used as metrics label
+            cache_dir: Directory holding the cached files
+            max_bytes: Maximum total size before least-recently-used files are evicted
+            metrics: Metric families to report to (default: the depth cache's)
+        """
+        self.stage = stage
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.metrics = metrics
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        # key -> (suffix, size in bytes), least recently used first
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._total_bytes = 0
+        self._load_index()
+        metrics.hit_ratio.labels(stage=stage).set_function(lambda: self.stats()["hit_ratio"])
+        metrics.size.labels(stage=stage).set_function(lambda: self._total_bytes)
+
+    def _load_index(self) -> None:
+        """Rebuild the LRU order from files on disk (oldest modification first)."""
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        files = []
+        for path in self.cache_dir.glob("*/*"):
+            if path.name.startswith("."):
+                # Temp file of a job that never committed
+                path.unlink(missing_ok=True)
+            else:
+                files.append((path.stat().st_mtime, path))
+        for _, path in sorted(files):
+            size = path.stat().st_size
+            self._entries[path.stem] = (path.suffix, size)
+            self._total_bytes += size
+        if files:
+            logger.info(f"{self.stage} cache loaded: {len(files)} files, {self._total_bytes / 1e6:.1f} MB")
+
+    def path_for(self, key: str, suffix: str) -> Path:
+        """Location of the cached file for a key (sharded by the first two hex digits)."""
+        return self.cache_dir / key[:2] / f"{key}{suffix}"
+
+    def get(self, key: str) -> Optional[Path]:
+        """
+        Look up a cached file and mark it as recently used.
+
+        Returns:
+            Path to the file, or None on a miss
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.path_for(key, entry[0]).exists():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                path = self.path_for(key, entry[0])
+            else:
+                if entry is not None:
+                    self._entries.pop(key)
+                    self._total_bytes -= entry[1]
+                self.misses += 1
+                self.metrics.requests.labels(stage=self.stage, result="miss").inc()
+                return None
+        self.metrics.requests.labels(stage=self.stage, result="hit").inc()
+
+        # Persist recency so the LRU order survives restarts
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return path
+
+    def temp_path(self, key: str, suffix: str) -> Path:
+        """A fresh path next to the final location for a writer to fill before commit()."""
+        final_path = self.path_for(key, suffix)
+        final_path.parent.mkdir(parents=True, exist_ok=True)
+        return final_path.with_name(f".{key}.{uuid.uuid4().hex}{suffix}")
+
+    def put(self, key: str, suffix: str, content: bytes) -> Path:
+        """Store a complete payload."""
+        temp_path = self.temp_path(key, suffix)
+        temp_path.write_bytes(content)
+        return self.commit(key, temp_path)
+
+    def commit(self, key: str, temp_path: Path) -> Path:
+        """Atomically move a finished temp file into place and evict if over budget."""
+        suffix = temp_path.suffix
+        final_path = self.path_for(key, suffix)
+        size = temp_path.stat().st_size
+        os.replace(temp_path, final_path)
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            self._total_bytes += size - (previous[1] if previous else 0)
+            self._entries[key] = (suffix, size)
+            self._evict_locked()
+        return final_path
+
+    def _evict_locked(self) -> None:
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            key, (suffix, size) = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            # Workers that already mapped the file keep reading it (POSIX unlink semantics)
+            self.path_for(key, suffix).unlink(missing_ok=True)
+            self.evictions += 1
+            self.metrics.evictions.labels(stage=self.stage).inc()
+            logger.info(f"Evicted {self.stage} cache entry {key[:12]} ({size} bytes)")
+
+    def clear(self) -> None:
+        """Drop every entry (counters are kept)."""
+        with self._lock:
+            entries, self._entries = self._entries, OrderedDict()
+            self._total_bytes = 0
+        for key, (suffix, _) in entries.items():
+            self.path_for(key, suffix).unlink(missing_ok=True)
+
+    def stats(self) -> Dict[str, float]:
+        """Hit/miss counters and current size."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+# Singleton instances for reuse across requests
+_depth_cache: Optional[FileLRUCache] = None
+_mesh_cache: Optional[FileLRUCache] = None
+
+
+def get_depth_cache() -> FileLRUCache:
+    global _depth_cache
+    if _depth_cache is None:
+        _depth_cache = FileLRUCache("depth", DEPTH_CACHE_DIR / "depth", DEPTH_CACHE_MAX_BYTES)
+    return _depth_cache
+
+
+def get_mesh_cache() -> FileLRUCache:
+    global _mesh_cache
+    if _mesh_cache is None:
+        _mesh_cache = FileLRUCache("mesh", DEPTH_CACHE_DIR / "mesh", MESH_CACHE_MAX_BYTES)
+    return _mesh_cache
@@ -0,0 +1,501 @@
+"""
+In-process depth-to-mesh generation, an alternative to the Blender service.
+
+Pipeline per image:
+  - monocular depth with an ONNX model (Depth Anything V2 layout: normalised
+    RGB in, relative inverse depth out), run by onnxruntime or, when it is not
+    installed, by OpenCV's DNN module
+  - a grid mesh over the image plane displaced by the depth map, built with
+    vectorised NumPy (grid resolution from `detail`, relief from `strength`)
+  - the mesh written directly as binary glTF (GLB) or ASCII FBX with the photo
+    embedded as texture
+
+This module only depends on NumPy and OpenCV so process-pool workers can
+import it without loading the API; see model_generation.DepthMeshGenerator
+for the pool, storage and metrics side.
+"""
+
+import base64
+import json
+import logging
+import os
+import struct
+import time
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Configuration
+# Models are looked up as depth_anything_v2_<size>.onnx (size: vits, vitb, vitl)
+DEPTH_MODEL_DIR = Path(__file__).parent / os.environ.get("DEPTH_MODEL_DIR", "models")
+DEPTH_INPUT_SIZE = int(os.environ.get("DEPTH_INPUT_SIZE", "518"))
+DEPTH_THREADS = int(os.environ.get("DEPTH_THREADS", "0"))  # 0: the CPU budget's 3D threads
+GRID_CELLS_PER_DETAIL = 16  # detail 10 -> 160 cells along the long side
+MESH_WIDTH = 20.0  # Scene units across the image, close to the Blender output
+RELIEF_PER_STRENGTH = 0.5  # Displacement range as a share of MESH_WIDTH at strength 1.0
+TEXTURE_MAX_SIDE = 2048
+TEXTURE_JPEG_QUALITY = 90
+
+MESH_FORMATS = ("fbx", "glb")
+
+_IMAGENET_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+_IMAGENET_STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+
+
+def depth_model_path(model: str = "vits") -> Path:
+    return DEPTH_MODEL_DIR / f"depth_anything_v2_{model}.onnx"
+
+
+class DepthEstimator:
+    """Monocular depth model loaded from an ONNX file."""
+
+    def __init__(self, model_path: Path, device: str = "cpu", input_size: int = DEPTH_INPUT_SIZE):
+        """
+        Args:
+            model_path: ONNX model taking (1, 3, H, W) normalised RGB and
+                returning (1, H, W) or (1, 1, H, W) relative inverse depth
+            device: 'cpu' or 'gpu' (CUDA provider when onnxruntime has it)
+            input_size: Square input resolution (a multiple of 14 for ViT models)
+
+        Raises:
+            FileNotFoundError: If the model file does not exist
+        """
+        if not Path(model_path).exists():
+            raise FileNotFoundError(f"Depth model not found: {model_path}")
+        self.input_size = input_size
+        self._session = None
+        self._net = None
+        try:
+            import onnxruntime
+        except ImportError:
+            onnxruntime = None
+
+        if onnxruntime is not None:
+            options = onnxruntime.SessionOptions()
+            threads = DEPTH_THREADS
+            if not threads:
+                from cpu_budget import CPU_BUDGET_ENABLED, get_cpu_budget
+                threads = get_cpu_budget().model_3d_threads if CPU_BUDGET_ENABLED else 0
+            if threads:
+                options.intra_op_num_threads = threads
+            providers = ["CPUExecutionProvider"]
+            if device == "gpu" and "CUDAExecutionProvider" in onnxruntime.get_available_providers():
+                providers.insert(0, "CUDAExecutionProvider")
+            self._session = onnxruntime.InferenceSession(str(model_path), options, providers=providers)
+            self._input_name = self._session.get_inputs()[0].name
+            self.runtime = "onnxruntime"
+        else:
+            self._net = cv2.dnn.readNetFromONNX(str(model_path))
+            if DEPTH_THREADS:
+                cv2.setNumThreads(DEPTH_THREADS)
+            self.runtime = "opencv"
+        logger.info(f"Depth model loaded from {model_path} ({self.runtime})")
+
+    def predict(self, rgb: np.ndarray) -> np.ndarray:
+        """
+        Relative inverse depth of an RGB image (larger = nearer).
+
+        Returns:
+            float32 array (input_size, input_size) scaled to 0-1, robust to
+            outliers (1st/99th percentile clipped)
+        """
+        resized = cv2.resize(rgb, (self.input_size, self.input_size), interpolation=cv2.INTER_CUBIC)
+        blob = ((resized.astype(np.float32) / 255.0 - _IMAGENET_MEAN) / _IMAGENET_STD).transpose(2, 0, 1)[None]
+        if self._session is not None:
+            output = self._session.run(None, {self._input_name: blob})[0]
+        else:
+            self._net.setInput(blob)
+            output = self._net.forward()
+        depth = np.squeeze(output).astype(np.float32)
+
+        low, high = np.percentile(depth, (1, 99))
+        if high - low < 1e-6:
+            return np.zeros_like(depth)
+        return np.clip((depth - low) / (high - low), 0.0, 1.0)
+
+
+def grid_shape(width: int, height: int, detail: int) -> Tuple[int, int]:
+    """Grid cells (x, y) for an image: detail * GRID_CELLS_PER_DETAIL along the long side."""
+    detail = min(max(int(detail), 5), 50)
+    cells = detail * GRID_CELLS_PER_DETAIL
+    if width >= height:
+        cells_x, cells_y = cells, max(1, round(cells * height / width))
+    else:
+        cells_x, cells_y = max(1, round(cells * width / height)), cells
+    # No point in more vertices than pixels
+    return min(cells_x, width - 1), min(cells_y, height - 1)
+
+
+def build_grid_mesh(
+    disparity: np.ndarray,
+    aspect: float,
+    cells: Tuple[int, int],
+    strength: float
+) -> Dict[str, np.ndarray]:
+    """
+    Displaced grid mesh over the image plane.
+
+    The plane spans MESH_WIDTH along x (centred on the origin, y up), near
+    surfaces are pushed towards +z by up to strength * RELIEF_PER_STRENGTH *
+    MESH_WIDTH. Triangles are counter-clockwise seen from +z.
+
+    Args:
+        disparity: Inverse depth scaled to 0-1 (any resolution)
+        aspect: Image width / height
+        cells: Grid cells (x, y)
+        strength: Depth strength 0.0-2.0
+
+    Returns:
+        Dict with 'positions' (N, 3) float32, 'normals' (N, 3) float32,
+        'uvs' (N, 2) float32 (origin top-left, as in glTF) and 'faces'
+        (M, 3) uint32
+    """
+    cells_x, cells_y = cells
+    width, height = MESH_WIDTH, MESH_WIDTH / aspect
+    heights = cv2.resize(np.asarray(disparity, dtype=np.float32), (cells_x + 1, cells_y + 1),
+                         interpolation=cv2.INTER_AREA)
+    heights *= (min(max(strength, 0.0), 2.0) * RELIEF_PER_STRENGTH * MESH_WIDTH)
+
+    xs = np.linspace(-width / 2, width / 2, cells_x + 1, dtype=np.float32)
+    ys = np.linspace(height / 2, -height / 2, cells_y + 1, dtype=np.float32)
+    grid_x, grid_y = np.meshgrid(xs, ys)
+    positions = np.stack([grid_x, grid_y, heights], axis=-1).reshape(-1, 3)
+
+    # Normals of a height field: (-dz/dx, -dz/dy, 1), normalised
+    dz_dy, dz_dx = np.gradient(heights, ys[1] - ys[0], xs[1] - xs[0])
+    normals = np.stack([-dz_dx, -dz_dy, np.ones_like(heights)], axis=-1).reshape(-1, 3)
+    normals /= np.linalg.norm(normals, axis=1, keepdims=True)
+
+    u, v = np.meshgrid(
+        np.linspace(0.0, 1.0, cells_x + 1, dtype=np.float32),
+        np.linspace(0.0, 1.0, cells_y + 1, dtype=np.float32)
+    )
+    uvs = np.stack([u, v], axis=-1).reshape(-1, 2)
+
+    index = np.arange((cells_y + 1) * (cells_x + 1), dtype=np.uint32).reshape(cells_y + 1, cells_x + 1)
+    top_left, top_right = index[:-1, :-1].ravel(), index[:-1, 1:].ravel()
+    bottom_left, bottom_right = index[1:, :-1].ravel(), index[1:, 1:].ravel()
+    faces = np.concatenate([
+        np.stack([top_left, bottom_left, top_right], axis=1),
+        np.stack([top_right, bottom_left, bottom_right], axis=1),
+    ])
+
+    return {"positions": positions, "normals": normals.astype(np.float32), "uvs": uvs, "faces": faces}
+
+
+def encode_texture(rgb: np.ndarray) -> bytes:
+    """JPEG texture of the photo, downscaled to TEXTURE_MAX_SIDE."""
+    height, width = rgb.shape[:2]
+    scale = TEXTURE_MAX_SIDE / max(height, width)
+    if scale < 1:
+        rgb = cv2.resize(rgb, (round(width * scale), round(height * scale)), interpolation=cv2.INTER_AREA)
+    ok, encoded = cv2.imencode(".jpg", cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR),
+                               [cv2.IMWRITE_JPEG_QUALITY, TEXTURE_JPEG_QUALITY])
+    if not ok:
+        raise ValueError("Could not encode texture")
+    return encoded.tobytes()
+
+
+# ---------------------------------------------------------------------------
+# Writers
+# ---------------------------------------------------------------------------
+
+def _pad4(data: bytes, fill: bytes = b"\x00") -> bytes:
+    return data + fill * (-len(data) % 4)
+
+
+def write_glb(mesh: Dict[str, np.ndarray], texture_jpeg: bytes) -> bytes:
+    """Binary glTF 2.0 with one textured, double-sided mesh."""
+    positions, normals, uvs, faces = mesh["positions"], mesh["normals"], mesh["uvs"], mesh["faces"]
+    chunks = [
+        (positions.tobytes(), 34962),
+        (normals.tobytes(), 34962),
+        (uvs.tobytes(), 34962),
+        (faces.astype(np.uint32).tobytes(), 34963),
+        (texture_jpeg, None),
+    ]
+    binary = b""
+    buffer_views = []
+    for data, target in chunks:
+        view = {"buffer": 0, "byteOffset": len(binary), "byteLength": len(data)}
+        if target is not None:
+            view["target"] = target
+        buffer_views.append(view)
+        binary += _pad4(data)
+
+    document = {
+        "asset": {"version": "2.0", "generator": "fengshui depth_mesh"},
+        "scene": 0,
+        "scenes": [{"nodes": [0]}],
+        "nodes": [{"mesh": 0, "name": "room"}],
+        "meshes": [{"name": "room", "primitives": [{
+            "attributes": {"POSITION": 0, "NORMAL": 1, "TEXCOORD_0": 2},
+            "indices": 3,
+            "material": 0,
+        }]}],
+        "materials": [{
+            "name": "room",
+            "pbrMetallicRoughness": {"baseColorTexture": {"index": 0}, "metallicFactor": 0.0, "roughnessFactor": 0.9},
+            "doubleSided": True,
+        }],
+        "textures": [{"source": 0, "sampler": 0}],
+        "samplers": [{"magFilter": 9729, "minFilter": 9729, "wrapS": 33071, "wrapT": 33071}],
+        "images": [{"bufferView": 4, "mimeType": "image/jpeg"}],
+        "accessors": [
+            {"bufferView": 0, "componentType": 5126, "count": len(positions), "type": "VEC3",
+             "min": positions.min(axis=0).tolist(), "max": positions.max(axis=0).tolist()},
+            {"bufferView": 1, "componentType": 5126, "count": len(normals), "type": "VEC3"},
+            {"bufferView": 2, "componentType": 5126, "count": len(uvs), "type": "VEC2"},
+            {"bufferView": 3, "componentType": 5125, "count": faces.size, "type": "SCALAR"},
+        ],
+        "bufferViews": buffer_views,
+        "buffers": [{"byteLength": len(binary)}],
+    }
+    json_chunk = _pad4(json.dumps(document, separators=(",", ":")).encode(), b" ")
+    total = 12 + 8 + len(json_chunk) + 8 + len(binary)
+    return b"".join([
+        struct.pack("<III", 0x46546C67, 2, total),
+        struct.pack("<II", len(json_chunk), 0x4E4F534A), json_chunk,
+        struct.pack("<II", len(binary), 0x004E4942), binary,
+    ])
+
+
+def _fbx_array(values: np.ndarray, fmt: str) -> str:
+    flat = values.ravel().tolist()
+    return ((fmt + ",") * len(flat) % tuple(flat))[:-1]
+
+
+def write_fbx(mesh: Dict[str, np.ndarray], texture_jpeg: bytes) -> bytes:
+    """
+    ASCII FBX 7.4 with one textured mesh (Y up) as read by three.js'
+    FBXLoader; the texture is embedded as base64 video content.
+    """
+    positions, normals, uvs, faces = mesh["positions"], mesh["normals"], mesh["uvs"], mesh["faces"]
+    # The last index of each polygon is stored as -(index + 1)
+    polygon_index = faces.astype(np.int64)
+    polygon_index[:, 2] = ~polygon_index[:, 2]
+    # FBX UVs have their origin at the bottom-left
+    fbx_uvs = np.column_stack([uvs[:, 0], 1.0 - uvs[:, 1]])
+
+    geometry, model, material, video, texture = 1000001, 1000002, 1000003, 1000004, 1000005
+    text = f"""; FBX 7.4.0 project file
+; Generated by fengshui depth_mesh
+; ----------------------------------------------------
+
+FBXHeaderExtension:  {{
+\tFBXHeaderVersion: 1003
+\tFBXVersion: 7400
+\tCreator: "fengshui depth_mesh"
+}}
+GlobalSettings:  {{
+\tVersion: 1000
+\tProperties70:  {{
+\t\tP: "UpAxis", "int", "Integer", "",1
+\t\tP: "UpAxisSign", "int", "Integer", "",1
+\t\tP: "FrontAxis", "int", "Integer", "",2
+\t\tP: "FrontAxisSign", "int", "Integer", "",1
+\t\tP: "CoordAxis", "int", "Integer", "",0
+\t\tP: "CoordAxisSign", "int", "Integer", "",1
+\t\tP: "UnitScaleFactor", "double", "Number", "",1
+\t}}
+}}
+Objects:  {{
+\tGeometry: {geometry}, "Geometry::room", "Mesh" {{
+\t\tVertices: *{positions.size} {{
+\t\t\ta: {_fbx_array(positions, "%.5g")}
+\t\t}}
+\t\tPolygonVertexIndex: *{polygon_index.size} {{
+\t\t\ta: {_fbx_array(polygon_index, "%d")}
+\t\t}}
+\t\tGeometryVersion: 124
+\t\tLayerElementNormal: 0 {{
+\t\t\tVersion: 101
+\t\t\tName: ""
+\t\t\tMappingInformationType: "ByVertice"
+\t\t\tReferenceInformationType: "Direct"
+\t\t\tNormals: *{normals.size} {{
+\t\t\t\ta: {_fbx_array(normals, "%.4g")}
+\t\t\t}}
+\t\t}}
+\t\tLayerElementUV: 0 {{
+\t\t\tVersion: 101
+\t\t\tName: "UVMap"
+\t\t\tMappingInformationType: "ByVertice"
+\t\t\tReferenceInformationType: "Direct"
+\t\t\tUV: *{fbx_uvs.size} {{
+\t\t\t\ta: {_fbx_array(fbx_uvs, "%.5g")}
+\t\t\t}}
+\t\t}}
+\t\tLayerElementMaterial: 0 {{
+\t\t\tVersion: 101
+\t\t\tName: ""
+\t\t\tMappingInformationType: "AllSame"
+\t\t\tReferenceInformationType: "IndexToDirect"
+\t\t\tMaterials: *1 {{
+\t\t\t\ta: 0
+\t\t\t}}
+\t\t}}
+\t\tLayer: 0 {{
+\t\t\tVersion: 100
+\t\t\tLayerElement:  {{
+\t\t\t\tType: "LayerElementNormal"
+\t\t\t\tTypedIndex: 0
+\t\t\t}}
+\t\t\tLayerElement:  {{
+\t\t\t\tType: "LayerElementUV"
+\t\t\t\tTypedIndex: 0
+\t\t\t}}
+\t\t\tLayerElement:  {{
+\t\t\t\tType: "LayerElementMaterial"
+\t\t\t\tTypedIndex: 0
+\t\t\t}}
+\t\t}}
+\t}}
+\tModel: {model}, "Model::room", "Mesh" {{
+\t\tVersion: 232
+\t\tShading: T
+\t\tCulling: "CullingOff"
+\t}}
+\tMaterial: {material}, "Material::room", "" {{
+\t\tVersion: 102
+\t\tShadingModel: "phong"
+\t\tMultiLayer: 0
+\t\tProperties70:  {{
+\t\t\tP: "DiffuseColor", "Color", "", "A",1,1,1
+\t\t\tP: "SpecularColor", "Color", "", "A",0,0,0
+\t\t\tP: "Shininess", "double", "Number", "",2
+\t\t}}
+\t}}
+\tVideo: {video}, "Video::room_texture", "Clip" {{
+\t\tType: "Clip"
+\t\tFilename: "room_texture.jpg"
+\t\tRelativeFilename: "room_texture.jpg"
+\t\tContent: ,
+\t\t\t"{base64.b64encode(texture_jpeg).decode()}"
+\t}}
+\tTexture: {texture}, "Texture::room_texture", "" {{
+\t\tType: "TextureVideoClip"
+\t\tVersion: 202
+\t\tTextureName: "Texture::room_texture"
+\t\tFileName: "room_texture.jpg"
+\t\tRelativeFilename: "room_texture.jpg"
+\t}}
+}}
+Connections:  {{
+\tC: "OO",{model},0
+\tC: "OO",{geometry},{model}
+\tC: "OO",{material},{model}
+\tC: "OP",{texture},{material}, "DiffuseColor"
+\tC: "OO",{video},{texture}
+}}
+"""
+    return text.encode()
+
+
+WRITERS = {"fbx": write_fbx, "glb": write_glb}
+
+
+# ---------------------------------------------------------------------------
+# Worker entry point
+# ---------------------------------------------------------------------------
+
+# Estimators loaded in this process, keyed by (model, device)
+_estimators: Dict[Tuple[str, str], DepthEstimator] = {}
+
+
+def get_estimator(model: str = "vits", device: str = "cpu") -> DepthEstimator:
+    key = (model, device)
+    if key not in _estimators:
+        _estimators[key] = DepthEstimator(depth_model_path(model), device)
+    return _estimators[key]
+
+
+def load_depth_map(path: str) -> np.ndarray:
+    """Memory-map a cached float16 depth map."""
+    return np.load(path, mmap_mode="r")
+
+
+def save_depth_map(path: str, disparity: np.ndarray) -> None:
+    """Store a depth map as float16 .npy (half the size; 0-1 values keep ~3 decimal digits)."""
+    with open(path, "wb") as f:
+        np.save(f, disparity.astype(np.float16))
+
+
+def generate_mesh_file(
+    image_data: bytes,
+    model: str = "vits",
+    device: str = "cpu",
+    detail: int = 10,
+    strength: float = 0.6,
+    mesh_format: str = "fbx",
+    depth_path: Optional[str] = None,
+    save_depth_to: Optional[str] = None
+) -> Tuple[bytes, Dict[str, float]]:
+    """
+    Image bytes to a textured mesh file (runs inside a pool worker).
+
+    Args:
+        depth_path: Cached depth map to use instead of running the depth model
+        save_depth_to: Where to store the depth map when it is computed
+
+    Returns:
+        Tuple of (file bytes, phase timings in seconds: decode, depth or
+        depth_load, mesh, write)
+
+    Raises:
+        ValueError: If the image cannot be decoded or the format is unknown
+        FileNotFoundError: If the depth model is missing
+    """
+    if mesh_format not in WRITERS:
+        raise ValueError(f"Unknown mesh format: {mesh_format}")
+    timings = {}
+
+    start = time.perf_counter()
+    image = cv2.imdecode(np.frombuffer(image_data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError("Could not decode image")
+    rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    height, width = rgb.shape[:2]
+    timings["decode"] = time.perf_counter() - start
+
+    disparity = None
+    if depth_path is not None:
+        start = time.perf_counter()
+        try:
+            disparity = load_depth_map(depth_path)
+            timings["depth_load"] = time.perf_counter() - start
+        except FileNotFoundError:
+            # Evicted between lookup and use
+            logger.info(f"Cached depth map vanished, recomputing: {depth_path}")
+    if disparity is None:
+        start = time.perf_counter()
+        disparity = get_estimator(model, device).predict(rgb)
+        timings["depth"] = time.perf_counter() - start
+        if save_depth_to is not None:
+            save_depth_map(save_depth_to, disparity)
+
+    start = time.perf_counter()
+    mesh = build_grid_mesh(disparity, width / height, grid_shape(width, height, detail), strength)
+    timings["mesh"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    data = WRITERS[mesh_format](mesh, encode_texture(rgb))
+    timings["write"] = time.perf_counter() - start
+    return data, timings
+
+
+def warm_up(model: str = "vits", device: str = "cpu") -> Optional[str]:
+    """Pool initializer: load the depth model once per worker (errors surface on first job)."""
+    from cpu_budget import apply_model_3d_budget
+    apply_model_3d_budget()
+    try:
+        get_estimator(model, device)
+    except Exception as e:
+        logger.warning(f"Depth model warm-up failed: {e}")
+        return str(e)
+    return None
@@ -0,0 +1,239 @@
+"""
+On-demand derivative images of analyzed rooms.
+
+Analyses store only the original upload. Previews, thumbnails and the
+annotated overlay are rendered when first requested, for a variant
+(original or annotated), a width snapped to a small set of sizes and an
+output format (JPEG, WebP or AVIF, negotiated from the Accept header), and
+kept in a size-bounded LRU cache on disk. Keys hash everything the pixels
+depend on, so a cached file never goes stale and can be served with a
+strong ETag and an immutable Cache-Control.
+
+Concurrent requests for the same derivative (a gallery opening on several
+devices) share one render.
+"""
+
+import asyncio
+import hashlib
+import io
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Optional
+
+from PIL import Image, features
+
+from depth_cache import CacheMetrics, FileLRUCache
+from metrics import (
+    DERIVATIVE_CACHE_BYTES, DERIVATIVE_CACHE_EVICTIONS, DERIVATIVE_CACHE_HIT_RATIO, DERIVATIVE_CACHE_REQUESTS,
+    DERIVATIVE_COALESCED, DERIVATIVE_RENDER_SECONDS
+)
+from object_detection import Detections, draw_detections
+from storage import KIND_RESULTS, get_store
+from tracing import bind_context, start_span
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Configuration
+DERIVATIVE_CACHE_DIR = Path(__file__).parent / os.environ.get("DERIVATIVE_CACHE_DIR", "derivative_cache")
+DERIVATIVE_CACHE_MAX_BYTES = int(os.environ.get("DERIVATIVE_CACHE_MAX_MB", "512")) * 1024 * 1024
+# Requested widths are rounded up to one of these so clients cannot fill the cache with arbitrary sizes
+DERIVATIVE_WIDTHS = (160, 320, 640, 960, 1280, 1920)
+VARIANTS = ("original", "annotated")
+# Bump when rendering changes (resampling, overlay style, encoder settings) so stale files are not served
+DERIVATIVE_VERSION = 1
+
+
+@dataclass(frozen=True)
+class ImageFormat:
+    name: str
+    pil_format: str
+    content_type: str
+    suffix: str
+    save_options: tuple
+
+
+IMAGE_FORMATS: Dict[str, ImageFormat] = {
+    "jpeg": ImageFormat("jpeg", "JPEG", "image/jpeg", ".jpg",
+                        (("quality", 82), ("optimize", True), ("progressive", True))),
+    "webp": ImageFormat("webp", "WEBP", "image/webp", ".webp", (("quality", 80), ("method", 4))),
+}
+try:
+    if features.check("avif"):
+        IMAGE_FORMATS["avif"] = ImageFormat("avif", "AVIF", "image/avif", ".avif", (("quality", 60), ("speed", 8)))
+except Exception:
+    # Older Pillow without the avif feature flag
+    pass
+
+# Smallest encoding first; JPEG is always acceptable
+NEGOTIATION_ORDER = [name for name in ("avif", "webp") if name in IMAGE_FORMATS]
+
+
+def snap_width(requested: Optional[int], source_width: Optional[int]) -> int:
+    """Round a requested width up to a cache size, never above the source width."""
+    if requested is None:
+        width = source_width or DERIVATIVE_WIDTHS[-1]
+    else:
+        width = next((size for size in DERIVATIVE_WIDTHS if size >= requested), DERIVATIVE_WIDTHS[-1])
+    return min(width, source_width) if source_width else width
+
+
+def negotiate_format(accept: Optional[str]) -> str:
+    """Best output format the client's Accept header allows (AVIF, then WebP, then JPEG)."""
+    accept = (accept or "").lower()
+    for name in NEGOTIATION_ORDER:
+        if IMAGE_FORMATS[name].content_type in accept:
+            return name
+    return "jpeg"
+
+
+def derivative_key(original_key: str, variant: str, width: int, fmt: str, detections: list) -> str:
+    overlay = detections if variant == "annotated" else None
+    payload = json.dumps(
+        ["derivative", DERIVATIVE_VERSION, original_key, variant, width, fmt, overlay],
+        separators=(",", ":")
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def render_derivative(
+    original: bytes,
+    detections: Optional[Detections],
+    width: int,
+    fmt: str
+) -> bytes:
+    """
+    Resize an original upload (and draw the detection overlay onto it) and encode it.
+
+    Args:
+        original: Original image bytes
+        detections: Detections in original image coordinates, or None for no overlay
+        width: Output width (never upscaled)
+        fmt: Key of IMAGE_FORMATS
+
+    Returns:
+        Encoded image bytes
+    """
+    image = Image.open(io.BytesIO(original))
+    source_width, source_height = image.size
+    width = min(width, source_width)
+    height = max(1, round(source_height * width / source_width))
+
+    # Let the JPEG decoder downscale by a power of two before the real resize
+    image.draft("RGB", (width, height))
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    if image.size != (width, height):
+        image = image.resize((width, height), Image.Resampling.LANCZOS, reducing_gap=3.0)
+
+    if detections is not None:
+        draw_detections(image, detections, width / source_width)
+
+    image_format = IMAGE_FORMATS[fmt]
+    buffer = io.BytesIO()
+    image.save(buffer, format=image_format.pil_format, **dict(image_format.save_options))
+    return buffer.getvalue()
+
+
+@dataclass
+class DerivativePlan:
+    """Everything needed to serve or render one derivative."""
+
+    key: str
+    variant: str
+    width: int
+    format: ImageFormat
+    original_key: str
+    detections: Optional[Detections]
+    # Set when the derivative is already cached
+    path: Optional[Path] = None
+
+
+class DerivativeService:
+    """Looks up, renders and caches derivative images."""
+
+    def __init__(self, cache: FileLRUCache):
+        self.cache = cache
+        self.renders = 0
+        self.coalesced = 0
+        self.render_seconds = 0.0
+        # key -> render in flight, awaited by every request for the same derivative
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    def plan(self, analysis_id: str, variant: str, width: Optional[int], fmt: str) -> Optional[DerivativePlan]:
+        """
+        Resolve a request against the stored detection record and the cache (blocking).
+
+        Returns:
+            The plan, or None if the analysis or its original image is unknown
+        """
+        record = get_store().load_record(f"detection_{analysis_id}.json", KIND_RESULTS)
+        if record is None or not record.get("original_key"):
+            return None
+        image_size = record.get("image_size")
+        width = snap_width(width, image_size[0] if image_size else None)
+        key = derivative_key(record["original_key"], variant, width, fmt, record["detections"])
+        # A video's record also lists objects only other keyframes saw; they are not in this image
+        placed = record["detections"][:record.get("image_objects", len(record["detections"]))]
+        detections = Detections.from_list(placed, image_size) if variant == "annotated" else None
+        image_format = IMAGE_FORMATS[fmt]
+        return DerivativePlan(
+            key, variant, width, image_format, record["original_key"], detections, self.cache.get(key)
+        )
+
+    def _render(self, plan: DerivativePlan) -> Path:
+        start = time.perf_counter()
+        attributes = {"variant": plan.variant, "width": plan.width, "format": plan.format.name}
+        with start_span("derivative.render", attributes=attributes):
+            original = get_store().backend.get(plan.original_key)
+            content = render_derivative(original, plan.detections, plan.width, plan.format.name)
+            path = self.cache.put(plan.key, plan.format.suffix, content)
+        elapsed = time.perf_counter() - start
+        DERIVATIVE_RENDER_SECONDS.labels(variant=plan.variant, format=plan.format.name).observe(elapsed)
+        self.renders += 1
+        self.render_seconds += elapsed
+        logger.info(f"Rendered {plan.variant} {plan.width}px {plan.format.name} in {elapsed * 1000:.0f} ms "
+                    f"({len(content)} bytes)")
+        return path
+
+    async def render(self, plan: DerivativePlan) -> Path:
+        """Render a cache miss, joining a render of the same derivative already in flight."""
+        future = self._inflight.get(plan.key)
+        if future is not None:
+            self.coalesced += 1
+            DERIVATIVE_COALESCED.inc()
+            return await asyncio.shield(future)
+
+        future = asyncio.get_event_loop().run_in_executor(None, bind_context(self._render), plan)
+        self._inflight[plan.key] = future
+        future.add_done_callback(lambda _: self._inflight.pop(plan.key, None))
+        return await asyncio.shield(future)
+
+    def stats(self) -> Dict[str, float]:
+        """Cache counters plus render counts and mean render latency."""
+        return {
+            **self.cache.stats(),
+            "renders": self.renders,
+            "coalesced": self.coalesced,
+            "mean_render_ms": round(self.render_seconds / self.renders * 1000, 1) if self.renders else 0.0,
+            "in_flight": len(self._inflight),
+        }
+
+
+# Singleton instance for reuse across requests
+_derivative_service: Optional[DerivativeService] = None
+
+
+def get_derivative_service() -> DerivativeService:
+    global _derivative_service
+    if _derivative_service is None:
+        metrics = CacheMetrics(
+            DERIVATIVE_CACHE_REQUESTS, DERIVATIVE_CACHE_EVICTIONS, DERIVATIVE_CACHE_HIT_RATIO, DERIVATIVE_CACHE_BYTES
+        )
+        cache = FileLRUCache("image", DERIVATIVE_CACHE_DIR, DERIVATIVE_CACHE_MAX_BYTES, metrics)
+        _derivative_service = DerivativeService(cache)
+    return _derivative_service
@@ -0,0 +1,358 @@
+"""
+Deterministic feng shui rules over object detection boxes.
+
+Much of the advice a room gets is geometric: where the bed sits relative to
+the entrance, screens facing the bed, clutter density and how furniture and
+plants are spread across the frame. These rules compute it from the
+Detections arrays in well under a millisecond, giving an instant preliminary score and
+tooltips, a compact summary for the Gemini prompt (in place of the full
+object list) and a complete analysis for fast mode, where the LLM is skipped.
+
+COCO has no door or mirror classes, so two stand-ins are used:
+  - the camera viewpoint is treated as the entrance (room photos are almost
+    always taken from the doorway), so "in line with the door" means centred
+    in the frame and reaching its near (bottom) edge
+  - screens (tv, laptop) are treated as the reflective surfaces that should
+    not face the bed
+"""
+
+import os
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from object_detection import Detections
+
+# Configuration
+FENGSHUI_FAST_MODE = os.environ.get("FENGSHUI_FAST_MODE", "false").lower() in ("1", "true", "yes")
+
+# Score of a room before any rule adjusts it (1-10 scale, like Gemini's)
+BASE_SCORE = 6.0
+
+# Rule groups of the COCO classes kept by the detector
+CLASS_GROUPS = {
+    "bed": "bed",
+    "tv": "screen", "laptop": "screen",
+    "couch": "furniture", "chair": "furniture", "bench": "furniture", "dining table": "furniture",
+    "refrigerator": "furniture", "oven": "furniture",
+    "potted plant": "plant",
+    "toilet": "bathroom",
+    "book": "clutter", "bottle": "clutter", "cup": "clutter", "bowl": "clutter", "wine glass": "clutter",
+    "teddy bear": "clutter", "backpack": "clutter", "handbag": "clutter", "suitcase": "clutter",
+    "umbrella": "clutter",
+}
+
+# Geometry thresholds, as fractions of the frame
+ENTRANCE_AXIS_WIDTH = 0.15   # |center x - 0.5| below this is "in line with the door"
+NEAR_EDGE = 0.97             # box bottom below this reaches the camera / entrance side
+CLUTTER_HIGH_COUNT = 8
+CLUTTER_HIGH_AREA = 0.15
+CLUTTER_SOME_COUNT = 4
+IMBALANCE_HIGH = 0.5         # area-weighted furniture centroid offset, 0 centred .. 1 at an edge
+IMBALANCE_LOW = 0.2
+
+
+@dataclass(frozen=True)
+class Finding:
+    """One rule outcome, shaped like a Gemini object tooltip plus a score weight."""
+
+    rule: str
+    type: str  # 'good', 'bad' or 'neutral'
+    brief: str  # few words for the LLM prompt
+    message: str
+    weight: float
+    object_index: Optional[int] = None
+    suggestion: Optional[str] = None
+
+
+@dataclass
+class RoomGeometry:
+    """Detections normalized to the frame (0-1) with each object's rule group."""
+
+    boxes: np.ndarray     # (N, 4) x1, y1, x2, y2
+    areas: np.ndarray     # (N,)
+    centers: np.ndarray   # (N, 2)
+    groups: np.ndarray    # (N,) rule group name, '' for classes no rule looks at
+    classes: np.ndarray   # (N,) class name
+    class_indices: Dict[str, List[int]]  # class name -> object indices, in order of first appearance
+
+    @classmethod
+    def from_detections(cls, detections: Detections) -> "RoomGeometry":
+        width, height = frame_size(detections)
+        scale = np.array([width, height, width, height], dtype=np.float32)
+        boxes = np.clip(detections.xyxy / scale, 0.0, 1.0)
+
+        # Class names and groups are looked up once per distinct class, not per object
+        class_ids, first, inverse, counts = np.unique(
+            detections.class_ids, return_index=True, return_inverse=True, return_counts=True
+        )
+        inverse = inverse.reshape(-1)
+        names = np.array([detections.names[int(class_id)] for class_id in class_ids], dtype=object)
+        groups = np.array([CLASS_GROUPS.get(name, "") for name in names], dtype="U16")
+        members = np.split(np.argsort(inverse, kind="stable"), np.cumsum(counts)[:-1])
+        return cls(
+            boxes=boxes,
+            areas=(boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1]),
+            centers=(boxes[:, :2] + boxes[:, 2:]) / 2,
+            groups=groups[inverse],
+            classes=names[inverse],
+            class_indices={names[k]: members[k].tolist() for k in np.argsort(first)},
+        )
+
+    def indices(self, group: str) -> np.ndarray:
+        return np.flatnonzero(self.groups == group)
+
+
+
+@dataclass
+class RuleReport:
+    """Outcome of all rules for one room."""
+
+    score: float
+    findings: List[Finding]
+    class_indices: Dict[str, List[int]]
+    measures: Dict[str, float] = field(default_factory=dict)
+
+    def tooltips(self) -> List[dict]:
+        """Findings tied to an object, in Gemini's object_tooltips format (one per object)."""
+        tooltips = {}
+        for finding in self.findings:
+            if finding.object_index is not None and finding.object_index not in tooltips:
+                tooltips[finding.object_index] = {
+                    "object_index": finding.object_index,
+                    "type": finding.type,
+                    "message": finding.message,
+                }
+        return list(tooltips.values())
+
+    def summary(self) -> str:
+        """Compact prompt context: object indices grouped by class plus brief rule findings."""
+        objects = "; ".join(
+            f"{name} {compact_indices(indices)}" for name, indices in self.class_indices.items()
+        )
+        findings = "; ".join(
+            f"{finding.type}: {finding.brief}"
+            + (f" [{finding.object_index}]" if finding.object_index is not None else "")
+            for finding in self.findings
+        )
+        return (
+            f"Detected objects (class object_index): {objects}\n"
+            f"Rule checks (photo taken from the entrance), preliminary {self.score}/10: {findings}\n"
+            "Confirm or correct these; use object_tooltips for other points."
+        )
+
+    def to_analysis(self) -> dict:
+        """A complete analysis in the Gemini response format (fast mode)."""
+        total = sum(len(indices) for indices in self.class_indices.values())
+        weaknesses = [f.message for f in self.findings if f.type == "bad"]
+        overall = (
+            f"Quick rule-based assessment of {total} detected objects, scored from bed placement, "
+            f"screens, clutter and balance. "
+            + (weaknesses[0] if weaknesses else "No major placement issues were found.")
+        )
+        return {
+            "score": self.score,
+            "overall_analysis": overall,
+            "strengths": [f.message for f in self.findings if f.type == "good"],
+            "weaknesses": weaknesses,
+            "suggestions": [f.suggestion for f in self.findings if f.suggestion],
+            "object_tooltips": self.tooltips(),
+        }
+
+    def to_dict(self) -> dict:
+        return {
+            "score": self.score,
+            "findings": [
+                {"rule": f.rule, "type": f.type, "object_index": f.object_index, "message": f.message}
+                for f in self.findings
+            ],
+            "measures": self.measures,
+        }
+
+
+def frame_size(detections: Detections) -> Tuple[float, float]:
+    """Image size of the detections, or the extent of the boxes when it is unknown."""
+    if detections.image_size is not None:
+        return float(detections.image_size[0]), float(detections.image_size[1])
+    if len(detections):
+        return max(float(detections.xyxy[:, 2].max()), 1.0), max(float(detections.xyxy[:, 3].max()), 1.0)
+    return 1.0, 1.0
+
+
+def compact_indices(indices: List[int]) -> str:
+    """'3,5-9' style list of sorted indices."""
+    parts = []
+    start = previous = indices[0]
+    for index in indices[1:] + [None]:
+        if index is not None and index == previous + 1:
+            previous = index
+            continue
+        parts.append(str(start) if start == previous else f"{start}-{previous}")
+        if index is not None:
+            start = previous = index
+    return ",".join(parts)
+
+
+def rule_bed_position(room: RoomGeometry, measures: Dict[str, float]) -> List[Finding]:
+    beds = room.indices("bed")
+    if not len(beds):
+        return []
+    bed = int(beds[np.argmax(room.areas[beds])])
+    offset = abs(float(room.centers[bed, 0]) - 0.5)
+    measures["bed_axis_offset"] = round(offset, 3)
+    if offset < ENTRANCE_AXIS_WIDTH and room.boxes[bed, 3] >= NEAR_EDGE:
+        return [Finding(
+            "bed_position", "bad",
+            "bed in line with door",
+            "The bed is in line with the entrance, with its foot pointing at the door.",
+            -1.0, bed, "Move the bed diagonally across from the door, headboard against a solid wall."
+        )]
+    if offset >= ENTRANCE_AXIS_WIDTH:
+        return [Finding(
+            "bed_position", "good",
+            "bed in commanding position",
+            "The bed sits diagonally from the entrance, a commanding position.",
+            0.5, bed
+        )]
+    return [Finding(
+        "bed_position", "neutral",
+        "bed centred on door axis",
+        "The bed is centred on the entrance axis; keep a clear view of the door from it.",
+        0.0, bed, "Shift the bed slightly off the line of the door if the room allows."
+    )]
+
+
+def rule_screen_facing_bed(room: RoomGeometry, measures: Dict[str, float]) -> List[Finding]:
+    beds = room.indices("bed")
+    screens = room.indices("screen")
+    if not len(beds) or not len(screens):
+        return []
+    bed_boxes = room.boxes[beds]
+    screen_centers = room.centers[screens]
+    # (screens, beds): mounted above the headboard is behind the sleeper, not facing them
+    above_headboard = (
+        (screen_centers[:, None, 0] >= bed_boxes[None, :, 0])
+        & (screen_centers[:, None, 0] <= bed_boxes[None, :, 2])
+        & (screen_centers[:, None, 1] < bed_boxes[None, :, 1])
+    )
+    # Vertical overlap with the bed means the screen is in the sleeper's line of sight
+    in_sight = room.boxes[screens, 3][:, None] >= bed_boxes[None, :, 1]
+    facing = (in_sight & ~above_headboard).any(axis=1)
+    measures["screens_facing_bed"] = int(facing.sum())
+    return [
+        Finding(
+            "screen_facing_bed", "bad",
+            f"{room.classes[i]} facing bed",
+            f"This {room.classes[i]} faces the bed and reflects energy back at the sleeper like a mirror.",
+            -0.75, int(i), "Cover or close screens facing the bed at night, or move them out of its line of sight."
+        )
+        for i in screens[facing]
+    ]
+
+
+def rule_clutter(room: RoomGeometry, measures: Dict[str, float]) -> List[Finding]:
+    clutter = room.indices("clutter")
+    area = float(room.areas[clutter].sum())
+    measures["clutter_count"] = len(clutter)
+    measures["clutter_area"] = round(area, 3)
+    if len(clutter) >= CLUTTER_HIGH_COUNT or area >= CLUTTER_HIGH_AREA:
+        largest = int(clutter[np.argmax(room.areas[clutter])])
+        return [Finding(
+            "clutter", "bad",
+            f"clutter, {len(clutter)} items",
+            f"{len(clutter)} small items are out in the room; clutter blocks the flow of chi.",
+            -1.0, largest, "Clear surfaces and put loose items into closed storage."
+        )]
+    if len(clutter) >= CLUTTER_SOME_COUNT:
+        largest = int(clutter[np.argmax(room.areas[clutter])])
+        return [Finding(
+            "clutter", "neutral",
+            f"some clutter, {len(clutter)} items",
+            f"A few loose items ({len(clutter)}) are on display; keep surfaces from filling up.",
+            -0.4, largest, "Give loose items a dedicated place so surfaces stay clear."
+        )]
+    if len(room.groups) and not len(clutter):
+        return [Finding(
+            "clutter", "good", "clear surfaces",
+            "Surfaces are clear of loose items, letting energy flow freely.", 0.5
+        )]
+    return []
+
+
+def rule_balance(room: RoomGeometry, measures: Dict[str, float]) -> List[Finding]:
+    heavy = np.flatnonzero(np.isin(room.groups, ("bed", "furniture", "screen")))
+    if len(heavy) < 2:
+        return []
+    weights = room.areas[heavy]
+    centroid = float(np.average(room.centers[heavy, 0], weights=weights)) if weights.sum() > 0 else 0.5
+    imbalance = abs(centroid - 0.5) * 2
+    measures["imbalance"] = round(imbalance, 3)
+    if imbalance >= IMBALANCE_HIGH:
+        side = "left" if centroid < 0.5 else "right"
+        on_side = heavy[(room.centers[heavy, 0] < 0.5) == (side == "left")]
+        largest = int(on_side[np.argmax(room.areas[on_side])])
+        return [Finding(
+            "balance", "bad",
+            f"furniture heavy on {side}",
+            f"Most of the furniture weight sits on the {side} side, leaving the room lopsided.",
+            -0.5, largest, f"Balance the {side} side with a piece, plant or lamp on the opposite side."
+        )]
+    if imbalance <= IMBALANCE_LOW:
+        return [Finding(
+            "balance", "good", "balanced furniture", "Furniture is evenly spread across the room.", 0.5
+        )]
+    return []
+
+
+def rule_plants(room: RoomGeometry, measures: Dict[str, float]) -> List[Finding]:
+    plants = room.indices("plant")
+    measures["plants"] = len(plants)
+    if len(plants):
+        return [Finding(
+            "plants", "good", "plant", "This plant brings lively wood energy into the space.", 0.25, int(plants[0])
+        )]
+    if len(room.groups):
+        return [Finding("plants", "neutral", "no plants", "There are no plants in view.", -0.25,
+                        suggestion="Add a healthy plant to bring in wood energy.")]
+    return []
+
+
+def rule_bathroom_visible(room: RoomGeometry, measures: Dict[str, float]) -> List[Finding]:
+    toilets = room.indices("bathroom")
+    if not len(toilets) or not len(room.indices("bed")):
+        return []
+    return [Finding(
+        "bathroom_visible", "bad",
+        "toilet visible from bed",
+        "A toilet is visible from the sleeping area, draining energy from the bedroom.",
+        -0.5, int(toilets[0]), "Keep the bathroom door closed."
+    )]
+
+
+# Evaluated in order; findings keep this order in reports and tooltips
+RULES: Tuple[Callable[[RoomGeometry, Dict[str, float]], List[Finding]], ...] = (
+    rule_bed_position,
+    rule_screen_facing_bed,
+    rule_clutter,
+    rule_balance,
+    rule_plants,
+    rule_bathroom_visible,
+)
+
+
+def evaluate_rules(detections: Detections) -> RuleReport:
+    """
+    Run every rule over a room's detections.
+
+    Args:
+        detections: Detections for one image
+
+    Returns:
+        RuleReport with a 1-10 preliminary score, findings and measures
+    """
+    room = RoomGeometry.from_detections(detections)
+    measures: Dict[str, float] = {}
+    findings = [finding for rule in RULES for finding in rule(room, measures)]
+    score = min(max(BASE_SCORE + sum(f.weight for f in findings), 1.0), 10.0)
+    return RuleReport(round(score, 1), findings, room.class_indices, measures)
@@ -8,30 +8,82 @@
 #   3. Run server: uvicorn main:app --reload --port 8000
 #
 # API Endpoints:
-#   POST /analyze/ - Upload image and get feng shui analysis
+#   POST /analyze/ - Upload image and get feng shui analysis (?fast=true: rule engine only, no LLM;
+#                    ?previous_analysis_id=...: re-photographed room, only the changes are re-analyzed;
+#                    ?compact=true: tooltips reference detected objects by index)
+#   POST /analyze/batch - Upload many images (or a zip) and stream per-room results
+#   POST /analyze/video - Upload a room walkthrough video (keyframes + object tracking)
+#   GET  /analyses - Past analyses by user, time, score or object class (keyset-paginated)
+#   GET  /analyses/{analysis_id} - A stored /analyze/ response
+#   GET  /rooms/similar - Analyzed rooms that look like a given one (optionally min_score)
+#   GET  /images/{analysis_id}/{variant} - Resized original / annotated room image (JPEG, WebP, AVIF)
+#   POST /tts/generate - Text to speech (cached)
+#   GET  /tts/audio/{audio_id} - Pre-synthesized narration audio
+#   GET  /metrics - Prometheus metrics
+#   /admin/* - Profiling for live workers (requires ADMIN_TOKEN)
+#
+# JSON and NDJSON responses are gzip/brotli-compressed when the client accepts it
 
 import base64
+import io
+import itertools
+import json
 import os
+import tempfile
+import zipfile
 import logging
 import asyncio
-from contextlib import asynccontextmanager
+import functools
+import hmac
+import time
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import AsyncExitStack, asynccontextmanager
 from datetime import datetime
 from pathlib import Path
-from fastapi import FastAPI, UploadFile, File, BackgroundTasks, HTTPException
+from typing import Optional
+from fastapi import FastAPI, UploadFile, File, BackgroundTasks, Depends, Header, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, PlainTextResponse, Response, StreamingResponse
 from google import genai
 from google.genai import types
 from dotenv import load_dotenv
 
-from object_detection import detect_room_objects
-from model_generation import generate_room_model, RENDER_OUTPUT_DIR
-from blender_service import start_blender_service, stop_blender_service, is_blender_service_running
-from elevenlabs import ElevenLabs
-
-# Load environment variables first
+# Load environment variables first (local modules read their configuration on import)
 load_dotenv()
 
+from object_detection import Detections, detect_room_objects, detect_room_objects_batch
+from fengshui_rules import FENGSHUI_FAST_MODE, RuleReport, evaluate_rules
+from video_analysis import detect_video_objects
+from reanalysis import Reanalysis, load_previous_analysis, plan_reanalysis, save_analysis_record
+from room_index import flush_room_index, get_room_index, index_room
+from analysis_history import (
+    ANALYSIS_PAGE_MAX, SORT_KEYS, AnalysisQuery, get_analysis_repository, get_analysis_writer, record_analysis,
+    stop_analysis_history
+)
+from derivatives import IMAGE_FORMATS, VARIANTS, get_derivative_service, negotiate_format
+from model_generation import (
+    MODEL_BACKEND, RENDER_OUTPUT_DIR, find_model_file, generate_room_model, save_model_record, shutdown_generator
+)
+from admission import FEATURE_ANNOTATION, FEATURE_MODEL_3D, AdmissionController, Overloaded
+from cpu_budget import apply_cpu_budget, get_cpu_budget, runtime_threads
+from blender_service import get_service_manager, start_blender_service, stop_blender_service, is_blender_service_running
+from metrics import (
+    ANALYSES, CONTENT_TYPE, LLM_TOKENS, MODEL_3D_JOB_SECONDS, MODEL_3D_QUEUE_DEPTH, REANALYSES, REGISTRY,
+    SIMILAR_SEARCH_SECONDS, STAGE_LLM, STAGE_LLM_DELTA, STAGE_RESPONSE_BUILD, STAGE_RULES, TTS_FIRST_CHUNK_SECONDS,
+    MetricsMiddleware
+)
+from response_encoding import CompressionMiddleware, FastJSONResponse, compact_analysis, encode_json_line
+from profiling import (
+    ProfilerBusyError, cpu_profiler, heap_report, in_flight_requests, set_stage, start_heap_tracing,
+    stop_heap_tracing, store_heap_baseline, track_request
+)
+from depth_cache import get_depth_cache, get_mesh_cache
+from storage import KIND_RENDERS, get_store
+from tracing import TracingMiddleware, bind_context, current_span, start_span, traced
+from tts_cache import DEFAULT_OUTPUT_FORMAT, DEFAULT_VOICE_ID, audio_cache_key, get_audio_cache
+from elevenlabs import ElevenLabs
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -39,9 +91,61 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Finished 3D jobs stay pollable this many seconds; beyond MODEL_STATUS_MAX_JOBS of them the oldest go first
+MODEL_STATUS_TTL = float(os.environ.get("MODEL_STATUS_TTL", "86400"))
+MODEL_STATUS_MAX_JOBS = int(os.environ.get("MODEL_STATUS_MAX_JOBS", "10000"))
+
+
+class ModelJobStatus(dict):
+    """
+    3D job statuses by model ID that forget finished jobs.
+
+    Every upload adds a status, so a long-running worker kept them all;
+    completed and failed jobs now expire after `ttl` seconds and when more
+    than `max_jobs` of them are held. Pending and processing jobs are never
+    dropped.
+    """
+
+    FINISHED = ('completed', 'failed')
+
+    def __init__(self, ttl: float = MODEL_STATUS_TTL, max_jobs: int = MODEL_STATUS_MAX_JOBS):
+        super().__init__()
+        self.ttl = ttl
+        self.max_jobs = max_jobs
+        self._finished = OrderedDict()  # model_id -> monotonic time it finished, oldest first
+
+    def __setitem__(self, model_id: str, status: dict) -> None:
+        super().__setitem__(model_id, status)
+        self._finished.pop(model_id, None)
+        if status['status'] in self.FINISHED:
+            self._finished[model_id] = time.monotonic()
+        self._expire()
+
+    def __delitem__(self, model_id: str) -> None:
+        super().__delitem__(model_id)
+        self._finished.pop(model_id, None)
+
+    def _expire(self) -> None:
+        cutoff = time.monotonic() - self.ttl
+        while self._finished:
+            model_id, finished_at = next(iter(self._finished.items()))
+            if finished_at > cutoff and len(self._finished) <= self.max_jobs:
+                break
+            del self[model_id]
+
+
 # Global storage for 3D model generation status
 # Format: {model_id: {'status': 'pending'|'processing'|'completed'|'failed', 'filename': str, 'error': str}}
-model_generation_status = {}
+model_generation_status = ModelJobStatus()
+
+
+def count_model_jobs(status: str) -> int:
+    """Number of 3D jobs currently in the given status (evaluated at scrape time)."""
+    return sum(1 for job in list(model_generation_status.values()) if job['status'] == status)
+
+
+for _status in ('pending', 'processing', 'completed', 'failed'):
+    MODEL_3D_QUEUE_DEPTH.labels(status=_status).set_function(functools.partial(count_model_jobs, _status))
 
 
 def get_allowed_origins() -> list[str]:
@@ -68,24 +172,52 @@ def get_allowed_origins() -> list[str]:
 # Lifespan context manager for startup/shutdown events
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Startup: Start Blender service
-    logger.info("Starting Blender 3D generation service...")
-    service_started = start_blender_service()
+    # Startup: split the cores between detection, the executor and 3D generation before models load
+    cpu_budget = apply_cpu_budget()
+    if cpu_budget is not None:
+        asyncio.get_event_loop().set_default_executor(
+            ThreadPoolExecutor(max_workers=cpu_budget.executor_workers, thread_name_prefix="executor")
+        )
+
+    # Start Blender service (the depth backend runs in-process instead)
+    if MODEL_BACKEND == "blender":
+        logger.info("Starting Blender 3D generation service...")
+        service_started = start_blender_service()
 
-    if service_started:
-        logger.info("✓ Blender service is ready")
+        if service_started:
+            logger.info("✓ Blender service is ready")
+        else:
+            logger.warning("⚠ Blender service failed to start - 3D generation will be disabled")
     else:
-        logger.warning("⚠ Blender service failed to start - 3D generation will be disabled")
+        logger.info(f"3D generation backend: {MODEL_BACKEND} (in-process)")
+
+    # Retention sweeper for results/ and room_renders/
+    get_store().start_sweeper()
 
     yield
 
+    get_store().stop_sweeper()
+    shutdown_generator()
+    flush_room_index()
+    stop_analysis_history()
+
     # Shutdown: Stop Blender service
-    logger.info("Shutting down Blender service...")
-    stop_blender_service()
-    logger.info("✓ Blender service stopped")
+    if MODEL_BACKEND == "blender":
+        logger.info("Shutting down Blender service...")
+        stop_blender_service()
+        logger.info("✓ Blender service stopped")
+
 
+app = FastAPI(lifespan=lifespan, default_response_class=FastJSONResponse)
 
-app = FastAPI(lifespan=lifespan)
+# gzip / brotli for JSON and NDJSON (innermost, so the metrics include compression time)
+app.add_middleware(CompressionMiddleware)
+
+# Request latency and in-flight metrics
+app.add_middleware(MetricsMiddleware)
+
+# Request spans (outermost, so the trace covers every other middleware)
+app.add_middleware(TracingMiddleware)
 
 # Configure CORS for frontend
 app.add_middleware(
@@ -124,71 +256,362 @@ def encode_image_to_base64(file) -> str:
     return base64.b64encode(file.read()).decode("utf-8")
 
 
-def call_gemini_fengshui(image_data: bytes, detected_objects: list = None) -> dict:
+# JSON schema Gemini is asked to fill in for each analyzed room
+FENGSHUI_RESPONSE_FORMAT = (
+    "{\n"
+    '  "score": <number 1-10>,\n'
+    '  "overall_analysis": "<your overall feng shui analysis>",\n'
+    '  "strengths": ["<strength 1>", "<strength 2>"],\n'
+    '  "weaknesses": ["<weakness 1>", "<weakness 2>"],\n'
+    '  "suggestions": ["<suggestion 1>", "<suggestion 2>"],\n'
+    '  "object_tooltips": [\n'
+    '    {"object_index": <index from detected objects>, "type": "good|bad|neutral", "message": "<specific feng shui tip for this object>"},\n'
+    '    ...\n'
+    '  ]\n'
+    "}\n\n"
+    "For object_tooltips, select 2-4 important objects that significantly impact feng shui. "
+    "Use the object_index from the detected objects list above. "
+    "Type should be 'good' (positive energy), 'bad' (negative energy), or 'neutral' (needs adjustment)."
+)
+
+# Maximum number of rooms packed into a single Gemini request by /analyze/batch
+GEMINI_BATCH_SIZE = int(os.environ.get("GEMINI_BATCH_SIZE", "4"))
+
+
+def build_object_context(detected_objects: Detections = None, rule_report: Optional[RuleReport] = None) -> str:
+    """
+    Compact object context for the Gemini prompt.
+
+    Instead of one line per object, indices are grouped by class and the
+    rule engine's findings are included, so the model confirms or corrects
+    the geometric checks rather than re-deriving them.
+    """
+    if not detected_objects:
+        return ""
+    if not isinstance(detected_objects, Detections):
+        detected_objects = Detections.from_list(detected_objects)
+    report = rule_report or evaluate_rules(detected_objects)
+    return f"\n\n{report.summary()}\n"
+
+
+def generate_gemini_json(parts: list, max_output_tokens: int = 800, prompt: str = "room") -> str:
+    """Send a multimodal prompt to Gemini and return the raw JSON text (prompt labels the token metrics)."""
+    client = get_gemini_client()
+    with start_span("gemini.generate_content", "client", {
+        "gen_ai.request.model": "gemini-2.5-flash",
+        "gen_ai.request.max_tokens": max_output_tokens,
+    }) as span:
+        response = client.models.generate_content(
+            model="gemini-2.5-flash",
+
+            contents=[
+                {
+                    "role": "user",
+                    "parts": parts,
+                }
+            ],
+            config=types.GenerateContentConfig(
+                temperature=0.3,
+                max_output_tokens=max_output_tokens,
+                thinking_config=types.ThinkingConfig(thinking_budget=0),
+                response_mime_type="application/json"
+            ),
+        )
+        span.set_attribute("gen_ai.response.chars", len(response.text or ""))
+        usage = response.usage_metadata
+        if usage is not None:
+            LLM_TOKENS.labels(prompt=prompt, direction="input").inc(usage.prompt_token_count or 0)
+            LLM_TOKENS.labels(prompt=prompt, direction="output").inc(usage.candidates_token_count or 0)
+            span.set_attributes({
+                "gen_ai.usage.input_tokens": usage.prompt_token_count or 0,
+                "gen_ai.usage.output_tokens": usage.candidates_token_count or 0,
+            })
+
+    return response.text
+
+
+@traced("call_gemini_fengshui")
+def call_gemini_fengshui(
+    image_data: bytes,
+    detected_objects: Detections = None,
+    rule_report: Optional[RuleReport] = None
+) -> dict:
     """
     Call Gemini for feng shui analysis with object-specific tooltips
     Returns: dict with score, analysis, and object-specific tooltips
     """
     img_b64 = base64.b64encode(image_data).decode("utf-8")
 
-    # Build object list for context
-    object_context = ""
-    if detected_objects:
-        object_context = "\n\nDetected objects in the room:\n"
-        for i, obj in enumerate(detected_objects):
-            object_context += f"{i}. {obj['class']} (confidence: {obj['confidence']:.2f})\n"
+    # Build compact object summary (with rule findings) for context
+    object_context = build_object_context(detected_objects, rule_report)
 
     prompt = (
         "You are a Feng Shui master. Analyze the room in this image.\n\n"
         f"{object_context}\n"
         "Please provide your response in the following JSON format:\n"
-        "{\n"
-        '  "score": <number 1-10>,\n'
-        '  "overall_analysis": "<your overall feng shui analysis>",\n'
-        '  "strengths": ["<strength 1>", "<strength 2>"],\n'
-        '  "weaknesses": ["<weakness 1>", "<weakness 2>"],\n'
-        '  "suggestions": ["<suggestion 1>", "<suggestion 2>"],\n'
-        '  "object_tooltips": [\n'
-        '    {"object_index": <index from detected objects>, "type": "good|bad|neutral", "message": "<specific feng shui tip for this object>"},\n'
-        '    ...\n'
-        '  ]\n'
-        "}\n\n"
-        "For object_tooltips, select 2-4 important objects that significantly impact feng shui. "
-        "Use the object_index from the detected objects list above. "
-        "Type should be 'good' (positive energy), 'bad' (negative energy), or 'neutral' (needs adjustment)."
+        f"{FENGSHUI_RESPONSE_FORMAT}"
     )
 
-    client = get_gemini_client()
-    response = client.models.generate_content(
-        model="gemini-2.5-flash",
-
-        contents=[
-            {
-                "role": "user",
-                "parts": [
-                    {"text": prompt},
-                    {
-                        "inline_data": {
-                            "mime_type": "image/jpeg",
-                            "data": img_b64,
-                        }
-                    },
-                ],
+    return generate_gemini_json([
+        {"text": prompt},
+        {
+            "inline_data": {
+                "mime_type": "image/jpeg",
+                "data": img_b64,
             }
-        ],
-        config=types.GenerateContentConfig(
-            temperature=0.3,
-            max_output_tokens=800,
-            thinking_config=types.ThinkingConfig(thinking_budget=0),
-            response_mime_type="application/json"
-        ),
+        },
+    ])
+
+
+@traced("call_gemini_fengshui_delta")
+def call_gemini_fengshui_delta(
+    reanalysis: Reanalysis,
+    detected_objects: Detections,
+    rule_report: RuleReport
+) -> dict:
+    """
+    Update a previous analysis after the room was rearranged.
+
+    Text only: the previous analysis, the object changes and the rule
+    findings for the new layout replace the image, and tooltips are only
+    asked for the moved and added objects (the others are carried over).
+    """
+    changed = sorted([new for _, new in reanalysis.diff.moved] + reanalysis.diff.added)
+    prompt = (
+        "You are a Feng Shui master. You analyzed this room before; the user has since rearranged it "
+        "and uploaded a new photo.\n\n"
+        f"{reanalysis.prior_summary()}\n\n"
+        "Changes since then (object indices refer to the new photo):\n"
+        f"{reanalysis.diff.summary(reanalysis.previous_detections, detected_objects)}\n"
+        f"{build_object_context(detected_objects, rule_report)}\n"
+        "Update the analysis for the new layout. "
+        + (f"Only write object_tooltips for the changed objects {changed}; " if changed
+           else "Leave object_tooltips empty; ")
+        + "the others keep their previous tips.\n"
+        "Please provide your response in the following JSON format:\n"
+        f"{FENGSHUI_RESPONSE_FORMAT}"
     )
+    return generate_gemini_json([{"text": prompt}], prompt="delta")
+
+
+def call_gemini_fengshui_batch(rooms: list) -> list:
+    """
+    Analyze several rooms with a single Gemini request.
+
+    Args:
+        rooms: List of (image_data, detected_objects) tuples
+
+    Returns:
+        List of parsed analysis dicts, one per room in input order.
+        Falls back to one request per room if the packed response
+        cannot be matched back to the input images.
+    """
+    if len(rooms) == 1:
+        image_data, detected_objects = rooms[0]
+        return [parse_fengshui_response(call_gemini_fengshui(image_data, detected_objects))]
+
+    parts = [{
+        "text": (
+            f"You are a Feng Shui master. You will be shown {len(rooms)} photos of rooms "
+            f"from the same property, labelled Image 0 to Image {len(rooms) - 1}. "
+            "Analyze each room independently."
+        )
+    }]
+    for i, (image_data, detected_objects) in enumerate(rooms):
+        parts.append({"text": f"\nImage {i}:{build_object_context(detected_objects)}"})
+        parts.append({
+            "inline_data": {
+                "mime_type": "image/jpeg",
+                "data": base64.b64encode(image_data).decode("utf-8"),
+            }
+        })
+    parts.append({
+        "text": (
+            f"\nPlease provide your response as a JSON array with exactly {len(rooms)} entries, "
+            "one per image in the same order. The object_index values of each entry refer to "
+            "that image's own detected objects list. Each entry uses the following JSON format:\n"
+            f"{FENGSHUI_RESPONSE_FORMAT}"
+        )
+    })
+
+    gemini_response = generate_gemini_json(parts, max_output_tokens=800 * len(rooms), prompt="batch")
+
+    try:
+        analyses = json.loads(gemini_response)
+    except (json.JSONDecodeError, TypeError):
+        analyses = None
+
+    if not isinstance(analyses, list) or len(analyses) != len(rooms) \
+            or not all(isinstance(a, dict) for a in analyses):
+        logger.warning(
+            f"Packed Gemini response did not match {len(rooms)} rooms - "
+            "falling back to one request per room"
+        )
+        return [
+            parse_fengshui_response(call_gemini_fengshui(image_data, detected_objects))
+            for image_data, detected_objects in rooms
+        ]
+
+    return analyses
+
+
+def parse_fengshui_response(gemini_response: str) -> dict:
+    """
+    Parse the JSON text returned by Gemini into an analysis dict.
+
+    Falls back to a neutral analysis carrying the raw text when the
+    response is not valid JSON.
+    """
+    try:
+        return json.loads(gemini_response)
+    except (json.JSONDecodeError, TypeError):
+        logger.error("Failed to parse Gemini response as JSON")
+        return {
+            "score": 5,
+            "overall_analysis": gemini_response,
+            "strengths": [],
+            "weaknesses": [],
+            "suggestions": [],
+            "object_tooltips": []
+        }
+
+
+def build_analysis_response(
+    feng_shui_analysis: dict,
+    detected_objects: Detections,
+    json_path: str,
+    image_path: str,
+    model_id: str,
+    rule_report: Optional[RuleReport] = None
+) -> dict:
+    """Combine the Gemini analysis and rule findings with detection results into the API response."""
+    if rule_report is None:
+        rule_report = evaluate_rules(detected_objects)
+
+    # Rule tooltips fill in objects the analysis did not comment on
+    analysis_tooltips = feng_shui_analysis.get("object_tooltips", [])
+    covered = {tooltip.get("object_index") for tooltip in analysis_tooltips}
+    tooltips = analysis_tooltips + [
+        tooltip for tooltip in rule_report.tooltips() if tooltip["object_index"] not in covered
+    ]
+
+    # Combine tooltips with object coordinates
+    tooltips_with_coords = []
+    for tooltip in tooltips:
+        obj_idx = tooltip.get("object_index")
+        if obj_idx is not None and 0 <= obj_idx < len(detected_objects):
+            obj = detected_objects[obj_idx]
+            tooltips_with_coords.append({
+                "object_class": obj["class"],
+                "object_index": obj_idx,
+                "type": tooltip.get("type", "neutral"),
+                "message": tooltip.get("message", ""),
+                "coordinates": {
+                    "bbox": obj["bbox"],
+                    "center": obj["center"]
+                },
+                "confidence": obj["confidence"]
+            })
+
+    # Build final response
+    response = {
+        "score": feng_shui_analysis.get("score", 5),
+        "overall_analysis": feng_shui_analysis.get("overall_analysis", ""),
+        "strengths": feng_shui_analysis.get("strengths", []),
+        "weaknesses": feng_shui_analysis.get("weaknesses", []),
+        "suggestions": feng_shui_analysis.get("suggestions", []),
+        "detected_objects": detected_objects.to_list(),
+        "tooltips": tooltips_with_coords,
+        "rules": rule_report.to_dict(),
+        "detection_metadata": {
+            "total_objects": len(detected_objects),
+            "json_path": json_path,
+            "image_path": image_path
+        },
+        "images": {
+            variant: f"/images/{model_id}/{variant}" for variant in VARIANTS
+        } if json_path else None,
+        "model_3d": {
+            "model_id": model_id,
+            "status": "pending"
+        }
+    }
+
+    return response
+
+
+# Pre-synthesize narration (overall analysis + tooltip messages) at analysis time
+TTS_PRESYNTHESIZE = os.environ.get("TTS_PRESYNTHESIZE", "false").lower() in ("1", "true", "yes")
+# Concurrent ElevenLabs syntheses started by pre-synthesis
+TTS_PRESYNTHESIZE_WORKERS = int(os.environ.get("TTS_PRESYNTHESIZE_WORKERS", "4"))
+# How long a TTS request follows audio that is already being synthesized
+TTS_WAIT_TIMEOUT = 60.0
+
+# Keeps references to running narration jobs so they are not garbage collected
+_narration_jobs: set = set()
+# Narration blocks on ElevenLabs for seconds at a time: its own pool keeps it from
+# queueing the default executor's indexing, history and admin work
+_narration_executor = ThreadPoolExecutor(max_workers=TTS_PRESYNTHESIZE_WORKERS, thread_name_prefix="narration")
 
-    return response.text
 
+def synthesize_speech(text: str, voice_id: str = DEFAULT_VOICE_ID):
+    """Start ElevenLabs synthesis and return its iterator of MP3 chunks."""
+    client = get_elevenlabs_client()
+    return client.text_to_speech.convert(
+        voice_id=voice_id,
+        text=text,
+        output_format=DEFAULT_OUTPUT_FORMAT
+    )
+
+
+def audio_reference(audio_id: str) -> dict:
+    return {"audio_id": audio_id, "url": f"/tts/audio/{audio_id}"}
+
+
+def schedule_narration(feng_shui_analysis: dict, voice_id: str = DEFAULT_VOICE_ID) -> dict:
+    """
+    Start synthesizing the analysis narration in the background.
+
+    Synthesis runs in a pool of TTS_PRESYNTHESIZE_WORKERS threads, concurrently
+    with the rest of the request and the 3D job; the audio lands in the TTS cache where /tts/audio/{id}
+    and /tts/generate pick it up (following the file if still in flight).
+
+    Returns:
+        Narration references: {"overall": {...} | None, "tooltips": [{"object_index", "audio_id", "url"}]}
+    """
+    cache = get_audio_cache()
+    loop = asyncio.get_event_loop()
+    narration = {"overall": None, "tooltips": []}
+    texts = {}
+
+    overall = feng_shui_analysis.get("overall_analysis")
+    if isinstance(overall, str) and overall:
+        key = audio_cache_key(overall, voice_id, DEFAULT_OUTPUT_FORMAT)
+        narration["overall"] = audio_reference(key)
+        texts[key] = overall
+
+    for tooltip in feng_shui_analysis.get("object_tooltips", []):
+        message = tooltip.get("message")
+        if isinstance(message, str) and message:
+            key = audio_cache_key(message, voice_id, DEFAULT_OUTPUT_FORMAT)
+            narration["tooltips"].append({"object_index": tooltip.get("object_index"), **audio_reference(key)})
+            texts[key] = message
+
+    for key, text in texts.items():
+        job = loop.run_in_executor(
+            _narration_executor, cache.synthesize, key, functools.partial(synthesize_speech, text, voice_id)
+        )
+        _narration_jobs.add(job)
+        job.add_done_callback(_narration_jobs.discard)
 
-async def generate_3d_model_background(image_data: bytes, model_id: str):
+    logger.info(f"Narration pre-synthesis started for {len(texts)} texts")
+    return narration
+
+
+@traced("generate_3d_model_background")
+async def generate_3d_model_background(image_data: bytes, model_id: str, detail: int = 10, strength: float = 0.6):
     """Background task to generate 3D model without blocking the response."""
+    job_start = time.perf_counter()
     try:
         logger.info(f"Starting background 3D model generation for model_id: {model_id}")
 
@@ -196,7 +619,7 @@ async def generate_3d_model_background(image_data: bytes, model_id: str):
         model_generation_status[model_id] = {'status': 'processing', 'filename': None, 'error': None}
 
         # Check if service is available
-        if not is_blender_service_running():
+        if MODEL_BACKEND == "blender" and not is_blender_service_running():
             logger.warning("Blender service not running - skipping 3D generation")
             model_generation_status[model_id] = {
                 'status': 'failed',
@@ -207,19 +630,24 @@ async def generate_3d_model_background(image_data: bytes, model_id: str):
 
         # Run in executor to avoid blocking
         loop = asyncio.get_event_loop()
-        fbx_path, message = await loop.run_in_executor(
+        current_span().set_attribute("model_id", model_id)
+        model_path, message = await loop.run_in_executor(
             None,
-            generate_room_model,
+            bind_context(generate_room_model),
             image_data,
             'vits',  # Fast model
             'cpu',   # Use CPU (GPU may have CUDA issues in background)
-            True     # Save results
+            True,    # Save results
+            detail,
+            strength
         )
 
-        if fbx_path:
+        if model_path:
             # Extract filename from path
-            filename = Path(fbx_path).name
-            logger.info(f"✓ 3D model generated: {fbx_path}")
+            filename = Path(model_path).name
+            logger.info(f"✓ 3D model generated: {model_path}")
+            # Stored so re-analyses can reuse the model after its status has expired
+            await loop.run_in_executor(None, save_model_record, model_id, filename)
             model_generation_status[model_id] = {
                 'status': 'completed',
                 'filename': filename,
@@ -240,101 +668,1087 @@ async def generate_3d_model_background(image_data: bytes, model_id: str):
             'filename': None,
             'error': str(e)
         }
+    finally:
+        # With MODEL_STATUS_TTL or MODEL_STATUS_MAX_JOBS at 0 the status is already gone
+        job = model_generation_status.get(model_id) or {}
+        outcome = job.get('status', 'failed')
+        if outcome == 'failed':
+            current_span().set_error(job.get('error') or '3D generation failed')
+        MODEL_3D_JOB_SECONDS.labels(outcome=outcome).observe(time.perf_counter() - job_start)
+
+
+async def generate_3d_models_batch_background(jobs: list):
+    """
+    Background task that generates 3D models for a whole batch.
+
+    Jobs are processed one after another because the Blender service
+    handles a single reconstruction at a time.
+
+    Args:
+        jobs: List of (image_data, model_id) tuples; jobs appended while
+              the batch runs are generated too
+    """
+    logger.info(f"Starting batched 3D model generation for {len(jobs)} rooms")
+    for image_data, model_id in jobs:
+        await generate_3d_model_background(image_data, model_id)
+
+
+# Keeps references to running batch 3D jobs so they are not garbage collected
+_model_batch_jobs: set = set()
+
+
+def start_batch_models(jobs: list) -> None:
+    """Start the 3D jobs queued by a finished (or abandoned) batch in the background."""
+    if not jobs:
+        return
+    task = asyncio.ensure_future(generate_3d_models_batch_background(jobs))
+    _model_batch_jobs.add(task)
+    task.add_done_callback(_model_batch_jobs.discard)
+
+
+def client_id(http_request: Request) -> str:
+    """Identity used for fair-share quotas: X-Client-Id header, else the peer address."""
+    header = http_request.headers.get("x-client-id")
+    if header:
+        return header[:64]
+    return http_request.client.host if http_request.client else "unknown"
+
+
+def count_unfinished_model_jobs() -> int:
+    return count_model_jobs('pending') + count_model_jobs('processing')
+
+
+# Admission control for /analyze/ (concurrency limits, fair queueing, load shedding)
+admission = AdmissionController(backlog_3d=count_unfinished_model_jobs)
 
 
 @app.post("/analyze/")
-async def analyze_image(background_tasks: BackgroundTasks, file: UploadFile = File(...)):
-    import json
+@traced("analyze_image")
+async def analyze_image(
+    http_request: Request,
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    narrate: Optional[bool] = None,
+    fast: Optional[bool] = None,
+    previous_analysis_id: Optional[str] = None,
+    compact: bool = False
+):
+    """
+    Analyze a room photo.
 
-    image_data = await file.read()
+    Returns 503 with a Retry-After header when the server is saturated.
+
+    Args:
+        file: Room image
+        narrate: Pre-synthesize narration audio for the analysis and tooltips
+                 (defaults to the TTS_PRESYNTHESIZE setting)
+        fast: Score with the local rule engine only and skip Gemini
+              (defaults to the FENGSHUI_FAST_MODE setting)
+        previous_analysis_id: Analysis of an earlier photo of the same room; unchanged
+                              objects keep their tooltips, Gemini only sees the changes
+                              and the 3D model is reused if the layout barely changed
+        compact: Compact wire format: tooltips reference detected_objects by
+                 object_index instead of repeating coordinates
+    """
+    client = client_id(http_request)
+    try:
+        async with admission.admit(client):
+            response = await run_analysis(
+                background_tasks, file, narrate, client, FENGSHUI_FAST_MODE if fast is None else fast,
+                previous_analysis_id
+            )
+        return FastJSONResponse(compact_analysis(response) if compact else response)
+    except Overloaded as e:
+        logger.warning(f"Rejected /analyze/ from {client}: {e.reason}")
+        current_span().set_error(e.reason)
+        raise HTTPException(status_code=503, detail=f"Server busy: {e.reason}",
+                            headers={"Retry-After": str(e.retry_after)})
+
+
+async def run_analysis(
+    background_tasks: BackgroundTasks,
+    file: UploadFile,
+    narrate: Optional[bool],
+    client: str,
+    fast: bool = False,
+    previous_analysis_id: Optional[str] = None
+):
+    """The /analyze/ pipeline for an admitted request."""
+    with track_request("/analyze/", client=client) as in_flight:
+        set_stage("read_upload")
+        image_data = await file.read()
+
+        # Generate unique model_id for tracking 3D generation
+        model_id = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        current_span().set_attributes({"model_id": model_id, "image.bytes": len(image_data)})
+        in_flight.details["model_id"] = model_id
+
+        # Decide up front which optional work to skip under load
+        skipped = admission.degraded_features()
+
+        # Run object detection with automatic saving to results folder; under load only the
+        # eager annotation is skipped, the upload and record are still needed by /images/
+        set_stage("detect")
+        try:
+            detect = functools.partial(
+                detect_room_objects, image_data, result_id=model_id,
+                annotate=False if FEATURE_ANNOTATION in skipped else None
+            )
+            detected_objects, json_path, image_path = await admission.run("detect", client, detect)
+            logger.info(f"Object detection completed. Found {len(detected_objects)} objects")
+            logger.info(f"Results saved to: {json_path}")
+            logger.info(f"Annotated image saved to: {image_path}")
+
+            for obj in detected_objects:
+                logger.info(
+                    f"  - {obj['class']}: confidence={obj['confidence']}, "
+                    f"bbox=({obj['bbox']['x1']}, {obj['bbox']['y1']}, {obj['bbox']['x2']}, {obj['bbox']['y2']}), "
+                    f"center=({obj['center']['x']}, {obj['center']['y']})"
+                )
+        except Overloaded:
+            raise
+        except Exception as e:
+            logger.error(f"Object detection failed: {e}")
+            detected_objects = Detections.empty()
+            json_path = ""
+            image_path = ""
+
+        # Geometric rules: preliminary score and tooltips in well under a millisecond
+        set_stage("rules")
+        with STAGE_RULES.time():
+            rule_report = evaluate_rules(detected_objects)
+
+        reanalysis = None
+        if previous_analysis_id:
+            set_stage("reanalysis_diff")
+            previous = await asyncio.get_event_loop().run_in_executor(
+                None, load_previous_analysis, previous_analysis_id
+            )
+            reanalysis = plan_reanalysis(previous_analysis_id, previous, detected_objects)
+            logger.info(f"Re-analysis of {previous_analysis_id}: {reanalysis.mode} ({reanalysis.reason})")
+
+        return await complete_analysis(
+            background_tasks, image_data, detected_objects, rule_report, json_path, image_path,
+            model_id, skipped, narrate, client, fast, reanalysis
+        )
+
+
+async def complete_analysis(
+    background_tasks: BackgroundTasks,
+    image_data: bytes,
+    detected_objects: Detections,
+    rule_report: RuleReport,
+    json_path: str,
+    image_path: str,
+    model_id: str,
+    skipped: set,
+    narrate: Optional[bool],
+    client: str,
+    fast: bool,
+    reanalysis: Optional[Reanalysis] = None
+) -> dict:
+    """LLM analysis (unless fast), narration, 3D job and response for an image's detections."""
+    delta = reanalysis is not None and reanalysis.mode == "delta"
+    if fast:
+        feng_shui_analysis = rule_report.to_analysis()
+    elif delta:
+        # Re-photographed room: Gemini only sees what changed
+        set_stage("llm")
+        with STAGE_LLM_DELTA.time():
+            gemini_response = await admission.run(
+                "llm", client, call_gemini_fengshui_delta, reanalysis, detected_objects, rule_report
+            )
+        feng_shui_analysis = parse_fengshui_response(gemini_response)
+    else:
+        # Run Feng Shui analysis with the compact object summary
+        set_stage("llm")
+        with STAGE_LLM.time():
+            gemini_response = await admission.run(
+                "llm", client, call_gemini_fengshui, image_data, detected_objects, rule_report
+            )
+
+        # Parse Gemini JSON response
+        feng_shui_analysis = parse_fengshui_response(gemini_response)
+    if delta:
+        feng_shui_analysis = reanalysis.merge(feng_shui_analysis)
+    ANALYSES.labels(mode="fast" if fast else "llm").inc()
+
+    # Make the room findable by similar-room search
+    await asyncio.get_event_loop().run_in_executor(
+        None, index_room, model_id, detected_objects.embedding, feng_shui_analysis.get("score", 5)
+    )
+
+    # Start narration synthesis right away so audio is ready when the viewer asks
+    narration = None
+    if TTS_PRESYNTHESIZE if narrate is None else narrate:
+        set_stage("narration")
+        narration = schedule_narration(feng_shui_analysis)
+
+    # Geometry barely changed: point at the previous upload's 3D model instead of generating one
+    model_3d_id = model_id
+    model_3d_status = None
+    if delta and reanalysis.reuse_3d:
+        previous_3d_id = (reanalysis.previous or {}).get("model_3d_id")
+        previous_job = model_generation_status.get(previous_3d_id) if previous_3d_id else None
+        if previous_job is not None and previous_job['status'] not in ('completed', 'failed'):
+            # Still being generated
+            model_3d_status = previous_job['status']
+        elif previous_3d_id and await asyncio.get_event_loop().run_in_executor(
+            None, find_model_file, previous_3d_id
+        ):
+            model_3d_status = 'completed'
+        if model_3d_status is not None:
+            model_3d_id = previous_3d_id
+            reanalysis.model_3d_reused = True
+    if reanalysis is not None:
+        REANALYSES.labels(mode=reanalysis.mode, model_3d="reused" if reanalysis.model_3d_reused else "new").inc()
+
+    if model_3d_id != model_id:
+        logger.info(f"3D model {model_3d_id} reused for ID: {model_id}")
+    elif FEATURE_MODEL_3D in skipped:
+        model_generation_status[model_id] = {
+            'status': 'failed', 'filename': None, 'error': '3D generation skipped under load'
+        }
+        logger.info(f"3D model generation skipped under load for ID: {model_id}")
+    else:
+        # Initialize 3D model status
+        model_generation_status[model_id] = {'status': 'pending', 'filename': None, 'error': None}
+
+        # Start 3D model generation in background (non-blocking)
+        background_tasks.add_task(generate_3d_model_background, image_data, model_id)
+        logger.info(f"3D model generation queued as background task with ID: {model_id}")
+
+    set_stage("response_build")
+    with STAGE_RESPONSE_BUILD.time():
+        response = build_analysis_response(
+            feng_shui_analysis, detected_objects, json_path, image_path, model_id, rule_report
+        )
+    if fast:
+        response["fast"] = True
+    if narration is not None:
+        response["narration"] = narration
+    if skipped:
+        response["degraded"] = sorted(skipped)
+        if FEATURE_MODEL_3D in skipped:
+            response["model_3d"]["status"] = "skipped"
+    if reanalysis is not None:
+        response["reanalysis"] = reanalysis.to_dict()
+    if model_3d_id != model_id:
+        response["model_3d"] = {
+            "model_id": model_3d_id,
+            "status": model_3d_status,
+            "reused": True,
+        }
+    if json_path:
+        # Stored next to the detections so this upload can be re-analyzed incrementally later
+        await asyncio.get_event_loop().run_in_executor(
+            None, save_analysis_record, model_id, feng_shui_analysis, model_3d_id
+        )
+    # Queued for the analysis history; written in batches by a background thread
+    record_analysis(model_id, client, response)
+    return response
+
+
+# Limits for /analyze/video
+MAX_VIDEO_MB = int(os.environ.get("MAX_VIDEO_MB", "200"))
+UPLOAD_CHUNK_SIZE = 1024 * 1024
 
-    # Generate unique model_id for tracking 3D generation
-    model_id = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
 
-    # Run object detection with automatic saving to results folder
+async def spool_upload(file: UploadFile, max_bytes: int) -> str:
+    """
+    Copy an upload to a temporary file in chunks (cv2 reads videos from a path).
+
+    Raises:
+        HTTPException: 413 if the upload is larger than max_bytes
+    """
+    suffix = Path(file.filename or "").suffix.lower() or ".mp4"
+    handle = tempfile.NamedTemporaryFile(prefix="video_", suffix=suffix, delete=False)
+    written = 0
     try:
-        detected_objects, json_path, image_path = detect_room_objects(image_data, save_results=True)
-        logger.info(f"Object detection completed. Found {len(detected_objects)} objects")
-        logger.info(f"Results saved to: {json_path}")
-        logger.info(f"Annotated image saved to: {image_path}")
-
-        for obj in detected_objects:
-            logger.info(
-                f"  - {obj['class']}: confidence={obj['confidence']}, "
-                f"bbox=({obj['bbox']['x1']}, {obj['bbox']['y1']}, {obj['bbox']['x2']}, {obj['bbox']['y2']}), "
-                f"center=({obj['center']['x']}, {obj['center']['y']})"
+        with handle:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                written += len(chunk)
+                if written > max_bytes:
+                    raise HTTPException(status_code=413, detail=f"Video larger than {max_bytes // (1024 * 1024)} MB")
+                handle.write(chunk)
+    except BaseException:
+        Path(handle.name).unlink(missing_ok=True)
+        raise
+    return handle.name
+
+
+@app.post("/analyze/video")
+@traced("analyze_video")
+async def analyze_video_upload(
+    http_request: Request,
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    narrate: Optional[bool] = None,
+    fast: Optional[bool] = None,
+    compact: bool = False
+):
+    """
+    Analyze a room walkthrough video.
+
+    Keyframes are picked by scene change and sharpness, detected in one
+    batch, and objects are tracked across them so each physical object is
+    listed once. The analysis image (for Gemini, the annotated result and
+    the 3D model) is the keyframe showing the most objects. The response
+    has the same fields as /analyze/ plus a "video" section with keyframes,
+    tracks and per-stage throughput.
+
+    Returns 400 if the video cannot be decoded, 413 above MAX_VIDEO_MB and
+    503 with a Retry-After header when the server is saturated.
+
+    Args:
+        file: Room video (any container/codec FFmpeg can decode)
+        narrate: Pre-synthesize narration audio (defaults to TTS_PRESYNTHESIZE)
+        fast: Score with the local rule engine only (defaults to FENGSHUI_FAST_MODE)
+        compact: Compact wire format (see /analyze/)
+    """
+    client = client_id(http_request)
+    try:
+        async with admission.admit(client):
+            response = await run_video_analysis(
+                background_tasks, file, narrate, client, FENGSHUI_FAST_MODE if fast is None else fast
+            )
+        return FastJSONResponse(compact_analysis(response) if compact else response)
+    except Overloaded as e:
+        logger.warning(f"Rejected /analyze/video from {client}: {e.reason}")
+        current_span().set_error(e.reason)
+        raise HTTPException(status_code=503, detail=f"Server busy: {e.reason}",
+                            headers={"Retry-After": str(e.retry_after)})
+
+
+async def run_video_analysis(
+    background_tasks: BackgroundTasks,
+    file: UploadFile,
+    narrate: Optional[bool],
+    client: str,
+    fast: bool = False
+):
+    """The /analyze/video pipeline for an admitted request."""
+    with track_request("/analyze/video", client=client) as in_flight:
+        set_stage("read_upload")
+        video_path = await spool_upload(file, MAX_VIDEO_MB * 1024 * 1024)
+
+        model_id = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        current_span().set_attributes({"model_id": model_id, "video.bytes": os.path.getsize(video_path)})
+        in_flight.details["model_id"] = model_id
+        skipped = admission.degraded_features()
+
+        # Decode, keyframes, batched detection and tracking hold one detection slot
+        set_stage("video")
+        try:
+            detect = functools.partial(
+                detect_video_objects, video_path, result_id=model_id,
+                annotate=False if FEATURE_ANNOTATION in skipped else None
+            )
+            video, json_path, image_path = await admission.run("detect", client, detect)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        finally:
+            Path(video_path).unlink(missing_ok=True)
+
+        set_stage("rules")
+        with STAGE_RULES.time():
+            rule_report = video.rule_report()
+
+        response = await complete_analysis(
+            background_tasks, video.hero_jpeg, video.objects, rule_report, json_path, image_path,
+            model_id, skipped, narrate, client, fast
+        )
+        response["video"] = video.to_dict()
+        return response
+
+
+# Limits for /analyze/batch
+MAX_BATCH_IMAGES = int(os.environ.get("MAX_BATCH_IMAGES", "64"))
+# Total uncompressed size of the images unpacked from zip archives
+MAX_BATCH_UNZIPPED_MB = int(os.environ.get("MAX_BATCH_UNZIPPED_MB", "512"))
+BATCH_IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+
+
+def extract_batch_images(uploads: list) -> list:
+    """
+    Expand uploaded files into a flat list of images.
+
+    Zip archives are unpacked (image members only, in name order);
+    any other upload is treated as a single image. Limits are checked
+    before a member is inflated, from the sizes in the archive's directory,
+    so a zip bomb is rejected without being unpacked.
+
+    Args:
+        uploads: List of (filename, data) tuples
+
+    Returns:
+        List of (filename, image_data) tuples
+
+    Raises:
+        HTTPException: 413 beyond MAX_BATCH_IMAGES images or
+            MAX_BATCH_UNZIPPED_MB unpacked
+    """
+    max_unzipped = MAX_BATCH_UNZIPPED_MB * 1024 * 1024
+    images = []
+    unzipped = 0
+
+    def check_count():
+        if len(images) >= MAX_BATCH_IMAGES:
+            raise HTTPException(
+                status_code=413, detail=f"Too many images in batch (more than {MAX_BATCH_IMAGES})"
             )
+
+    for filename, data in uploads:
+        if zipfile.is_zipfile(io.BytesIO(data)):
+            with zipfile.ZipFile(io.BytesIO(data)) as archive:
+                for member in sorted(archive.infolist(), key=lambda info: info.filename):
+                    name = Path(member.filename).name
+                    if member.is_dir() or name.startswith('.') or not name.lower().endswith(BATCH_IMAGE_EXTENSIONS):
+                        continue
+                    check_count()
+                    unzipped += member.file_size
+                    if unzipped > max_unzipped:
+                        raise HTTPException(
+                            status_code=413,
+                            detail=f"Zip contents larger than {MAX_BATCH_UNZIPPED_MB} MB"
+                        )
+                    # Inflate no more than the declared size, even if the member lies about it
+                    with archive.open(member) as stream:
+                        images.append((name, stream.read(member.file_size)))
+        else:
+            check_count()
+            images.append((filename, data))
+    return images
+
+
+def summarize_batch(batch_id: str, results: list) -> dict:
+    """Build the property-level summary for a finished batch."""
+    analyzed = [r for r in results if "error" not in r]
+    scored = [r for r in analyzed if isinstance(r.get("score"), (int, float))]
+
+    object_counts = Counter(
+        obj["class"] for r in analyzed for obj in r.get("detected_objects", [])
+    )
+
+    summary = {
+        "type": "summary",
+        "batch_id": batch_id,
+        "total_images": len(results),
+        "analyzed": len(analyzed),
+        "failed": len(results) - len(analyzed),
+        "average_score": None,
+        "min_score": None,
+        "max_score": None,
+        "best_room": None,
+        "worst_room": None,
+        "total_objects": sum(object_counts.values()),
+        "object_counts": dict(object_counts.most_common()),
+    }
+
+    if scored:
+        best = max(scored, key=lambda r: r["score"])
+        worst = min(scored, key=lambda r: r["score"])
+        summary.update({
+            "average_score": round(sum(r["score"] for r in scored) / len(scored), 2),
+            "min_score": worst["score"],
+            "max_score": best["score"],
+            "best_room": {"index": best["index"], "filename": best["filename"], "score": best["score"]},
+            "worst_room": {"index": worst["index"], "filename": worst["filename"], "score": worst["score"]},
+        })
+
+    return summary
+
+
+def detect_batch_images(images_data: list, result_ids: list, annotate: Optional[bool] = None) -> list:
+    """
+    Batched detection that isolates images the detector cannot read.
+
+    A single undecodable upload makes the batched call raise, so on failure
+    the images are detected one by one and only the failing ones get an error.
+
+    Returns:
+        One (detections, json_path, image_path) tuple, or the exception
+        raised for that image, per input image
+    """
+    try:
+        return detect_room_objects_batch(images_data, True, result_ids, annotate)
     except Exception as e:
-        logger.error(f"Object detection failed: {e}")
-        detected_objects = []
-        json_path = ""
-        image_path = ""
+        logger.warning(f"Batched detection failed ({e}); detecting images one by one")
+    results = []
+    for image_data, result_id in zip(images_data, result_ids):
+        try:
+            results.append(detect_room_objects(image_data, save_results=True, result_id=result_id, annotate=annotate))
+        except Exception as e:
+            results.append(e)
+    return results
+
+
+async def stream_batch_analysis(
+    images: list,
+    model_ids: list,
+    batch_id: str,
+    fast: bool = False,
+    client: str = "",
+    compact: bool = False,
+    admitted: Optional[AsyncExitStack] = None,
+    model_jobs: Optional[list] = None
+):
+    """
+    Run batched detection and packed Gemini analysis, yielding NDJSON lines.
+
+    Images are detected one Gemini pack at a time in the admission
+    controller's detect stage, so a batch holds a single detection slot and
+    queues fairly with /analyze/ requests; each pack goes to Gemini (through
+    the llm stage, at most the client's share of it at once) as soon as it
+    is detected. Each room is emitted as soon as the Gemini request
+    containing it returns (or right after detection in fast mode, where the
+    rule engine replaces Gemini); a final summary line aggregates the whole
+    batch. Images that cannot be detected, or are rejected by a saturated
+    stage, are reported on their own line and never sent to Gemini.
+
+    Only rooms that produce a result get a 3D job: it is appended to
+    model_jobs (run once the stream ends) unless degraded mode skips 3D for
+    the room's pack; every other room's 3D status is failed.
+
+    admitted holds the request's admission; the work started here is
+    stopped through it when the response closes it (see
+    AdmittedStreamingResponse), even if the stream is never read to the end.
+    """
+    loop = asyncio.get_event_loop()
+    lines: asyncio.Queue = asyncio.Queue()
+    llm_slots = asyncio.Semaphore(max(1, int(admission.stages["llm"].limit * admission.client_share)))
 
-    # Run Feng Shui analysis with detected objects
-    gemini_response = call_gemini_fengshui(image_data, detected_objects)
+    def error_record(i: int, error: str) -> dict:
+        model_generation_status[model_ids[i]] = {'status': 'failed', 'filename': None, 'error': error}
+        return {"type": "result", "index": i, "filename": images[i][0], "error": error}
 
-    # Parse Gemini JSON response
+    async def analyze_pack(indices: list, detection_results: dict, rule_reports: dict, skipped: set):
+        if fast:
+            analyses = [rule_reports[i].to_analysis() for i in indices]
+        else:
+            rooms = [(images[i][1], detection_results[i][0]) for i in indices]
+            try:
+                async with llm_slots:
+                    analyses = await admission.run("llm", client, call_gemini_fengshui_batch, rooms)
+            except Exception as e:
+                logger.error(f"Batch {batch_id}: Gemini analysis failed for images {indices}: {e}")
+                error = f"Server busy: {e.reason}" if isinstance(e, Overloaded) else str(e)
+                for i in indices:
+                    await lines.put(error_record(i, error))
+                return
+
+        for i, analysis in zip(indices, analyses):
+            detected_objects, json_path, image_path = detection_results[i]
+            record = {
+                "type": "result",
+                "index": i,
+                "filename": images[i][0],
+                **build_analysis_response(
+                    analysis, detected_objects, json_path, image_path, model_ids[i], rule_reports[i]
+                )
+            }
+            if fast:
+                record["fast"] = True
+            if skipped:
+                record["degraded"] = sorted(skipped)
+            if FEATURE_MODEL_3D in skipped or model_jobs is None:
+                model_generation_status[model_ids[i]] = {
+                    'status': 'failed', 'filename': None, 'error': '3D generation skipped under load'
+                }
+                record["model_3d"]["status"] = "skipped"
+            else:
+                model_generation_status[model_ids[i]] = {'status': 'pending', 'filename': None, 'error': None}
+                model_jobs.append((images[i][1], model_ids[i]))
+            ANALYSES.labels(mode="fast" if fast else "llm").inc()
+            await loop.run_in_executor(None, index_room, model_ids[i], detected_objects.embedding, record["score"])
+            if json_path:
+                # Lets a later upload of the room be re-analyzed against this one
+                await loop.run_in_executor(None, save_analysis_record, model_ids[i], analysis, model_ids[i])
+            record_analysis(model_ids[i], client, record)
+            await lines.put(record)
+
+    async def detect_and_analyze():
+        analyses = []
+        try:
+            await detect_packs(analyses)
+            await asyncio.gather(*analyses)
+        finally:
+            for task in analyses:
+                task.cancel()
+            lines.put_nowait(None)
+
+    async def detect_packs(analyses: list):
+        for start in range(0, len(images), GEMINI_BATCH_SIZE):
+            pack = list(range(start, min(start + GEMINI_BATCH_SIZE, len(images))))
+            # Optional work to skip is decided per pack, as /analyze/ does per request
+            skipped = admission.degraded_features()
+            try:
+                pack_results = await admission.run(
+                    "detect", client, detect_batch_images,
+                    [images[i][1] for i in pack], [model_ids[i] for i in pack],
+                    False if FEATURE_ANNOTATION in skipped else None
+                )
+            except Overloaded as e:
+                pack_results = [e] * len(pack)
+
+            detection_results = {}
+            for i, result in zip(pack, pack_results):
+                if isinstance(result, Overloaded):
+                    await lines.put(error_record(i, f"Server busy: {result.reason}"))
+                elif isinstance(result, Exception):
+                    logger.error(f"Batch {batch_id}: object detection failed for image {i}: {result}")
+                    await lines.put(error_record(i, f"Object detection failed: {result}"))
+                else:
+                    detection_results[i] = result
+            if not detection_results:
+                continue
+            with STAGE_RULES.time():
+                rule_reports = {i: evaluate_rules(result[0]) for i, result in detection_results.items()}
+            analyses.append(asyncio.ensure_future(
+                analyze_pack(list(detection_results), detection_results, rule_reports, skipped)
+            ))
+        logger.info(f"Batch {batch_id}: object detection completed for {len(images)} images")
+
+    producer = asyncio.ensure_future(detect_and_analyze())
+    if admitted is not None:
+        admitted.callback(producer.cancel)
     try:
-        feng_shui_analysis = json.loads(gemini_response)
-    except json.JSONDecodeError:
-        logger.error("Failed to parse Gemini response as JSON")
-        feng_shui_analysis = {
-            "score": 5,
-            "overall_analysis": gemini_response,
-            "strengths": [],
-            "weaknesses": [],
-            "suggestions": [],
-            "object_tooltips": []
-        }
+        results = []
+        while (record := await lines.get()) is not None:
+            results.append(record)
+            yield encode_json_line(compact_analysis(record) if compact else record)
+        await producer  # Re-raises whatever stopped the batch early
 
-    # Initialize 3D model status
-    model_generation_status[model_id] = {'status': 'pending', 'filename': None, 'error': None}
+        results.sort(key=lambda r: r["index"])
+        yield encode_json_line(summarize_batch(batch_id, results))
+    finally:
+        # Client gone or stream finished: stop the remaining work
+        producer.cancel()
 
-    # Start 3D model generation in background (non-blocking)
-    background_tasks.add_task(generate_3d_model_background, image_data, model_id)
-    logger.info(f"3D model generation queued as background task with ID: {model_id}")
 
-    # Combine tooltips with object coordinates
-    tooltips_with_coords = []
-    for tooltip in feng_shui_analysis.get("object_tooltips", []):
-        obj_idx = tooltip.get("object_index")
-        if obj_idx is not None and 0 <= obj_idx < len(detected_objects):
-            obj = detected_objects[obj_idx]
-            tooltips_with_coords.append({
-                "object_class": obj["class"],
-                "object_index": obj_idx,
-                "type": tooltip.get("type", "neutral"),
-                "message": tooltip.get("message", ""),
-                "coordinates": {
-                    "bbox": obj["bbox"],
-                    "center": obj["center"]
-                },
-                "confidence": obj["confidence"]
-            })
+class AdmittedStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse that closes the request's admission however it ends.
 
-    # Build final response
-    response = {
-        "score": feng_shui_analysis.get("score", 5),
-        "overall_analysis": feng_shui_analysis.get("overall_analysis", ""),
-        "strengths": feng_shui_analysis.get("strengths", []),
-        "weaknesses": feng_shui_analysis.get("weaknesses", []),
-        "suggestions": feng_shui_analysis.get("suggestions", []),
-        "detected_objects": detected_objects,
-        "tooltips": tooltips_with_coords,
-        "detection_metadata": {
-            "total_objects": len(detected_objects),
-            "json_path": json_path,
-            "image_path": image_path
-        },
-        "model_3d": {
-            "model_id": model_id,
-            "status": "pending"
-        }
+    A body generator's finally only runs once the body is being iterated, so
+    a client that disconnects right after the start message would otherwise
+    hold its admission slot forever.
+    """
+
+    def __init__(self, content, admitted: AsyncExitStack, **kwargs):
+        super().__init__(content, **kwargs)
+        self.admitted = admitted
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.admitted.aclose()
+
+
+@app.post("/analyze/batch")
+async def analyze_batch(
+    http_request: Request,
+    files: list[UploadFile] = File(...),
+    fast: Optional[bool] = None,
+    compact: bool = False
+):
+    """
+    Analyze many room photos (e.g. a whole listing) in one request.
+
+    Accepts multiple image files and/or zip archives of images. Detection
+    runs as batched YOLO passes, rooms are packed several per Gemini
+    request (or scored by the rule engine alone with fast=true, default
+    FENGSHUI_FAST_MODE), and the 3D jobs of the rooms that got a result
+    are run together as one background task once the response ends.
+    compact=true streams result lines in the compact wire format (see
+    /analyze/).
+
+    Returns 503 with a Retry-After header when the server is saturated;
+    images rejected by a saturated stage once streaming has started get an
+    error line instead.
+
+    Returns:
+        NDJSON stream: one {"type": "result", ...} line per image as it
+        completes (same fields as /analyze/ plus index and filename),
+        followed by a final {"type": "summary", ...} line.
+    """
+    uploads = [(file.filename or f"image_{i}", await file.read()) for i, file in enumerate(files)]
+
+    try:
+        images = extract_batch_images(uploads)
+    except zipfile.BadZipFile:
+        raise HTTPException(status_code=400, detail="Invalid zip archive")
+
+    if not images:
+        raise HTTPException(status_code=400, detail="No images found in upload")
+
+    # Admitted for the whole stream: the slot is given back when the response ends
+    client = client_id(http_request)
+    admitted = AsyncExitStack()
+    try:
+        await admitted.enter_async_context(admission.admit(client))
+    except Overloaded as e:
+        logger.warning(f"Rejected /analyze/batch from {client}: {e.reason}")
+        current_span().set_error(e.reason)
+        raise HTTPException(status_code=503, detail=f"Server busy: {e.reason}",
+                            headers={"Retry-After": str(e.retry_after)})
+
+    batch_id = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    logger.info(f"Batch {batch_id}: received {len(images)} images")
+
+    # 3D jobs of the rooms that get a result start together once the response ends
+    model_ids = [f"{batch_id}_{i:03d}" for i in range(len(images))]
+    model_jobs = []
+    admitted.callback(start_batch_models, model_jobs)
+
+    return AdmittedStreamingResponse(
+        stream_batch_analysis(
+            images, model_ids, batch_id, FENGSHUI_FAST_MODE if fast is None else fast, client, compact,
+            admitted, model_jobs
+        ),
+        admitted,
+        media_type="application/x-ndjson"
+    )
+
+
+@app.get("/analyses")
+async def list_analyses(
+    user: Optional[str] = None,
+    object_class: Optional[str] = None,
+    min_score: Optional[float] = None,
+    max_score: Optional[float] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    sort: str = "created",
+    limit: int = 50,
+    cursor: Optional[str] = None
+):
+    """
+    Past analyses, newest first (or best first with sort=score).
+
+    Analyses appear within ANALYSIS_WRITE_INTERVAL of their response (the
+    history is written in batches off the request path).
+
+    Args:
+        user: Client the analysis was made for (X-Client-Id, else the peer address)
+        object_class: Only analyses with this detected class (e.g. "bed")
+        min_score / max_score: Score range
+        since / until: Analysis time range (ISO 8601)
+        sort: 'created' or 'score'
+        limit: Page size (1-200)
+        cursor: next_cursor of the previous page
+
+    Returns:
+        {"items": [{"analysis_id", "user", "created", "score", "object_count", "classes"}, ...],
+         "next_cursor": cursor of the next page, or null on the last one}
+    """
+    if not 1 <= limit <= ANALYSIS_PAGE_MAX:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {ANALYSIS_PAGE_MAX}")
+    if sort not in SORT_KEYS:
+        raise HTTPException(status_code=400, detail=f"sort must be one of: {', '.join(SORT_KEYS)}")
+    query = AnalysisQuery(
+        user=user,
+        object_class=object_class,
+        min_score=min_score,
+        max_score=max_score,
+        since=since.timestamp() if since else None,
+        until=until.timestamp() if until else None,
+        sort=sort,
+        limit=limit,
+        cursor=cursor,
+    )
+    try:
+        page = await asyncio.get_event_loop().run_in_executor(None, get_analysis_repository().query, query)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return FastJSONResponse(page.to_dict())
+
+
+@app.get("/analyses/{analysis_id}")
+async def get_analysis(analysis_id: str, compact: bool = False):
+    """The stored /analyze/ response of an analysis (model_id from the response; compact as for /analyze/)."""
+    response = await asyncio.get_event_loop().run_in_executor(None, get_analysis_repository().get, analysis_id)
+    if response is None:
+        raise HTTPException(status_code=404, detail=f"Analysis {analysis_id} not found")
+    return FastJSONResponse(compact_analysis(response) if compact else response)
+
+
+@app.get("/rooms/similar")
+async def similar_rooms(analysis_id: str, k: int = 10, min_score: Optional[float] = None):
+    """
+    Analyzed rooms that look like a given one, e.g. "rooms like yours that scored 9+".
+
+    Rooms are compared by embeddings pooled from the detector's backbone
+    during analysis, searched in an IVF index (see room_index.py).
+
+    Args:
+        analysis_id: model_id of an analyzed room (from the /analyze/ response)
+        k: Number of rooms to return (1-100)
+        min_score: Only return rooms with at least this feng shui score
+
+    Returns:
+        {"analysis_id": ..., "rooms": [{"analysis_id", "similarity", "score"}, ...]},
+        most similar first
+    """
+    if not 1 <= k <= 100:
+        raise HTTPException(status_code=400, detail="k must be between 1 and 100")
+
+    def search():
+        index = get_room_index()
+        embedding = index.get_embedding(analysis_id)
+        if embedding is None:
+            return None
+        with SIMILAR_SEARCH_SECONDS.time():
+            return index.search(embedding, k, min_score, exclude=analysis_id)
+
+    matches = await asyncio.get_event_loop().run_in_executor(None, search)
+    if matches is None:
+        raise HTTPException(status_code=404, detail=f"Room {analysis_id} is not in the similar-room index")
+    return {
+        "analysis_id": analysis_id,
+        "rooms": [
+            {"analysis_id": room_id, "similarity": round(similarity, 4), "score": round(score, 2)}
+            for room_id, similarity, score in matches
+        ],
     }
 
+
+@app.get("/images/{analysis_id}/{variant}")
+async def get_room_image(
+    analysis_id: str,
+    variant: str,
+    request: Request,
+    width: Optional[int] = None,
+    format: Optional[str] = None
+):
+    """
+    An analyzed room's photo, resized and (for 'annotated') with detection boxes drawn.
+
+    Rendered on first request from the stored original and cached; the
+    width is rounded up to a fixed set of sizes (see derivatives.py).
+
+    Args:
+        analysis_id: model_id of an analyzed room (from the /analyze/ response)
+        variant: 'original' or 'annotated'
+        width: Desired width in pixels (default: the original's)
+        format: jpeg, webp or avif (default: negotiated from the Accept header)
+
+    Returns:
+        The image, with an ETag and immutable Cache-Control
+    """
+    if variant not in VARIANTS:
+        raise HTTPException(status_code=400, detail=f"variant must be one of {', '.join(VARIANTS)}")
+    if format is not None and format not in IMAGE_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(IMAGE_FORMATS)}")
+    if width is not None and width < 1:
+        raise HTTPException(status_code=400, detail="width must be positive")
+
+    service = get_derivative_service()
+    image_format = format or negotiate_format(request.headers.get("accept"))
+    plan = await asyncio.get_event_loop().run_in_executor(
+        None, service.plan, analysis_id, variant, width, image_format
+    )
+    if plan is None:
+        raise HTTPException(status_code=404, detail=f"No stored image for analysis {analysis_id}")
+
+    headers = {
+        "ETag": f'"{plan.key[:32]}"',
+        "Cache-Control": "public, max-age=31536000, immutable",
+    }
+    if format is None:
+        headers["Vary"] = "Accept"
+    # The key covers everything the pixels depend on, so a matching tag needs no render
+    if_none_match = {tag.strip().removeprefix("W/") for tag in request.headers.get("if-none-match", "").split(",")}
+    if headers["ETag"] in if_none_match or "*" in if_none_match:
+        return Response(status_code=304, headers=headers)
+
+    path = plan.path or await service.render(plan)
+    return FileResponse(path, media_type=plan.format.content_type, headers=headers)
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus metrics: per-stage latency histograms, 3D job counts, cache ratios, in-flight gauges."""
+    return Response(content=REGISTRY.render(), media_type=CONTENT_TYPE)
+
+
+# Admin endpoints are disabled unless a token is configured
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
+
+
+def require_admin(authorization: Optional[str] = Header(None), x_admin_token: Optional[str] = Header(None)):
+    """Accept 'Authorization: Bearer <ADMIN_TOKEN>' or 'X-Admin-Token: <ADMIN_TOKEN>'."""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    supplied = x_admin_token or ""
+    if authorization and authorization.startswith("Bearer "):
+        supplied = authorization[len("Bearer "):]
+    if not hmac.compare_digest(supplied.encode("utf-8"), ADMIN_TOKEN.encode("utf-8")):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+
+def folded_profile_response() -> PlainTextResponse:
+    status = cpu_profiler.status()
+    return PlainTextResponse(cpu_profiler.folded(), headers={
+        "X-Profile-Samples": str(status["samples"]),
+        "X-Profile-Duration": str(status["duration_s"]),
+        "X-Profile-Running": str(status["running"]).lower(),
+    })
+
+
+@app.post("/admin/profile/cpu/start", dependencies=[Depends(require_admin)])
+async def start_cpu_profile(seconds: float = 30.0, interval_ms: float = 5.0):
+    """
+    Start the sampling CPU profiler; it stops by itself after `seconds`.
+
+    Fetch the result from GET /admin/profile/cpu (or stop early with
+    POST /admin/profile/cpu/stop).
+    """
+    if seconds <= 0 or interval_ms < 1:
+        raise HTTPException(status_code=400, detail="seconds must be > 0 and interval_ms >= 1")
+    try:
+        cpu_profiler.start(seconds, interval_ms / 1000)
+    except ProfilerBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return cpu_profiler.status()
+
+
+@app.post("/admin/profile/cpu/stop", dependencies=[Depends(require_admin)])
+async def stop_cpu_profile():
+    """Stop the CPU profiler and return the folded stacks."""
+    await asyncio.get_event_loop().run_in_executor(None, cpu_profiler.stop)
+    return folded_profile_response()
+
+
+@app.get("/admin/profile/cpu", dependencies=[Depends(require_admin)])
+async def get_cpu_profile():
+    """
+    Folded stacks ('thread;outer;...;inner count' per line) of the current or
+    last profile, ready for flamegraph.pl, speedscope or inferno.
+    """
+    return folded_profile_response()
+
+
+@app.post("/admin/heap/start", dependencies=[Depends(require_admin)])
+async def start_heap_profile():
+    """Start tracemalloc (allocations are slower until /admin/heap/stop)."""
+    start_heap_tracing()
+    return {"tracing": True}
+
+
+@app.post("/admin/heap/stop", dependencies=[Depends(require_admin)])
+async def stop_heap_profile():
+    stop_heap_tracing()
+    return {"tracing": False}
+
+
+@app.post("/admin/heap/baseline", dependencies=[Depends(require_admin)])
+async def store_heap_snapshot():
+    """Store a heap snapshot to compare later reports against."""
+    try:
+        await asyncio.get_event_loop().run_in_executor(None, store_heap_baseline)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"baseline": True}
+
+
+@app.get("/admin/heap", dependencies=[Depends(require_admin)])
+async def get_heap_profile(limit: int = 25, group_by: str = "lineno", compare: bool = False):
+    """Top allocators (or growth since the stored baseline with compare=true)."""
+    if group_by not in ("lineno", "filename", "traceback"):
+        raise HTTPException(status_code=400, detail="group_by must be lineno, filename or traceback")
+    try:
+        return await asyncio.get_event_loop().run_in_executor(
+            None, functools.partial(heap_report, limit, group_by, compare)
+        )
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@app.get("/admin/requests", dependencies=[Depends(require_admin)])
+async def get_in_flight_requests():
+    """In-flight analysis requests with their current pipeline stage."""
+    return {"requests": in_flight_requests(), "cpu_profiler": cpu_profiler.status()}
+
+
+@app.get("/admin/admission", dependencies=[Depends(require_admin)])
+async def get_admission_stats():
+    """Admission control state: in-flight requests, stage queues and pressure."""
+    return admission.stats()
+
+
+@app.get("/admin/cpu", dependencies=[Depends(require_admin)])
+async def get_cpu_budget_stats():
+    """CPU budget (threads and cores per consumer) and the thread counts in effect."""
+    return {"budget": get_cpu_budget().to_dict(), "runtime": runtime_threads()}
+
+
+@app.get("/admin/blender", dependencies=[Depends(require_admin)])
+async def get_blender_stats():
+    """Blender service supervision: process, resource limits, watchdog restarts and recent output."""
+    if MODEL_BACKEND != "blender":
+        raise HTTPException(status_code=404, detail=f"3D backend is {MODEL_BACKEND}, not blender")
+    return get_service_manager().stats()
+
+
+@app.get("/admin/storage", dependencies=[Depends(require_admin)])
+async def get_storage_stats():
+    """Stored artifacts per kind, the retention policies applied to them and derivative / depth-mesh cache stats."""
+    store = get_store()
+    stats = await asyncio.get_event_loop().run_in_executor(None, store.index.stats)
+    response = {
+        "backend": type(store.backend).__name__,
+        "kinds": stats,
+        "retention": {kind: vars(policy) for kind, policy in store.policies.items()},
+    }
+    if MODEL_BACKEND == "depth":
+        response["depth_cache"] = {"depth": get_depth_cache().stats(), "mesh": get_mesh_cache().stats()}
+    response["derivative_cache"] = get_derivative_service().stats()
+    response["analysis_history"] = {
+        **await asyncio.get_event_loop().run_in_executor(None, get_analysis_repository().stats),
+        "writer": get_analysis_writer().stats(),
+    }
     return response
 
 
+@app.post("/admin/storage/sweep", dependencies=[Depends(require_admin)])
+async def sweep_storage():
+    """Apply retention policies now instead of waiting for the sweeper."""
+    return {"deleted": await asyncio.get_event_loop().run_in_executor(None, get_store().sweep)}
+
+
+@app.post("/models/generate")
+async def generate_model(
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    detail: int = 10,
+    strength: float = 0.6
+):
+    """
+    (Re)generate the 3D model of a room photo with other mesh parameters.
+
+    With the depth backend the room's depth map is cached, so a new
+    detail/strength only rebuilds the mesh.
+
+    Args:
+        file: Room image
+        detail: Mesh subdivisions 5-50
+        strength: Depth strength 0.0-2.0
+
+    Returns:
+        {"model_id", "status"}; poll /models/status/{model_id}
+    """
+    if not 5 <= detail <= 50 or not 0.0 <= strength <= 2.0:
+        raise HTTPException(status_code=400, detail="detail must be 5-50 and strength 0.0-2.0")
+    image_data = await file.read()
+    model_id = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    model_generation_status[model_id] = {'status': 'pending', 'filename': None, 'error': None}
+    background_tasks.add_task(generate_3d_model_background, image_data, model_id, detail, strength)
+    logger.info(f"3D model generation queued with ID: {model_id} (detail={detail}, strength={strength})")
+    return {"model_id": model_id, "status": "pending"}
+
+
 @app.get("/models/status/{model_id}")
 async def get_model_status(model_id: str):
     """
@@ -349,42 +1763,67 @@ async def get_model_status(model_id: str):
     """
     logger.info(f"Model status check for: {model_id}")
 
-    if model_id not in model_generation_status:
-        logger.warning(f"Model ID not found: {model_id}")
-        raise HTTPException(status_code=404, detail="Model ID not found")
-
-    status = model_generation_status[model_id]
+    status = model_generation_status.get(model_id)
+    if status is None:
+        # Finished jobs are forgotten after MODEL_STATUS_TTL; their model files are not
+        filename = await asyncio.get_event_loop().run_in_executor(None, find_model_file, model_id)
+        if filename is None:
+            logger.warning(f"Model ID not found: {model_id}")
+            raise HTTPException(status_code=404, detail="Model ID not found")
+        status = {'status': 'completed', 'filename': filename, 'error': None}
     logger.info(f"Model {model_id} status: {status}")
     return status
 
 
+# Served 3D model formats (FBX from either backend, GLB from the depth backend)
+MODEL_MEDIA_TYPES = {".fbx": "application/octet-stream", ".glb": "model/gltf-binary"}
+
+
 @app.get("/models/{filename}")
 async def get_model_file(filename: str):
     """
     Download a generated 3D model file.
 
     Args:
-        filename: Name of the FBX file (e.g., room_model_20251004_123456_789012.fbx)
+        filename: Name of the FBX or GLB file (e.g., room_model_20251004_123456_789012.fbx)
 
     Returns:
-        FileResponse with the FBX file
+        FileResponse with the model file
     """
     # Security: Only allow alphanumeric, underscores, dots, and hyphens
     if not filename.replace('_', '').replace('.', '').replace('-', '').isalnum():
         raise HTTPException(status_code=400, detail="Invalid filename")
 
-    # Ensure .fbx extension
-    if not filename.endswith('.fbx'):
-        raise HTTPException(status_code=400, detail="Only FBX files are supported")
-
-    file_path = RENDER_OUTPUT_DIR / filename
+    # Ensure a model extension
+    media_type = MODEL_MEDIA_TYPES.get(Path(filename).suffix)
+    if media_type is None:
+        raise HTTPException(status_code=400, detail="Only FBX and GLB files are supported")
+
+    store = get_store()
+    key = store.find(filename, KIND_RENDERS)
+    if key is not None:
+        file_path = store.backend.local_path(key)
+        if file_path is None:
+            # Remote object store: fetch the object without blocking the event loop
+            try:
+                content = await asyncio.get_event_loop().run_in_executor(None, store.backend.get, key)
+            except FileNotFoundError:
+                raise HTTPException(status_code=404, detail="Model file not found")
+            return Response(
+                content=content,
+                media_type=media_type,
+                headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+            )
+    else:
+        # Files written before the storage layer sit directly in room_renders/
+        file_path = RENDER_OUTPUT_DIR / filename
 
     if not file_path.exists():
         raise HTTPException(status_code=404, detail="Model file not found")
 
     return FileResponse(
         path=str(file_path),
-        media_type="application/octet-stream",
+        media_type=media_type,
         filename=filename
     )
 
@@ -394,39 +1833,74 @@ async def generate_speech(text: dict):
     """
     Generate speech audio from text using ElevenLabs API.
 
+    Audio is content-addressed by text, voice and format: repeated texts are
+    served from the on-disk cache, and on a miss the audio streams to the
+    client as ElevenLabs produces it while being written to the cache.
+
     Args:
         text: JSON body with 'text' field containing the text to convert
+              and an optional 'voice_id' overriding the default voice
 
     Returns:
-        Audio file as MP3
+        Audio file as MP3 (X-TTS-Cache header reports hit, miss or pending)
     """
     try:
         text_content = text.get("text", "")
         if not text_content:
             raise HTTPException(status_code=400, detail="Text field is required")
 
-        client = get_elevenlabs_client()
+        voice_id = text.get("voice_id") or DEFAULT_VOICE_ID
+        cache = get_audio_cache()
+        cache_key = audio_cache_key(text_content, voice_id, DEFAULT_OUTPUT_FORMAT)
+        headers = {
+            "Content-Disposition": "inline; filename=speech.mp3",
+            "ETag": f'"{cache_key}"',
+        }
 
-        # Generate audio using ElevenLabs with specified voice
-        audio_generator = client.text_to_speech.convert(
-            voice_id="pFQStpMdprGFILRDrWR2",  # Voice ID as specified
-            text=text_content,
-            output_format="mp3_44100_128"
-        )
+        # Only the request that claims the key synthesizes it; the others follow that
+        # synthesis or read its file, so identical misses never pay for audio twice
+        while not cache.claim(cache_key):
+            if cache.is_pending(cache_key):
+                # Already being synthesized (e.g. pre-rendered narration) - follow it
+                return StreamingResponse(
+                    cache.follow(cache_key, TTS_WAIT_TIMEOUT),
+                    media_type="audio/mpeg",
+                    headers={**headers, "X-TTS-Cache": "pending"}
+                )
+
+            cached_path = cache.get(cache_key)
+            if cached_path is not None:
+                return FileResponse(
+                    path=str(cached_path),
+                    media_type="audio/mpeg",
+                    headers={**headers, "X-TTS-Cache": "hit"}
+                )
+            # The synthesis that held the key failed in between: claim it again
+
+        def start_synthesis():
+            # Generate audio using ElevenLabs and wait for the first chunk, so
+            # provider errors (e.g. quota) still surface as HTTP errors
+            with TTS_FIRST_CHUNK_SECONDS.time():
+                audio_iterator = iter(synthesize_speech(text_content, voice_id))
+                return next(audio_iterator, b""), audio_iterator
 
-        # Collect audio bytes from generator
-        audio_bytes = b"".join(audio_generator)
+        loop = asyncio.get_event_loop()
+        try:
+            first_chunk, audio_iterator = await loop.run_in_executor(None, start_synthesis)
+        except Exception:
+            cache.release(cache_key)
+            raise
+
+        audio_chunks = cache.stream_and_store(cache_key, itertools.chain([first_chunk], audio_iterator))
 
-        # Return audio as response
-        from fastapi.responses import Response
-        return Response(
-            content=audio_bytes,
+        return StreamingResponse(
+            audio_chunks,
             media_type="audio/mpeg",
-            headers={
-                "Content-Disposition": "inline; filename=speech.mp3"
-            }
+            headers={**headers, "X-TTS-Cache": "miss"}
         )
 
+    except HTTPException:
+        raise
     except Exception as e:
         error_msg = str(e)
         logger.error(f"Text-to-speech generation failed: {error_msg}")
@@ -438,6 +1912,44 @@ async def generate_speech(text: dict):
         raise HTTPException(status_code=500, detail=f"Failed to generate speech: {error_msg}")
 
 
+@app.get("/tts/audio/{audio_id}")
+async def get_speech_audio(audio_id: str):
+    """
+    Fetch pre-synthesized audio by reference (the audio_id from an analysis' narration).
+
+    If the audio is still being synthesized it is streamed as it is produced.
+
+    Returns:
+        Audio file as MP3
+    """
+    if len(audio_id) != 64 or any(c not in "0123456789abcdef" for c in audio_id):
+        raise HTTPException(status_code=400, detail="Invalid audio ID")
+
+    headers = {
+        "Content-Disposition": "inline; filename=speech.mp3",
+        "ETag": f'"{audio_id}"',
+    }
+
+    cache = get_audio_cache()
+    if cache.is_pending(audio_id):
+        # Stream the audio as it is being synthesized
+        return StreamingResponse(
+            cache.follow(audio_id, TTS_WAIT_TIMEOUT),
+            media_type="audio/mpeg",
+            headers=headers
+        )
+
+    audio_path = cache.get(audio_id)
+    if audio_path is None:
+        raise HTTPException(status_code=404, detail="Audio not found")
+
+    return FileResponse(
+        path=str(audio_path),
+        media_type="audio/mpeg",
+        headers={**headers, "Cache-Control": "public, max-age=31536000, immutable"}
+    )
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,431 @@
+"""
+Lightweight Prometheus-style metrics for the Feng Shui backend.
+
+Provides counters, gauges and histograms rendered in the Prometheus text
+exposition format at /metrics, without adding a client-library dependency.
+Label children are resolved once (at import time for the hot paths) so
+recording a value is a lock, an increment and, for histograms, a bisect.
+"""
+
+import bisect
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Latency buckets in seconds: covers sub-millisecond bookkeeping up to
+# multi-minute Blender reconstructions
+DEFAULT_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0,
+)
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class _Metric:
+    """Base class: a named metric family with optional labels."""
+
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def labels(self, **labels):
+        """Return the child for a label combination (create on first use)."""
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _default(self):
+        """Child used when the metric has no labels."""
+        if self.labelnames:
+            raise ValueError(f"{self.name} requires labels {self.labelnames}")
+        return self.labels()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        for key, child in sorted(self._children.items()):
+            lines.extend(self._render_child(key, child))
+        return lines
+
+    def _render_child(self, key, child) -> List[str]:
+        raise NotImplementedError
+
+
+class _CounterChild:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+
+class Counter(_Metric):
+    """Monotonically increasing count."""
+
+    type_name = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._default().inc(amount)
+
+    def _render_child(self, key, child) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(child.value)}"]
+
+
+class _GaugeChild:
+    __slots__ = ("value", "function", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self.function: Optional[Callable[[], float]] = None
+        self._lock = threading.Lock()
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value -= amount
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        """Compute the value at scrape time instead of on the hot path."""
+        self.function = function
+
+    def get(self) -> float:
+        if self.function is not None:
+            try:
+                return float(self.function())
+            except Exception:
+                return float("nan")
+        return self.value
+
+
+class Gauge(_Metric):
+    """Value that can go up and down (or is computed on scrape)."""
+
+    type_name = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value: float) -> None:
+        self._default().set(value)
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._default().inc(amount)
+
+    def dec(self, amount: float = 1.0) -> None:
+        self._default().dec(amount)
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        self._default().set_function(function)
+
+    def _render_child(self, key, child) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(child.get())}"]
+
+
+class _Timer:
+    """Context manager recording elapsed wall time into a histogram child."""
+
+    __slots__ = ("_child", "_start")
+
+    def __init__(self, child):
+        self._child = child
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._child.observe(time.perf_counter() - self._start)
+        return False
+
+
+class _HistogramChild:
+    __slots__ = ("upper_bounds", "counts", "sum", "_lock")
+
+    def __init__(self, upper_bounds: Tuple[float, ...]):
+        self.upper_bounds = upper_bounds
+        self.counts = [0] * (len(upper_bounds) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self.upper_bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def time(self) -> _Timer:
+        return _Timer(self)
+
+
+class Histogram(_Metric):
+    """Distribution of observed values in cumulative buckets."""
+
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS, registry=None):
+        self.upper_bounds = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramChild(self.upper_bounds)
+
+    def observe(self, value: float) -> None:
+        self._default().observe(value)
+
+    def time(self) -> _Timer:
+        return _Timer(self._default())
+
+    def _render_child(self, key, child) -> List[str]:
+        with child._lock:
+            counts = list(child.counts)
+            total = child.sum
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.upper_bounds + (float("inf"),), counts):
+            cumulative += count
+            labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    """Collection of metric families rendered together."""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> None:
+        with self._lock:
+            self._metrics.append(metric)
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware counting in-flight HTTP requests and request latency.
+
+    Requests are labelled by route template (e.g. /models/{filename}) rather
+    than raw path to keep label cardinality bounded.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            HTTP_REQUEST_SECONDS.labels(
+                method=scope["method"], route=path, status=status["code"]
+            ).observe(time.perf_counter() - start)
+
+
+# ---------------------------------------------------------------------------
+# Application metrics
+# ---------------------------------------------------------------------------
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "fengshui_http_request_seconds", "HTTP request latency by route", ("method", "route", "status")
+)
+HTTP_IN_FLIGHT = Gauge("fengshui_http_requests_in_flight", "HTTP requests currently being served")
+RESPONSE_BYTES = Counter(
+    "fengshui_response_bytes_total", "Compressed response bytes before (raw) and after (sent) compression",
+    ("encoding", "stage")
+)
+
+ANALYZE_STAGE_SECONDS = Histogram(
+    "fengshui_analyze_stage_seconds", "Latency of each /analyze/ pipeline stage", ("stage",)
+)
+STAGE_DECODE = ANALYZE_STAGE_SECONDS.labels(stage="decode")
+STAGE_DETECT = ANALYZE_STAGE_SECONDS.labels(stage="detect")
+STAGE_ANNOTATE_SAVE = ANALYZE_STAGE_SECONDS.labels(stage="annotate_save")
+STAGE_RULES = ANALYZE_STAGE_SECONDS.labels(stage="rules")
+STAGE_LLM = ANALYZE_STAGE_SECONDS.labels(stage="llm")
+STAGE_LLM_DELTA = ANALYZE_STAGE_SECONDS.labels(stage="llm_delta")
+STAGE_RESPONSE_BUILD = ANALYZE_STAGE_SECONDS.labels(stage="response_build")
+
+ANALYSES = Counter(
+    "fengshui_analyses_total", "Room analyses by mode ('llm', or 'fast' for rules only)", ("mode",)
+)
+REANALYSES = Counter(
+    "fengshui_reanalyses_total", "Re-uploads of an analyzed room by mode ('delta' or 'full') and 3D model reuse",
+    ("mode", "model_3d")
+)
+LLM_TOKENS = Counter(
+    "fengshui_llm_tokens_total", "Gemini tokens by prompt ('room', 'batch', 'delta') and direction", ("prompt", "direction")
+)
+
+VIDEO_STAGE_SECONDS = Histogram(
+    "fengshui_video_stage_seconds", "Latency of each /analyze/video stage per video", ("stage",)
+)
+VIDEO_FRAMES = Counter(
+    "fengshui_video_frames_total", "Video frames by handling (decoded, sampled, keyframe)", ("kind",)
+)
+
+SIMILAR_SEARCH_SECONDS = Histogram(
+    "fengshui_similar_search_seconds", "Latency of similar-room index searches"
+)
+SIMILAR_INDEX_ROOMS = Gauge("fengshui_similar_index_rooms", "Rooms in the similar-room index")
+
+ANALYSIS_HISTORY_QUEUE = Gauge("fengshui_analysis_history_queue", "Analyses waiting to be written to the history")
+ANALYSIS_HISTORY_WRITES = Counter(
+    "fengshui_analysis_history_writes_total", "Analyses written to the history by outcome", ("outcome",)
+)
+ANALYSIS_HISTORY_BATCH_SECONDS = Histogram(
+    "fengshui_analysis_history_batch_seconds", "Latency of analysis history write batches"
+)
+ANALYSIS_HISTORY_QUERY_SECONDS = Histogram(
+    "fengshui_analysis_history_query_seconds", "Latency of /analyses page queries", ("sort",)
+)
+
+MODEL_3D_PHASE_SECONDS = Histogram(
+    "fengshui_3d_phase_seconds", "Latency of each 3D generation phase", ("phase",)
+)
+PHASE_HEALTH_CHECK = MODEL_3D_PHASE_SECONDS.labels(phase="health_check")
+PHASE_PROCESS = MODEL_3D_PHASE_SECONDS.labels(phase="process")
+PHASE_DOWNLOAD = MODEL_3D_PHASE_SECONDS.labels(phase="download")
+PHASE_SAVE = MODEL_3D_PHASE_SECONDS.labels(phase="save")
+MODEL_3D_JOB_SECONDS = Histogram(
+    "fengshui_3d_job_seconds", "End-to-end 3D generation job duration", ("outcome",)
+)
+MODEL_3D_QUEUE_DEPTH = Gauge("fengshui_3d_jobs", "3D generation jobs by status", ("status",))
+
+CPU_BUDGET_THREADS = Gauge("fengshui_cpu_budget_threads", "Threads the CPU budget assigns per consumer", ("consumer",))
+
+BLENDER_STATUS_SECONDS = Histogram(
+    "fengshui_blender_status_seconds", "Latency of the Blender service /status checks made by the watchdog"
+)
+BLENDER_RESTARTS = Counter(
+    "fengshui_blender_restarts_total", "Blender service restarts by the watchdog by reason", ("reason",)
+)
+BLENDER_OUTPUT_LINES = Counter(
+    "fengshui_blender_output_lines_total", "Lines the Blender service wrote, by stream", ("stream",)
+)
+BLENDER_OUTPUT_SUPPRESSED = Counter(
+    "fengshui_blender_output_suppressed_total", "Blender service lines kept in the ring buffer but not logged"
+)
+
+DEPTH_CACHE_REQUESTS = Counter(
+    "fengshui_depth_cache_requests_total", "Depth-to-mesh cache lookups by stage and result", ("stage", "result")
+)
+DEPTH_CACHE_EVICTIONS = Counter(
+    "fengshui_depth_cache_evictions_total", "Depth-to-mesh cache entries evicted by stage", ("stage",)
+)
+DEPTH_CACHE_HIT_RATIO = Gauge("fengshui_depth_cache_hit_ratio", "Share of cache lookups served from cache", ("stage",))
+DEPTH_CACHE_BYTES = Gauge("fengshui_depth_cache_bytes", "Size of cached depth maps / meshes on disk", ("stage",))
+
+DERIVATIVE_RENDER_SECONDS = Histogram(
+    "fengshui_derivative_render_seconds", "Latency of rendering a derivative image", ("variant", "format")
+)
+DERIVATIVE_COALESCED = Counter(
+    "fengshui_derivative_coalesced_total", "Derivative requests that joined a render already in flight"
+)
+DERIVATIVE_CACHE_REQUESTS = Counter(
+    "fengshui_derivative_cache_requests_total", "Derivative image cache lookups", ("stage", "result")
+)
+DERIVATIVE_CACHE_EVICTIONS = Counter(
+    "fengshui_derivative_cache_evictions_total", "Derivative images evicted from the cache", ("stage",)
+)
+DERIVATIVE_CACHE_HIT_RATIO = Gauge(
+    "fengshui_derivative_cache_hit_ratio", "Share of derivative lookups served from cache", ("stage",)
+)
+DERIVATIVE_CACHE_BYTES = Gauge("fengshui_derivative_cache_bytes", "Size of cached derivative images", ("stage",))
+
+TTS_FIRST_CHUNK_SECONDS = Histogram(
+    "fengshui_tts_first_chunk_seconds", "Time until the TTS provider returns the first audio chunk"
+)
+TTS_SYNTHESIS_SECONDS = Histogram(
+    "fengshui_tts_synthesis_seconds", "Time to synthesize and cache a complete narration"
+)
+TTS_CACHE_REQUESTS = Counter(
+    "fengshui_tts_cache_requests_total", "TTS cache lookups by result", ("result",)
+)
+TTS_CACHE_HITS = TTS_CACHE_REQUESTS.labels(result="hit")
+TTS_CACHE_MISSES = TTS_CACHE_REQUESTS.labels(result="miss")
+TTS_CACHE_HIT_RATIO = Gauge("fengshui_tts_cache_hit_ratio", "Share of TTS cache lookups served from cache")
+TTS_CACHE_BYTES = Gauge("fengshui_tts_cache_bytes", "Size of cached TTS audio on disk")
+TTS_IN_FLIGHT = Gauge("fengshui_tts_syntheses_in_flight", "TTS syntheses currently running")
+
+ADMISSION_REJECTIONS = Counter(
+    "fengshui_admission_rejections_total", "Requests rejected by admission control", ("reason",)
+)
+ADMISSION_DEGRADED = Counter(
+    "fengshui_admission_degraded_total", "Optional work skipped under load", ("feature",)
+)
+ADMISSION_STAGE_ACTIVE = Gauge("fengshui_admission_stage_active", "Requests running in a stage", ("stage",))
+ADMISSION_STAGE_WAITING = Gauge("fengshui_admission_stage_waiting", "Requests queued for a stage", ("stage",))
@@ -1,23 +1,77 @@
 """
-3D Model generation module using TrueDepth Extractor via web service.
-Converts room images into 3D FBX meshes with depth information.
+3D Model generation module.
+Converts room images into 3D meshes with depth information, using one of two backends:
+  - blender: TrueDepth Extractor via the Blender web service (FBX)
+  - depth: in-process depth-to-mesh engine (see depth_mesh.py) in a process pool (FBX or GLB)
 """
 
 import io
 import logging
+import multiprocessing
+import os
+import threading
 import requests
-from typing import Tuple, Optional
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import Tuple, Optional, Union
 from pathlib import Path
 from datetime import datetime
 
+from depth_cache import depth_cache_key, get_depth_cache, get_mesh_cache, image_hash, mesh_cache_key
+from depth_mesh import DEPTH_INPUT_SIZE, MESH_FORMATS, depth_model_path, generate_mesh_file, warm_up
+from metrics import MODEL_3D_PHASE_SECONDS, PHASE_DOWNLOAD, PHASE_HEALTH_CHECK, PHASE_PROCESS, PHASE_SAVE
+from storage import KIND_RENDERS, get_store
+from tracing import current_span, inject_headers, start_span, traced
+
 # Configure logging
 logger = logging.getLogger(__name__)
 
 # Configuration
+MODEL_BACKEND = os.environ.get("MODEL_BACKEND", "blender").lower()  # blender | depth
 BLENDER_SERVICE_URL = "http://localhost:5001"
+DEPTH_MESH_FORMAT = os.environ.get("DEPTH_MESH_FORMAT", "fbx").lower()  # fbx | glb
+DEPTH_WORKERS = int(os.environ.get("DEPTH_WORKERS", "1"))  # 0: run in the calling thread
+DEPTH_JOB_TIMEOUT = 300
+# Pre-storage-layer FBX files live directly in this directory
 RENDER_OUTPUT_DIR = Path(__file__).parent / "room_renders"
 
 
+def save_model_file(content: bytes, extension: str) -> str:
+    """
+    Save a generated model to the artifact store.
+
+    Returns:
+        Location of the saved file
+    """
+    now = datetime.now()
+    filename = f"room_model_{now:%Y%m%d_%H%M%S_%f}.{extension}"
+    with PHASE_SAVE.time():
+        store = get_store()
+        key = store.save(KIND_RENDERS, filename, content, when=now)
+    return store.location(key)
+
+
+def model_record_name(model_id: str) -> str:
+    return f"model_{model_id}.json"
+
+
+def save_model_record(model_id: str, filename: str) -> None:
+    """Remember the file a 3D job produced; it outlives the job's in-memory status."""
+    try:
+        get_store().save_record(KIND_RENDERS, model_record_name(model_id), {"filename": filename})
+    except Exception as e:
+        logger.warning(f"Could not store the model file of {model_id}: {e}")
+
+
+def find_model_file(model_id: str) -> Optional[str]:
+    """Filename of a finished 3D job's model, or None if the job or its file is gone."""
+    store = get_store()
+    record = store.load_record(model_record_name(model_id), KIND_RENDERS)
+    if record is None or store.find(record["filename"], KIND_RENDERS) is None:
+        return None
+    return record["filename"]
+
+
 class ModelGenerator:
     """3D model generator using TrueDepth Extractor service."""
 
@@ -43,12 +97,15 @@ class ModelGenerator:
             bool: True if service is running, False otherwise
         """
         try:
-            response = requests.get(f"{self.service_url}/status", timeout=2)
+            with start_span("blender.status", "client", {"http.url": f"{self.service_url}/status"}) as span:
+                response = requests.get(f"{self.service_url}/status", headers=inject_headers(), timeout=2)
+                span.set_attribute("http.status_code", response.status_code)
             return response.status_code == 200
         except Exception as e:
             logger.warning(f"Blender service health check failed: {e}")
             return False
 
+    @traced("ModelGenerator.generate_3d_model")
     def generate_3d_model(
         self,
         image_data: bytes,
@@ -71,13 +128,16 @@ class ModelGenerator:
 
         Returns:
             Tuple of (fbx_path, message)
-            - fbx_path: Path to saved FBX file (None if failed)
+            - fbx_path: Location of the saved FBX file (None if failed)
             - message: Success or error message
         """
         try:
             # Check if service is available
-            if not self.check_service_health():
+            with PHASE_HEALTH_CHECK.time():
+                healthy = self.check_service_health()
+            if not healthy:
                 logger.error("Blender service is not running or not healthy")
+                current_span().set_error("3D generation service unavailable")
                 return None, "3D generation service unavailable"
 
             # Prepare image file for upload
@@ -96,12 +156,20 @@ class ModelGenerator:
             logger.info(f"Sending request to Blender service: model={model}, device={device}, detail={detail}")
 
             # Send request to Blender service
-            response = requests.post(
-                f"{self.service_url}/process",
-                files=files,
-                data=data,
-                timeout=300  # 5 minute timeout for processing
-            )
+            with PHASE_PROCESS.time(), start_span("blender.process", "client", {
+                "http.url": f"{self.service_url}/process",
+                "depth.model": model,
+                "depth.device": device,
+                "mesh.detail": detail,
+            }) as span:
+                response = requests.post(
+                    f"{self.service_url}/process",
+                    files=files,
+                    data=data,
+                    headers=inject_headers(),
+                    timeout=300  # 5 minute timeout for processing
+                )
+                span.set_attribute("http.status_code", response.status_code)
 
             if response.status_code != 200:
                 # Try to get detailed error message from response
@@ -113,6 +181,7 @@ class ModelGenerator:
                     error_msg = f"Blender service returned error: {response.status_code} - {response.text[:200]}"
 
                 logger.error(error_msg)
+                current_span().set_error(error_msg)
                 return None, error_msg
 
             result = response.json()
@@ -131,7 +200,12 @@ class ModelGenerator:
             logger.info(f"Downloading FBX from: {fbx_url}")
 
             # Download FBX file
-            fbx_response = requests.get(f"{self.service_url}{fbx_url}", timeout=30)
+            with PHASE_DOWNLOAD.time(), start_span("blender.download", "client", {
+                "http.url": f"{self.service_url}{fbx_url}",
+            }) as span:
+                fbx_response = requests.get(f"{self.service_url}{fbx_url}", headers=inject_headers(), timeout=30)
+                span.set_attribute("http.status_code", fbx_response.status_code)
+                span.set_attribute("http.response_bytes", len(fbx_response.content))
 
             if fbx_response.status_code != 200:
                 logger.error(f"Failed to download FBX: {fbx_response.status_code}")
@@ -139,15 +213,9 @@ class ModelGenerator:
 
             # Save FBX file if requested
             if save_results:
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
-                fbx_filename = f"room_model_{timestamp}.fbx"
-                fbx_path = RENDER_OUTPUT_DIR / fbx_filename
-
-                with open(fbx_path, 'wb') as f:
-                    f.write(fbx_response.content)
-
+                fbx_path = save_model_file(fbx_response.content, "fbx")
                 logger.info(f"Saved 3D model to: {fbx_path}")
-                return str(fbx_path), "3D model generated successfully"
+                return fbx_path, "3D model generated successfully"
             else:
                 return None, "3D model generated (not saved)"
 
@@ -159,42 +227,219 @@ class ModelGenerator:
             return None, f"3D generation error: {str(e)}"
 
 
+class DepthMeshGenerator:
+    """
+    3D model generator running the depth-to-mesh engine in a process pool.
+
+    Depth maps and finished meshes are cached (see depth_cache.py), so
+    regenerating a room with other detail/strength only rebuilds the mesh.
+    """
+
+    def __init__(self, workers: int = DEPTH_WORKERS, mesh_format: str = DEPTH_MESH_FORMAT):
+        """
+        Initialize the model generator.
+
+        Args:
+            workers: Worker processes (0 runs jobs in the calling thread)
+            mesh_format: Output format: 'fbx' or 'glb'
+        """
+        if mesh_format not in MESH_FORMATS:
+            raise ValueError(f"Unknown mesh format: {mesh_format}")
+        self.workers = workers
+        self.mesh_format = mesh_format
+        self.depth_cache = get_depth_cache()
+        self.mesh_cache = get_mesh_cache()
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                # spawn: forking the API process would copy its threads and loaded models
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=warm_up
+                )
+            return self._pool
+
+    def _reset_pool(self) -> None:
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def check_service_health(self, model: str = 'vits') -> bool:
+        """
+        Check if the depth model is available.
+
+        Returns:
+            bool: True if the model file exists
+        """
+        return depth_model_path(model).exists()
+
+    @traced("DepthMeshGenerator.generate_3d_model")
+    def generate_3d_model(
+        self,
+        image_data: bytes,
+        model: str = 'vits',
+        device: str = 'cpu',
+        detail: int = 10,
+        strength: float = 0.6,
+        save_results: bool = True
+    ) -> Tuple[Optional[str], Optional[str]]:
+        """
+        Generate a 3D model from image data.
+
+        Args:
+            image_data: Raw image bytes
+            model: Depth model size: 'vits', 'vitb', 'vitl' (default: 'vits')
+            device: Processing device: 'cpu', 'gpu' (default: 'cpu')
+            detail: Mesh resolution 5-50 (default: 10)
+            strength: Depth strength 0.0-2.0 (default: 0.6)
+            save_results: Whether to save results to disk (default: True)
+
+        Returns:
+            Tuple of (model_path, message)
+            - model_path: Location of the saved FBX/GLB file (None if failed)
+            - message: Success or error message
+        """
+        try:
+            digest = image_hash(image_data)
+            depth_key = depth_cache_key(digest, model, DEPTH_INPUT_SIZE)
+            mesh_key = mesh_cache_key(depth_key, detail, strength, self.mesh_format)
+            current_span().set_attributes({"image.sha256": digest[:16], "mesh.detail": detail})
+
+            cached_mesh = self.mesh_cache.get(mesh_key)
+            if cached_mesh is not None:
+                logger.info(f"Depth mesh served from cache: {mesh_key[:12]}")
+                content = cached_mesh.read_bytes()
+            else:
+                content = self._run_pipeline(image_data, model, device, detail, strength, depth_key)
+                self.mesh_cache.put(mesh_key, f".{self.mesh_format}", content)
+
+            if save_results:
+                model_path = save_model_file(content, self.mesh_format)
+                logger.info(f"Saved 3D model to: {model_path}")
+                return model_path, "3D model generated successfully"
+            else:
+                return None, "3D model generated (not saved)"
+
+        except FutureTimeoutError:
+            # The worker is still busy with the job: replace the pool rather than queue behind it
+            self._reset_pool()
+            logger.error("In-process 3D generation timed out")
+            return None, "3D generation timed out (processing took too long)"
+        except BrokenProcessPool:
+            self._reset_pool()
+            logger.error("3D generation worker died")
+            return None, "3D generation error: worker process died"
+        except Exception as e:
+            logger.error(f"Error during 3D model generation: {e}")
+            return None, f"3D generation error: {str(e)}"
+
+    def _run_pipeline(self, image_data: bytes, model: str, device: str, detail: int, strength: float,
+                      depth_key: str) -> bytes:
+        """
+        Build the mesh file in a worker, reusing the cached depth map when there is one.
+
+        Raises:
+            FileNotFoundError: If the depth map is not cached and the depth model is missing
+        """
+        depth_path = self.depth_cache.get(depth_key)
+        save_depth_to = None
+        if depth_path is None:
+            with PHASE_HEALTH_CHECK.time():
+                healthy = self.check_service_health(model)
+            if not healthy:
+                raise FileNotFoundError(f"Depth model not found: {depth_model_path(model)}")
+            save_depth_to = self.depth_cache.temp_path(depth_key, ".npy")
+
+        logger.info(f"Generating depth mesh in-process: model={model}, device={device}, detail={detail}, "
+                    f"depth {'cached' if depth_path else 'computed'}")
+        args = (image_data, model, device, detail, strength, self.mesh_format,
+                str(depth_path) if depth_path else None, str(save_depth_to) if save_depth_to else None)
+        try:
+            with PHASE_PROCESS.time(), start_span("depth_mesh.generate", "internal", {
+                "depth.model": model,
+                "depth.device": device,
+                "depth.cached": depth_path is not None,
+                "mesh.detail": detail,
+                "mesh.format": self.mesh_format,
+            }) as span:
+                if self.workers > 0:
+                    content, timings = self._get_pool().submit(generate_mesh_file, *args).result(DEPTH_JOB_TIMEOUT)
+                else:
+                    content, timings = generate_mesh_file(*args)
+                span.set_attributes({f"depth_mesh.{phase}_ms": round(seconds * 1000, 1)
+                                     for phase, seconds in timings.items()})
+                span.set_attribute("mesh.bytes", len(content))
+            if save_depth_to is not None and save_depth_to.exists():
+                self.depth_cache.commit(depth_key, save_depth_to)
+        finally:
+            if save_depth_to is not None:
+                save_depth_to.unlink(missing_ok=True)
+
+        for phase, seconds in timings.items():
+            MODEL_3D_PHASE_SECONDS.labels(phase=phase).observe(seconds)
+        return content
+
+    def shutdown(self) -> None:
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+
 # Singleton instance for reuse across requests
 _generator_instance = None
 
 
-def get_generator() -> ModelGenerator:
+def get_generator() -> Union[ModelGenerator, DepthMeshGenerator]:
     """
-    Get or create singleton generator instance.
+    Get or create singleton generator instance for the configured MODEL_BACKEND.
     Ensures generator is initialized only once.
 
     Returns:
-        ModelGenerator instance
+        ModelGenerator or DepthMeshGenerator instance
     """
     global _generator_instance
     if _generator_instance is None:
-        _generator_instance = ModelGenerator()
+        if MODEL_BACKEND == "depth":
+            _generator_instance = DepthMeshGenerator()
+        else:
+            _generator_instance = ModelGenerator()
     return _generator_instance
 
 
+def shutdown_generator() -> None:
+    """Stop the depth-mesh worker processes, if any were started."""
+    if isinstance(_generator_instance, DepthMeshGenerator):
+        _generator_instance.shutdown()
+
+
 def generate_room_model(
     image_data: bytes,
     model: str = 'vits',
     device: str = 'cpu',
-    save_results: bool = True
+    save_results: bool = True,
+    detail: int = 10,
+    strength: float = 0.6
 ) -> Tuple[Optional[str], Optional[str]]:
     """
-    Convenience function to generate 3D room model.
+    Convenience function to generate 3D room model with the configured backend.
 
     Args:
         image_data: Raw image bytes
         model: Model size (default: 'vits' for speed)
         device: Processing device (default: 'cpu')
         save_results: Whether to save results (default: True)
+        detail: Mesh subdivisions 5-50 (default: 10)
+        strength: Depth strength 0.0-2.0 (default: 0.6)
 
     Returns:
-        Tuple of (fbx_path, message)
-        - fbx_path: Path to saved FBX file (None if failed)
+        Tuple of (model_path, message)
+        - model_path: Path to saved FBX/GLB file (None if failed)
         - message: Success or error message
     """
     generator = get_generator()
@@ -202,7 +447,7 @@ def generate_room_model(
         image_data=image_data,
         model=model,
         device=device,
-        detail=10,
-        strength=0.6,
+        detail=detail,
+        strength=strength,
         save_results=save_results
     )
@@ -4,9 +4,11 @@ Detects objects in bedroom and living space images.
 """
 
 import io
-import json
 import logging
-from typing import List, Dict, Any, Tuple
+import os
+import threading
+from dataclasses import dataclass, replace
+from typing import List, Dict, Any, Optional, Tuple
 from pathlib import Path
 from datetime import datetime
 import numpy as np
@@ -14,53 +16,551 @@ from PIL import Image, ImageDraw, ImageFont
 from ultralytics import YOLO
 import cv2
 
+from metrics import STAGE_ANNOTATE_SAVE, STAGE_DECODE, STAGE_DETECT
+from storage import KIND_RESULTS, get_store
+from tracing import start_span, traced
+
 # Configure logging
 logger = logging.getLogger(__name__)
 
-# Model path - will download automatically on first run
-MODEL_NAME = "yolo11x.pt"  # YOLOv11 XL model (most accurate)
+# Models download automatically on first run (size is chosen by the detection profile)
 MODEL_CACHE_DIR = Path(__file__).parent / "models"
-RESULTS_DIR = Path(__file__).parent / "results"
+RESULTS_JPEG_QUALITY = int(os.environ.get("RESULTS_JPEG_QUALITY", "95"))
+# Also draw and store the full-size annotated image at analysis time (previews
+# and overlays are otherwise rendered on demand by /images/, see derivatives.py)
+EAGER_ANNOTATION = os.environ.get("EAGER_ANNOTATION", "false").lower() in ("1", "true", "yes")
+DETECTION_BATCH_SIZE = 8  # Images per forward pass for batched detection
+# Room embeddings for similar-room search, pooled from the backbone during detection
+ROOM_EMBEDDINGS = os.environ.get("ROOM_EMBEDDINGS", "true").lower() in ("1", "true", "yes")
+ROOM_EMBEDDING_DIM = 128
+
+# COCO classes that matter for a room's feng shui (furniture, decor, clutter).
+# Everything else (people, cars, animals...) is dropped inside inference so it
+# cannot take detection slots away from furniture.
+ROOM_CLASSES = (
+    "bed", "couch", "chair", "bench", "dining table", "toilet", "sink",
+    "tv", "laptop", "clock", "vase", "potted plant", "book",
+    "refrigerator", "oven", "microwave", "toaster",
+    "bottle", "cup", "bowl", "wine glass", "teddy bear",
+    "backpack", "handbag", "suitcase", "umbrella",
+)
+
+# Core furniture classes, used to measure recall when comparing profiles
+FURNITURE_CLASSES = (
+    "bed", "couch", "chair", "bench", "dining table", "tv",
+    "clock", "vase", "potted plant",
+)
+
+
+@dataclass(frozen=True)
+class DetectionProfile:
+    """
+    Inference configuration for a deployment.
+
+    Attributes:
+        name: Profile name
+        model_size: YOLO11 model size: 'n', 's', 'm', 'l' or 'x'
+        model_format: Weights format/extension ('pt', or an exported 'onnx', 'engine', ...)
+        classes: Class names to keep (None keeps all 80 COCO classes)
+        imgsz: Inference input size in pixels
+        iou: NMS IoU threshold
+        max_det: Maximum detections per image
+        conf: Default confidence threshold
+        tiling_min_side: Enable sliced inference for images whose longer side
+            is at least this many pixels (0 disables tiling)
+        tile_size: Tile edge length in pixels for sliced inference
+        tile_overlap: Fractional overlap between neighbouring tiles (0-0.5)
+    """
+    name: str
+    model_size: str = "x"
+    model_format: str = "pt"
+    classes: Optional[Tuple[str, ...]] = ROOM_CLASSES
+    imgsz: int = 640
+    iou: float = 0.7
+    max_det: int = 20
+    conf: float = 0.25
+    tiling_min_side: int = 0
+    tile_size: int = 1024
+    tile_overlap: float = 0.2
+
+    @property
+    def model_name(self) -> str:
+        return f"yolo11{self.model_size}.{self.model_format}"
+
+
+DETECTION_PROFILES = {
+    # Original behaviour: largest model, every COCO class
+    "full": DetectionProfile("full", model_size="x", classes=None),
+    "accurate": DetectionProfile("accurate", model_size="x"),
+    "balanced": DetectionProfile("balanced", model_size="m"),
+    "fast": DetectionProfile("fast", model_size="s", imgsz=512),
+    "edge": DetectionProfile("edge", model_size="n", imgsz=416, max_det=15),
+}
+DEFAULT_DETECTION_PROFILE = "accurate"
+
+
+def load_detection_profile(name: Optional[str] = None) -> DetectionProfile:
+    """
+    Resolve the detection profile for this deployment.
+
+    The profile is picked by name (argument, then DETECTION_PROFILE env var,
+    then the default) and individual fields can be overridden with
+    DETECTION_MODEL_SIZE, DETECTION_MODEL_FORMAT, DETECTION_IMGSZ,
+    DETECTION_IOU, DETECTION_MAX_DET, DETECTION_CONF, DETECTION_CLASSES
+    (comma-separated class names, or "all"), DETECTION_TILING_MIN_SIDE,
+    DETECTION_TILE_SIZE and DETECTION_TILE_OVERLAP.
+
+    Args:
+        name: Profile name (optional)
+
+    Returns:
+        DetectionProfile
+    """
+    name = name or os.environ.get("DETECTION_PROFILE", DEFAULT_DETECTION_PROFILE)
+    if name not in DETECTION_PROFILES:
+        raise ValueError(
+            f"Unknown detection profile '{name}'. Available: {', '.join(DETECTION_PROFILES)}"
+        )
+    profile = DETECTION_PROFILES[name]
+
+    overrides = {}
+    if os.environ.get("DETECTION_MODEL_SIZE"):
+        overrides["model_size"] = os.environ["DETECTION_MODEL_SIZE"]
+    if os.environ.get("DETECTION_MODEL_FORMAT"):
+        overrides["model_format"] = os.environ["DETECTION_MODEL_FORMAT"]
+    if os.environ.get("DETECTION_IMGSZ"):
+        overrides["imgsz"] = int(os.environ["DETECTION_IMGSZ"])
+    if os.environ.get("DETECTION_IOU"):
+        overrides["iou"] = float(os.environ["DETECTION_IOU"])
+    if os.environ.get("DETECTION_MAX_DET"):
+        overrides["max_det"] = int(os.environ["DETECTION_MAX_DET"])
+    if os.environ.get("DETECTION_CONF"):
+        overrides["conf"] = float(os.environ["DETECTION_CONF"])
+    if os.environ.get("DETECTION_TILING_MIN_SIDE"):
+        overrides["tiling_min_side"] = int(os.environ["DETECTION_TILING_MIN_SIDE"])
+    if os.environ.get("DETECTION_TILE_SIZE"):
+        overrides["tile_size"] = int(os.environ["DETECTION_TILE_SIZE"])
+    if os.environ.get("DETECTION_TILE_OVERLAP"):
+        overrides["tile_overlap"] = float(os.environ["DETECTION_TILE_OVERLAP"])
+    if os.environ.get("DETECTION_CLASSES"):
+        classes = os.environ["DETECTION_CLASSES"]
+        overrides["classes"] = None if classes.strip() == "all" else tuple(
+            c.strip() for c in classes.split(",") if c.strip()
+        )
+
+    if overrides.get("model_size", profile.model_size) not in ("n", "s", "m", "l", "x"):
+        raise ValueError(f"Invalid model size '{overrides['model_size']}' (expected n/s/m/l/x)")
+
+    return replace(profile, **overrides) if overrides else profile
+
+
+def tile_boxes(width: int, height: int, tile_size: int, overlap: float) -> List[Tuple[int, int, int, int]]:
+    """
+    Compute overlapping tile windows covering an image.
+
+    Args:
+        width: Image width in pixels
+        height: Image height in pixels
+        tile_size: Tile edge length in pixels
+        overlap: Fractional overlap between neighbouring tiles
+
+    Returns:
+        List of (x1, y1, x2, y2) crop boxes, evenly spaced so that every
+        tile is full size when the image allows it
+    """
+    stride = max(1, int(tile_size * (1 - overlap)))
+
+    def starts(length: int) -> List[int]:
+        if length <= tile_size:
+            return [0]
+        # Fewest tiles that keep at least the requested overlap, spread evenly
+        count = int(np.ceil((length - tile_size) / stride)) + 1
+        return [int(round(p)) for p in np.linspace(0, length - tile_size, count)]
+
+    return [
+        (x, y, min(x + tile_size, width), min(y + tile_size, height))
+        for y in starts(height)
+        for x in starts(width)
+    ]
+
+
+def non_max_suppression(
+    xyxy: np.ndarray,
+    scores: np.ndarray,
+    class_ids: np.ndarray,
+    iou_threshold: float
+) -> np.ndarray:
+    """
+    Class-aware NMS.
+
+    Returns:
+        Indices of the kept boxes, highest score first
+    """
+    if len(xyxy) == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    # Offset boxes per class so boxes of different classes never overlap
+    offset = class_ids[:, None].astype(np.float64) * (float(xyxy.max()) + 1)
+    boxes = xyxy.astype(np.float64) + offset
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+
+    order = np.argsort(-scores)
+    keep = []
+    while order.size:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        top_left = np.maximum(boxes[i, :2], boxes[rest, :2])
+        bottom_right = np.minimum(boxes[i, 2:], boxes[rest, 2:])
+        intersection = np.prod(np.clip(bottom_right - top_left, 0, None), axis=1)
+        iou = intersection / (areas[i] + areas[rest] - intersection + 1e-9)
+        order = rest[iou <= iou_threshold]
+    return np.array(keep, dtype=np.int64)
+
+
+class Detections:
+    """
+    Columnar detection results for a single image.
+
+    Boxes, class ids and confidences are kept as NumPy arrays copied off the
+    device in one transfer. Derived geometry (width, height, center) is
+    computed vectorized, and the per-object dict format returned by the API
+    is only built when it is first needed (indexing, iteration or to_list()).
+
+    Behaves like a read-only list of detection dicts, so existing code that
+    does len(), indexing or iteration keeps working unchanged.
+    """
+
+    __slots__ = ("xyxy", "class_ids", "confidences", "names", "image_size", "embedding", "_dicts")
+
+    def __init__(
+        self,
+        xyxy: np.ndarray,
+        class_ids: np.ndarray,
+        confidences: np.ndarray,
+        names: Dict[int, str],
+        image_size: Optional[Tuple[int, int]] = None,
+        embedding: Optional[np.ndarray] = None
+    ):
+        """
+        Args:
+            xyxy: (N, 4) float array of x1, y1, x2, y2 box corners
+            class_ids: (N,) int array of class ids
+            confidences: (N,) float array of confidence scores
+            names: Mapping of class id to class name
+            image_size: (width, height) of the source image, if known
+            embedding: (ROOM_EMBEDDING_DIM,) unit vector describing the whole image, if computed
+        """
+        self.xyxy = np.asarray(xyxy, dtype=np.float32).reshape(-1, 4)
+        self.class_ids = np.asarray(class_ids, dtype=np.int64).reshape(-1)
+        self.confidences = np.asarray(confidences, dtype=np.float32).reshape(-1)
+        self.names = names
+        self.image_size = image_size
+        self.embedding = embedding
+        self._dicts = None
+
+    @classmethod
+    def from_result(cls, result, embedding: Optional[np.ndarray] = None) -> "Detections":
+        """Build from a single ultralytics Results object."""
+        # boxes.data is (N, 6): x1, y1, x2, y2, conf, cls - one device transfer
+        data = result.boxes.data.cpu().numpy()
+        height, width = result.orig_shape[:2]
+        return cls(data[:, :4], data[:, 5].astype(np.int64), data[:, 4], result.names, (width, height), embedding)
+
+    @classmethod
+    def from_list(
+        cls,
+        detections: List[Dict[str, Any]],
+        image_size: Optional[Tuple[int, int]] = None
+    ) -> "Detections":
+        """Rebuild from the serialized dict format (e.g. a stored JSON result)."""
+        class_names = sorted({det["class"] for det in detections})
+        class_index = {name: i for i, name in enumerate(class_names)}
+        return cls(
+            np.array([
+                [det["bbox"]["x1"], det["bbox"]["y1"], det["bbox"]["x2"], det["bbox"]["y2"]]
+                for det in detections
+            ], dtype=np.float32),
+            np.array([class_index[det["class"]] for det in detections], dtype=np.int64),
+            np.array([det["confidence"] for det in detections], dtype=np.float32),
+            dict(enumerate(class_names)),
+            image_size
+        )
+
+    @classmethod
+    def empty(cls) -> "Detections":
+        """Detections for an image with no objects."""
+        return cls(np.zeros((0, 4)), np.zeros(0), np.zeros(0), {})
+
+    @classmethod
+    def concatenate(cls, parts: List["Detections"]) -> "Detections":
+        """Join detections that share the same class names mapping (and the first part's image size and embedding)."""
+        if not parts:
+            return cls.empty()
+        return cls(
+            np.concatenate([p.xyxy for p in parts]),
+            np.concatenate([p.class_ids for p in parts]),
+            np.concatenate([p.confidences for p in parts]),
+            parts[0].names,
+            parts[0].image_size,
+            parts[0].embedding
+        )
+
+    @property
+    def widths(self) -> np.ndarray:
+        return self.xyxy[:, 2] - self.xyxy[:, 0]
+
+    @property
+    def heights(self) -> np.ndarray:
+        return self.xyxy[:, 3] - self.xyxy[:, 1]
+
+    @property
+    def centers(self) -> np.ndarray:
+        """(N, 2) array of box centers."""
+        return (self.xyxy[:, :2] + self.xyxy[:, 2:]) / 2
+
+    @property
+    def class_names(self) -> List[str]:
+        return [self.names[int(class_id)] for class_id in self.class_ids]
+
+    def translate(self, dx: float, dy: float) -> "Detections":
+        """Return a copy with boxes shifted by (dx, dy), e.g. from tile to image coordinates."""
+        return Detections(self.xyxy + np.array([dx, dy, dx, dy], dtype=np.float32),
+                          self.class_ids, self.confidences, self.names, self.image_size, self.embedding)
+
+    def select(self, mask) -> "Detections":
+        """Return the subset selected by a boolean mask or index array."""
+        return Detections(self.xyxy[mask], self.class_ids[mask], self.confidences[mask],
+                          self.names, self.image_size, self.embedding)
+
+    def to_list(self) -> List[Dict[str, Any]]:
+        """Serialize to the API's list-of-dicts format (cached after first call)."""
+        if self._dicts is None:
+            xyxy = self.xyxy.astype(np.float64)
+            # Columns: x1, y1, x2, y2, width, height, center_x, center_y
+            geometry = np.round(np.column_stack([
+                xyxy,
+                xyxy[:, 2] - xyxy[:, 0],
+                xyxy[:, 3] - xyxy[:, 1],
+                (xyxy[:, 0] + xyxy[:, 2]) / 2,
+                (xyxy[:, 1] + xyxy[:, 3]) / 2,
+            ]), 2).tolist()
+            confidences = np.round(self.confidences.astype(np.float64), 3).tolist()
+
+            self._dicts = [
+                {
+                    "class": class_name,
+                    "confidence": confidence,
+                    "bbox": {
+                        "x1": x1, "y1": y1, "x2": x2, "y2": y2,
+                        "width": width, "height": height
+                    },
+                    "center": {"x": cx, "y": cy}
+                }
+                for class_name, confidence, (x1, y1, x2, y2, width, height, cx, cy)
+                in zip(self.class_names, confidences, geometry)
+            ]
+        return self._dicts
+
+    def __len__(self) -> int:
+        return len(self.class_ids)
+
+    def __getitem__(self, index):
+        return self.to_list()[index]
+
+    def __iter__(self):
+        return iter(self.to_list())
+
+    def __repr__(self) -> str:
+        return f"Detections(n={len(self)})"
+
+
+def draw_detections(image: Image.Image, detections: Detections, scale: float = 1.0) -> Image.Image:
+    """
+    Draw labelled bounding boxes onto an RGB image (in place).
+
+    Args:
+        image: RGB image to draw on
+        detections: Detections in source image coordinates
+        scale: Size of the image relative to the source (boxes, line width
+            and label size are scaled by it)
+
+    Returns:
+        The same image, for chaining
+    """
+    # Create drawing context
+    draw = ImageDraw.Draw(image)
+    font_size = max(10, round(20 * scale))
+    line_width = max(1, round(3 * scale))
+
+    # Try to use a decent font, fall back to default if not available
+    try:
+        font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", font_size)
+    except OSError:
+        font = ImageFont.load_default()
+
+    # Color palette for different classes
+    colors = [
+        (255, 0, 0), (0, 255, 0), (0, 0, 255), (255, 255, 0),
+        (255, 0, 255), (0, 255, 255), (128, 0, 0), (0, 128, 0),
+        (0, 0, 128), (128, 128, 0), (128, 0, 128), (0, 128, 128)
+    ]
+
+    # Draw each detection
+    for i, (class_name, confidence, box) in enumerate(
+        zip(detections.class_names, detections.confidences.tolist(), (detections.xyxy * scale).tolist())
+    ):
+        x1, y1, x2, y2 = box
+
+        # Get color for this detection
+        color = colors[i % len(colors)]
+
+        # Draw rectangle
+        draw.rectangle([x1, y1, x2, y2], outline=color, width=line_width)
+
+        # Draw label with background
+        label = f"{class_name} {confidence:.2f}"
+
+        # Get text bounding box for background
+        bbox_text = draw.textbbox((x1, y1 - font_size), label, font=font)
+        draw.rectangle(bbox_text, fill=color)
+        draw.text((x1, y1 - font_size), label, fill=(255, 255, 255), font=font)
+
+    return image
+
+
+# Pooled backbone features captured during the current _predict call, per thread.
+# The hook is a plain function because ultralytics deep-copies the model (hooks
+# included) when it sets up a predictor.
+_captured_features = threading.local()
+
+
+def _capture_backbone_features(module, inputs, output) -> None:
+    batches = getattr(_captured_features, "batches", None)
+    if batches is not None:
+        batches.append(output.detach().float().mean(dim=(2, 3)).cpu().numpy())
 
 
 class ObjectDetector:
     """YOLOv11-based object detector for room furniture and arrangement analysis."""
 
-    def __init__(self, model_name: str = MODEL_NAME):
+    def __init__(self, model_name: Optional[str] = None, profile: Optional[DetectionProfile] = None):
         """
         Initialize the object detector.
 
         Args:
-            model_name: YOLO model to use (default: yolo11n.pt)
+            model_name: YOLO weights to load, overriding the profile's model (optional)
+            profile: Detection profile (default: from load_detection_profile())
         """
-        self.model_name = model_name
+        self.profile = profile or load_detection_profile()
+        self.model_name = model_name or self.profile.model_name
         self.model = None
+        self.class_ids: Optional[List[int]] = None
+        self.embeddings_enabled = False
+        self._projection: Optional[np.ndarray] = None
         self._load_model()
 
     def _load_model(self) -> None:
         """Load the YOLO model with error handling."""
         try:
-            # Create model cache and results directories if they don't exist
+            # Create model cache directory if it doesn't exist
             MODEL_CACHE_DIR.mkdir(parents=True, exist_ok=True)
-            RESULTS_DIR.mkdir(parents=True, exist_ok=True)
 
             # Load model (will auto-download if not present)
             self.model = YOLO(self.model_name)
-            logger.info(f"Successfully loaded YOLO model: {self.model_name}")
+            logger.info(f"Successfully loaded YOLO model: {self.model_name} (profile: {self.profile.name})")
         except Exception as e:
             logger.error(f"Failed to load YOLO model: {e}")
             raise
 
-    def detect_objects(self, image_data: bytes, confidence_threshold: float = 0.25) -> List[Dict[str, Any]]:
+        self.class_ids = self._resolve_class_ids(self.profile.classes)
+        if ROOM_EMBEDDINGS:
+            self._attach_embedding_hook()
+
+    def _attach_embedding_hook(self) -> None:
+        """
+        Capture the last backbone layer's output during inference for room embeddings.
+
+        The embedding costs no extra model pass: the feature map is average
+        pooled inside the forward hook. Only PyTorch weights expose the layers;
+        exported formats (onnx, openvino...) run without embeddings.
+        """
+        network = getattr(self.model, "model", None)
+        layers = getattr(network, "model", None)
+        config = getattr(network, "yaml", None)
+        if layers is None or not isinstance(config, dict) or "backbone" not in config:
+            logger.info(f"Room embeddings unavailable for {self.model_name} (no PyTorch backbone)")
+            return
+        layers[len(config["backbone"]) - 1].register_forward_hook(_capture_backbone_features)
+        self.embeddings_enabled = True
+
+    def _embed(self, pooled: np.ndarray) -> np.ndarray:
+        """
+        Project pooled backbone features (B, C) to unit-length ROOM_EMBEDDING_DIM vectors.
+
+        The projection is a fixed random Gaussian matrix seeded by the channel
+        count, so vectors from every process running the same weights are
+        comparable without storing it.
+        """
+        if self._projection is None or self._projection.shape[0] != pooled.shape[1]:
+            rng = np.random.default_rng(pooled.shape[1])
+            self._projection = rng.standard_normal((pooled.shape[1], ROOM_EMBEDDING_DIM)).astype(np.float32)
+        pooled = pooled / (np.linalg.norm(pooled, axis=1, keepdims=True) + 1e-12)
+        embeddings = pooled @ self._projection
+        return embeddings / (np.linalg.norm(embeddings, axis=1, keepdims=True) + 1e-12)
+
+    def _resolve_class_ids(self, classes: Optional[Tuple[str, ...]]) -> Optional[List[int]]:
+        """Map profile class names to the model's class ids (None keeps all classes)."""
+        if classes is None:
+            return None
+
+        ids_by_name = {name: class_id for class_id, name in self.model.names.items()}
+        unknown = [name for name in classes if name not in ids_by_name]
+        if unknown:
+            logger.warning(f"Ignoring classes not known to {self.model_name}: {unknown}")
+
+        class_ids = sorted(ids_by_name[name] for name in classes if name in ids_by_name)
+        if not class_ids:
+            logger.warning(f"No profile classes match {self.model_name} - detecting all classes")
+            return None
+        return class_ids
+
+    def _predict(self, source, confidence_threshold: Optional[float] = None) -> List[Detections]:
+        """Run YOLO inference with the profile's settings (one Detections per source image)."""
+        _captured_features.batches = []
+        try:
+            results = self.model(
+                source,
+                conf=self.profile.conf if confidence_threshold is None else confidence_threshold,
+                iou=self.profile.iou,
+                imgsz=self.profile.imgsz,
+                max_det=self.profile.max_det,
+                classes=self.class_ids,
+                verbose=False
+            )
+            batches = _captured_features.batches
+        finally:
+            _captured_features.batches = None
+
+        embeddings: List[Optional[np.ndarray]] = [None] * len(results)
+        if batches:
+            pooled = np.concatenate(batches)
+            # The first forward of a fresh predictor may include a warm-up pass
+            if len(pooled) >= len(results):
+                embeddings = list(self._embed(pooled[-len(results):]))
+        return [Detections.from_result(result, embedding) for result, embedding in zip(results, embeddings)]
+
+    def detect_objects(self, image_data: bytes, confidence_threshold: Optional[float] = None) -> Detections:
         """
         Detect objects in an image.
 
         Args:
             image_data: Raw image bytes
-            confidence_threshold: Minimum confidence score for detections (0-1)
+            confidence_threshold: Minimum confidence score for detections (0-1),
+                defaults to the profile's threshold
 
         Returns:
-            List of detected objects with format:
+            Detections for the image. Serializes (to_list()) to:
             [
                 {
                     "class": "bed",
@@ -79,53 +579,23 @@ class ObjectDetector:
             ]
         """
         try:
-            # Convert bytes to PIL Image
-            image = Image.open(io.BytesIO(image_data))
-
-            # Convert to RGB if necessary (handle RGBA, grayscale, etc.)
-            if image.mode != 'RGB':
-                image = image.convert('RGB')
-
-            # Run inference (max_det=20 allows up to 20 detections)
-            results = self.model(image, conf=confidence_threshold, max_det=20, verbose=False)
-
-            # Parse results
-            detections = []
-            for result in results:
-                boxes = result.boxes
-                for i in range(len(boxes)):
-                    # Get bounding box coordinates (xyxy format)
-                    bbox = boxes.xyxy[i].cpu().numpy()
-                    x1, y1, x2, y2 = bbox
-
-                    # Get class and confidence
-                    class_id = int(boxes.cls[i].cpu().numpy())
-                    confidence = float(boxes.conf[i].cpu().numpy())
-                    class_name = result.names[class_id]
-
-                    # Calculate additional metrics
-                    width = x2 - x1
-                    height = y2 - y1
-                    center_x = (x1 + x2) / 2
-                    center_y = (y1 + y2) / 2
-
-                    detection = {
-                        "class": class_name,
-                        "confidence": round(confidence, 3),
-                        "bbox": {
-                            "x1": round(float(x1), 2),
-                            "y1": round(float(y1), 2),
-                            "x2": round(float(x2), 2),
-                            "y2": round(float(y2), 2),
-                            "width": round(float(width), 2),
-                            "height": round(float(height), 2)
-                        },
-                        "center": {
-                            "x": round(float(center_x), 2),
-                            "y": round(float(center_y), 2)
-                        }
-                    }
-                    detections.append(detection)
+            with STAGE_DECODE.time(), start_span("detect.decode", attributes={"image.bytes": len(image_data)}):
+                image = self._load_image(image_data)
+
+            with STAGE_DETECT.time(), start_span("detect.inference") as span:
+                tiled = self._should_tile(image)
+                if tiled:
+                    detections = self._detect_tiled(image, confidence_threshold)
+                else:
+                    # Run inference restricted to the profile's classes
+                    detections = Detections.concatenate(self._predict(image, confidence_threshold))
+                span.set_attributes({
+                    "detect.profile": self.profile.name,
+                    "detect.model": self.model_name,
+                    "detect.imgsz": self.profile.imgsz,
+                    "detect.tiled": tiled,
+                    "detect.objects": len(detections),
+                })
 
             logger.info(f"Detected {len(detections)} objects in image")
             return detections
@@ -134,102 +604,226 @@ class ObjectDetector:
             logger.error(f"Error during object detection: {e}")
             raise
 
-    def draw_bounding_boxes(self, image_data: bytes, detections: List[Dict[str, Any]]) -> Image.Image:
+    def detect_objects_batch(
+        self,
+        images_data: List[bytes],
+        confidence_threshold: Optional[float] = None,
+        batch_size: int = DETECTION_BATCH_SIZE
+    ) -> List[Detections]:
         """
-        Draw bounding boxes on image with labels.
+        Detect objects in several images using batched inference.
+
+        Images are sent to YOLO as a list so that each chunk of `batch_size`
+        images runs as a single forward pass instead of one pass per image.
 
         Args:
-            image_data: Raw image bytes
-            detections: List of detection results from detect_objects()
+            images_data: List of raw image bytes
+            confidence_threshold: Minimum confidence score for detections (0-1),
+                defaults to the profile's threshold
+            batch_size: Maximum number of images per forward pass
 
         Returns:
-            PIL Image with bounding boxes drawn
+            List of Detections, one per input image (same order as input)
         """
-        # Convert bytes to PIL Image
-        image = Image.open(io.BytesIO(image_data))
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
+        images = [self._load_image(image_data) for image_data in images_data]
+        return self.detect_images_batch(images, confidence_threshold, batch_size)
 
-        # Create drawing context
-        draw = ImageDraw.Draw(image)
+    def detect_images_batch(
+        self,
+        images: List[Image.Image],
+        confidence_threshold: Optional[float] = None,
+        batch_size: int = DETECTION_BATCH_SIZE
+    ) -> List[Detections]:
+        """
+        Batched detection on already decoded RGB images (e.g. video keyframes).
 
-        # Try to use a decent font, fall back to default if not available
-        try:
-            font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", 20)
-        except:
-            font = ImageFont.load_default()
+        Args:
+            images: List of RGB PIL images
+            confidence_threshold: Minimum confidence score for detections (0-1),
+                defaults to the profile's threshold
+            batch_size: Maximum number of images per forward pass
 
-        # Color palette for different classes
-        colors = [
-            (255, 0, 0), (0, 255, 0), (0, 0, 255), (255, 255, 0),
-            (255, 0, 255), (0, 255, 255), (128, 0, 0), (0, 128, 0),
-            (0, 0, 128), (128, 128, 0), (128, 0, 128), (0, 128, 128)
-        ]
+        Returns:
+            List of Detections, one per input image (same order as input)
+        """
+        try:
+            # Very large images go through sliced inference on their own
+            all_detections: List[Optional[Detections]] = [None] * len(images)
+            regular = []
+            for index, image in enumerate(images):
+                if self._should_tile(image):
+                    all_detections[index] = self._detect_tiled(image, confidence_threshold)
+                else:
+                    regular.append(index)
+
+            for start in range(0, len(regular), batch_size):
+                chunk = regular[start:start + batch_size]
+                results = self._predict([images[i] for i in chunk], confidence_threshold)
+                for index, detections in zip(chunk, results):
+                    all_detections[index] = detections
+
+            logger.info(
+                f"Detected {sum(len(d) for d in all_detections)} objects "
+                f"across {len(images)} images"
+            )
+            return all_detections
 
-        # Draw each detection
-        for i, det in enumerate(detections):
-            bbox = det['bbox']
-            x1, y1, x2, y2 = bbox['x1'], bbox['y1'], bbox['x2'], bbox['y2']
+        except Exception as e:
+            logger.error(f"Error during batched object detection: {e}")
+            raise
 
-            # Get color for this detection
-            color = colors[i % len(colors)]
+    def _should_tile(self, image: Image.Image) -> bool:
+        """Whether the profile enables sliced inference for an image of this size."""
+        min_side = self.profile.tiling_min_side
+        return min_side > 0 and max(image.size) >= min_side
 
-            # Draw rectangle
-            draw.rectangle([x1, y1, x2, y2], outline=color, width=3)
+    def _detect_tiled(self, image: Image.Image, confidence_threshold: Optional[float] = None) -> Detections:
+        """
+        Sliced inference for high-resolution images.
 
-            # Draw label with background
-            label = f"{det['class']} {det['confidence']:.2f}"
+        The image is cut into overlapping tiles that are run through the model
+        in batches together with one downscaled pass over the whole image (so
+        large objects spanning several tiles are still found whole). Tile
+        detections are shifted back to full-image coordinates and merged with
+        class-aware NMS.
+        """
+        boxes = tile_boxes(*image.size, self.profile.tile_size, self.profile.tile_overlap)
+        sources = [image] + [image.crop(box) for box in boxes]
+        offsets = [(0, 0)] + [(x1, y1) for x1, y1, _, _ in boxes]
+
+        parts = []
+        for start in range(0, len(sources), DETECTION_BATCH_SIZE):
+            results = self._predict(sources[start:start + DETECTION_BATCH_SIZE], confidence_threshold)
+            for (dx, dy), detections in zip(offsets[start:start + DETECTION_BATCH_SIZE], results):
+                parts.append(detections.translate(dx, dy))
+
+        # The whole-image pass comes first, so the merged result keeps the full image size and embedding
+        merged = Detections.concatenate(parts)
+        keep = non_max_suppression(merged.xyxy, merged.confidences, merged.class_ids, self.profile.iou)
+        detections = merged.select(keep[:self.profile.max_det])
+        logger.info(
+            f"Tiled inference: {len(boxes)} tiles of {self.profile.tile_size}px on "
+            f"{image.size[0]}x{image.size[1]} image, {len(merged)} raw -> {len(detections)} merged"
+        )
+        return detections
+
+    @staticmethod
+    def _load_image(image_data: bytes) -> Image.Image:
+        """Decode raw bytes into an RGB PIL image."""
+        # Convert bytes to PIL Image
+        image = Image.open(io.BytesIO(image_data))
 
-            # Get text bounding box for background
-            bbox_text = draw.textbbox((x1, y1 - 20), label, font=font)
-            draw.rectangle(bbox_text, fill=color)
-            draw.text((x1, y1 - 20), label, fill=(255, 255, 255), font=font)
+        # Convert to RGB if necessary (handle RGBA, grayscale, etc.)
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
 
         return image
 
+    def draw_bounding_boxes(self, image_data: bytes, detections: Detections) -> Image.Image:
+        """
+        Draw bounding boxes on image with labels.
+
+        Args:
+            image_data: Raw image bytes
+            detections: List of detection results from detect_objects()
+
+        Returns:
+            PIL Image with bounding boxes drawn
+        """
+        return draw_detections(self._load_image(image_data), detections)
+
     def save_results(
         self,
         image_data: bytes,
-        detections: List[Dict[str, Any]],
-        timestamp: str = None
+        detections: Detections,
+        timestamp: str = None,
+        annotate: Optional[bool] = None,
+        image_objects: Optional[int] = None,
+        object_keyframes: Optional[List[int]] = None
     ) -> Tuple[str, str]:
         """
-        Save detection results to JSON file and annotated image.
+        Save the original image and detection results to the artifact store
+        (plus the annotated image with EAGER_ANNOTATION).
 
         Args:
             image_data: Raw image bytes
-            detections: List of detection results
-            timestamp: Optional timestamp string (generated if not provided)
+            detections: Detection results from detect_objects()
+            timestamp: Optional timestamp string (generated if not provided);
+                the record is stored as detection_{timestamp}.json
+            annotate: Whether to also store the annotated image (default: EAGER_ANNOTATION)
+            image_objects: Only the first image_objects detections are in this
+                image's coordinates (a video's other keyframes saw the rest);
+                only those are drawn (default: all)
+            object_keyframes: Video keyframe each detection's box comes from,
+                stored with the detection
 
         Returns:
-            Tuple of (json_file_path, image_file_path)
+            Tuple of (json_record_key, image_location); the JSON record is a
+            row in the storage index (see storage.ArtifactStore.load_record)
+            and image_location is empty unless EAGER_ANNOTATION is on
         """
-        if timestamp is None:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        with STAGE_ANNOTATE_SAVE.time(), start_span("detect.annotate_save"):
+            return self._save_results(image_data, detections, timestamp, annotate, image_objects, object_keyframes)
 
-        # Create annotated image
-        annotated_image = self.draw_bounding_boxes(image_data, detections)
-
-        # Save annotated image
-        image_path = RESULTS_DIR / f"detection_{timestamp}.jpg"
-        annotated_image.save(image_path, quality=95)
-        logger.info(f"Saved annotated image to: {image_path}")
+    def _save_results(
+        self,
+        image_data: bytes,
+        detections: Detections,
+        timestamp: str = None,
+        annotate: Optional[bool] = None,
+        image_objects: Optional[int] = None,
+        object_keyframes: Optional[List[int]] = None
+    ) -> Tuple[str, str]:
+        now = datetime.now()
+        if timestamp is None:
+            timestamp = now.strftime("%Y%m%d_%H%M%S_%f")
+        store = get_store()
+
+        # Keep the upload as-is: previews and overlays are rendered from it on demand
+        image_format = Image.open(io.BytesIO(image_data)).format or "JPEG"
+        original_key = store.save(
+            KIND_RESULTS, f"original_{timestamp}.{image_format.lower()}", image_data,
+            Image.MIME.get(image_format, "application/octet-stream"), when=now
+        )
+
+        if image_objects is None:
+            image_objects = len(detections)
+
+        image_name = None
+        image_key = None
+        if EAGER_ANNOTATION if annotate is None else annotate:
+            # Create annotated image
+            annotated_image = self.draw_bounding_boxes(image_data, detections.select(np.arange(image_objects)))
+
+            # Save annotated image
+            buffer = io.BytesIO()
+            annotated_image.save(buffer, format="JPEG", quality=RESULTS_JPEG_QUALITY, optimize=True)
+            image_name = f"detection_{timestamp}.jpg"
+            image_key = store.save(KIND_RESULTS, image_name, buffer.getvalue(), "image/jpeg", when=now)
+            logger.info(f"Saved annotated image to: {store.location(image_key)}")
+
+        objects = detections.to_list()
+        if object_keyframes is not None:
+            # Copies: to_list() is cached and also serialized into the response
+            objects = [{**obj, "keyframe": keyframe} for obj, keyframe in zip(objects, object_keyframes)]
 
         # Prepare JSON data
         results_data = {
             "timestamp": timestamp,
-            "image_file": str(image_path.name),
+            "original_key": original_key,
+            "image_file": image_name,
+            "image_key": image_key,
             "total_detections": len(detections),
-            "detections": detections
+            "image_size": detections.image_size,
+            "image_objects": image_objects,
+            "detections": objects
         }
 
-        # Save JSON results
-        json_path = RESULTS_DIR / f"detection_{timestamp}.json"
-        with open(json_path, 'w') as f:
-            json.dump(results_data, f, indent=2)
-        logger.info(f"Saved detection results to: {json_path}")
+        # Save JSON results (compact row in the storage index)
+        json_key = store.save_record(KIND_RESULTS, f"detection_{timestamp}.json", results_data, when=now)
+        logger.info(f"Saved detection results to index: {json_key}")
 
-        return str(json_path), str(image_path)
+        return json_key, store.location(image_key) if image_key else ""
 
 
 # Singleton instance for reuse across requests
@@ -250,19 +844,27 @@ def get_detector() -> ObjectDetector:
     return _detector_instance
 
 
-def detect_room_objects(image_data: bytes, save_results: bool = True) -> Tuple[List[Dict[str, Any]], str, str]:
+@traced("detect_room_objects")
+def detect_room_objects(
+    image_data: bytes,
+    save_results: bool = True,
+    result_id: Optional[str] = None,
+    annotate: Optional[bool] = None
+) -> Tuple[Detections, str, str]:
     """
     Convenience function to detect objects in room images.
 
     Args:
         image_data: Raw image bytes
-        save_results: Whether to save annotated image and JSON results (default: True)
+        save_results: Whether to save the image and JSON results (default: True)
+        result_id: Id the saved results are stored under (default: a new timestamp)
+        annotate: Whether to also store the annotated image (default: EAGER_ANNOTATION)
 
     Returns:
         Tuple of (detections, json_path, image_path)
-        - detections: List of detected objects with coordinates
-        - json_path: Path to saved JSON file (empty string if save_results=False)
-        - image_path: Path to saved annotated image (empty string if save_results=False)
+        - detections: Detected objects with coordinates (call to_list() to serialize)
+        - json_path: Storage key of the JSON results record (empty string if save_results=False)
+        - image_path: Location of the saved annotated image (empty string if save_results=False)
     """
     detector = get_detector()
     detections = detector.detect_objects(image_data)
@@ -271,6 +873,43 @@ def detect_room_objects(image_data: bytes, save_results: bool = True) -> Tuple[L
     image_path = ""
 
     if save_results:
-        json_path, image_path = detector.save_results(image_data, detections)
+        json_path, image_path = detector.save_results(image_data, detections, result_id, annotate)
 
     return detections, json_path, image_path
+
+
+@traced("detect_room_objects_batch")
+def detect_room_objects_batch(
+    images_data: List[bytes],
+    save_results: bool = True,
+    result_ids: Optional[List[str]] = None,
+    annotate: Optional[bool] = None
+) -> List[Tuple[Detections, str, str]]:
+    """
+    Convenience function to detect objects in many room images at once.
+
+    Args:
+        images_data: List of raw image bytes
+        save_results: Whether to save the images and JSON results (default: True)
+        result_ids: Ids the saved results are stored under, one per image (default: new timestamps)
+        annotate: Whether to also store the annotated images (default: EAGER_ANNOTATION)
+
+    Returns:
+        List of (detections, json_path, image_path) tuples, one per input image
+    """
+    detector = get_detector()
+    batch_detections = detector.detect_objects_batch(images_data)
+
+    results = []
+    for i, (image_data, detections) in enumerate(zip(images_data, batch_detections)):
+        json_path = ""
+        image_path = ""
+
+        if save_results:
+            json_path, image_path = detector.save_results(
+                image_data, detections, result_ids[i] if result_ids else None, annotate
+            )
+
+        results.append((detections, json_path, image_path))
+
+    return results
@@ -0,0 +1,275 @@
+"""
+On-demand profiling for live workers.
+
+Three tools, all inert until an admin switches them on:
+  - SamplingProfiler: a background thread that samples every thread's Python
+    stack at a fixed interval and aggregates them in the folded format used by
+    flamegraph.pl, speedscope and inferno
+  - heap snapshots: tracemalloc start/stop, top allocators and diffs against
+    a stored snapshot
+  - in-flight requests: analysis requests register themselves with their
+    current pipeline stage, so a stuck or slow request can be located
+
+Nothing is sampled or traced while the profiler and tracemalloc are off; the
+in-flight registry costs a dict insert per request.
+"""
+
+import contextvars
+import itertools
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Configuration
+MAX_PROFILE_SECONDS = 300
+DEFAULT_SAMPLE_INTERVAL = 0.005  # 200 Hz
+TRACEMALLOC_FRAMES = int(os.environ.get("TRACEMALLOC_FRAMES", "10"))
+
+
+class ProfilerBusyError(RuntimeError):
+    """Raised when a CPU profile is requested while one is already running."""
+
+
+class SamplingProfiler:
+    """Statistical CPU profiler based on sys._current_frames()."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._stacks: Counter = Counter()
+        self.samples = 0
+        self.interval = DEFAULT_SAMPLE_INTERVAL
+        self.started_at: Optional[float] = None
+        self.stopped_at: Optional[float] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, seconds: float, interval: float = DEFAULT_SAMPLE_INTERVAL) -> None:
+        """
+        Start sampling in the background; stops by itself after `seconds`.
+
+        Raises:
+            ProfilerBusyError: If a profile is already running
+        """
+        with self._lock:
+            if self.running:
+                raise ProfilerBusyError("CPU profiler is already running")
+            self._stacks = Counter()
+            self.samples = 0
+            self.interval = interval
+            self.started_at = time.time()
+            self.stopped_at = None
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._run, args=(min(seconds, MAX_PROFILE_SECONDS),), name="cpu-profiler", daemon=True
+            )
+            self._thread.start()
+        logger.info(f"CPU profiler started for {seconds}s at {1 / interval:.0f} Hz")
+
+    def stop(self) -> None:
+        """Stop sampling early and wait for the sampler to exit."""
+        self._stop.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join()
+
+    def wait(self, timeout: Optional[float] = None) -> None:
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def _run(self, seconds: float) -> None:
+        own_id = threading.get_ident()
+        deadline = time.monotonic() + seconds
+        while not self._stop.wait(self.interval) and time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, f"thread-{thread_id}"))
+                self._stacks[tuple(reversed(stack))] += 1
+            self.samples += 1
+        self.stopped_at = time.time()
+        logger.info(f"CPU profiler stopped after {self.samples} samples")
+
+    def folded(self) -> str:
+        """
+        Aggregated stacks in folded format, one 'root;...;leaf count' per line
+        (the input of flamegraph.pl / speedscope), heaviest first.
+        """
+        stacks = list(self._stacks.items())
+        return "".join(
+            f"{';'.join(frame.replace(';', ':') for frame in stack)} {count}\n"
+            for stack, count in sorted(stacks, key=lambda item: -item[1])
+        )
+
+    def status(self) -> dict:
+        end = self.stopped_at or time.time()
+        return {
+            "running": self.running,
+            "samples": self.samples,
+            "interval_ms": round(self.interval * 1000, 3),
+            "started_at": self.started_at,
+            "duration_s": round(end - self.started_at, 3) if self.started_at else 0.0,
+            "unique_stacks": len(self._stacks),
+        }
+
+
+# Singleton profiler shared by the admin endpoints
+cpu_profiler = SamplingProfiler()
+
+
+# ---------------------------------------------------------------------------
+# Heap snapshots
+# ---------------------------------------------------------------------------
+
+_heap_baseline: Optional[tracemalloc.Snapshot] = None
+
+
+def start_heap_tracing(frames: int = TRACEMALLOC_FRAMES) -> None:
+    """Start tracemalloc (slows allocations down while active)."""
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+        logger.info(f"tracemalloc started ({frames} frames)")
+
+
+def stop_heap_tracing() -> None:
+    global _heap_baseline
+    _heap_baseline = None
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+        logger.info("tracemalloc stopped")
+
+
+def _take_snapshot() -> tracemalloc.Snapshot:
+    return tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        tracemalloc.Filter(False, "<unknown>"),
+    ))
+
+
+def store_heap_baseline() -> None:
+    """Remember the current heap so later reports can show growth since now."""
+    global _heap_baseline
+    _heap_baseline = _take_snapshot()
+
+
+def heap_report(limit: int = 25, group_by: str = "lineno", compare: bool = False) -> dict:
+    """
+    Top allocators by size.
+
+    Args:
+        limit: Number of entries to return
+        group_by: 'lineno', 'filename' or 'traceback'
+        compare: Report growth since store_heap_baseline() instead of totals
+
+    Raises:
+        RuntimeError: If tracemalloc is not running, or compare without a baseline
+    """
+    if not tracemalloc.is_tracing():
+        raise RuntimeError("tracemalloc is not running")
+    if compare and _heap_baseline is None:
+        raise RuntimeError("No heap baseline stored")
+
+    snapshot = _take_snapshot()
+    if compare:
+        stats = snapshot.compare_to(_heap_baseline, group_by)
+    else:
+        stats = snapshot.statistics(group_by)
+
+    current, peak = tracemalloc.get_traced_memory()
+    entries = []
+    for stat in stats[:limit]:
+        entry = {
+            "size_kb": round(stat.size / 1024, 1),
+            "count": stat.count,
+            "traceback": [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback],
+        }
+        if compare:
+            entry["size_diff_kb"] = round(stat.size_diff / 1024, 1)
+            entry["count_diff"] = stat.count_diff
+        entries.append(entry)
+
+    return {
+        "traced_current_mb": round(current / 1e6, 3),
+        "traced_peak_mb": round(peak / 1e6, 3),
+        "group_by": group_by,
+        "compared_to_baseline": compare,
+        "top": entries,
+    }
+
+
+# ---------------------------------------------------------------------------
+# In-flight requests
+# ---------------------------------------------------------------------------
+
+class _InFlightRequest:
+    __slots__ = ("request_id", "endpoint", "started", "stage", "stage_started", "details")
+
+    def __init__(self, request_id: int, endpoint: str, details: dict):
+        self.request_id = request_id
+        self.endpoint = endpoint
+        self.started = time.monotonic()
+        self.stage = "started"
+        self.stage_started = self.started
+        self.details = details
+
+
+_request_ids = itertools.count(1)
+_in_flight: Dict[int, _InFlightRequest] = {}
+_current_request: contextvars.ContextVar = contextvars.ContextVar("in_flight_request", default=None)
+
+
+@contextmanager
+def track_request(endpoint: str, **details):
+    """Register the enclosed block as an in-flight request until it exits."""
+    request = _InFlightRequest(next(_request_ids), endpoint, details)
+    _in_flight[request.request_id] = request
+    token = _current_request.set(request)
+    try:
+        yield request
+    finally:
+        _current_request.reset(token)
+        _in_flight.pop(request.request_id, None)
+
+
+def set_stage(stage: str) -> None:
+    """Record the pipeline stage of the current in-flight request (no-op outside one)."""
+    request = _current_request.get()
+    if request is not None:
+        request.stage = stage
+        request.stage_started = time.monotonic()
+
+
+def in_flight_requests() -> List[dict]:
+    """Snapshot of in-flight requests, longest running first."""
+    now = time.monotonic()
+    return [
+        {
+            "request_id": request.request_id,
+            "endpoint": request.endpoint,
+            "stage": request.stage,
+            "elapsed_s": round(now - request.started, 3),
+            "stage_elapsed_s": round(now - request.stage_started, 3),
+            **request.details,
+        }
+        for request in sorted(list(_in_flight.values()), key=lambda r: r.started)
+    ]
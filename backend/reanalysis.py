@@ -0,0 +1,306 @@
+"""
+Incremental re-analysis of a re-photographed room.
+
+The usual flow is analyze -> the user moves the bed -> upload again. With
+the previous analysis ID the new detections are diffed against the stored
+ones instead of starting from scratch:
+  - objects are matched by class and box IoU; same-class leftovers are
+    paired by distance as "moved", the rest are "added" / "removed"
+  - tooltips of unchanged objects are carried over to their new indices
+  - Gemini gets a text-only prompt with the prior summary and the changes
+    (no image), and only writes tooltips for moved or added objects
+  - the 3D model of the previous upload is reused when the changed share of
+    the image is small
+
+When too few objects are unchanged (the camera moved, or it is another
+room) the upload is analyzed in full.
+"""
+
+import logging
+import os
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from fengshui_rules import compact_indices, frame_size
+from object_detection import Detections
+from storage import KIND_RESULTS, get_store
+from video_analysis import box_iou
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Configuration
+REANALYSIS_MATCH_IOU = float(os.environ.get("REANALYSIS_MATCH_IOU", "0.3"))
+REANALYSIS_UNCHANGED_IOU = float(os.environ.get("REANALYSIS_UNCHANGED_IOU", "0.75"))
+# Center shift (share of the frame diagonal) still counted as unchanged: detection
+# jitter alone drops the IoU of small objects such as cups below REANALYSIS_UNCHANGED_IOU
+REANALYSIS_MOVE_DISTANCE = float(os.environ.get("REANALYSIS_MOVE_DISTANCE", "0.03"))
+# Share of objects that must be unchanged for a delta analysis
+REANALYSIS_MIN_UNCHANGED = float(os.environ.get("REANALYSIS_MIN_UNCHANGED", "0.5"))
+# Share of the image covered by changed objects below which the 3D model is reused
+REANALYSIS_3D_TOLERANCE = float(os.environ.get("REANALYSIS_3D_TOLERANCE", "0.03"))
+# Characters of the previous overall analysis quoted in the delta prompt
+PRIOR_SUMMARY_CHARS = 600
+
+
+def analysis_record_name(analysis_id: str) -> str:
+    return f"analysis_{analysis_id}.json"
+
+
+def describe_position(box: np.ndarray, size: Tuple[float, float]) -> str:
+    """'left, near' style location of a box in the frame (near = close to the camera)."""
+    center_x = (box[0] + box[2]) / 2 / size[0]
+    bottom = box[3] / size[1]
+    horizontal = "left" if center_x < 1 / 3 else "right" if center_x > 2 / 3 else "centre"
+    depth = "near" if bottom > 0.8 else "far" if bottom < 0.5 else "middle"
+    return f"{horizontal}, {depth}"
+
+
+@dataclass
+class RoomDiff:
+    """Object-level difference between two photos of a room (indices into each photo's detections)."""
+
+    unchanged: List[Tuple[int, int]]  # (previous index, current index)
+    moved: List[Tuple[int, int]]
+    added: List[int]
+    removed: List[int]
+    previous_count: int
+    current_count: int
+    changed_area: float  # Share of the image covered by moved / added / removed boxes
+
+    @property
+    def unchanged_share(self) -> float:
+        total = max(self.previous_count, self.current_count)
+        return len(self.unchanged) / total if total else 1.0
+
+    def summary(self, previous: Detections, current: Detections) -> str:
+        """Compact prompt text of the changes (indices refer to the current photo)."""
+        previous_names = previous.class_names
+        current_names = current.class_names
+        previous_size = frame_size(previous)
+        current_size = frame_size(current)
+        lines = []
+        if self.unchanged:
+            by_class: Dict[str, List[int]] = {}
+            for _, index in sorted(self.unchanged, key=lambda pair: pair[1]):
+                by_class.setdefault(current_names[index], []).append(index)
+            lines.append("Unchanged: " + "; ".join(
+                f"{name} {compact_indices(indices)}" for name, indices in by_class.items()
+            ))
+        for old, new in self.moved:
+            lines.append(
+                f"Moved: {current_names[new]} {new} from {describe_position(previous.xyxy[old], previous_size)} "
+                f"to {describe_position(current.xyxy[new], current_size)}"
+            )
+        for index in self.added:
+            lines.append(f"Added: {current_names[index]} {index} at {describe_position(current.xyxy[index], current_size)}")
+        for index in self.removed:
+            lines.append(
+                f"Removed: {previous_names[index]} (was at {describe_position(previous.xyxy[index], previous_size)})"
+            )
+        return "\n".join(lines) if lines else "No object changes detected."
+
+    def to_dict(self) -> dict:
+        return {
+            "unchanged": len(self.unchanged),
+            "moved": len(self.moved),
+            "added": len(self.added),
+            "removed": len(self.removed),
+            "changed_area": round(self.changed_area, 4),
+        }
+
+
+def diff_detections(
+    previous: Detections,
+    current: Detections,
+    match_iou: float = REANALYSIS_MATCH_IOU,
+    unchanged_iou: float = REANALYSIS_UNCHANGED_IOU,
+    move_distance: float = REANALYSIS_MOVE_DISTANCE
+) -> RoomDiff:
+    """
+    Match the objects of two photos of a room.
+
+    Same-class boxes are matched greedily by IoU (at least match_iou);
+    matches of at least unchanged_iou, or whose centers are less than
+    move_distance (of the frame diagonal) apart, count as unchanged, the
+    others as moved. Leftover objects of a class present in both photos are
+    then paired by center distance as moved (the bed went to the other wall).
+
+    Returns:
+        The diff
+    """
+    previous_names = np.array(previous.class_names, dtype=object)
+    current_names = np.array(current.class_names, dtype=object)
+    unchanged, moved = [], []
+    free_previous = set(range(len(previous)))
+    free_current = set(range(len(current)))
+
+    if len(previous) and len(current):
+        # Centers in frame coordinates (0-1), so photos of different resolution compare
+        previous_centers = (previous.xyxy[:, :2] + previous.xyxy[:, 2:]) / 2 / frame_size(previous)
+        current_centers = (current.xyxy[:, :2] + current.xyxy[:, 2:]) / 2 / frame_size(current)
+        distance = np.linalg.norm(previous_centers[:, None, :] - current_centers[None, :, :], axis=2) / np.sqrt(2)
+
+        iou = box_iou(previous.xyxy, current.xyxy)
+        iou[previous_names[:, None] != current_names[None, :]] = 0.0
+        for flat in np.argsort(-iou, axis=None):
+            old, new = np.unravel_index(flat, iou.shape)
+            if iou[old, new] < match_iou:
+                break
+            if old in free_previous and new in free_current:
+                still = iou[old, new] >= unchanged_iou or distance[old, new] < move_distance
+                (unchanged if still else moved).append((int(old), int(new)))
+                free_previous.discard(old)
+                free_current.discard(new)
+
+        # Same-class leftovers: nearest centers first
+        candidates = sorted(
+            (float(distance[old, new]), old, new)
+            for old in free_previous for new in free_current
+            if previous_names[old] == current_names[new]
+        )
+        for _, old, new in candidates:
+            if old in free_previous and new in free_current:
+                moved.append((int(old), int(new)))
+                free_previous.discard(old)
+                free_current.discard(new)
+
+    def area(detections: Detections, indices) -> float:
+        indices = list(indices)
+        if not indices:
+            return 0.0
+        boxes = detections.xyxy[indices]
+        width, height = frame_size(detections)
+        return float(np.prod(boxes[:, 2:] - boxes[:, :2], axis=1).sum()) / (width * height)
+
+    changed_area = (
+        area(previous, [old for old, _ in moved]) + area(current, [new for _, new in moved])
+        + area(previous, free_previous) + area(current, free_current)
+    )
+    return RoomDiff(
+        unchanged=sorted(unchanged, key=lambda pair: pair[1]),
+        moved=sorted(moved, key=lambda pair: pair[1]),
+        added=sorted(int(index) for index in free_current),
+        removed=sorted(int(index) for index in free_previous),
+        previous_count=len(previous),
+        current_count=len(current),
+        changed_area=min(1.0, changed_area),
+    )
+
+
+@dataclass
+class Reanalysis:
+    """How an upload with a previous analysis ID is analyzed."""
+
+    previous_id: str
+    mode: str  # 'delta' or 'full'
+    reason: str
+    previous: Optional[dict] = None  # Stored analysis record of the previous upload
+    previous_detections: Optional[Detections] = None
+    diff: Optional[RoomDiff] = None
+    reuse_3d: bool = False
+    tooltips_reused: int = 0
+    model_3d_reused: bool = False
+    reused_tooltips: List[dict] = field(default_factory=list)
+
+    def merge(self, analysis: dict) -> dict:
+        """Add the carried-over tooltips to a delta analysis (the new ones win per object)."""
+        tooltips = analysis.get("object_tooltips", [])
+        covered = {tooltip.get("object_index") for tooltip in tooltips}
+        reused = [tooltip for tooltip in self.reused_tooltips if tooltip["object_index"] not in covered]
+        self.tooltips_reused = len(reused)
+        return {**analysis, "object_tooltips": tooltips + reused}
+
+    def prior_summary(self) -> str:
+        """The previous analysis, condensed for the delta prompt."""
+        previous = self.previous or {}
+        overall = previous.get("overall_analysis", "")
+        if len(overall) > PRIOR_SUMMARY_CHARS:
+            overall = overall[:PRIOR_SUMMARY_CHARS].rsplit(" ", 1)[0] + "..."
+        lines = [f"Previous analysis ({previous.get('score', 5)}/10): {overall}"]
+        for key in ("strengths", "weaknesses", "suggestions"):
+            if previous.get(key):
+                lines.append(f"{key.capitalize()}: " + "; ".join(previous[key]))
+        return "\n".join(lines)
+
+    def to_dict(self) -> dict:
+        result = {
+            "previous_analysis_id": self.previous_id,
+            "mode": self.mode,
+            "reason": self.reason,
+            "tooltips_reused": self.tooltips_reused,
+            "model_3d_reused": self.model_3d_reused,
+        }
+        if self.diff is not None:
+            result["changes"] = self.diff.to_dict()
+        return result
+
+
+def load_previous_analysis(analysis_id: str) -> Optional[Tuple[dict, Detections]]:
+    """The stored analysis record and detections of an earlier upload, or None."""
+    store = get_store()
+    analysis = store.load_record(analysis_record_name(analysis_id), KIND_RESULTS)
+    detections = store.load_record(f"detection_{analysis_id}.json", KIND_RESULTS)
+    if analysis is None or detections is None:
+        return None
+    image_size = detections.get("image_size")
+    return analysis, Detections.from_list(detections["detections"], tuple(image_size) if image_size else None)
+
+
+def save_analysis_record(analysis_id: str, analysis: dict, model_3d_id: Optional[str]) -> None:
+    """Store what a later re-analysis of this upload needs (the detections are stored by detection)."""
+    record = {
+        key: analysis.get(key)
+        for key in ("score", "overall_analysis", "strengths", "weaknesses", "suggestions", "object_tooltips")
+    }
+    record["model_3d_id"] = model_3d_id
+    try:
+        get_store().save_record(KIND_RESULTS, analysis_record_name(analysis_id), record)
+    except Exception as e:
+        logger.warning(f"Could not store analysis {analysis_id} for re-analysis: {e}")
+
+
+def plan_reanalysis(
+    previous_id: str,
+    previous: Optional[Tuple[dict, Detections]],
+    current: Detections
+) -> Reanalysis:
+    """
+    Decide between a delta and a full analysis for an upload of a previously analyzed room.
+
+    Args:
+        previous_id: ID of the earlier analysis
+        previous: load_previous_analysis() result (None if it is gone)
+        current: Detections of the new photo
+
+    Returns:
+        The plan; for a delta analysis with the tooltips to carry over
+    """
+    if previous is None:
+        return Reanalysis(previous_id, "full", "previous analysis not found")
+    record, previous_detections = previous
+    diff = diff_detections(previous_detections, current)
+    reuse_3d = (
+        diff.changed_area <= REANALYSIS_3D_TOLERANCE
+        and previous_detections.image_size == current.image_size
+        and diff.unchanged_share >= REANALYSIS_MIN_UNCHANGED
+    )
+
+    if diff.unchanged_share < REANALYSIS_MIN_UNCHANGED:
+        return Reanalysis(
+            previous_id, "full", f"only {diff.unchanged_share:.0%} of objects unchanged",
+            record, previous_detections, diff
+        )
+
+    current_index = dict(diff.unchanged)
+    reused_tooltips = [
+        {**tooltip, "object_index": current_index[tooltip["object_index"]]}
+        for tooltip in record.get("object_tooltips") or []
+        if tooltip.get("object_index") in current_index
+    ]
+    return Reanalysis(
+        previous_id, "delta", f"{diff.unchanged_share:.0%} of objects unchanged",
+        record, previous_detections, diff, reuse_3d, reused_tooltips=reused_tooltips
+    )
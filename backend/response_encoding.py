@@ -0,0 +1,262 @@
+"""
+Response encoding for the JSON API.
+
+Three independent pieces:
+  - FastJSONResponse: JSON bodies rendered by orjson (the standard library
+    encoder when orjson is not installed). Endpoints returning large payloads
+    hand it their dict directly, which also skips FastAPI's jsonable_encoder
+    pass over every nested value
+  - CompressionMiddleware: gzip or brotli (brotli needs the brotli package),
+    negotiated from Accept-Encoding, for JSON and NDJSON responses of at
+    least RESPONSE_COMPRESS_MIN_BYTES. Streamed NDJSON (batch results) is
+    flushed per chunk, so every line still reaches the client as soon as
+    it is produced. Files, audio and images pass through untouched
+  - compact_analysis(): an opt-in wire format (?compact=true) for analysis
+    payloads. Tooltips reference detected objects by index instead of
+    repeating their box, center and confidence, and objects carry only their
+    box corners (width, height and center follow from them)
+"""
+
+import json
+import os
+import zlib
+from typing import Any, Optional
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from metrics import RESPONSE_BYTES
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Configuration
+RESPONSE_COMPRESSION = os.environ.get("RESPONSE_COMPRESSION", "true").lower() in ("1", "true", "yes")
+# Smaller bodies go out as they are: the headers would outweigh the savings
+RESPONSE_COMPRESS_MIN_BYTES = int(os.environ.get("RESPONSE_COMPRESS_MIN_BYTES", "1024"))
+RESPONSE_GZIP_LEVEL = int(os.environ.get("RESPONSE_GZIP_LEVEL", "6"))
+RESPONSE_BROTLI_QUALITY = int(os.environ.get("RESPONSE_BROTLI_QUALITY", "4"))
+COMPRESSIBLE_TYPES = (b"application/json", b"application/x-ndjson", b"text/")
+
+# Preferred first
+ENCODINGS = [name for name in ("br", "gzip") if name != "br" or brotli is not None]
+
+COMPACT_TOOLTIP_KEYS = ("object_index", "type", "message")
+BOX_CORNERS = ("x1", "y1", "x2", "y2")
+
+
+def _default(value: Any) -> Any:
+    """Whatever orjson cannot serialize natively (e.g. Path, Decimal), the way FastAPI would."""
+    return jsonable_encoder(value)
+
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+    def encode_json(content: Any) -> bytes:
+        """Serialize to compact UTF-8 JSON."""
+        return orjson.dumps(content, default=_default, option=_ORJSON_OPTIONS)
+else:
+    def encode_json(content: Any) -> bytes:
+        """Serialize to compact UTF-8 JSON."""
+        return json.dumps(
+            content, default=_default, ensure_ascii=False, allow_nan=False, separators=(",", ":")
+        ).encode("utf-8")
+
+
+def encode_json_line(content: Any) -> bytes:
+    """One NDJSON line."""
+    return encode_json(content) + b"\n"
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with encode_json()."""
+
+    def render(self, content: Any) -> bytes:
+        return encode_json(content)
+
+
+def compact_analysis(response: dict) -> dict:
+    """
+    The compact wire format of an /analyze/ response (or batch result line).
+
+    Tooltips keep only object_index, type and message; the object's class,
+    box and confidence are in detected_objects[object_index]. Objects drop
+    their center and box width/height. The response is not modified.
+    """
+    compact = dict(response)
+    if response.get("detected_objects") is not None:
+        compact["detected_objects"] = [
+            {
+                **{key: value for key, value in obj.items() if key not in ("bbox", "center")},
+                "bbox": {corner: obj["bbox"][corner] for corner in BOX_CORNERS},
+            }
+            for obj in response["detected_objects"]
+        ]
+    if response.get("tooltips") is not None:
+        compact["tooltips"] = [
+            {key: tooltip[key] for key in COMPACT_TOOLTIP_KEYS if key in tooltip}
+            for tooltip in response["tooltips"]
+        ]
+    compact["wire_format"] = "compact"
+    return compact
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """
+    Best content coding the client accepts (brotli, then gzip), or None.
+
+    Honours q-values, including q=0 and "*".
+    """
+    if not accept_encoding:
+        return None
+    weights = {}
+    for item in accept_encoding.lower().split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        weights[name.strip()] = quality
+    wildcard = weights.get("*", 0.0)
+    accepted = [(weights.get(name, wildcard), -rank, name) for rank, name in enumerate(ENCODINGS)]
+    quality, _, name = max(accepted)
+    return name if quality > 0 else None
+
+
+class Compressor:
+    """Incremental gzip or brotli encoder."""
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=RESPONSE_BROTLI_QUALITY)
+        else:
+            # wbits 16 + 15: gzip container
+            self._zlib = zlib.compressobj(RESPONSE_GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes, flush: bool = False) -> bytes:
+        """Compress a chunk; with flush everything so far is emitted (for streams)."""
+        if self.encoding == "br":
+            out = self._brotli.process(data)
+            return out + self._brotli.flush() if flush else out
+        out = self._zlib.compress(data)
+        return out + self._zlib.flush(zlib.Z_SYNC_FLUSH) if flush else out
+
+    def finish(self) -> bytes:
+        if self.encoding == "br":
+            return self._brotli.finish()
+        return self._zlib.flush(zlib.Z_FINISH)
+
+
+def compress_body(body: bytes, encoding: str) -> bytes:
+    compressor = Compressor(encoding)
+    return compressor.compress(body) + compressor.finish()
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing JSON and NDJSON responses.
+
+    Complete bodies are compressed when at least RESPONSE_COMPRESS_MIN_BYTES;
+    streamed bodies always are, chunk by chunk with a flush after each.
+    Responses that already carry a Content-Encoding, other content types and
+    clients without a matching Accept-Encoding are passed through. Every
+    compressible response carries Vary: Accept-Encoding, compressed or not,
+    so shared caches never hand an identity copy to a client asking for gzip.
+    """
+
+    def __init__(self, app, minimum_size: int = RESPONSE_COMPRESS_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not RESPONSE_COMPRESSION:
+            await self.app(scope, receive, send)
+            return
+        accept = next((value for key, value in scope.get("headers") or [] if key == b"accept-encoding"), b"")
+        encoding = negotiate_encoding(accept.decode("latin-1"))
+
+        start_message = None
+        compressor = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start_message, compressor, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                headers = message.get("headers") or []
+                content_type = next((value for key, value in headers if key == b"content-type"), b"")
+                if content_type.startswith(COMPRESSIBLE_TYPES) and not any(
+                    key == b"content-encoding" for key, _ in headers
+                ):
+                    message["headers"] = [(key, value) for key, value in headers if key != b"vary"] + [
+                        (b"vary", _vary(headers))
+                    ]
+                    if encoding is not None:
+                        # Held back until the first body chunk shows whether compression pays off
+                        start_message = message
+                        return
+                passthrough = True
+                await send(message)
+                return
+            if start_message is None or message["type"] != "http.response.body":
+                passthrough = True
+                if start_message is not None:
+                    await send(start_message)
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if compressor is None:
+                if not more_body and len(body) < self.minimum_size:
+                    passthrough = True
+                    await send(start_message)
+                    await send(message)
+                    return
+                compressor = Compressor(encoding)
+                start_message["headers"] = [
+                    (key, value) for key, value in start_message["headers"] if key != b"content-length"
+                ] + [(b"content-encoding", encoding.encode("latin-1"))]
+                if not more_body:
+                    compressed = compressor.compress(body) + compressor.finish()
+                    start_message["headers"].append((b"content-length", str(len(compressed)).encode("latin-1")))
+                    _count(encoding, len(body), len(compressed))
+                    await send(start_message)
+                    await send({"type": "http.response.body", "body": compressed})
+                    return
+                await send(start_message)
+
+            out = compressor.compress(body, flush=more_body)
+            if not more_body:
+                out += compressor.finish()
+            _count(encoding, len(body), len(out))
+            await send({"type": "http.response.body", "body": out, "more_body": more_body})
+
+        await self.app(scope, receive, send_wrapper)
+
+
+def _vary(headers: list) -> bytes:
+    existing = next((value for key, value in headers if key == b"vary"), b"")
+    if b"accept-encoding" in existing.lower():
+        return existing
+    return existing + b", Accept-Encoding" if existing else b"Accept-Encoding"
+
+
+def _count(encoding: str, raw: int, sent: int) -> None:
+    RESPONSE_BYTES.labels(encoding=encoding, stage="raw").inc(raw)
+    RESPONSE_BYTES.labels(encoding=encoding, stage="sent").inc(sent)
@@ -0,0 +1,420 @@
+"""
+Similar-room search: room embeddings in a persistent IVF index.
+
+Every analyzed room's embedding (pooled from the detector's backbone during
+detection, see ObjectDetector._attach_embedding_hook) is appended with its
+feng shui score to a memory-mapped float16 matrix. An IVF index (spherical
+k-means coarse quantizer plus inverted lists of row numbers) narrows a query
+to the SIMILAR_NPROBE closest clusters. Their rooms are scored against int8
+codes of the embeddings held in memory (converting int8 is far cheaper than
+float16), and the best few are re-ranked exactly from the float16 matrix, so a
+search reads a few percent of the rooms.
+
+Layout of SIMILAR_INDEX_DIR/<detection model>/:
+  vectors.f16    (capacity, dim) float16 embeddings, memory-mapped
+  rooms.dat      (capacity,) records of room id, score and inverted list
+  centroids.npy  IVF centroids (absent until SIMILAR_TRAIN_MIN rooms)
+  meta.json      dimension, row count, rows at the last training
+
+Rows are written in place as they are added. meta.json is rewritten every
+SIMILAR_FLUSH_EVERY rooms and at shutdown; rows added after the last flush
+are recovered on load (their room id is set). Below SIMILAR_TRAIN_MIN rooms
+searches are exact; the quantizer is retrained in a background thread each
+time the index has grown SIMILAR_RETRAIN_GROWTH-fold since the last training.
+"""
+
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from metrics import SIMILAR_INDEX_ROOMS
+from object_detection import ROOM_EMBEDDING_DIM, load_detection_profile
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Configuration
+SIMILAR_INDEX_DIR = Path(__file__).parent / os.environ.get("SIMILAR_INDEX_DIR", "similar_index")
+SIMILAR_NPROBE = int(os.environ.get("SIMILAR_NPROBE", "8"))
+SIMILAR_TRAIN_MIN = int(os.environ.get("SIMILAR_TRAIN_MIN", "20000"))
+SIMILAR_RETRAIN_GROWTH = 4.0
+SIMILAR_FLUSH_EVERY = 256
+GROWTH_ROWS = 65536          # Smallest capacity increment of the memory-mapped files
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLE_PER_LIST = 32  # Training vectors per centroid
+CODE_SCALE = 254.0           # int8 code = embedding component * CODE_SCALE (components beyond +-0.5 clip)
+RERANK_FACTOR = 4            # Candidates per requested result re-ranked from the float16 vectors
+ROOM_RECORD = np.dtype([("room_id", "S32"), ("score", "<f4"), ("list", "<i4")])
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / (np.linalg.norm(vectors, axis=-1, keepdims=True) + 1e-12)
+
+
+def encode(vectors: np.ndarray, chunk: int = 65536) -> np.ndarray:
+    """int8 codes of unit vectors, for fast approximate scoring."""
+    codes = np.empty(np.shape(vectors), dtype=np.int8)
+    for start in range(0, len(codes), chunk):
+        block = np.asarray(vectors[start:start + chunk], dtype=np.float32) * CODE_SCALE
+        codes[start:start + chunk] = np.clip(np.rint(block), -127, 127)
+    return codes
+
+
+def list_count(rows: int) -> int:
+    """Inverted lists for an index of this size (about sqrt(rows))."""
+    return int(np.clip(round(np.sqrt(rows)), 16, 8192))
+
+
+def assign(vectors: np.ndarray, centroids: np.ndarray, chunk: int = 65536) -> np.ndarray:
+    """Nearest centroid (by cosine) of each vector, computed in chunks."""
+    assignment = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), chunk):
+        block = np.asarray(vectors[start:start + chunk], dtype=np.float32)
+        assignment[start:start + chunk] = np.argmax(block @ centroids.T, axis=1)
+    return assignment
+
+
+def kmeans(vectors: np.ndarray, clusters: int, iterations: int, rng: np.random.Generator) -> np.ndarray:
+    """Spherical k-means: unit-length centroids, cosine assignment."""
+    centroids = vectors[rng.choice(len(vectors), clusters, replace=False)]
+    for _ in range(iterations):
+        assignment = assign(vectors, centroids)
+        order = np.argsort(assignment, kind="stable")
+        counts = np.bincount(assignment, minlength=clusters)
+        sums = np.zeros_like(centroids)
+        filled = counts > 0
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        sums[filled] = np.add.reduceat(vectors[order], starts[filled])
+        # Re-seed empty clusters with random vectors
+        sums[~filled] = vectors[rng.choice(len(vectors), int((~filled).sum()))]
+        centroids = normalize(sums)
+    return centroids
+
+
+def top_indices(values: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k largest values, largest first."""
+    top = np.argpartition(-values, k - 1)[:k] if len(values) > k else np.arange(len(values))
+    return top[np.argsort(-values[top])]
+
+
+class InvertedLists:
+    """Row numbers per IVF list, each an array grown by doubling."""
+
+    def __init__(self, assignment: np.ndarray, lists: int):
+        order = np.argsort(assignment, kind="stable")
+        counts = np.bincount(assignment, minlength=lists)
+        bounds = np.concatenate([[0], np.cumsum(counts)])
+        self.sizes = counts.astype(np.int64)
+        self.rows = [order[bounds[i]:bounds[i + 1]].astype(np.int64) for i in range(lists)]
+
+    def append(self, lists: np.ndarray, rows: np.ndarray) -> None:
+        for list_id, row in zip(lists.tolist(), rows.tolist()):
+            size = self.sizes[list_id]
+            if size == len(self.rows[list_id]):
+                self.rows[list_id] = np.resize(self.rows[list_id], max(8, 2 * size))
+            self.rows[list_id][size] = row
+            self.sizes[list_id] = size + 1
+
+    def gather(self, list_ids: Sequence[int]) -> np.ndarray:
+        return np.concatenate([self.rows[i][:self.sizes[i]] for i in list_ids])
+
+
+class RoomIndex:
+    """Persistent IVF index over room embeddings."""
+
+    def __init__(self, directory: Path, dim: int = ROOM_EMBEDDING_DIM, auto_train: bool = True):
+        """
+        Open (or create) an index, recovering rows added after the last flush.
+
+        Args:
+            directory: Directory holding the index files
+            dim: Embedding dimension
+            auto_train: Retrain the quantizer in the background as the index grows
+        """
+        self.directory = directory
+        self.dim = dim
+        self.auto_train = auto_train
+        self.count = 0
+        self.trained_rows = 0
+        self._lock = threading.Lock()
+        self._training = False
+        self._unflushed = 0
+        self._centroids: Optional[np.ndarray] = None
+        self._lists: Optional[InvertedLists] = None
+        self._row_by_id: Dict[bytes, int] = {}
+        # In-memory copies for scoring and filtering (rows in the same order as the files)
+        self._codes = np.zeros((0, dim), dtype=np.int8)
+        self._scores = np.zeros(0, dtype=np.float32)
+        self._open()
+
+    @property
+    def _meta_path(self) -> Path:
+        return self.directory / "meta.json"
+
+    @property
+    def _centroids_path(self) -> Path:
+        return self.directory / "centroids.npy"
+
+    def _open(self) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        meta = json.loads(self._meta_path.read_text()) if self._meta_path.exists() else {}
+        if meta.get("dim", self.dim) != self.dim:
+            raise ValueError(f"Index at {self.directory} has dimension {meta['dim']}, expected {self.dim}")
+
+        rooms_path = self.directory / "rooms.dat"
+        capacity = rooms_path.stat().st_size // ROOM_RECORD.itemsize if rooms_path.exists() else 0
+        self._map(max(capacity, GROWTH_ROWS))
+
+        # Rows written after the last flush have their room id set
+        count = min(meta.get("count", 0), len(self._rooms))
+        while count < len(self._rooms) and self._rooms[count]["room_id"]:
+            count += 1
+        self.count = count
+        self.trained_rows = meta.get("trained_rows", 0)
+        self._row_by_id = {room_id: row for row, room_id in enumerate(self._rooms["room_id"][:count].tolist())}
+        self._codes = np.zeros((len(self._rooms), self.dim), dtype=np.int8)
+        self._codes[:count] = encode(self._vectors[:count])
+        self._scores = np.zeros(len(self._rooms), dtype=np.float32)
+        self._scores[:count] = self._rooms["score"][:count]
+
+        if self._centroids_path.exists():
+            self._centroids = np.load(self._centroids_path)
+            lists = np.array(self._rooms["list"][:count])
+            unassigned = np.flatnonzero(lists < 0)
+            if len(unassigned):
+                lists[unassigned] = assign(self._vectors[unassigned], self._centroids)
+                self._rooms["list"][unassigned] = lists[unassigned]
+            self._lists = InvertedLists(lists, len(self._centroids))
+        if count:
+            logger.info(f"Room index loaded: {count} rooms, "
+                        f"{len(self._centroids) if self._centroids is not None else 0} lists")
+
+    def _map(self, capacity: int) -> None:
+        """Memory-map the row files at the given capacity, growing them if needed."""
+        for name, row_bytes in (("vectors.f16", self.dim * 2), ("rooms.dat", ROOM_RECORD.itemsize)):
+            path = self.directory / name
+            with open(path, "ab") as handle:
+                if handle.tell() < capacity * row_bytes:
+                    handle.truncate(capacity * row_bytes)
+        self._vectors = np.memmap(self.directory / "vectors.f16", dtype=np.float16, mode="r+",
+                                  shape=(capacity, self.dim))
+        self._rooms = np.memmap(self.directory / "rooms.dat", dtype=ROOM_RECORD, mode="r+", shape=(capacity,))
+
+    def add(self, room_id: str, embedding: np.ndarray, score: float) -> None:
+        self.add_many([room_id], np.asarray(embedding).reshape(1, -1), [score])
+
+    def add_many(self, room_ids: Sequence[str], embeddings: np.ndarray, scores: Sequence[float]) -> int:
+        """
+        Append rooms (room ids already in the index are skipped).
+
+        Returns:
+            Number of rooms added
+        """
+        keys = [room_id.encode("utf-8")[:ROOM_RECORD["room_id"].itemsize] for room_id in room_ids]
+        embeddings = normalize(np.asarray(embeddings).reshape(-1, self.dim))
+        with self._lock:
+            fresh, seen = [], set()
+            for i, key in enumerate(keys):
+                if key not in self._row_by_id and key not in seen:
+                    fresh.append(i)
+                    seen.add(key)
+            if not fresh:
+                return 0
+
+            start, end = self.count, self.count + len(fresh)
+            if end > len(self._rooms):
+                self._vectors.flush()
+                self._rooms.flush()
+                self._map(max(end, 2 * len(self._rooms)))
+                self._codes = np.resize(self._codes, (len(self._rooms), self.dim))
+                self._scores = np.resize(self._scores, len(self._rooms))
+            rows = np.arange(start, end)
+            self._vectors[start:end] = embeddings[fresh]
+            self._codes[start:end] = encode(embeddings[fresh])
+            self._scores[start:end] = np.asarray(scores, dtype=np.float32)[fresh]
+            records = self._rooms[start:end]
+            records["score"] = self._scores[start:end]
+            if self._centroids is not None:
+                lists = assign(embeddings[fresh], self._centroids)
+                records["list"] = lists
+                self._lists.append(lists, rows)
+            else:
+                records["list"] = -1
+            # Set last: a row with an id is complete when recovered after a crash
+            records["room_id"] = [keys[i] for i in fresh]
+            self._row_by_id.update(zip((keys[i] for i in fresh), rows.tolist()))
+            self.count = end
+
+            self._unflushed += len(fresh)
+            if self._unflushed >= SIMILAR_FLUSH_EVERY:
+                self._flush_locked()
+            retrain = (self.auto_train and not self._training and self.count >= SIMILAR_TRAIN_MIN
+                       and self.count >= self.trained_rows * SIMILAR_RETRAIN_GROWTH)
+            if retrain:
+                self._training = True
+        if retrain:
+            threading.Thread(target=self.train, name="room-index-train", daemon=True).start()
+        return len(fresh)
+
+    def train(self) -> None:
+        """(Re)build the IVF quantizer from the current rows and reassign every row."""
+        with self._lock:
+            self._training = True
+            rows = self.count
+            vectors = self._vectors
+        try:
+            if rows < 16:
+                return
+            rng = np.random.default_rng(rows)
+            clusters = list_count(rows)
+            sample = np.sort(rng.choice(rows, min(rows, clusters * KMEANS_SAMPLE_PER_LIST), replace=False))
+            centroids = kmeans(np.asarray(vectors[sample], dtype=np.float32), clusters, KMEANS_ITERATIONS, rng)
+            assignment = assign(vectors[:rows], centroids)
+
+            with self._lock:
+                # Rooms added while training
+                if self.count > rows:
+                    assignment = np.concatenate([assignment, assign(self._vectors[rows:self.count], centroids)])
+                self._rooms["list"][:self.count] = assignment
+                self._rooms.flush()
+                temp_path = self._centroids_path.with_suffix(".tmp.npy")
+                np.save(temp_path, centroids)
+                os.replace(temp_path, self._centroids_path)
+                self._centroids = centroids
+                self._lists = InvertedLists(assignment, clusters)
+                self.trained_rows = self.count
+                self._flush_locked()
+            logger.info(f"Room index trained: {clusters} lists over {self.trained_rows} rooms")
+        finally:
+            self._training = False
+
+    def get_embedding(self, room_id: str) -> Optional[np.ndarray]:
+        with self._lock:
+            row = self._row_by_id.get(room_id.encode("utf-8"))
+            return None if row is None else np.asarray(self._vectors[row], dtype=np.float32)
+
+    def search(
+        self,
+        embedding: np.ndarray,
+        k: int = 10,
+        min_score: Optional[float] = None,
+        nprobe: int = SIMILAR_NPROBE,
+        exclude: Optional[str] = None
+    ) -> List[Tuple[str, float, float]]:
+        """
+        Most similar rooms to an embedding.
+
+        Args:
+            embedding: Query embedding
+            k: Number of rooms to return
+            min_score: Only consider rooms scored at least this
+            nprobe: IVF lists scanned. With min_score it is divided by the
+                share of rooms that pass, so about as many rooms are scored
+                as without a filter; more lists are scanned if fewer than k
+                rooms pass
+            exclude: Room id to leave out (the query room itself)
+
+        Returns:
+            List of (room id, cosine similarity, score), most similar first
+        """
+        query = normalize(np.asarray(embedding).reshape(-1))
+        excluded = exclude.encode("utf-8") if exclude else None
+        with self._lock:
+            if self._centroids is None:
+                candidates = np.arange(self.count)
+                candidates = self._filter(candidates, min_score, excluded)
+            else:
+                order = np.argsort(-(self._centroids @ query))
+                if min_score is not None and self.count:
+                    # Share of rooms passing the filter, estimated from a strided sample
+                    sample = self._scores[:self.count:max(1, self.count // 20000)]
+                    passing = max(np.count_nonzero(sample >= min_score) / len(sample), 1 / len(order))
+                    nprobe = int(np.ceil(nprobe / passing))
+                probed = min(nprobe, len(order))
+                candidates = self._filter(self._lists.gather(order[:probed]), min_score, excluded)
+                while len(candidates) < k and probed < len(order):
+                    more = order[probed:probed * 2]
+                    probed += len(more)
+                    candidates = np.concatenate([
+                        candidates, self._filter(self._lists.gather(more), min_score, excluded)
+                    ])
+            # Approximate scores from the int8 codes, then exact re-ranking of the best
+            approximate = self._codes[candidates].astype(np.float32) @ query
+            shortlist = candidates[top_indices(approximate, RERANK_FACTOR * k)]
+            shortlist.sort()
+            vectors = np.asarray(self._vectors[shortlist], dtype=np.float32)
+            records = self._rooms[shortlist]
+
+        similarities = vectors @ query
+        top = top_indices(similarities, k)
+        return [
+            (records[i]["room_id"].decode("utf-8"), float(similarities[i]), float(records[i]["score"]))
+            for i in top
+        ]
+
+    def _filter(self, rows: np.ndarray, min_score: Optional[float], excluded: Optional[bytes]) -> np.ndarray:
+        if min_score is not None and len(rows):
+            rows = rows[self._scores[rows] >= min_score]
+        if excluded is not None and excluded in self._row_by_id:
+            rows = rows[rows != self._row_by_id[excluded]]
+        return rows
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self) -> None:
+        self._vectors.flush()
+        self._rooms.flush()
+        temp_path = self._meta_path.with_suffix(".tmp")
+        temp_path.write_text(json.dumps({"dim": self.dim, "count": self.count, "trained_rows": self.trained_rows}))
+        os.replace(temp_path, self._meta_path)
+        self._unflushed = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "rooms": self.count,
+                "lists": 0 if self._centroids is None else len(self._centroids),
+                "trained_rooms": self.trained_rows,
+                "dim": self.dim,
+                "nprobe": SIMILAR_NPROBE,
+            }
+
+
+# Singleton instance for reuse across requests
+_room_index: Optional[RoomIndex] = None
+_room_index_lock = threading.Lock()
+
+
+def get_room_index() -> RoomIndex:
+    """The index for the configured detection model (embeddings of other models are not comparable)."""
+    global _room_index
+    with _room_index_lock:
+        if _room_index is None:
+            model = Path(load_detection_profile().model_name).stem
+            _room_index = RoomIndex(SIMILAR_INDEX_DIR / model)
+            SIMILAR_INDEX_ROOMS.set_function(lambda: _room_index.count)
+    return _room_index
+
+
+def index_room(room_id: str, embedding: Optional[np.ndarray], score) -> None:
+    """Add an analyzed room to the shared index (failures are logged, not raised)."""
+    if embedding is None:
+        return
+    try:
+        get_room_index().add(room_id, embedding, float(score))
+    except Exception as e:
+        logger.warning(f"Could not index room {room_id}: {e}")
+
+
+def flush_room_index() -> None:
+    """Persist the shared index's row count (called at shutdown)."""
+    if _room_index is not None:
+        _room_index.flush()
@@ -0,0 +1,421 @@
+"""
+Storage layer for generated artifacts (annotated detections and 3D models).
+
+Objects are stored under date/hash-sharded keys, e.g.
+    room_renders/2025/10/04/3f/room_model_20251004_123456_789012.fbx
+so no directory grows without bound, and every object is registered in a
+single SQLite index (name -> key, size, creation time). Detection results
+are kept as compact JSON rows in that index instead of one pretty-printed
+file per request.
+
+Blobs go through a pluggable StorageBackend: LocalDirectoryBackend (the
+default, rooted at the backend directory so existing results/ and
+room_renders/ folders are reused) or S3Backend for an S3-compatible object
+store. A background sweeper enforces per-kind age and size retention.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime
+from hashlib import sha1
+from pathlib import Path
+from typing import Dict, Optional
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Configuration
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "local").lower()  # local | s3
+STORAGE_ROOT = Path(os.environ.get("STORAGE_ROOT", Path(__file__).parent))
+STORAGE_INDEX_PATH = Path(os.environ.get("STORAGE_INDEX_PATH", Path(__file__).parent / "storage_index.sqlite3"))
+STORAGE_S3_BUCKET = os.environ.get("STORAGE_S3_BUCKET", "")
+STORAGE_S3_PREFIX = os.environ.get("STORAGE_S3_PREFIX", "")
+STORAGE_SWEEP_INTERVAL = float(os.environ.get("STORAGE_SWEEP_INTERVAL", "3600"))
+
+# Artifact kinds (also the top-level key prefix)
+KIND_RESULTS = "results"
+KIND_RENDERS = "room_renders"
+
+
+@dataclass(frozen=True)
+class RetentionPolicy:
+    """Limits for one artifact kind (0 disables a limit)."""
+
+    max_age_days: float = 0
+    max_bytes: int = 0
+
+
+def load_retention_policies() -> Dict[str, RetentionPolicy]:
+    """Retention per kind from RESULTS_/RENDERS_RETENTION_DAYS and _MAX_MB."""
+    def policy(prefix: str, days: str, megabytes: str) -> RetentionPolicy:
+        return RetentionPolicy(
+            max_age_days=float(os.environ.get(f"{prefix}_RETENTION_DAYS", days)),
+            max_bytes=int(float(os.environ.get(f"{prefix}_MAX_MB", megabytes)) * 1024 * 1024),
+        )
+
+    return {
+        KIND_RESULTS: policy("RESULTS", "30", "2048"),
+        KIND_RENDERS: policy("RENDERS", "30", "10240"),
+    }
+
+
+# ---------------------------------------------------------------------------
+# Backends
+# ---------------------------------------------------------------------------
+
+class StorageBackend:
+    """Minimal object-store interface: whole-object put/get/delete by key."""
+
+    def put(self, key: str, data: bytes, content_type: str = "application/octet-stream") -> None:
+        raise NotImplementedError
+
+    def get(self, key: str) -> bytes:
+        """Raises FileNotFoundError if the key does not exist."""
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        """Delete an object (missing keys are ignored)."""
+        raise NotImplementedError
+
+    def exists(self, key: str) -> bool:
+        raise NotImplementedError
+
+    def local_path(self, key: str) -> Optional[Path]:
+        """Filesystem path of the object if the backend is local (enables sendfile), else None."""
+        return None
+
+    def location(self, key: str) -> str:
+        """Human-readable location of an object, for logs and API responses."""
+        return key
+
+
+class LocalDirectoryBackend(StorageBackend):
+    """Objects stored as files below a root directory (keys are relative paths)."""
+
+    def __init__(self, root: Path = STORAGE_ROOT):
+        self.root = Path(root)
+
+    def _path(self, key: str) -> Path:
+        path = (self.root / key).resolve()
+        if self.root.resolve() not in path.parents:
+            raise ValueError(f"Invalid storage key: {key}")
+        return path
+
+    def put(self, key: str, data: bytes, content_type: str = "application/octet-stream") -> None:
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write then rename, so readers never see a partial file
+        temp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+        try:
+            temp_path.write_bytes(data)
+            os.replace(temp_path, path)
+        except BaseException:
+            temp_path.unlink(missing_ok=True)
+            raise
+
+    def get(self, key: str) -> bytes:
+        return self._path(key).read_bytes()
+
+    def delete(self, key: str) -> None:
+        path = self._path(key)
+        path.unlink(missing_ok=True)
+        # Prune empty shard directories up to the kind directory
+        for parent in list(path.parents)[:4]:
+            try:
+                parent.rmdir()
+            except OSError:
+                break
+
+    def exists(self, key: str) -> bool:
+        return self._path(key).is_file()
+
+    def local_path(self, key: str) -> Optional[Path]:
+        return self._path(key)
+
+    def location(self, key: str) -> str:
+        return str(self._path(key))
+
+
+class S3Backend(StorageBackend):
+    """S3-compatible object store (requires boto3; endpoint from the usual AWS_* settings)."""
+
+    def __init__(self, bucket: str = STORAGE_S3_BUCKET, prefix: str = STORAGE_S3_PREFIX):
+        try:
+            import boto3
+        except ImportError as e:
+            raise RuntimeError("STORAGE_BACKEND=s3 requires boto3 (pip install boto3)") from e
+        if not bucket:
+            raise RuntimeError("STORAGE_S3_BUCKET is not set")
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.client = boto3.client("s3", endpoint_url=os.environ.get("STORAGE_S3_ENDPOINT") or None)
+        self._missing = self.client.exceptions.NoSuchKey
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def put(self, key: str, data: bytes, content_type: str = "application/octet-stream") -> None:
+        self.client.put_object(Bucket=self.bucket, Key=self._key(key), Body=data, ContentType=content_type)
+
+    def get(self, key: str) -> bytes:
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=self._key(key))["Body"].read()
+        except self._missing as e:
+            raise FileNotFoundError(key) from e
+
+    def delete(self, key: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+    def exists(self, key: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+            return True
+        except Exception:
+            return False
+
+    def location(self, key: str) -> str:
+        return f"s3://{self.bucket}/{self._key(key)}"
+
+
+def create_backend(name: str = STORAGE_BACKEND) -> StorageBackend:
+    """Build the backend selected by STORAGE_BACKEND."""
+    if name == "s3":
+        return S3Backend()
+    if name != "local":
+        logger.warning(f"Unknown STORAGE_BACKEND '{name}' - using local directory")
+    return LocalDirectoryBackend()
+
+
+# ---------------------------------------------------------------------------
+# Index
+# ---------------------------------------------------------------------------
+
+class StorageIndex:
+    """SQLite registry of stored objects and compact JSON records."""
+
+    def __init__(self, path: Path = STORAGE_INDEX_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS objects (
+                key TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                name TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                payload TEXT
+            );
+            CREATE INDEX IF NOT EXISTS objects_name ON objects (name);
+            CREATE INDEX IF NOT EXISTS objects_kind_created ON objects (kind, created);
+        """)
+
+    def add(self, key: str, kind: str, name: str, size: int, created: float, payload: Optional[str] = None) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO objects (key, kind, name, size, created, payload) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, kind, name, size, created, payload),
+            )
+
+    def find(self, name: str, kind: Optional[str] = None) -> Optional[tuple]:
+        """(key, payload) of the most recent entry with this name."""
+        query = "SELECT key, payload FROM objects WHERE name = ?"
+        params = [name]
+        if kind is not None:
+            query += " AND kind = ?"
+            params.append(kind)
+        with self._lock:
+            return self._conn.execute(query + " ORDER BY created DESC LIMIT 1", params).fetchone()
+
+    def expired(self, kind: str, before: float, limit: int = 1000) -> list:
+        """(key, size, has_blob) of entries created before a timestamp, oldest first."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT key, size, payload IS NULL FROM objects WHERE kind = ? AND created < ? "
+                "ORDER BY created LIMIT ?",
+                (kind, before, limit),
+            ).fetchall()
+
+    def oldest(self, kind: str, limit: int = 1000) -> list:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT key, size, payload IS NULL FROM objects WHERE kind = ? ORDER BY created LIMIT ?",
+                (kind, limit),
+            ).fetchall()
+
+    def total_size(self, kind: str) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM objects WHERE kind = ?", (kind,)
+            ).fetchone()[0]
+
+    def remove(self, keys: list) -> None:
+        with self._lock:
+            self._conn.executemany("DELETE FROM objects WHERE key = ?", [(key,) for key in keys])
+
+    def stats(self) -> Dict[str, dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT kind, COUNT(*), COALESCE(SUM(size), 0) FROM objects GROUP BY kind"
+            ).fetchall()
+        return {kind: {"objects": count, "bytes": size} for kind, count, size in rows}
+
+
+# ---------------------------------------------------------------------------
+# Store
+# ---------------------------------------------------------------------------
+
+def object_key(kind: str, name: str, when: datetime) -> str:
+    """Date/hash-sharded key: kind/YYYY/MM/DD/<2 hex>/name."""
+    shard = sha1(name.encode("utf-8")).hexdigest()[:2]
+    return f"{kind}/{when:%Y/%m/%d}/{shard}/{name}"
+
+
+class ArtifactStore:
+    """Sharded, indexed, retention-managed storage for generated artifacts."""
+
+    def __init__(
+        self,
+        backend: Optional[StorageBackend] = None,
+        index: Optional[StorageIndex] = None,
+        policies: Optional[Dict[str, RetentionPolicy]] = None
+    ):
+        self.backend = backend or create_backend()
+        self.index = index or StorageIndex()
+        self.policies = policies if policies is not None else load_retention_policies()
+        self._sweeper: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def save(self, kind: str, name: str, data: bytes, content_type: str = "application/octet-stream",
+             when: Optional[datetime] = None) -> str:
+        """
+        Store a blob and register it in the index.
+
+        Returns:
+            The object's storage key
+        """
+        when = when or datetime.now()
+        key = object_key(kind, name, when)
+        self.backend.put(key, data, content_type)
+        self.index.add(key, kind, name, len(data), when.timestamp())
+        return key
+
+    def save_record(self, kind: str, name: str, record: dict, when: Optional[datetime] = None) -> str:
+        """
+        Store a JSON record as a compact row in the index (no file per record).
+
+        Returns:
+            The record's key
+        """
+        when = when or datetime.now()
+        key = object_key(kind, name, when)
+        payload = json.dumps(record, separators=(",", ":"))
+        self.index.add(key, kind, name, len(payload), when.timestamp(), payload)
+        return key
+
+    def load_record(self, name: str, kind: Optional[str] = None) -> Optional[dict]:
+        row = self.index.find(name, kind)
+        if row is None or row[1] is None:
+            return None
+        return json.loads(row[1])
+
+    def find(self, name: str, kind: Optional[str] = None) -> Optional[str]:
+        """Key of the most recent blob stored under name, or None."""
+        row = self.index.find(name, kind)
+        return row[0] if row is not None and row[1] is None else None
+
+    def location(self, key: str) -> str:
+        return self.backend.location(key)
+
+    def sweep(self, now: Optional[float] = None) -> Dict[str, int]:
+        """
+        Apply retention policies once.
+
+        Returns:
+            Number of entries deleted per kind
+        """
+        now = time.time() if now is None else now
+        deleted = {}
+        for kind, policy in self.policies.items():
+            count = 0
+            if policy.max_age_days > 0:
+                cutoff = now - policy.max_age_days * 86400
+                while True:
+                    rows = self.index.expired(kind, cutoff)
+                    if not rows:
+                        break
+                    count += self._delete(rows)
+            if policy.max_bytes > 0:
+                excess = self.index.total_size(kind) - policy.max_bytes
+                while excess > 0:
+                    rows = self.index.oldest(kind)
+                    if not rows:
+                        break
+                    batch = []
+                    for row in rows:
+                        batch.append(row)
+                        excess -= row[1]
+                        if excess <= 0:
+                            break
+                    count += self._delete(batch)
+            if count:
+                logger.info(f"Storage sweep removed {count} {kind} entries")
+            deleted[kind] = count
+        return deleted
+
+    def _delete(self, rows: list) -> int:
+        for key, _, has_blob in rows:
+            if has_blob:
+                try:
+                    self.backend.delete(key)
+                except Exception as e:
+                    logger.warning(f"Failed to delete {key}: {e}")
+        self.index.remove([row[0] for row in rows])
+        return len(rows)
+
+    def start_sweeper(self, interval: float = STORAGE_SWEEP_INTERVAL) -> None:
+        """Run sweep() every `interval` seconds in a daemon thread (0 disables)."""
+        if interval <= 0 or (self._sweeper is not None and self._sweeper.is_alive()):
+            return
+        self._stop.clear()
+
+        def run():
+            while True:
+                try:
+                    self.sweep()
+                except Exception as e:
+                    logger.error(f"Storage sweep failed: {e}")
+                if self._stop.wait(interval):
+                    return
+
+        self._sweeper = threading.Thread(target=run, name="storage-sweeper", daemon=True)
+        self._sweeper.start()
+
+    def stop_sweeper(self) -> None:
+        self._stop.set()
+
+
+# Singleton instance for reuse across requests
+_store_instance: Optional[ArtifactStore] = None
+
+
+def get_store() -> ArtifactStore:
+    """
+    Get or create singleton artifact store instance.
+
+    Returns:
+        ArtifactStore instance
+    """
+    global _store_instance
+    if _store_instance is None:
+        _store_instance = ArtifactStore()
+    return _store_instance
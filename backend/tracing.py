@@ -0,0 +1,482 @@
+"""
+Lightweight distributed tracing for the Feng Shui backend.
+
+Spans are tracked per request with contextvars, propagated to the Blender
+service with W3C `traceparent` headers and exported in batches from a
+background thread, either as JSON lines to a local file or as OTLP/HTTP JSON
+to a collector (Jaeger, Tempo, the OpenTelemetry Collector...), without
+adding an OpenTelemetry SDK dependency.
+
+Sampling is decided once per trace (ratio of trace ids, or the caller's
+decision when a `traceparent` header arrives) and unsampled spans are
+no-op objects, so tracing stays cheap under full load. With no exporter
+configured tracing is disabled entirely.
+"""
+
+import atexit
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional
+
+import requests
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Configuration
+TRACE_EXPORTER = os.environ.get("TRACE_EXPORTER", "none").lower()  # none | file | otlp
+# Relative paths are resolved against the backend directory
+TRACE_EXPORT_FILE = Path(__file__).parent / os.environ.get("TRACE_EXPORT_FILE", "traces/spans.jsonl")
+TRACE_OTLP_ENDPOINT = os.environ.get("TRACE_OTLP_ENDPOINT", "http://localhost:4318/v1/traces")
+TRACE_SAMPLE_RATIO = float(os.environ.get("TRACE_SAMPLE_RATIO", "0.1"))
+TRACE_SERVICE_NAME = os.environ.get("TRACE_SERVICE_NAME", "fengshui-backend")
+EXPORT_BATCH_SIZE = 256
+EXPORT_INTERVAL = 2.0  # Seconds between flushes of a partial batch
+EXPORT_QUEUE_SIZE = 4096  # Finished spans waiting for export; newer spans are dropped when full
+
+SPAN_KINDS = {"internal": 1, "server": 2, "client": 3}
+
+
+class SpanContext:
+    """Identifiers carried across process boundaries."""
+
+    __slots__ = ("trace_id", "span_id", "sampled")
+
+    def __init__(self, trace_id: str, span_id: str, sampled: bool):
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.sampled = sampled
+
+    def to_traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+
+class Span:
+    """A timed operation within a trace."""
+
+    __slots__ = ("name", "context", "parent_id", "kind", "start_ns", "end_ns",
+                 "attributes", "status", "status_message")
+
+    recording = True
+
+    def __init__(self, name: str, context: SpanContext, parent_id: Optional[str], kind: str,
+                 attributes: Optional[dict] = None):
+        self.name = name
+        self.context = context
+        self.parent_id = parent_id
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = dict(attributes) if attributes else {}
+        self.status = "unset"
+        self.status_message = ""
+
+    def set_attribute(self, key: str, value) -> None:
+        self.attributes[key] = value
+
+    def set_attributes(self, attributes: dict) -> None:
+        self.attributes.update(attributes)
+
+    def record_exception(self, exc: BaseException) -> None:
+        self.status = "error"
+        self.status_message = str(exc)[:500]
+        self.attributes["exception.type"] = type(exc).__name__
+        self.attributes["exception.message"] = self.status_message
+
+    def set_error(self, message: str) -> None:
+        self.status = "error"
+        self.status_message = message[:500]
+
+    def end(self) -> None:
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+            _processor.on_end(self)
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.context.trace_id,
+            "span_id": self.context.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "attributes": self.attributes,
+            "status": self.status,
+            "status_message": self.status_message,
+            "service": TRACE_SERVICE_NAME,
+        }
+
+
+class _NonRecordingSpan:
+    """Placeholder for unsampled spans: keeps ids for propagation, records nothing."""
+
+    __slots__ = ("context",)
+
+    recording = False
+
+    def __init__(self, context: Optional[SpanContext]):
+        self.context = context
+
+    def set_attribute(self, key: str, value) -> None:
+        pass
+
+    def set_attributes(self, attributes: dict) -> None:
+        pass
+
+    def record_exception(self, exc: BaseException) -> None:
+        pass
+
+    def set_error(self, message: str) -> None:
+        pass
+
+    def end(self) -> None:
+        pass
+
+
+_NOOP_SPAN = _NonRecordingSpan(None)
+_current_span: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+
+
+# ---------------------------------------------------------------------------
+# Exporters
+# ---------------------------------------------------------------------------
+
+class FileSpanExporter:
+    """Append finished spans to a JSON lines file."""
+
+    def __init__(self, path: Path = TRACE_EXPORT_FILE):
+        self.path = path
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+    def export(self, spans: List[Span]) -> None:
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(span.to_dict(), default=str) + "\n" for span in spans))
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class OTLPSpanExporter:
+    """Send finished spans to an OTLP/HTTP collector using the JSON encoding."""
+
+    def __init__(self, endpoint: str = TRACE_OTLP_ENDPOINT, timeout: float = 5.0):
+        self.endpoint = endpoint
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def export(self, spans: List[Span]) -> None:
+        payload = {"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": TRACE_SERVICE_NAME}}]},
+            "scopeSpans": [{"scope": {"name": "fengshui.tracing"}, "spans": [
+                {
+                    "traceId": span.context.trace_id,
+                    "spanId": span.context.span_id,
+                    "parentSpanId": span.parent_id or "",
+                    "name": span.name,
+                    "kind": SPAN_KINDS[span.kind],
+                    "startTimeUnixNano": str(span.start_ns),
+                    "endTimeUnixNano": str(span.end_ns),
+                    "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in span.attributes.items()],
+                    "status": {"code": 2 if span.status == "error" else 0, "message": span.status_message},
+                }
+                for span in spans
+            ]}],
+        }]}
+        response = self.session.post(self.endpoint, json=payload, timeout=self.timeout)
+        response.raise_for_status()
+
+
+class BatchSpanProcessor:
+    """Queue finished spans and export them in batches from a daemon thread."""
+
+    def __init__(self, exporter=None, batch_size: int = EXPORT_BATCH_SIZE,
+                 interval: float = EXPORT_INTERVAL, queue_size: int = EXPORT_QUEUE_SIZE):
+        self.exporter = exporter
+        self.batch_size = batch_size
+        self.interval = interval
+        self.dropped = 0
+        self._queue: "queue.Queue[Span]" = queue.Queue(maxsize=queue_size)
+        self._flush_requested = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.exporter is not None
+
+    def on_end(self, span: Span) -> None:
+        if self.exporter is None:
+            return
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+            return
+        if self._thread is None:
+            self._start()
+        if self._queue.qsize() >= self.batch_size:
+            self._flush_requested.set()
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            self._flush_requested.wait(self.interval)
+            self._flush_requested.clear()
+            self._export_pending()
+
+    def _export_pending(self) -> None:
+        while True:
+            batch = []
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if not batch:
+                return
+            try:
+                self.exporter.export(batch)
+            except Exception as e:
+                logger.warning(f"Span export failed ({len(batch)} spans dropped): {e}")
+
+    def force_flush(self) -> None:
+        """Export everything queued so far (called at shutdown)."""
+        if self.exporter is not None:
+            with self._lock:
+                self._export_pending()
+
+
+def create_exporter(name: str = TRACE_EXPORTER):
+    """Build the exporter selected by TRACE_EXPORTER, or None when tracing is off."""
+    if name == "file":
+        return FileSpanExporter()
+    if name == "otlp":
+        return OTLPSpanExporter()
+    if name not in ("", "none"):
+        logger.warning(f"Unknown TRACE_EXPORTER '{name}' - tracing disabled")
+    return None
+
+
+_processor = BatchSpanProcessor(create_exporter())
+atexit.register(_processor.force_flush)
+
+
+def configure(exporter=None, sample_ratio: Optional[float] = None) -> None:
+    """Replace the exporter and/or sample ratio at runtime (benchmarks, tests)."""
+    global TRACE_SAMPLE_RATIO
+    _processor.force_flush()
+    _processor.exporter = exporter
+    if sample_ratio is not None:
+        TRACE_SAMPLE_RATIO = sample_ratio
+
+
+# ---------------------------------------------------------------------------
+# Span API
+# ---------------------------------------------------------------------------
+
+def _new_id(bits: int) -> str:
+    return f"{random.getrandbits(bits):0{bits // 4}x}"
+
+
+def _should_sample(trace_id: str) -> bool:
+    """Deterministic ratio sampling on the low 64 bits of the trace id."""
+    return int(trace_id[16:], 16) < TRACE_SAMPLE_RATIO * 2 ** 64
+
+
+def current_span():
+    """The active span (a no-op span outside of any trace)."""
+    return _current_span.get() or _NOOP_SPAN
+
+
+def create_span(name: str, kind: str = "internal", attributes: Optional[dict] = None,
+                parent: Optional[SpanContext] = None):
+    """
+    Create (but do not activate) a span.
+
+    Args:
+        name: Operation name
+        kind: 'internal', 'server' or 'client'
+        attributes: Initial span attributes
+        parent: Explicit parent context (defaults to the active span)
+
+    Returns:
+        A recording Span if the trace is sampled, otherwise a non-recording span
+    """
+    if not _processor.enabled:
+        return _NOOP_SPAN
+    if parent is None:
+        parent = current_span().context
+    if parent is None:
+        trace_id = _new_id(128)
+        context = SpanContext(trace_id, _new_id(64), _should_sample(trace_id))
+        parent_id = None
+    else:
+        context = SpanContext(parent.trace_id, _new_id(64), parent.sampled)
+        parent_id = parent.span_id
+    if not context.sampled:
+        return _NonRecordingSpan(context)
+    return Span(name, context, parent_id, kind, attributes)
+
+
+@contextmanager
+def start_span(name: str, kind: str = "internal", attributes: Optional[dict] = None,
+               parent: Optional[SpanContext] = None) -> Iterator:
+    """
+    Run a block inside a new span, made active for code (and threads bound
+    with bind_context) called from within it.
+
+    Exceptions escaping the block are recorded on the span and re-raised.
+    """
+    span = create_span(name, kind, attributes, parent)
+    if span is _NOOP_SPAN:
+        yield span
+        return
+    token = _current_span.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.record_exception(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        span.end()
+
+
+def traced(name: Optional[str] = None, kind: str = "internal") -> Callable:
+    """Decorator wrapping every call of a function (sync or async) in a span."""
+
+    def decorator(fn: Callable) -> Callable:
+        span_name = name or fn.__qualname__
+
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with start_span(span_name, kind):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with start_span(span_name, kind):
+                return fn(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+def bind_context(fn: Callable) -> Callable:
+    """
+    Bind fn to the current context, so spans it opens in an executor thread
+    (loop.run_in_executor does not copy contextvars) join the caller's trace.
+    """
+    return functools.partial(contextvars.copy_context().run, fn)
+
+
+def inject_headers(headers: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    """Add a W3C traceparent header for the active span to outgoing request headers."""
+    headers = dict(headers or {})
+    context = current_span().context
+    if context is not None:
+        headers["traceparent"] = context.to_traceparent()
+    return headers
+
+
+def extract_context(traceparent: Optional[str]) -> Optional[SpanContext]:
+    """Parse an incoming W3C traceparent header (None if absent or malformed)."""
+    if not traceparent:
+        return None
+    parts = traceparent.strip().split("-")
+    if len(parts) < 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        int(parts[1], 16), int(parts[2], 16)
+        flags = int(parts[3][:2], 16)
+    except ValueError:
+        return None
+    if parts[1] == "0" * 32 or parts[2] == "0" * 16:
+        return None
+    return SpanContext(parts[1], parts[2], bool(flags & 1))
+
+
+class TracingMiddleware:
+    """
+    ASGI middleware opening a server span per HTTP request.
+
+    Continues the caller's trace when a traceparent header is present and
+    returns the trace id in an X-Trace-Id response header for sampled
+    requests. The span ends when the response body is complete; background
+    tasks that run afterwards still join the trace as children.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not _processor.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        parent = extract_context(headers.get(b"traceparent", b"").decode("latin-1"))
+        span = create_span(f"{scope['method']} {scope['path']}", "server", {
+            "http.method": scope["method"],
+            "http.target": scope["path"],
+        }, parent)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                span.set_attribute("http.status_code", message["status"])
+                if message["status"] >= 500:
+                    span.set_error(f"HTTP {message['status']}")
+                if span.recording:
+                    message.setdefault("headers", [])
+                    message["headers"] = list(message["headers"]) + [
+                        (b"x-trace-id", span.context.trace_id.encode("latin-1"))
+                    ]
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                _finish(span, scope)
+
+        token = _current_span.set(span)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except BaseException as e:
+            span.record_exception(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            _finish(span, scope)
+
+
+def _finish(span, scope) -> None:
+    if not span.recording or span.end_ns is not None:
+        return
+    route = getattr(scope.get("route"), "path", None)
+    if route:
+        span.name = f"{scope['method']} {route}"
+        span.set_attribute("http.route", route)
+    span.end()
@@ -0,0 +1,359 @@
+"""
+Content-addressed cache for text-to-speech audio.
+
+Synthesized audio is stored on disk keyed by a hash of (text, voice_id,
+output_format), so replaying an analysis or the mascot's stock phrases never
+pays for the same synthesis twice. On a miss, audio chunks are passed through
+to the client as they arrive from the TTS provider while being written to the
+cache. Total cache size is bounded with least-recently-used eviction.
+
+Syntheses in flight are tracked per key, so a request for audio that is
+already being produced (e.g. narration pre-synthesized at analysis time)
+follows the file as it is written instead of paying for a second synthesis.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, Optional
+
+from metrics import (
+    TTS_CACHE_BYTES, TTS_CACHE_HIT_RATIO, TTS_CACHE_HITS, TTS_CACHE_MISSES,
+    TTS_IN_FLIGHT, TTS_SYNTHESIS_SECONDS
+)
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Configuration
+TTS_CACHE_DIR = Path(__file__).parent / "tts_cache"
+TTS_CACHE_MAX_BYTES = int(os.environ.get("TTS_CACHE_MAX_MB", "512")) * 1024 * 1024
+DEFAULT_VOICE_ID = os.environ.get("ELEVENLABS_VOICE_ID", "pFQStpMdprGFILRDrWR2")
+DEFAULT_OUTPUT_FORMAT = "mp3_44100_128"
+READ_CHUNK_SIZE = 64 * 1024
+FOLLOW_POLL_INTERVAL = 0.02  # Seconds between checks for new data in an in-flight file
+
+
+def audio_cache_key(text: str, voice_id: str, output_format: str) -> str:
+    """
+    Compute the content address for a synthesis request.
+
+    Returns:
+        Hex SHA-256 digest of the text, voice and output format
+    """
+    payload = json.dumps([text, voice_id, output_format], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class _Synthesis:
+    """Bookkeeping for one in-flight synthesis."""
+
+    __slots__ = ("done", "temp_path")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.temp_path: Optional[Path] = None
+
+
+class AudioCache:
+    """Disk-backed LRU cache of synthesized audio files."""
+
+    def __init__(self, cache_dir: Path = TTS_CACHE_DIR, max_bytes: int = TTS_CACHE_MAX_BYTES):
+        """
+        Initialize the cache, indexing any audio already on disk.
+
+        Args:
+            cache_dir: Directory holding cached audio files
+            max_bytes: Maximum total size of cached audio before eviction
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # key -> size in bytes, least recently used first
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._total_bytes = 0
+        # key -> in-flight synthesis (claimed but not yet released)
+        self._pending: Dict[str, _Synthesis] = {}
+        self._load_index()
+
+    def _load_index(self) -> None:
+        """Rebuild the LRU order from files on disk (oldest modification first)."""
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        files = sorted(self.cache_dir.glob("*/*.mp3"), key=lambda p: p.stat().st_mtime)
+        for path in files:
+            size = path.stat().st_size
+            self._entries[path.stem] = size
+            self._total_bytes += size
+        if files:
+            logger.info(f"TTS cache loaded: {len(files)} files, {self._total_bytes / 1e6:.1f} MB")
+
+    def path_for(self, key: str) -> Path:
+        """Location of the cached file for a key (sharded by the first two hex digits)."""
+        return self.cache_dir / key[:2] / f"{key}.mp3"
+
+    def get(self, key: str) -> Optional[Path]:
+        """
+        Look up cached audio and mark it as recently used.
+
+        Returns:
+            Path to the audio file, or None on a miss
+        """
+        with self._lock:
+            if key in self._entries and self.path_for(key).exists():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                path = self.path_for(key)
+            else:
+                self._entries.pop(key, None)
+                self.misses += 1
+                TTS_CACHE_MISSES.inc()
+                return None
+        TTS_CACHE_HITS.inc()
+
+        # Persist recency so the LRU order survives restarts
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return path
+
+    def claim(self, key: str) -> bool:
+        """
+        Reserve a key for synthesis.
+
+        Returns:
+            True if the caller should synthesize (and later release) the key,
+            False if it is already cached or being synthesized elsewhere
+        """
+        with self._lock:
+            if key in self._pending or (key in self._entries and self.path_for(key).exists()):
+                return False
+            self._pending[key] = _Synthesis()
+        TTS_IN_FLIGHT.inc()
+        return True
+
+    def release(self, key: str) -> None:
+        """End a claim and wake up any waiters."""
+        with self._lock:
+            synthesis = self._pending.pop(key, None)
+        if synthesis is not None:
+            TTS_IN_FLIGHT.dec()
+            synthesis.done.set()
+
+    def is_pending(self, key: str) -> bool:
+        with self._lock:
+            return key in self._pending
+
+    def wait(self, key: str, timeout: float) -> Optional[Path]:
+        """
+        Block until an in-flight synthesis of key finishes, then look it up.
+
+        Returns:
+            Path to the audio file, or None if it failed or timed out
+        """
+        with self._lock:
+            synthesis = self._pending.get(key)
+        if synthesis is not None:
+            synthesis.done.wait(timeout)
+        return self.get(key)
+
+    def follow(self, key: str, timeout: float) -> Iterator[bytes]:
+        """
+        Stream audio for key, following an in-flight synthesis as it is written.
+
+        Bytes are yielded as soon as the synthesizing writer flushes them, so
+        the first audio byte does not wait for the whole file. Falls back to
+        the cached file if the synthesis already finished.
+
+        Args:
+            key: Cache key from audio_cache_key()
+            timeout: Maximum time to wait for the synthesis to progress
+        """
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            synthesis = self._pending.get(key)
+
+        if synthesis is not None:
+            # Wait for the writer to open its temp file
+            while synthesis.temp_path is None and not synthesis.done.is_set():
+                if time.monotonic() > deadline:
+                    return
+                time.sleep(FOLLOW_POLL_INTERVAL)
+
+            try:
+                f = open(synthesis.temp_path, "rb") if synthesis.temp_path else None
+            except FileNotFoundError:
+                # Already committed (renamed) or discarded
+                f = None
+
+            if f is not None:
+                self._count_hit()
+                with f:
+                    while True:
+                        chunk = f.read(READ_CHUNK_SIZE)
+                        if chunk:
+                            yield chunk
+                        elif synthesis.done.is_set():
+                            # Writer finished: drain whatever was flushed last
+                            yield from iter(lambda: f.read(READ_CHUNK_SIZE), b"")
+                            return
+                        elif time.monotonic() > deadline:
+                            return
+                        else:
+                            time.sleep(FOLLOW_POLL_INTERVAL)
+
+        cached_path = self.get(key)
+        if cached_path is not None:
+            with open(cached_path, "rb") as f:
+                yield from iter(lambda: f.read(READ_CHUNK_SIZE), b"")
+
+    def _count_hit(self) -> None:
+        with self._lock:
+            self.hits += 1
+        TTS_CACHE_HITS.inc()
+
+    def synthesize(self, key: str, produce: Callable[[], Iterable[bytes]], timeout: float = 120.0) -> Optional[Path]:
+        """
+        Ensure audio for key is cached, synthesizing it at most once.
+
+        Args:
+            key: Cache key from audio_cache_key()
+            produce: Callable returning the provider's audio chunks
+            timeout: How long to wait if another caller is already synthesizing
+
+        Returns:
+            Path to the cached audio file, or None if synthesis failed
+        """
+        if not self.claim(key):
+            return self.wait(key, timeout)
+        try:
+            with TTS_SYNTHESIS_SECONDS.time():
+                return self._commit(key, self._write_temp(key, produce()))
+        except Exception as e:
+            logger.error(f"TTS synthesis failed for {key[:12]}: {e}")
+            return None
+        finally:
+            self.release(key)
+
+    def put(self, key: str, audio: bytes) -> Path:
+        """Store a complete audio payload."""
+        return self._commit(key, self._write_temp(key, [audio]))
+
+    def stream_and_store(self, key: str, chunks: Iterable[bytes]) -> Iterator[bytes]:
+        """
+        Pass audio chunks through while writing them to the cache.
+
+        The file is only added to the cache once the stream completes; if the
+        provider fails or the client disconnects, the partial file is discarded.
+        The caller must have claimed the key; it is released when the stream ends.
+
+        Args:
+            key: Cache key from audio_cache_key()
+            chunks: Audio chunks as they arrive from the TTS provider
+
+        Yields:
+            The same chunks, unchanged
+        """
+        temp_path = self._temp_path(key)
+        completed = False
+        try:
+            with open(temp_path, "wb") as f:
+                for chunk in chunks:
+                    if chunk:
+                        f.write(chunk)
+                        # Flush so followers of this synthesis see the chunk
+                        f.flush()
+                        yield chunk
+            completed = True
+        finally:
+            try:
+                if completed:
+                    self._commit(key, temp_path)
+                else:
+                    temp_path.unlink(missing_ok=True)
+            finally:
+                self.release(key)
+
+    def stats(self) -> Dict[str, float]:
+        """Hit/miss counters and current size."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+    def _temp_path(self, key: str) -> Path:
+        final_path = self.path_for(key)
+        final_path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = final_path.with_name(f".{key}.{uuid.uuid4().hex}.tmp")
+        # Create it now so followers can open the file before the first write
+        temp_path.touch()
+        with self._lock:
+            if key in self._pending:
+                self._pending[key].temp_path = temp_path
+        return temp_path
+
+    def _write_temp(self, key: str, chunks: Iterable[bytes]) -> Path:
+        temp_path = self._temp_path(key)
+        try:
+            with open(temp_path, "wb") as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    f.flush()
+        except BaseException:
+            temp_path.unlink(missing_ok=True)
+            raise
+        return temp_path
+
+    def _commit(self, key: str, temp_path: Path) -> Path:
+        """Atomically move a finished temp file into place and evict if over budget."""
+        final_path = self.path_for(key)
+        size = temp_path.stat().st_size
+        os.replace(temp_path, final_path)
+
+        with self._lock:
+            self._total_bytes += size - self._entries.pop(key, 0)
+            self._entries[key] = size
+            self._evict_locked()
+        return final_path
+
+    def _evict_locked(self) -> None:
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            key, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            self.path_for(key).unlink(missing_ok=True)
+            logger.info(f"Evicted TTS cache entry {key[:12]} ({size} bytes)")
+
+
+# Singleton instance for reuse across requests
+_cache_instance: Optional[AudioCache] = None
+
+
+def get_audio_cache() -> AudioCache:
+    """
+    Get or create singleton audio cache instance.
+
+    Returns:
+        AudioCache instance
+    """
+    global _cache_instance
+    if _cache_instance is None:
+        _cache_instance = AudioCache()
+    return _cache_instance
+
+
+TTS_CACHE_HIT_RATIO.set_function(lambda: get_audio_cache().stats()["hit_ratio"])
+TTS_CACHE_BYTES.set_function(lambda: get_audio_cache().stats()["bytes"])
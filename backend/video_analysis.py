@@ -0,0 +1,484 @@
+"""
+Video walkthrough ingestion: keyframe selection, batched detection and tracking.
+
+A room video is decoded in one streaming pass with cv2, sampled at
+VIDEO_SAMPLE_FPS. Sampled frames are grouped into segments that end on a
+scene change (colour histogram distance from the segment's first frame) or
+after VIDEO_MAX_SEGMENT_SECONDS of a slow pan, and the sharpest frame of each
+segment (variance of the Laplacian) becomes a keyframe. Only the current
+segment's best frame and the chosen keyframes are held in memory.
+
+Keyframes go through the detector as one batched pass, then a lightweight
+IoU tracker links detections of the same physical object across keyframes,
+compensating camera motion between keyframes with phase correlation. The
+result is one consolidated object list for the analysis, with the objects
+of the "hero" keyframe (the one showing the most objects, used as the
+analysis image) first and in that frame's coordinates.
+"""
+
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from functools import cached_property
+from typing import Any, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from fengshui_rules import RoomGeometry, RuleReport, evaluate_rules
+from metrics import VIDEO_FRAMES, VIDEO_STAGE_SECONDS
+from object_detection import Detections, ObjectDetector, get_detector
+from tracing import start_span
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Configuration
+VIDEO_SAMPLE_FPS = float(os.environ.get("VIDEO_SAMPLE_FPS", "4"))
+VIDEO_MAX_KEYFRAMES = int(os.environ.get("VIDEO_MAX_KEYFRAMES", "8"))
+VIDEO_SCENE_THRESHOLD = float(os.environ.get("VIDEO_SCENE_THRESHOLD", "0.3"))
+VIDEO_MAX_SEGMENT_SECONDS = float(os.environ.get("VIDEO_MAX_SEGMENT_SECONDS", "3"))
+VIDEO_MIN_SHARPNESS = float(os.environ.get("VIDEO_MIN_SHARPNESS", "15"))
+VIDEO_MAX_SECONDS = float(os.environ.get("VIDEO_MAX_SECONDS", "180"))
+VIDEO_TRACK_IOU = float(os.environ.get("VIDEO_TRACK_IOU", "0.3"))
+VIDEO_TRACK_MAX_AGE = 2       # Keyframes a track survives without being matched
+ANALYSIS_WIDTH = 320          # Width of the copy used for histograms, sharpness and motion
+KEYFRAME_MAX_SIDE = 1280      # Kept keyframes are downscaled to this (detection runs at imgsz anyway)
+KEYFRAME_JPEG_QUALITY = 90
+MIN_SHIFT_RESPONSE = 0.05     # Phase correlation peaks below this are treated as "no estimate"
+
+
+@dataclass
+class Keyframe:
+    """A selected frame, downscaled to KEYFRAME_MAX_SIDE."""
+
+    frame_index: int
+    time_s: float
+    sharpness: float
+    image: np.ndarray  # BGR
+    gray: np.ndarray   # ANALYSIS_WIDTH-wide grayscale, for motion estimation
+
+    def to_jpeg(self) -> bytes:
+        ok, buffer = cv2.imencode(".jpg", self.image, [cv2.IMWRITE_JPEG_QUALITY, KEYFRAME_JPEG_QUALITY])
+        if not ok:
+            raise ValueError(f"Could not encode keyframe {self.frame_index}")
+        return buffer.tobytes()
+
+    def to_rgb(self) -> Image.Image:
+        return Image.fromarray(cv2.cvtColor(self.image, cv2.COLOR_BGR2RGB))
+
+
+def downscale(image: np.ndarray, max_side: int) -> np.ndarray:
+    height, width = image.shape[:2]
+    scale = max_side / max(height, width)
+    if scale >= 1:
+        return image
+    return cv2.resize(image, (round(width * scale), round(height * scale)), interpolation=cv2.INTER_AREA)
+
+
+class KeyframeSelector:
+    """Streaming scene-change + sharpness keyframe selection."""
+
+    def __init__(
+        self,
+        max_keyframes: int = VIDEO_MAX_KEYFRAMES,
+        scene_threshold: float = VIDEO_SCENE_THRESHOLD,
+        max_segment_seconds: float = VIDEO_MAX_SEGMENT_SECONDS,
+        min_sharpness: float = VIDEO_MIN_SHARPNESS
+    ):
+        """
+        Args:
+            max_keyframes: Keyframes returned at most (evenly spread over the video)
+            scene_threshold: Bhattacharyya histogram distance (0-1) that starts a new segment
+            max_segment_seconds: Segment length after which a new one starts anyway (slow pans)
+            min_sharpness: Laplacian variance below which a segment's best frame is dropped as blurred
+        """
+        self.max_keyframes = max(1, max_keyframes)
+        self.scene_threshold = scene_threshold
+        self.max_segment_seconds = max_segment_seconds
+        self.min_sharpness = min_sharpness
+        self.keyframes: List[Keyframe] = []
+        self.segments = 0
+        self._anchor_hist: Optional[np.ndarray] = None
+        self._segment_start = 0.0
+        # Best frame of the current segment: (sharpness, frame_index, time_s, frame, gray)
+        self._best: Optional[tuple] = None
+        # Sharpest frame seen anywhere, used if every segment was too blurred
+        self._fallback: Optional[tuple] = None
+
+    def add(self, frame_index: int, time_s: float, frame: np.ndarray) -> None:
+        """Feed one sampled BGR frame."""
+        small = downscale(frame, ANALYSIS_WIDTH) if frame.shape[1] > ANALYSIS_WIDTH else frame
+        hsv = cv2.cvtColor(small, cv2.COLOR_BGR2HSV)
+        hist = cv2.calcHist([hsv], [0, 1], None, [16, 8], [0, 180, 0, 256])
+        cv2.normalize(hist, hist)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        sharpness = float(cv2.Laplacian(gray, cv2.CV_64F).var())
+
+        if self._anchor_hist is None:
+            self._start_segment(hist, time_s)
+        elif (cv2.compareHist(self._anchor_hist, hist, cv2.HISTCMP_BHATTACHARYYA) > self.scene_threshold
+              or time_s - self._segment_start >= self.max_segment_seconds):
+            self._close_segment()
+            self._start_segment(hist, time_s)
+
+        if self._best is None or sharpness > self._best[0]:
+            self._best = (sharpness, frame_index, time_s, frame, gray)
+
+    def finish(self) -> List[Keyframe]:
+        """Close the last segment and return at most max_keyframes keyframes in time order."""
+        self._close_segment()
+        if not self.keyframes and self._fallback is not None:
+            self.keyframes.append(self._keyframe(self._fallback))
+        if len(self.keyframes) > self.max_keyframes:
+            picks = np.unique(np.linspace(0, len(self.keyframes) - 1, self.max_keyframes).round().astype(int))
+            self.keyframes = [self.keyframes[i] for i in picks]
+        return self.keyframes
+
+    def _start_segment(self, hist: np.ndarray, time_s: float) -> None:
+        self._anchor_hist = hist
+        self._segment_start = time_s
+        self.segments += 1
+
+    def _close_segment(self) -> None:
+        best, self._best = self._best, None
+        if best is None:
+            return
+        if best[0] >= self.min_sharpness:
+            self.keyframes.append(self._keyframe(best))
+            # Bound memory on long videos: merge neighbours, keeping the sharper one
+            if len(self.keyframes) >= 2 * self.max_keyframes:
+                self.keyframes = [
+                    max(self.keyframes[i:i + 2], key=lambda k: k.sharpness)
+                    for i in range(0, len(self.keyframes), 2)
+                ]
+        elif self._fallback is None or best[0] > self._fallback[0]:
+            self._fallback = best
+
+    @staticmethod
+    def _keyframe(candidate: tuple) -> Keyframe:
+        sharpness, frame_index, time_s, frame, gray = candidate
+        return Keyframe(frame_index, time_s, sharpness, downscale(frame, KEYFRAME_MAX_SIDE), gray)
+
+
+def estimate_shift(previous: Keyframe, current: Keyframe) -> Tuple[float, float]:
+    """
+    Global image motion from one keyframe to the next, in keyframe pixels.
+
+    Objects at (x, y) in the previous keyframe are expected near
+    (x + dx, y + dy) in the current one. Returns (0, 0) when the frames do
+    not correlate (scene cut, resolution change).
+    """
+    if previous.gray.shape != current.gray.shape:
+        return 0.0, 0.0
+    window = cv2.createHanningWindow(previous.gray.shape[::-1], cv2.CV_32F)
+    (dx, dy), response = cv2.phaseCorrelate(
+        previous.gray.astype(np.float32), current.gray.astype(np.float32), window
+    )
+    if response < MIN_SHIFT_RESPONSE:
+        return 0.0, 0.0
+    scale = current.image.shape[1] / current.gray.shape[1]
+    return dx * scale, dy * scale
+
+
+def box_iou(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """(len(a), len(b)) IoU matrix of x1, y1, x2, y2 boxes."""
+    top_left = np.maximum(a[:, None, :2], b[None, :, :2])
+    bottom_right = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    intersection = np.prod(np.clip(bottom_right - top_left, 0, None), axis=2)
+    area_a = np.prod(a[:, 2:] - a[:, :2], axis=1)
+    area_b = np.prod(b[:, 2:] - b[:, :2], axis=1)
+    return intersection / (area_a[:, None] + area_b[None, :] - intersection + 1e-9)
+
+
+@dataclass
+class Track:
+    """One physical object followed across keyframes."""
+
+    track_id: int
+    class_id: int
+    box: np.ndarray  # Last known box, moved along with the camera while unmatched
+    misses: int = 0
+    # keyframe index -> (box, confidence)
+    observations: Dict[int, Tuple[np.ndarray, float]] = field(default_factory=dict)
+
+    @property
+    def confidence(self) -> float:
+        return max(confidence for _, confidence in self.observations.values())
+
+    def best_observation(self) -> Tuple[int, np.ndarray]:
+        keyframe = max(self.observations, key=lambda k: self.observations[k][1])
+        return keyframe, self.observations[keyframe][0]
+
+
+class ObjectTracker:
+    """Greedy class-aware IoU tracker over keyframes with camera-motion compensation."""
+
+    def __init__(self, iou_threshold: float = VIDEO_TRACK_IOU, max_age: int = VIDEO_TRACK_MAX_AGE):
+        self.iou_threshold = iou_threshold
+        self.max_age = max_age
+        self.tracks: List[Track] = []
+        self._active: List[Track] = []
+
+    def update(self, keyframe: int, detections: Detections, shift: Tuple[float, float] = (0.0, 0.0)) -> List[int]:
+        """
+        Match a keyframe's detections to the active tracks.
+
+        Returns:
+            Track id of every detection, in detection order
+        """
+        offset = np.array([shift[0], shift[1], shift[0], shift[1]], dtype=np.float32)
+        for track in self._active:
+            track.box = track.box + offset
+
+        assigned = [-1] * len(detections)
+        matched_tracks = set()
+        if self._active and len(detections):
+            iou = box_iou(np.stack([t.box for t in self._active]), detections.xyxy)
+            same_class = np.array([t.class_id for t in self._active])[:, None] == detections.class_ids[None, :]
+            iou = np.where(same_class, iou, 0.0)
+            rows, cols = np.nonzero(iou >= self.iou_threshold)
+            for order in np.argsort(-iou[rows, cols], kind="stable"):
+                row, col = int(rows[order]), int(cols[order])
+                if row in matched_tracks or assigned[col] >= 0:
+                    continue
+                matched_tracks.add(row)
+                assigned[col] = self._observe(self._active[row], keyframe, detections, col)
+
+        for row, track in enumerate(self._active):
+            if row not in matched_tracks:
+                track.misses += 1
+        self._active = [t for t in self._active if t.misses <= self.max_age]
+
+        for col in range(len(detections)):
+            if assigned[col] < 0:
+                track = Track(len(self.tracks), int(detections.class_ids[col]), detections.xyxy[col])
+                self.tracks.append(track)
+                self._active.append(track)
+                assigned[col] = self._observe(track, keyframe, detections, col)
+        return assigned
+
+    @staticmethod
+    def _observe(track: Track, keyframe: int, detections: Detections, col: int) -> int:
+        track.box = detections.xyxy[col]
+        track.misses = 0
+        track.observations[keyframe] = (detections.xyxy[col], float(detections.confidences[col]))
+        return track.track_id
+
+
+@dataclass
+class VideoAnalysis:
+    """Keyframes, their detections and the consolidated object list of one video."""
+
+    keyframes: List[Keyframe]
+    keyframe_detections: List[Detections]
+    objects: Detections  # Consolidated: hero keyframe's objects first, in its coordinates
+    tracks: List[dict]   # Per consolidated object: track id, keyframes seen, keyframe of its box
+    hero: int            # Index of the keyframe used as the analysis image
+    stats: Dict[str, Any]
+
+    @property
+    def hero_detections(self) -> Detections:
+        return self.keyframe_detections[self.hero]
+
+    @cached_property
+    def hero_jpeg(self) -> bytes:
+        return self.keyframes[self.hero].to_jpeg()
+
+    def rule_report(self) -> RuleReport:
+        """Rules on the hero keyframe (coherent geometry) over the whole room's object list."""
+        hero_count = len(self.hero_detections)
+        report = evaluate_rules(self.objects.select(np.arange(hero_count)))
+        report.class_indices = RoomGeometry.from_detections(self.objects).class_indices
+        return report
+
+    def to_dict(self) -> dict:
+        return {
+            **self.stats,
+            "hero_keyframe": self.hero,
+            "keyframes": [
+                {
+                    "frame": keyframe.frame_index,
+                    "time_s": round(keyframe.time_s, 2),
+                    "sharpness": round(keyframe.sharpness, 1),
+                    "objects": len(detections),
+                }
+                for keyframe, detections in zip(self.keyframes, self.keyframe_detections)
+            ],
+            "tracks": self.tracks,
+        }
+
+
+def consolidate(
+    keyframes: List[Keyframe],
+    keyframe_detections: List[Detections],
+    track_ids: List[List[int]],
+    tracker: ObjectTracker
+) -> Tuple[Detections, List[dict], int]:
+    """One detection per track; the hero keyframe's objects come first, with their boxes from that frame."""
+    hero = max(range(len(keyframes)), key=lambda i: (len(keyframe_detections[i]), keyframes[i].sharpness))
+    hero_tracks = track_ids[hero]
+    others = [t.track_id for t in tracker.tracks if t.track_id not in set(hero_tracks)]
+
+    boxes, class_ids, confidences, tracks = [], [], [], []
+    for track_id in hero_tracks + others:
+        track = tracker.tracks[track_id]
+        if track_id in hero_tracks:
+            keyframe, box = hero, track.observations[hero][0]
+        else:
+            keyframe, box = track.best_observation()
+        boxes.append(box)
+        class_ids.append(track.class_id)
+        confidences.append(track.confidence)
+        tracks.append({
+            "track_id": track_id,
+            "keyframe": keyframe,
+            "seen_in": sorted(track.observations),
+        })
+
+    names = next((d.names for d in keyframe_detections if d.names), {})
+    image_size = keyframe_detections[hero].image_size or tuple(keyframes[hero].image.shape[1::-1])
+    objects = Detections(np.array(boxes).reshape(-1, 4), np.array(class_ids), np.array(confidences), names,
+                         image_size, keyframe_detections[hero].embedding)
+    return objects, tracks, hero
+
+
+def stage_stats(seconds: float, items: int, unit: str) -> dict:
+    return {"seconds": round(seconds, 4), unit: items, f"{unit}_per_s": round(items / seconds, 1) if seconds else None}
+
+
+def analyze_video(path: str, detector: Optional[ObjectDetector] = None) -> VideoAnalysis:
+    """
+    Decode a video, select keyframes, detect and track objects.
+
+    Args:
+        path: Video file readable by cv2 (FFmpeg backend)
+        detector: Detector to use (default: the shared instance)
+
+    Returns:
+        VideoAnalysis
+
+    Raises:
+        ValueError: If the file cannot be decoded or has no frames
+    """
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise ValueError("Could not open video (unsupported format or corrupt file)")
+
+    fps = capture.get(cv2.CAP_PROP_FPS)
+    if not fps or not np.isfinite(fps) or fps <= 0:
+        fps = 30.0
+    stride = max(1, round(fps / VIDEO_SAMPLE_FPS))
+    max_frames = int(VIDEO_MAX_SECONDS * fps)
+    selector = KeyframeSelector()
+    decoded = sampled = 0
+    decode_seconds = select_seconds = 0.0
+
+    with start_span("video.decode_select", attributes={"video.fps": fps, "video.stride": stride}) as span:
+        try:
+            while decoded < max_frames:
+                start = time.perf_counter()
+                # grab() decodes every frame (inter-frame codecs need it); only sampled ones are retrieved
+                if not capture.grab():
+                    break
+                frame_index = decoded
+                decoded += 1
+                if frame_index % stride:
+                    decode_seconds += time.perf_counter() - start
+                    continue
+                ok, frame = capture.retrieve()
+                retrieved = time.perf_counter()
+                decode_seconds += retrieved - start
+                if not ok:
+                    continue
+                sampled += 1
+                selector.add(frame_index, frame_index / fps, frame)
+                select_seconds += time.perf_counter() - retrieved
+        finally:
+            capture.release()
+        keyframes = selector.finish()
+        span.set_attributes({"video.frames": decoded, "video.sampled": sampled, "video.keyframes": len(keyframes)})
+    if not keyframes:
+        raise ValueError("No decodable frames in video")
+
+    with start_span("video.detect", attributes={"video.keyframes": len(keyframes)}):
+        start = time.perf_counter()
+        detector = detector or get_detector()
+        keyframe_detections = detector.detect_images_batch([keyframe.to_rgb() for keyframe in keyframes])
+        detect_seconds = time.perf_counter() - start
+
+    with start_span("video.track") as span:
+        start = time.perf_counter()
+        tracker = ObjectTracker()
+        track_ids = []
+        for i, (keyframe, detections) in enumerate(zip(keyframes, keyframe_detections)):
+            shift = estimate_shift(keyframes[i - 1], keyframe) if i else (0.0, 0.0)
+            track_ids.append(tracker.update(i, detections, shift))
+        objects, tracks, hero = consolidate(keyframes, keyframe_detections, track_ids, tracker)
+        track_seconds = time.perf_counter() - start
+        raw_detections = sum(len(d) for d in keyframe_detections)
+        span.set_attributes({"video.detections": raw_detections, "video.objects": len(objects)})
+
+    for stage, seconds in (("decode", decode_seconds), ("select", select_seconds),
+                           ("detect", detect_seconds), ("track", track_seconds)):
+        VIDEO_STAGE_SECONDS.labels(stage=stage).observe(seconds)
+    VIDEO_FRAMES.labels(kind="decoded").inc(decoded)
+    VIDEO_FRAMES.labels(kind="sampled").inc(sampled)
+    VIDEO_FRAMES.labels(kind="keyframe").inc(len(keyframes))
+
+    logger.info(
+        f"Video: {decoded} frames decoded, {sampled} sampled, {selector.segments} segments, "
+        f"{len(keyframes)} keyframes, {raw_detections} detections -> {len(objects)} objects"
+    )
+    stats = {
+        "fps": round(fps, 2),
+        "duration_s": round(decoded / fps, 2),
+        "frames_decoded": decoded,
+        "frames_sampled": sampled,
+        "segments": selector.segments,
+        "detections": raw_detections,
+        "objects": len(objects),
+        "stages": {
+            "decode": stage_stats(decode_seconds, decoded, "frames"),
+            "select": stage_stats(select_seconds, sampled, "frames"),
+            "detect": stage_stats(detect_seconds, len(keyframes), "frames"),
+            "track": stage_stats(track_seconds, raw_detections, "detections"),
+        },
+    }
+    return VideoAnalysis(keyframes, keyframe_detections, objects, tracks, hero, stats)
+
+
+def detect_video_objects(
+    path: str,
+    save_results: bool = True,
+    result_id: Optional[str] = None,
+    annotate: Optional[bool] = None
+) -> Tuple[VideoAnalysis, str, str]:
+    """
+    Convenience function mirroring detect_room_objects for a video.
+
+    Args:
+        path: Video file path
+        save_results: Whether to save the hero keyframe and the consolidated objects
+                      (with the keyframe each box comes from) (default: True)
+        result_id: Optional id to store the results under (generated if not provided)
+        annotate: Whether to also store the annotated hero keyframe (default: EAGER_ANNOTATION)
+
+    Returns:
+        Tuple of (video analysis, json_path, image_path); paths are empty strings if save_results=False
+    """
+    video = analyze_video(path)
+    json_path = ""
+    image_path = ""
+
+    if save_results:
+        # The whole room's objects, as in the response; only the hero's are drawn on its keyframe
+        json_path, image_path = get_detector().save_results(
+            video.hero_jpeg, video.objects, result_id, annotate,
+            image_objects=len(video.hero_detections),
+            object_keyframes=[track["keyframe"] for track in video.tracks]
+        )
+
+    return video, json_path, image_path
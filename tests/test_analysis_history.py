@@ -0,0 +1,108 @@
+"""
+Keyset pagination of the analysis history through ties in the sort key.
+
+Many analyses share a score (and batches share a timestamp), so a cursor
+that only carried the sort value would skip or repeat rows at page
+boundaries. Each test pages through a fresh SQLite history and checks every
+row comes back exactly once, in order.
+
+Run from the repository root:
+    python -m pytest tests/test_analysis_history.py -q
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from analysis_history import (  # noqa: E402
+    AnalysisQuery, AnalysisRecord, AnalysisWriter, SQLiteAnalysisRepository, encode_cursor
+)
+
+
+@pytest.fixture
+def repository(tmp_path):
+    repository = SQLiteAnalysisRepository(tmp_path / "analyses.sqlite3")
+    yield repository
+    repository.close()
+
+
+def record(index: int, score: float, created: float, user: str = "alice", classes=("bed",)) -> AnalysisRecord:
+    return AnalysisRecord(
+        analysis_id=f"a{index:03d}", user=user, created=created, score=score,
+        classes=sorted(classes), object_count=len(classes), response={"score": score},
+    )
+
+
+def page_all(repository, limit: int, **filters) -> list:
+    """Every item of a query, following next_cursor page by page."""
+    items, cursor = [], None
+    while True:
+        page = repository.query(AnalysisQuery(limit=limit, cursor=cursor, **filters))
+        assert len(page.items) <= limit
+        items.extend(page.items)
+        cursor = page.next_cursor
+        if cursor is None:
+            return items
+
+
+def test_score_ties_across_pages(repository):
+    # Three scores, 10 analyses each, inserted interleaved so ids do not follow the score
+    repository.add_many([record(i, score=(7.0, 9.0, 5.0)[i % 3], created=1000.0 + i) for i in range(30)])
+
+    for limit in (1, 3, 4, 7, 10, 30):
+        items = page_all(repository, limit, sort="score")
+        ids = [item["analysis_id"] for item in items]
+        assert sorted(ids) == [f"a{i:03d}" for i in range(30)]
+        # Best first, and within a score the most recently inserted first
+        assert [item["score"] for item in items] == [9.0] * 10 + [7.0] * 10 + [5.0] * 10
+        assert ids[:10] == [f"a{i:03d}" for i in range(28, -1, -3)]
+
+
+def test_created_ties_with_filters(repository):
+    # One timestamp shared by a whole batch, across two users and two classes
+    repository.add_many([
+        record(i, score=8.0, created=2000.0, user=("alice", "bob")[i % 2], classes=("bed", ("tv", "chair")[i % 2]))
+        for i in range(20)
+    ])
+
+    everyone = page_all(repository, 3)
+    assert len({item["analysis_id"] for item in everyone}) == 20
+
+    alice = page_all(repository, 4, user="alice")
+    assert [item["analysis_id"] for item in alice] == [f"a{i:03d}" for i in range(18, -1, -2)]
+
+    chairs = page_all(repository, 2, object_class="chair")
+    assert [item["analysis_id"] for item in chairs] == [f"a{i:03d}" for i in range(19, 0, -2)]
+
+    best_chairs = page_all(repository, 3, object_class="chair", sort="score", min_score=8.0)
+    assert {item["analysis_id"] for item in best_chairs} == {item["analysis_id"] for item in chairs}
+
+
+def test_replaced_analysis_is_listed_once(repository):
+    repository.add_many([record(i, score=6.0, created=3000.0) for i in range(5)])
+    repository.add_many([record(2, score=6.0, created=3000.0)])
+
+    items = page_all(repository, 2, sort="score")
+    assert sorted(item["analysis_id"] for item in items) == [f"a{i:03d}" for i in range(5)]
+    assert items[0]["analysis_id"] == "a002"
+
+
+def test_cursor_must_match_sort(repository):
+    repository.add_many([record(0, score=5.0, created=1.0)])
+    with pytest.raises(ValueError):
+        repository.query(AnalysisQuery(sort="created", cursor=encode_cursor("score", 5.0, 1)))
+    with pytest.raises(ValueError):
+        repository.query(AnalysisQuery(cursor="not-a-cursor"))
+
+
+def test_writer_stop_with_full_queue(repository):
+    writer = AnalysisWriter(repository, batch_size=2, interval=0.01, queue_size=4)
+    assert all(writer.submit(record(i, score=5.0, created=float(i))) for i in range(4))
+    writer.submit(record(4, score=5.0, created=4.0))
+
+    writer.stop(timeout=5.0)
+    assert not writer._thread.is_alive()
+    assert repository.stats()["analyses"] + writer.dropped == 5
@@ -0,0 +1,206 @@
+"""
+Blender service supervision against a fake service that floods its output.
+
+The fake writes megabytes to stdout and stderr before it starts serving and
+logs every /status request to stderr (as Flask does), so a supervisor that
+does not drain the pipes never sees it become healthy. Once a trigger file
+exists every /status request hangs, to exercise the watchdog.
+
+Run from the repository root:
+    python -m pytest tests/test_blender_supervisor.py -q
+"""
+
+import os
+import resource
+import socket
+import sys
+import textwrap
+import time
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import blender_service  # noqa: E402
+from blender_service import BlenderServiceManager  # noqa: E402
+
+FLOOD_LINES = 40_000  # ~4 MB per stream, far beyond a 64 KB pipe buffer
+
+FAKE_SERVICE = textwrap.dedent("""
+    import os
+    import sys
+    import time
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    port, lines, trigger = int(sys.argv[1]), int(sys.argv[2]), sys.argv[3]
+    for i in range(lines):
+        print(f"render progress {i:06d} " + "x" * 80)
+        print(f"warning {i:06d} " + "y" * 80, file=sys.stderr)
+    print("flood done", flush=True)
+    print("flood done", file=sys.stderr, flush=True)
+
+    hung = False
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            global hung
+            if os.path.exists(trigger):
+                os.remove(trigger)
+                hung = True
+            if hung:
+                time.sleep(3600)
+            self.send_response(200)
+            self.end_headers()
+            self.wfile.write(b'{"status": "ok"}')
+
+    ThreadingHTTPServer(("127.0.0.1", port), Handler).serve_forever()
+""")
+
+
+# Runs the fake service, except on the launches listed in argv[2] (counted in argv[1]),
+# where it exits right away as a service that fails during startup would
+FLAKY_LAUNCHER = textwrap.dedent("""
+    import os
+    import sys
+
+    counter, failing, service = sys.argv[1], sys.argv[2], sys.argv[3:]
+    launch = int(open(counter).read()) + 1 if os.path.exists(counter) else 1
+    with open(counter, "w") as f:
+        f.write(str(launch))
+    if str(launch) in failing.split(","):
+        sys.exit(3)
+    os.execv(sys.executable, [sys.executable] + service)
+""")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def fake_service(tmp_path):
+    script = tmp_path / "fake_service.py"
+    script.write_text(FAKE_SERVICE)
+    trigger = tmp_path / "hang"
+    port = free_port()
+    managers = []
+
+    launcher = tmp_path / "flaky_launcher.py"
+    launcher.write_text(FLAKY_LAUNCHER)
+
+    def make(failing_launches: str = "", **kwargs) -> BlenderServiceManager:
+        command = [sys.executable, str(script), str(port), str(FLOOD_LINES), str(trigger)]
+        if failing_launches:
+            command = [sys.executable, str(launcher), str(tmp_path / "launches"), failing_launches] + command[1:]
+        manager = BlenderServiceManager(port=port, command=command, startup_timeout=30, **kwargs)
+        managers.append(manager)
+        return manager
+
+    make.trigger = trigger
+    yield make
+    for manager in managers:
+        manager.stop()
+
+
+def test_flooding_service_starts_and_output_is_bounded(fake_service):
+    # Larger than what one pipe can still hold once the service serves (~700 lines)
+    manager = fake_service(watchdog_interval=0, output_lines=2000, log_rate=20)
+    assert manager.start()
+
+    # Requests keep working while the service writes an access log line per request
+    for _ in range(50):
+        assert manager.is_running()
+
+    assert len(manager.output) == 2000
+    tail = manager.output_tail(2000)
+    assert "stdout: flood done" in tail and "stderr: flood done" in tail
+    assert manager.stats()["running"]
+
+
+def test_resource_limits_are_applied(fake_service):
+    manager = fake_service(watchdog_interval=0, nice=7, max_memory_mb=4096, cpus=[0])
+    assert manager.start()
+    pid = manager.process.pid
+
+    assert os.getpriority(os.PRIO_PROCESS, pid) - os.getpriority(os.PRIO_PROCESS, 0) == 7
+    assert resource.prlimit(pid, resource.RLIMIT_AS)[0] == 4096 * 1024 * 1024
+    assert os.sched_getaffinity(pid) == {0}
+
+
+def test_watchdog_restarts_hung_service(fake_service):
+    manager = fake_service(watchdog_interval=0.5, hang_timeout=0.5, hang_checks=2)
+    assert manager.start()
+    first_pid = manager.process.pid
+
+    fake_service.trigger.touch()
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        process = manager.process
+        if process is not None and process.pid != first_pid and manager.is_running():
+            break
+        time.sleep(0.2)
+    else:
+        pytest.fail("watchdog did not restart the hung service")
+
+    assert len(manager.restarts) == 1
+    assert not fake_service.trigger.exists()
+
+
+def test_watchdog_restarts_exited_service(fake_service):
+    manager = fake_service(watchdog_interval=0.5)
+    assert manager.start()
+    first_pid = manager.process.pid
+
+    manager.process.kill()
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        process = manager.process
+        if process is not None and process.pid != first_pid and manager.is_running():
+            break
+        time.sleep(0.2)
+    else:
+        pytest.fail("watchdog did not restart the exited service")
+
+
+def test_failed_restart_is_retried(fake_service):
+    # Launch 1 is the start, launches 2 and 3 (the first restarts) die during startup
+    manager = fake_service(failing_launches="2,3", watchdog_interval=0.2)
+    assert manager.start()
+
+    manager.process.kill()
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if len(manager.restarts) == 3 and manager.failed_restarts == 0 and manager.is_running():
+            break
+        time.sleep(0.2)
+    else:
+        pytest.fail("watchdog stopped retrying after a failed restart")
+
+
+def test_failed_restarts_stop_at_the_cap(fake_service, monkeypatch):
+    monkeypatch.setattr(blender_service, "BLENDER_MAX_RESTARTS_PER_HOUR", 2)
+    manager = fake_service(failing_launches="2,3,4,5", watchdog_interval=0.1)
+    assert manager.start()
+
+    manager.process.kill()
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline and manager.failed_restarts < 2:
+        time.sleep(0.1)
+    time.sleep(1.5)  # Past the next backoff: a third restart would have been tried
+
+    assert len(manager.restarts) == 2
+    assert manager.failed_restarts == 2
+    assert manager.process is None
+
+
+def test_stop_terminates_service(fake_service):
+    manager = fake_service(watchdog_interval=0.5)
+    assert manager.start()
+    process = manager.process
+
+    manager.stop()
+    assert process.poll() is not None
+    assert not manager.is_running()
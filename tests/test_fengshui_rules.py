@@ -0,0 +1,136 @@
+"""
+Feng shui rule engine on hand-built rooms.
+
+Every room is a 1000x1000 frame with boxes placed to trigger (or avoid) one
+rule, so the expected findings follow directly from the thresholds in
+fengshui_rules.py.
+
+Run from the repository root:
+    python -m pytest tests/test_fengshui_rules.py -q
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from fengshui_rules import BASE_SCORE, compact_indices, evaluate_rules  # noqa: E402
+from object_detection import Detections  # noqa: E402
+
+FRAME = (1000, 1000)
+
+
+def room(*objects) -> Detections:
+    """Detections from (class, x1, y1, x2, y2) tuples in a 1000x1000 frame."""
+    return Detections.from_list(
+        [
+            {"class": name, "confidence": 0.9, "bbox": {"x1": x1, "y1": y1, "x2": x2, "y2": y2}}
+            for name, x1, y1, x2, y2 in objects
+        ],
+        image_size=FRAME,
+    )
+
+
+def findings(report, rule: str) -> list:
+    return [finding for finding in report.findings if finding.rule == rule]
+
+
+def test_empty_room_keeps_base_score():
+    report = evaluate_rules(Detections.empty())
+    assert report.findings == []
+    assert report.score == BASE_SCORE
+    assert report.tooltips() == []
+
+
+def test_bed_in_line_with_door():
+    report = evaluate_rules(room(("bed", 300, 500, 700, 1000)))
+    [finding] = findings(report, "bed_position")
+    assert (finding.type, finding.object_index) == ("bad", 0)
+    assert report.measures["bed_axis_offset"] == 0.0
+    assert report.score < BASE_SCORE
+
+
+def test_bed_off_axis_is_commanding():
+    report = evaluate_rules(room(("bed", 600, 400, 950, 800)))
+    [finding] = findings(report, "bed_position")
+    assert finding.type == "good"
+
+
+def test_largest_bed_is_judged():
+    report = evaluate_rules(room(("bed", 650, 700, 750, 800), ("bed", 300, 500, 700, 1000)))
+    [finding] = findings(report, "bed_position")
+    assert finding.object_index == 1
+
+
+def test_screen_facing_bed_but_not_above_headboard():
+    facing = evaluate_rules(room(("bed", 100, 500, 500, 900), ("tv", 700, 450, 900, 600)))
+    [finding] = findings(facing, "screen_facing_bed")
+    assert (finding.type, finding.object_index) == ("bad", 1)
+
+    above = evaluate_rules(room(("bed", 100, 500, 500, 900), ("tv", 200, 200, 400, 350)))
+    assert findings(above, "screen_facing_bed") == []
+    assert above.measures["screens_facing_bed"] == 0
+
+
+def test_clutter_levels():
+    items = [("book", 10 + 40 * i, 10, 40 + 40 * i, 40) for i in range(8)]
+    items.append(("bottle", 500, 10, 560, 100))  # the largest item gets the tooltip
+
+    heavy = evaluate_rules(room(*items))
+    [finding] = findings(heavy, "clutter")
+    assert (finding.type, finding.object_index) == ("bad", 8)
+    assert heavy.measures["clutter_count"] == 9
+
+    some = evaluate_rules(room(*items[:4]))
+    assert findings(some, "clutter")[0].type == "neutral"
+
+    clear = evaluate_rules(room(("couch", 100, 400, 500, 700)))
+    assert findings(clear, "clutter")[0].type == "good"
+
+
+def test_balance():
+    lopsided = evaluate_rules(room(("couch", 0, 400, 300, 700), ("chair", 50, 500, 200, 700)))
+    [finding] = findings(lopsided, "balance")
+    assert (finding.type, finding.object_index) == ("bad", 0)
+    assert finding.brief == "furniture heavy on left"
+
+    even = evaluate_rules(room(("couch", 0, 400, 300, 700), ("couch", 700, 400, 1000, 700)))
+    assert findings(even, "balance")[0].type == "good"
+
+
+def test_score_adds_rule_weights_and_is_clamped():
+    report = evaluate_rules(room(("bed", 300, 500, 700, 1000), ("tv", 750, 500, 900, 600)))
+    assert report.score == round(BASE_SCORE + sum(finding.weight for finding in report.findings), 1)
+
+    screens = [("tv", 720 + 30 * (i % 4), 500 + 60 * (i // 4), 740 + 30 * (i % 4), 550 + 60 * (i // 4))
+               for i in range(8)]
+    worst = evaluate_rules(room(("bed", 300, 500, 700, 1000), *screens))
+    assert len(findings(worst, "screen_facing_bed")) == 8
+    assert worst.score == 1.0
+
+
+def test_tooltips_one_per_object_in_rule_order():
+    # Bed placement comes first in RULES, the plant rule later
+    report = evaluate_rules(room(("bed", 300, 500, 700, 1000), ("potted plant", 850, 300, 950, 500)))
+    tooltips = report.tooltips()
+    assert [tooltip["object_index"] for tooltip in tooltips] == [0, 1]
+    assert tooltips[0]["type"] == "bad"
+
+    analysis = report.to_analysis()
+    assert analysis["score"] == report.score
+    assert analysis["object_tooltips"] == tooltips
+    assert analysis["weaknesses"][0] in analysis["overall_analysis"]
+
+
+def test_class_indices_and_summary():
+    report = evaluate_rules(room(
+        ("chair", 0, 0, 10, 10), ("book", 20, 0, 30, 10), ("chair", 40, 0, 50, 10), ("chair", 60, 0, 70, 10)
+    ))
+    assert report.class_indices == {"chair": [0, 2, 3], "book": [1]}
+    assert "chair 0,2-3; book 1" in report.summary()
+
+
+def test_compact_indices():
+    assert compact_indices([0]) == "0"
+    assert compact_indices([3, 5, 6, 7, 8, 9]) == "3,5-9"
+    assert compact_indices([1, 2, 4, 6, 7]) == "1-2,4,6-7"
@@ -0,0 +1,106 @@
+"""
+Expiry of finished 3D job statuses (main.ModelJobStatus).
+
+Importing main needs the depth backend and somewhere to keep its stores, so
+the environment is pointed at a scratch directory before the import.
+
+Run from the repository root:
+    python -m pytest tests/test_model_job_status.py -q
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+_scratch = Path(tempfile.mkdtemp(prefix="model-job-status-"))
+os.environ.setdefault("MODEL_BACKEND", "depth")
+os.environ.setdefault("ROOM_EMBEDDINGS", "false")
+os.environ.setdefault("STORAGE_ROOT", str(_scratch))
+os.environ.setdefault("STORAGE_INDEX_PATH", str(_scratch / "storage_index.sqlite3"))
+os.environ.setdefault("DERIVATIVE_CACHE_DIR", str(_scratch / "derivative_cache"))
+os.environ.setdefault("ANALYSIS_DB_PATH", str(_scratch / "analyses.sqlite3"))
+
+import main  # noqa: E402
+from main import ModelJobStatus  # noqa: E402
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """A controllable time.monotonic for the expiry checks."""
+    now = [1000.0]
+    monkeypatch.setattr(main.time, "monotonic", lambda: now[0])
+    return now
+
+
+def job(status: str) -> dict:
+    return {"status": status, "filename": None, "error": None}
+
+
+def test_finished_jobs_expire_after_ttl(clock):
+    jobs = ModelJobStatus(ttl=60, max_jobs=100)
+    jobs["done"] = job("completed")
+    jobs["broken"] = job("failed")
+    jobs["running"] = job("processing")
+
+    clock[0] += 59
+    jobs["queued"] = job("pending")
+    assert set(jobs) == {"done", "broken", "running", "queued"}
+
+    clock[0] += 2
+    jobs["other"] = job("pending")
+    assert set(jobs) == {"running", "queued", "other"}
+
+
+def test_ttl_counts_from_completion(clock):
+    jobs = ModelJobStatus(ttl=60, max_jobs=100)
+    jobs["slow"] = job("pending")
+    clock[0] += 600
+    jobs["slow"] = job("processing")
+    clock[0] += 600
+    jobs["slow"] = job("completed")
+
+    clock[0] += 30
+    jobs["next"] = job("pending")
+    assert jobs["slow"]["status"] == "completed"
+
+
+def test_max_jobs_drops_oldest_finished(clock):
+    jobs = ModelJobStatus(ttl=3600, max_jobs=3)
+    for i in range(5):
+        jobs[f"active{i}"] = job("processing")
+    for i in range(5):
+        clock[0] += 1
+        jobs[f"done{i}"] = job("completed")
+
+    assert set(jobs) == {f"active{i}" for i in range(5)} | {"done2", "done3", "done4"}
+
+
+def test_requeued_job_is_not_expired(clock):
+    jobs = ModelJobStatus(ttl=60, max_jobs=1)
+    jobs["retry"] = job("failed")
+    jobs["retry"] = job("pending")
+    clock[0] += 120
+    jobs["done"] = job("completed")
+    jobs["done2"] = job("completed")
+
+    assert set(jobs) == {"retry", "done2"}
+
+    del jobs["done2"]
+    jobs["done3"] = job("completed")
+    assert set(jobs) == {"retry", "done3"}
+
+
+@pytest.mark.parametrize("ttl, max_jobs", [(0, 100), (3600, 0)])
+def test_background_job_survives_immediate_expiry(monkeypatch, ttl, max_jobs):
+    jobs = ModelJobStatus(ttl=ttl, max_jobs=max_jobs)
+    monkeypatch.setattr(main, "model_generation_status", jobs)
+    monkeypatch.setattr(main, "generate_room_model", lambda *args: (None, "no depth model"))
+
+    asyncio.run(main.generate_3d_model_background(b"", "expired"))
+    assert "expired" not in jobs
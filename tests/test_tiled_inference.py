@@ -0,0 +1,68 @@
+"""
+Tile windows and class-aware NMS used by tiled inference.
+
+Run from the repository root:
+    python -m pytest tests/test_tiled_inference.py -q
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from object_detection import non_max_suppression, tile_boxes  # noqa: E402
+
+
+def nms(boxes, scores, classes, iou=0.5) -> list:
+    return non_max_suppression(
+        np.array(boxes, dtype=np.float32), np.array(scores, dtype=np.float32), np.array(classes), iou
+    ).tolist()
+
+
+def test_small_image_is_one_tile():
+    assert tile_boxes(500, 300, 640, 0.2) == [(0, 0, 500, 300)]
+
+
+def test_tiles_cover_image_with_overlap():
+    width, height, size, overlap = 1920, 1080, 640, 0.2
+    tiles = tile_boxes(width, height, size, overlap)
+
+    # Every tile is full size and inside the image
+    assert all(x2 - x1 == size and y2 - y1 == size for x1, y1, x2, y2 in tiles)
+    assert all(x1 >= 0 and y1 >= 0 and x2 <= width and y2 <= height for x1, y1, x2, y2 in tiles)
+
+    # Row-major grid whose edges reach the image borders
+    xs = sorted({x1 for x1, _, _, _ in tiles})
+    ys = sorted({y1 for _, y1, _, _ in tiles})
+    assert len(tiles) == len(xs) * len(ys)
+    assert (xs[0], ys[0]) == (0, 0)
+    assert (xs[-1] + size, ys[-1] + size) == (width, height)
+
+    # Neighbours overlap by at least the requested fraction
+    for starts in (xs, ys):
+        assert all(size - (b - a) >= size * overlap for a, b in zip(starts, starts[1:]))
+
+
+def test_nms_keeps_best_of_overlapping_boxes():
+    keep = nms(
+        [(0, 0, 100, 100), (5, 5, 105, 105), (300, 300, 400, 400)],
+        [0.6, 0.9, 0.8],
+        [0, 0, 0],
+    )
+    assert keep == [1, 2]
+
+
+def test_nms_threshold_and_classes():
+    boxes = [(0, 0, 100, 100), (50, 0, 150, 100)]  # IoU 1/3
+    assert nms(boxes, [0.9, 0.8], [0, 0], iou=0.5) == [0, 1]
+    assert nms(boxes, [0.9, 0.8], [0, 0], iou=0.3) == [0]
+
+    # Identical boxes of different classes never suppress each other
+    assert nms([(0, 0, 100, 100)] * 2, [0.7, 0.9], [0, 1]) == [1, 0]
+
+
+def test_nms_empty():
+    keep = non_max_suppression(np.zeros((0, 4)), np.zeros(0), np.zeros(0, dtype=np.int64), 0.5)
+    assert keep.shape == (0,)